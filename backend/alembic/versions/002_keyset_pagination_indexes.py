@@ -0,0 +1,27 @@
+"""Indexes for keyset pagination
+
+Revision ID: 002
+Revises: 001
+Create Date: 2025-09-02
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Category listings seek on (category_id, is_available, name, id)
+    op.create_index('idx_products_category_available_name', 'products',
+                    ['category_id', 'is_available', 'name'], unique=False)
+    # Order history seeks on (created_at, id) newest first
+    op.create_index('idx_orders_created', 'orders', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('idx_orders_created', table_name='orders')
+    op.drop_index('idx_products_category_available_name', table_name='products')
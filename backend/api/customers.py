@@ -5,15 +5,36 @@ from fastapi import APIRouter, HTTPException
 from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime, date
+import threading
 import mysql.connector
 
+from core.customer_search import customer_index
+
 router = APIRouter()
+_index_loading = threading.Lock()
 
 def get_db_connection():
     """Get database connection from pool"""
     from complete_server import pool
     return pool.get_connection()
 
+def _fetch_all(query, params=None):
+    """Run a read query and return rows as dicts"""
+    connection = get_db_connection()
+    cursor = connection.cursor(dictionary=True)
+    try:
+        cursor.execute(query, params or ())
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+        connection.close()
+
+def _ensure_customer_index():
+    """Start loading the trigram search index in the background (once)"""
+    if customer_index.is_ready() or not _index_loading.acquire(blocking=False):
+        return
+    customer_index.start_background_refresh(_fetch_all)
+
 class CustomerBase(BaseModel):
     first_name: str
     last_name: str
@@ -139,6 +160,11 @@ async def create_customer(customer: CustomerCreate):
         connection.commit()
         
         customer_id = cursor.lastrowid
+        customer_index.upsert({
+            'id': customer_id, 'company_id': customer.company_id,
+            'first_name': customer.first_name, 'last_name': customer.last_name,
+            'email': customer.email, 'phone': customer.phone, 'is_active': 1
+        })
         
         # Get the created customer
         cursor.execute("SELECT * FROM customers WHERE id = %s", (customer_id,))
@@ -224,6 +250,7 @@ async def update_customer(customer_id: int, customer_update: CustomerUpdate):
         # Get updated customer
         cursor.execute("SELECT * FROM customers WHERE id = %s", (customer_id,))
         updated_customer = cursor.fetchone()
+        customer_index.upsert(updated_customer)
         
         if updated_customer.get('total_spent'):
             updated_customer['total_spent'] = float(updated_customer['total_spent'])
@@ -263,11 +290,13 @@ async def delete_customer(customer_id: int):
             # Soft delete if has orders
             cursor.execute("UPDATE customers SET is_active = 0, updated_at = NOW() WHERE id = %s", (customer_id,))
             connection.commit()
+            customer_index.remove(customer_id)
             return {"message": "Customer deactivated successfully (has order history)"}
         else:
             # Hard delete if no orders
             cursor.execute("DELETE FROM customers WHERE id = %s", (customer_id,))
             connection.commit()
+            customer_index.remove(customer_id)
             return {"message": "Customer deleted successfully"}
         
     except mysql.connector.Error as e:
@@ -319,6 +348,21 @@ async def search_customers(query: str, company_id: Optional[int] = None):
         connection = get_db_connection()
         cursor = connection.cursor(dictionary=True)
         
+        if customer_index.is_ready():
+            # Trigram index: prefix, substring, phone digits and typo-tolerant matches
+            customer_ids = customer_index.search(query, limit=20, company_id=company_id)
+            if not customer_ids:
+                return []
+            placeholders = ", ".join(["%s"] * len(customer_ids))
+            cursor.execute(f"SELECT * FROM customers WHERE id IN ({placeholders})", customer_ids)
+            by_id = {row['id']: row for row in cursor.fetchall()}
+            customers = [by_id[cid] for cid in customer_ids if cid in by_id]
+            for customer in customers:
+                if customer.get('total_spent'):
+                    customer['total_spent'] = float(customer['total_spent'])
+            return customers
+        
+        _ensure_customer_index()
         search_query = """
             SELECT * FROM customers 
             WHERE (CONCAT(first_name, ' ', last_name) LIKE %s 
@@ -1,10 +1,12 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_
+from sqlalchemy import select, and_, func
 from datetime import datetime
 
 from ..core.database import get_db
+from ..core.cache import invalidate_tag
+from ..core.pagination import InvalidCursor, cached_count, decode_cursor, keyset_after, page_from_rows
 from ..core.security import get_current_user
 from ..core.websocket import manager
 from ..models.order import Order, OrderItem
@@ -23,27 +25,56 @@ router = APIRouter()
 
 @router.get("/", response_model=List[OrderResponse])
 async def get_orders(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     status: Optional[str] = None,
     table_number: Optional[int] = None,
+    cursor: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header"),
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get all orders with optional filters"""
-    query = select(Order)
+    """
+    Get all orders with optional filters, newest first.
+    
+    Pass the ``X-Next-Cursor`` header of a page as ``cursor`` for keyset
+    pagination on (created_at, id); ``skip`` keeps working. ``X-Total-Count``
+    carries a cached total.
+    """
+    filters = []
     
     if status:
-        query = query.where(Order.status == status)
+        filters.append(Order.status == status)
     if table_number:
-        query = query.where(Order.table_number == table_number)
-    
-    query = query.offset(skip).limit(limit).order_by(Order.created_at.desc())
+        filters.append(Order.table_number == table_number)
+    
+    sort_columns = [Order.created_at, Order.id]
+    query = select(Order).where(*filters).order_by(
+        Order.created_at.desc(), Order.id.desc()
+    ).limit(limit + 1)
+    
+    if cursor:
+        try:
+            after = decode_cursor(cursor, len(sort_columns))
+        except InvalidCursor:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.where(keyset_after(sort_columns, after, descending=True))
+    elif skip:
+        query = query.offset(skip)
     
     result = await db.execute(query)
-    orders = result.scalars().all()
+    page = page_from_rows(list(result.scalars().all()), limit, lambda o: (o.created_at, o.id))
+    
+    async def count(session: AsyncSession):
+        total_result = await session.execute(select(func.count()).select_from(Order).where(*filters))
+        return total_result.scalar()
+    
+    total = await cached_count(f"count:orders:status:{status}:table:{table_number}", count, ["orders"])
+    response.headers["X-Total-Count"] = str(total)
+    if page["next_cursor"]:
+        response.headers["X-Next-Cursor"] = page["next_cursor"]
     
-    return orders
+    return page["items"]
 
 @router.get("/{order_id}", response_model=OrderResponse)
 async def get_order(
@@ -144,6 +175,7 @@ async def create_order(
     db.add(order)
     await db.commit()
     await db.refresh(order)
+    await invalidate_tag("orders")
     
     # Send WebSocket notification to kitchen
     await manager.notify_kitchen_new_order({
@@ -205,6 +237,7 @@ async def update_order_status(
     
     await db.commit()
     await db.refresh(order)
+    await invalidate_tag("orders")
     
     return order
 
@@ -283,6 +316,7 @@ async def update_order(
     
     await db.commit()
     await db.refresh(order)
+    await invalidate_tag("orders")
     
     return order
 
@@ -323,6 +357,7 @@ async def cancel_order(
         table.status = "available"
     
     await db.commit()
+    await invalidate_tag("orders")
     
     return {"message": "Order cancelled successfully"}
 
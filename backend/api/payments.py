@@ -10,7 +10,7 @@ from decimal import Decimal
 import stripe
 import structlog
 
-from core.database import get_db
+from core.database import get_db, get_read_db
 from core.auth import get_current_user
 from core.config import settings
 from models.payment import Payment, PaymentMethod, PaymentStatus
@@ -319,7 +319,7 @@ async def get_payment_summary(
 @router.get("/reports/daily", response_model=DailySalesReport)
 async def get_daily_sales_report(
     date: Optional[datetime] = None,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -3,7 +3,7 @@ Product management API endpoints.
 """
 from typing import List, Optional
 from decimal import Decimal
-from fastapi import APIRouter, Depends, HTTPException, Query, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status, BackgroundTasks
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, or_, and_
 from sqlalchemy.orm import selectinload
@@ -11,6 +11,8 @@ from pydantic import BaseModel, Field, validator
 
 from core.database import get_db
 from core.auth import get_current_user, require_role
+from core.cache import invalidate_tag, make_cache_key
+from core.pagination import InvalidCursor, cached_count, decode_cursor, keyset_after, page_from_rows
 from models import Product, Category, ProductVariant, User
 
 router = APIRouter(prefix="/api/v1/products", tags=["Products"])
@@ -182,6 +184,7 @@ async def create_category(
     db.add(new_category)
     await db.commit()
     await db.refresh(new_category)
+    await invalidate_tag("categories")
     
     return new_category
 
@@ -211,6 +214,7 @@ async def update_category(
     
     await db.commit()
     await db.refresh(category)
+    await invalidate_tag("categories")
     
     return category
 
@@ -218,6 +222,7 @@ async def update_category(
 # Product endpoints
 @router.get("/", response_model=List[ProductResponse])
 async def get_products(
+    response: Response,
     category_id: Optional[int] = Query(None),
     is_available: Optional[bool] = Query(None),
     is_featured: Optional[bool] = Query(None),
@@ -225,30 +230,32 @@ async def get_products(
     tags: Optional[str] = Query(None, description="Comma-separated tags"),
     limit: int = Query(50, le=100),
     offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header"),
     db: AsyncSession = Depends(get_db)
 ):
     """
     Get products with optional filters.
     Optimized for menu display.
+    
+    Pagination is keyset-based on (category_id, name, id): pass the
+    ``X-Next-Cursor`` header of a page as ``cursor`` to get the next one.
+    ``offset`` keeps working. ``X-Total-Count`` carries a cached total.
     """
-    query = select(Product).options(
-        selectinload(Product.category),
-        selectinload(Product.variants)
-    )
+    filters = []
     
     # Apply filters
     if category_id:
-        query = query.where(Product.category_id == category_id)
+        filters.append(Product.category_id == category_id)
     
     if is_available is not None:
-        query = query.where(Product.is_available == is_available)
+        filters.append(Product.is_available == is_available)
     
     if is_featured is not None:
-        query = query.where(Product.is_featured == is_featured)
+        filters.append(Product.is_featured == is_featured)
     
     if search:
         search_term = f"%{search}%"
-        query = query.where(
+        filters.append(
             or_(
                 Product.name.like(search_term),
                 Product.description.like(search_term)
@@ -261,15 +268,41 @@ async def get_products(
         # This would need proper JSON querying in production
         pass
     
-    # Order and paginate
-    query = query.order_by(Product.category_id, Product.name)
-    query = query.offset(offset).limit(limit)
+    query = select(Product).options(
+        selectinload(Product.category),
+        selectinload(Product.variants)
+    ).where(*filters)
+    
+    # Order and paginate; one extra row tells whether another page exists
+    sort_columns = [Product.category_id, Product.name, Product.id]
+    query = query.order_by(*sort_columns).limit(limit + 1)
+    if cursor:
+        try:
+            after = decode_cursor(cursor, len(sort_columns))
+        except InvalidCursor:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+        query = query.where(keyset_after(sort_columns, after))
+    elif offset:
+        query = query.offset(offset)
     
     result = await db.execute(query)
-    products = result.scalars().all()
+    page = page_from_rows(
+        list(result.scalars().all()), limit, lambda p: (p.category_id, p.name, p.id)
+    )
     
-    return 
+    async def count(session: AsyncSession):
+        total_result = await session.execute(select(func.count()).select_from(Product).where(*filters))
+        return total_result.scalar()
     
+    count_key = "count:products:" + make_cache_key(
+        category_id=category_id, is_available=is_available, is_featured=is_featured, search=search
+    )
+    count_tags = ["products"] + ([f"category:{category_id}"] if category_id else [])
+    response.headers["X-Total-Count"] = str(await cached_count(count_key, count, count_tags))
+    if page["next_cursor"]:
+        response.headers["X-Next-Cursor"] = page["next_cursor"]
+    
+    return page["items"]
 
 
 @router.post("/", response_model=ProductResponse, status_code=status.HTTP_201_CREATED)
@@ -315,6 +348,7 @@ async def create_product(
             detail="Error creating product"
         )
     
+    await invalidate_tag("products", "categories", f"category:{new_product.category_id}")
     return new_product
 
 
@@ -375,11 +409,16 @@ async def update_product(
                 detail="Category not found"
             )
     
+    previous_category_id = product.category_id
     for field, value in update_data.items():
         setattr(product, field, value)
     
     await db.commit()
     await db.refresh(product)
+    await invalidate_tag(
+        "products", "categories",
+        f"category:{previous_category_id}", f"category:{product.category_id}"
+    )
     
     return product
 
@@ -405,8 +444,10 @@ async def delete_product(
     # Check if product has active orders
     # TODO: Implement check for active orders
     
+    category_id = product.category_id
     await db.delete(product)
     await db.commit()
+    await invalidate_tag("products", "categories", f"category:{category_id}")
 
 
 # Product variant endpoints
@@ -6,13 +6,14 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, and_, func
 from sqlalchemy.orm import selectinload, joinedload
 from typing import List, Optional
-import json
 import redis.asyncio as redis
 from decimal import Decimal
 import structlog
 
-from core.database import get_db
+from core.database import AsyncSessionLocal, get_db
 from core.config import settings
+from core.cache import invalidate_tags, tiered_cache
+from core.pagination import InvalidCursor, cached_count, decode_cursor, keyset_after, page_from_rows
 from models.product import Product, Category, ProductVariant, Ingredient
 from schemas.product import ProductResponse, CategoryResponse
 
@@ -32,7 +33,6 @@ async def get_redis():
 @router.get("/categories", response_model=List[CategoryResponse])
 async def get_categories(
     include_counts: bool = Query(False, description="Include product counts"),
-    db: AsyncSession = Depends(get_db),
     cache: redis.Redis = Depends(get_redis)
 ):
     """
@@ -41,16 +41,19 @@ async def get_categories(
     """
     cache_key = f"categories:counts:{include_counts}"
     
-    # Try cache first
-    if cache:
-        try:
-            cached = await cache.get(cache_key)
-            if cached:
-                logger.info("Categories served from cache")
-                return json.loads(cached)
-        except Exception as e:
-            logger.warning("Redis cache error", error=str(e))
+    # The loader may run after this request returns (XFetch early refresh) or on
+    # behalf of other callers (single-flight), so it opens its own session
+    async def load():
+        async with AsyncSessionLocal() as db:
+            return await _load_categories(db, include_counts)
     
+    return await tiered_cache.get_or_compute(
+        cache_key, load, 300, tags=["categories"], prefix="categories", client=cache  # 5 minutes
+    )
+
+
+async def _load_categories(db: AsyncSession, include_counts: bool):
+    """Query active categories (cache miss path)"""
     # Query database
     query = select(Category).where(Category.is_active == True).order_by(Category.display_order)
     
@@ -78,13 +81,6 @@ async def get_categories(
         
         response.append(cat_dict)
     
-    # Cache result
-    if cache:
-        try:
-            await cache.setex(cache_key, 300, json.dumps(response))  # 5 minutes
-        except Exception as e:
-            logger.warning("Failed to cache categories", error=str(e))
-    
     return response
 
 
@@ -93,27 +89,48 @@ async def get_category_products(
     category_id: int,
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from a previous page's next_cursor"),
     include_variants: bool = Query(False),
-    db: AsyncSession = Depends(get_db),
     cache: redis.Redis = Depends(get_redis)
 ):
     """
     Get products for a specific category with pagination.
     Implements lazy loading - only loads products when category is selected.
-    """
-    cache_key = f"products:cat:{category_id}:skip:{skip}:limit:{limit}:variants:{include_variants}"
     
-    # Try cache first
-    if cache:
+    Pass ``cursor`` (keyset on name, id) for constant-time deep pages;
+    ``skip`` keeps working for existing clients.
+    """
+    after = None
+    if cursor:
         try:
-            cached = await cache.get(cache_key)
-            if cached:
-                logger.info("Products served from cache", category_id=category_id)
-                return json.loads(cached)
-        except Exception as e:
-            logger.warning("Redis cache error", error=str(e))
+            after = decode_cursor(cursor, 2)
+        except InvalidCursor:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+        skip = 0
+    
+    page_ref = f"cursor:{cursor}" if cursor else f"skip:{skip}"
+    cache_key = f"products:cat:{category_id}:{page_ref}:limit:{limit}:variants:{include_variants}"
+    
+    async def load():
+        async with AsyncSessionLocal() as db:
+            return await _load_category_products(db, category_id, skip, limit, include_variants, after)
     
-    # Build optimized query
+    return await tiered_cache.get_or_compute(
+        cache_key, load, 60,  # 1 minute
+        tags=["products", f"category:{category_id}"], prefix="products:cat", client=cache
+    )
+
+
+async def _load_category_products(
+    db: AsyncSession,
+    category_id: int,
+    skip: int,
+    limit: int,
+    include_variants: bool,
+    after: Optional[list] = None
+):
+    """Query one page of a category (cache miss path)"""
+    # Build optimized query; one extra row tells whether another page exists
     query = (
         select(Product)
         .where(
@@ -122,21 +139,24 @@ async def get_category_products(
                 Product.is_available == True
             )
         )
-        .order_by(Product.name)
-        .offset(skip)
-        .limit(limit)
+        .order_by(Product.name, Product.id)
+        .limit(limit + 1)
     )
+    if after is not None:
+        query = query.where(keyset_after([Product.name, Product.id], after))
+    elif skip:
+        query = query.offset(skip)
     
     # Optionally include variants
     if include_variants:
         query = query.options(selectinload(Product.variants))
     
     result = await db.execute(query)
-    products = result.scalars().all()
+    page = page_from_rows(list(result.scalars().all()), limit, lambda p: (p.name, p.id))
     
     # Format response
     response = []
-    for product in products:
+    for product in page["items"]:
         prod_dict = {
             "id": product.id,
             "name": product.name,
@@ -166,38 +186,36 @@ async def get_category_products(
         
         response.append(prod_dict)
     
-    # Get total count for pagination
-    count_query = select(func.count()).where(
-        and_(
-            Product.category_id == category_id,
-            Product.is_available == True
+    # Total count is cached and dropped with the category's tags
+    async def count(session: AsyncSession):
+        count_query = select(func.count()).where(
+            and_(
+                Product.category_id == category_id,
+                Product.is_available == True
+            )
         )
+        total_result = await session.execute(count_query)
+        return total_result.scalar()
+    
+    total = await cached_count(
+        f"count:products:cat:{category_id}", count, ["products", f"category:{category_id}"]
     )
-    total_result = await db.execute(count_query)
-    total = total_result.scalar()
     
     result_data = {
         "products": response,
         "total": total,
         "skip": skip,
         "limit": limit,
-        "has_more": skip + limit < total
+        "has_more": page["has_more"],
+        "next_cursor": page["next_cursor"]
     }
     
-    # Cache result
-    if cache:
-        try:
-            await cache.setex(cache_key, 60, json.dumps(result_data))  # 1 minute
-        except Exception as e:
-            logger.warning("Failed to cache products", error=str(e))
-    
     return result_data
 
 
 @router.get("/products/featured")
 async def get_featured_products(
     limit: int = Query(10, ge=1, le=20),
-    db: AsyncSession = Depends(get_db),
     cache: redis.Redis = Depends(get_redis)
 ):
     """
@@ -206,16 +224,18 @@ async def get_featured_products(
     """
     cache_key = f"products:featured:{limit}"
     
-    # Try cache first
-    if cache:
-        try:
-            cached = await cache.get(cache_key)
-            if cached:
-                logger.info("Featured products served from cache")
-                return json.loads(cached)
-        except Exception as e:
-            logger.warning("Redis cache error", error=str(e))
+    async def load():
+        async with AsyncSessionLocal() as db:
+            return await _load_featured_products(db, limit)
     
+    return await tiered_cache.get_or_compute(
+        cache_key, load, 600,  # 10 minutes
+        tags=["products", "featured"], prefix="products:featured", client=cache
+    )
+
+
+async def _load_featured_products(db: AsyncSession, limit: int):
+    """Query featured products (cache miss path)"""
     # Query only featured products
     query = (
         select(Product)
@@ -245,13 +265,6 @@ async def get_featured_products(
         for p in products
     ]
     
-    # Cache for longer as featured products change rarely
-    if cache:
-        try:
-            await cache.setex(cache_key, 600, json.dumps(response))  # 10 minutes
-        except Exception as e:
-            logger.warning("Failed to cache featured products", error=str(e))
-    
     return response
 
 
@@ -306,28 +319,35 @@ async def search_products(
     ]
 
 
+@router.get("/cache/stats")
+async def cache_stats():
+    """
+    Per-prefix hit ratios of the two-tier cache in this process.
+    """
+    return tiered_cache.get_stats()
+
+
 @router.post("/cache/clear")
 async def clear_cache(
-    pattern: str = Query("*", description="Cache key pattern to clear"),
+    tag: Optional[str] = Query(
+        None,
+        description="Cache tag to clear (e.g. 'category:5', 'featured'). Clears all product and category entries when omitted."
+    ),
     cache: redis.Redis = Depends(get_redis)
 ):
     """
-    Clear cache for specific pattern.
+    Clear cache entries registered under a tag.
+    Cost is proportional to the entries under the tag, not to the keyspace.
     Admin only endpoint.
     """
     if not cache:
         return {"message": "Cache not configured"}
     
     try:
-        keys = await cache.keys(f"products:{pattern}")
-        if keys:
-            await cache.delete(*keys)
-        
-        keys = await cache.keys(f"categories:{pattern}")
-        if keys:
-            await cache.delete(*keys)
+        tags = [tag] if tag else ["products", "categories"]
+        deleted = await invalidate_tags(cache, *tags)
         
-        return {"message": f"Cleared cache for pattern: {pattern}"}
+        return {"message": f"Cleared cache for tags: {', '.join(tags)}", "deleted": deleted}
     except Exception as e:
         logger.error("Failed to clear cache", error=str(e))
         raise HTTPException(
@@ -9,10 +9,12 @@ import hashlib
 import urllib.request
 import urllib.parse
 import base64
+import binascii
 import ssl
 import os
 import mimetypes
 import time
+import atexit
 from datetime import datetime, date
 import logging
 import traceback
@@ -29,12 +31,39 @@ except ImportError:
     print("ℹ️ python-dotenv no instalado, usando variables de entorno del sistema")
 # from crash_diagnostics import CrashDiagnostics
 try:
-    from scripts.mercadopago_config import create_payment_preference, process_webhook, get_payment_status
+    from scripts.mercadopago_config import create_payment_preference, get_payment_status, fetch_payment
     MERCADOPAGO_AVAILABLE = True
     print("✅ MercadoPago configurado")
 except ImportError as e:
     MERCADOPAGO_AVAILABLE = False
     print(f"⚠️ MercadoPago no disponible: {e}")
+from core.pairing_engine import pairing_engine
+from core.webhook_inbox import WebhookInbox, extract_payment_id
+from core.customer_search import customer_index
+from core.prefork import run_prefork, invalidation_channel
+from core.image_pipeline import ImagePipeline, ImageVariantStore, LocalImageStorage, S3ImageStorage
+from core.schema_bootstrap import SchemaBootstrap, print_report
+from core.catalog import CatalogSnapshot, EMPTY_CATALOG
+from core.prompt_builder import prompt_assembler
+from core.intent_classifier import intent_classifier
+from core.deadlines import (
+    begin_request, end_request, bound_query, note_query_error, current_deadline,
+    deadline_stats, DeadlineExceeded, QueryTimeout
+)
+from core.admission import admission_controller, route_class, RETRY_AFTER
+from core import replica
+from core import product_costs
+from core.metrics import (
+    registry as metrics_registry, HTTP_REQUESTS, HTTP_LATENCY, CACHE_LOOKUPS, CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    observe_llm, route_label, admission_collector, deadline_collector, query_budget_collector, InstrumentedPool
+)
+from core import request_timing
+from core.query_analytics import index_advisor
+from core.change_bus import ChangeBus
+from core.floor_layout import apply_layout_batch, check_batch_settings, SettingsDebouncer, LayoutConflict, LayoutError
+from core.order_export import (
+    OrderExport, ExportError, StreamWriter, FORMATS, write_export, open_export_cursor, close_export_cursor
+)
 # import google.generativeai as genai  # Se importa condicionalmente más abajo
 
 # Usar puerto de Heroku si está disponible, sino usar 9002 para desarrollo local
@@ -45,11 +74,28 @@ GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', None)
 GEMINI_AVAILABLE = False
 genai = None  # Variable global para el módulo
 
+# GEMINI_API_ENDPOINT apunta el SDK a otro host por REST (p. ej. scripts/fake_gemini_server.py en pruebas de carga)
+GEMINI_CONFIG = {'api_key': GEMINI_API_KEY}
+if os.environ.get('GEMINI_API_ENDPOINT'):
+    GEMINI_CONFIG.update(transport='rest', client_options={'api_endpoint': os.environ['GEMINI_API_ENDPOINT']})
+
+
+def gemini_generate(model, prompt, kind):
+    """model.generate_content medido: métricas de LLM por tipo y tiempo de LLM en el Server-Timing del request"""
+    start = time.perf_counter()
+    try:
+        response = model.generate_content(prompt)
+    except Exception:
+        observe_llm(kind, time.perf_counter() - start, ok=False)
+        raise
+    observe_llm(kind, time.perf_counter() - start)
+    return response
+
 # Solo configurar si hay API key disponible
 if GEMINI_API_KEY:
     try:
         import google.generativeai as genai
-        genai.configure(api_key=GEMINI_API_KEY)
+        genai.configure(**GEMINI_CONFIG)
         
         # 🔍 VERIFICAR QUE LA API KEY FUNCIONA
         print(f"🔍 Verificando API Key de Gemini...")
@@ -156,7 +202,18 @@ def setup_logging():
     logger.addHandler(requests_handler)
     logger.addHandler(db_handler)
     logger.addHandler(console_handler)
-    
+
+    # Access log estructurado (una línea JSON por request, core/request_timing.py)
+    access_handler = logging.FileHandler(
+        os.path.join(LOG_DIR, 'access.log'),
+        encoding='utf-8'
+    )
+    access_handler.setFormatter(logging.Formatter('%(message)s'))
+    access_logger = logging.getLogger('gastro.access')
+    access_logger.setLevel(logging.INFO)
+    access_logger.propagate = False
+    access_logger.addHandler(access_handler)
+
     return logger
 
 # Inicializar logging
@@ -262,6 +319,9 @@ def get_mysql_config():
 
 MYSQL_CONFIG = get_mysql_config()
 
+# Réplica de lectura para reportes (None si MYSQL_REPLICA_HOST no está configurado)
+replica_router = replica.ReplicaRouter.from_env(MYSQL_CONFIG)
+
 # Cache simple en memoria (60 segundos)
 cache = {}
 
@@ -272,6 +332,8 @@ restaurant_data_cache = {
     'categories': None,
     'ingredients': None,
     'product_ingredients': None,
+    'products_by_id': {},
+    'catalog': EMPTY_CATALOG,  # Snapshot indexado para el chat (core/catalog.py)
     'last_updated': None,
     'cache_duration': 3600  # 1 hora
 }
@@ -283,6 +345,12 @@ ai_response_cache = {
     'cache_duration': 1800  # 30 minutos
 }
 
+# Bus de cambios: las escrituras emiten (tabla, id) y los cachés de arriba se invalidan por dependencia
+change_bus = ChangeBus(invalidation_channel)
+
+# Mensajes previos que se ofrecen al prompt de intención (el presupuesto de tokens puede recortarlos)
+CHAT_HISTORY_MESSAGES = int(os.environ.get('CHAT_HISTORY_MESSAGES', 6))
+
 # 🧠 SISTEMA DE CONTEXTO PERSISTENTE (como ChatGPT)
 conversation_threads = {
     # 'thread_id': {
@@ -325,13 +393,41 @@ def get_or_create_thread(thread_id):
         conversation_threads[thread_id]['last_activity'] = time.time()
     
     return conversation_threads[thread_id]
-CACHE_TTL = 60  # segundos
+# Red de seguridad para escrituras hechas por fuera del servidor: las propias invalidan por change_bus
+CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', 600))  # segundos
 
 # Pool de conexiones global - Inicializar al arrancar
 connection_pool = None
 pool_recovery_attempts = 0
 MAX_RECOVERY_ATTEMPTS = 3
 
+# Bandeja durable de webhooks de MercadoPago (los workers se inician en __main__)
+webhook_inbox = WebhookInbox(
+    get_connection=lambda: connection_pool.get_connection(),
+    fetch_payment=fetch_payment,
+    workers=int(os.environ.get('MP_WEBHOOK_WORKERS', 4)),
+    batch_size=int(os.environ.get('MP_WEBHOOK_BATCH_SIZE', 20))
+) if MERCADOPAGO_AVAILABLE else None
+
+# Pipeline de variantes de imágenes (WebP/JPEG en varios anchos)
+def create_image_storage():
+    """S3 si está configurado y disponible; si no, disco local servido en /static/products/"""
+    if IMAGE_STORAGE_TYPE == 's3':
+        try:
+            from scripts.s3_upload_handler import s3_handler, S3_BUCKET_NAME
+            return S3ImageStorage(s3_handler.s3_client, S3_BUCKET_NAME, S3_BASE_URL, prefix=IMAGE_BASE_PATH)
+        except Exception as e:
+            print(f"⚠️ S3 no disponible para imágenes ({e}), usando disco local")
+    return LocalImageStorage(PRODUCTS_IMG_DIR, '/static/products')
+
+image_variant_store = ImageVariantStore(get_connection=lambda: connection_pool.get_connection())
+image_pipeline = ImagePipeline(
+    storage=create_image_storage(),
+    variant_store=image_variant_store,
+    workers=int(os.environ.get('IMAGE_PIPELINE_WORKERS', 2)),
+    on_stored=lambda product_id: change_bus.emit('products', product_id)
+)
+
 # Inicializar pool al importar el módulo
 def load_restaurant_data():
     """Cargar todos los datos del restaurante en memoria de una sola vez"""
@@ -472,6 +568,8 @@ def load_restaurant_data():
         # Actualizar caché
         restaurant_data_cache.update({
             'products': products,
+            'products_by_id': {p['id']: p for p in products},
+            'catalog': CatalogSnapshot(products),
             'categories': categories,
             'ingredients': ingredients,
             'ingredients_by_product': ingredients_by_product,
@@ -502,6 +600,73 @@ def get_restaurant_data():
     
     return restaurant_data_cache
 
+def classify_pairing_type(category_name):
+    """Tipo de maridaje según el nombre de la categoría"""
+    category_lower = (category_name or '').lower()
+    if any(word in category_lower for word in ['vino']):
+        return 'wine'
+    if any(word in category_lower for word in ['bebida', 'cerveza', 'jugo', 'agua', 'cocktail', 'café']):
+        return 'beverage'
+    if any(word in category_lower for word in ['entrada', 'ensalada', 'aperitivo']):
+        return 'appetizer'
+    if any(word in category_lower for word in ['postre', 'dulce']):
+        return 'dessert'
+    return 'side'
+
+def find_product_id_by_name(product_name):
+    """Resolver un nombre de producto a su ID usando el caché en memoria"""
+    if not product_name:
+        return None
+    name_lower = product_name.strip().lower()
+    products = get_restaurant_data().get('products') or []
+    partial_match = None
+    for p in products:
+        p_name = (p.get('name') or '').lower()
+        if p_name == name_lower:
+            return p['id']
+        if partial_match is None and name_lower in p_name:
+            partial_match = p['id']
+    return partial_match
+
+def get_basket_pairings(product_id, limit=8):
+    """
+    Maridajes desde el modelo de canasta (pairing_engine): productos que
+    realmente se piden juntos, ordenados por lift. Sin llamadas a la IA.
+    """
+    if product_id is None or not pairing_engine.has_model():
+        return []
+    try:
+        product_id = int(product_id)
+    except (TypeError, ValueError):
+        return []
+
+    products_by_id = get_restaurant_data().get('products_by_id') or {}
+    pairings = []
+    for neighbour in pairing_engine.neighbours(product_id, exclude={product_id}):
+        p = products_by_id.get(neighbour['product_id'])
+        if not p:
+            continue  # Producto no disponible actualmente
+        category_name = p.get('category_name') or ''
+        pairings.append({
+            'id': p['id'],
+            'name': p['name'],
+            'product_id': p['id'],
+            'description': p.get('description') or '',
+            'reason': f"Se pide junto en el {neighbour['confidence'] * 100:.0f}% de los pedidos",
+            'type': classify_pairing_type(category_name),
+            'price': float(p.get('price') or 0),
+            'image_url': p.get('image_url', ''),
+            'category': category_name,
+            'category_name': category_name,
+            'category_id': p.get('category_id'),
+            'lift': neighbour['lift'],
+            'confidence': neighbour['confidence'],
+            'support': neighbour['support'],
+        })
+        if len(pairings) >= limit:
+            break
+    return pairings
+
 def init_pool():
     """Inicializar pool de conexiones con logging detallado"""
     global connection_pool, pool_recovery_attempts
@@ -520,7 +685,8 @@ def init_pool():
         # - pool_size=10: Mantiene 10 conexiones permanentes
         # - Las conexiones se REUTILIZAN automáticamente
         # - IMPORTANTE: Siempre devolver las conexiones al pool
-        connection_pool = mysql.connector.pooling.MySQLConnectionPool(
+        # InstrumentedPool: espera del pool + consultas de cada cursor van a métricas y al Server-Timing
+        connection_pool = InstrumentedPool(mysql.connector.pooling.MySQLConnectionPool(
             pool_name=f"gastro_pool_v{int(time.time())}",  # Nombre único por reinicio
             pool_size=10,  # AUMENTADO: 10 conexiones para manejar más carga
             pool_reset_session=True,  # Resetear sesión para evitar problemas
@@ -533,7 +699,7 @@ def init_pool():
             autocommit=True,
             connect_timeout=20,  # Timeout de conexión aumentado
             raise_on_warnings=False
-        )
+        ))
         
         log_detailed('INFO', 'POOL_SUCCESS', "Pool de conexiones inicializado exitosamente", {
             'pool_name': connection_pool.pool_name,
@@ -599,6 +765,10 @@ def execute_mysql_query_with_recovery(query, params=None, retry_count=0):
     try:
         return execute_mysql_query(query, params)
         
+    except (DeadlineExceeded, request_timing.QueryBudgetExceeded):
+        # Sin reintentos ni fallback: el request ya no tiene tiempo o se pasó de su presupuesto
+        raise
+        
     except Exception as e:
         # ============ NUEVO: DIAGNÓSTICO INTELIGENTE ============
         # Analizar el error con el sistema de diagnósticos
@@ -732,6 +902,7 @@ def execute_fallback_query(query, params=None):
     
     try:
         import mysql.connector
+        query = bound_query(query)
         connection = mysql.connector.connect(**MYSQL_CONFIG, ssl_disabled=False)
         cursor = connection.cursor(dictionary=True)
         
@@ -757,6 +928,46 @@ def execute_fallback_query(query, params=None):
         })
         raise
 
+def execute_read_query(query, params=None):
+    """
+    Consultas de solo lectura (reportes): van a la réplica si está configurada,
+    con lag aceptable y el request no escribió; si no, o si la réplica falla, al primario
+    """
+    if replica_router and replica_router.use_replica():
+        try:
+            return replica_router.execute(query, params)
+        except (DeadlineExceeded, request_timing.QueryBudgetExceeded):
+            raise
+        except Exception as e:
+            logger.warning(f"[REPLICA] Error en réplica, usando primario: {e}")
+    return execute_mysql_query_with_recovery(query, params)
+
+def collect_server_metrics():
+    """Métricas que se leen al hacer scrape: pool MySQL, réplica y caches en memoria"""
+    pool_size = getattr(connection_pool, 'pool_size', 0) if connection_pool else 0
+    # Conexiones libres = las que esperan en la cola interna del pool
+    idle_queue = getattr(connection_pool, '_cnx_queue', None)
+    in_use = pool_size - idle_queue.qsize() if idle_queue is not None else None
+    families = [
+        ('gastro_db_pool_size', 'gauge', 'Tamaño del pool de conexiones MySQL', [({'pool': 'primary'}, pool_size)]),
+        ('gastro_db_pool_in_use', 'gauge', 'Conexiones del pool en uso', [({'pool': 'primary'}, in_use)]),
+        ('gastro_cache_entries', 'gauge', 'Entradas en caches en memoria',
+         [({'cache': 'simple'}, len(cache)), ({'cache': 'ai_pairings'}, len(ai_response_cache['pairings']))]),
+    ]
+    if replica_router:
+        stats = replica_router.get_stats()
+        families.append(('gastro_db_replica_lag_seconds', 'gauge', 'Atraso de la réplica de lectura',
+                         [({}, stats['lag_seconds'])]))
+        families.append(('gastro_db_replica_reads_total', 'counter', 'Lecturas de reportes por destino',
+                         [({'target': target}, count) for target, count in stats['reads'].items()]))
+    return families
+
+metrics_registry.register_collector(collect_server_metrics)
+metrics_registry.register_collector(deadline_collector(deadline_stats))
+metrics_registry.register_collector(query_budget_collector(request_timing.budget_stats))
+if admission_controller:
+    metrics_registry.register_collector(admission_collector(admission_controller))
+
 # Pool se inicializa en el main, no aquí
 # success = init_pool()
 # if not success:
@@ -764,15 +975,28 @@ def execute_fallback_query(query, params=None):
 
 def get_from_cache(key):
     """Obtener de cache si no está expirado"""
-    if key in cache:
-        data, timestamp = cache[key]
-        if time.time() - timestamp < CACHE_TTL:
-            return data
+    entry = get_cache_entry(key)
+    return entry[0] if entry else None
+
+def get_cache_entry(key):
+    """(datos, timestamp, hash del contenido) si la entrada no está expirada"""
+    entry = cache.get(key)
+    if entry and time.time() - entry[1] < CACHE_TTL:
+        CACHE_LOOKUPS.labels('simple', 'hit').inc()
+        return entry
+    CACHE_LOOKUPS.labels('simple', 'miss').inc()
     return None
 
+def content_digest(data):
+    """Hash estable de una respuesta (entra en su ETag)"""
+    body = json.dumps(data, cls=DecimalEncoder, sort_keys=True)
+    return hashlib.sha1(body.encode()).hexdigest()[:16]
+
 def set_cache(key, data):
-    """Guardar en cache"""
-    cache[key] = (data, time.time())
+    """Guardar en cache junto con el hash del contenido"""
+    digest = content_digest(data)
+    cache[key] = (data, time.time(), digest)
+    return digest
 
 def execute_mysql_query(query, params=None):
     """Ejecutar consulta MySQL con pool de conexiones - CON LOGGING SÚPER DETALLADO"""
@@ -783,6 +1007,11 @@ def execute_mysql_query(query, params=None):
     cursor = None
     operation_id = f"db_{int(time.time() * 1000)}"
     
+    # Límite de tiempo del request actual (MAX_EXECUTION_TIME); si ya no queda, no se pide conexión
+    query = bound_query(query)
+    # Read-your-writes: si el request escribe, sus lecturas siguientes no van a la réplica
+    replica.note_statement(query)
+    
     # Log de inicio súper detallado
     log_detailed('DEBUG', 'DATABASE_START', f"Iniciando query {operation_id}", {
         'query_preview': query[:150] + '...' if len(query) > 150 else query,
@@ -832,6 +1061,8 @@ def execute_mysql_query(query, params=None):
                     'error_type': type(direct_error).__name__,
                     'traceback': traceback.format_exc()
                 })
+                if note_query_error(direct_error):
+                    raise QueryTimeout(str(direct_error)) from direct_error
                 raise
         
         # Usar pool de conexiones (mucho más rápido)
@@ -858,6 +1089,7 @@ def execute_mysql_query(query, params=None):
                 'cursor_id': id(cursor)
             })
             
+            # El cursor del pool instrumentado registra latencia y conteo de la consulta
             if params:
                 cursor.execute(query, params)
             else:
@@ -881,6 +1113,9 @@ def execute_mysql_query(query, params=None):
                 'operation_id': operation_id,
                 'error_type': type(e).__name__
             })
+            # Consulta abortada por MAX_EXECUTION_TIME: la conexión sigue sana y vuelve al pool en el finally
+            if note_query_error(e):
+                raise QueryTimeout(str(e)) from e
             raise
         
         finally:
@@ -926,21 +1161,13 @@ def execute_mysql_query(query, params=None):
                 print("FALTA INSTALAR: mysql-connector-python o pymysql")
                 return None
             
+    except (DeadlineExceeded, request_timing.QueryBudgetExceeded):
+        raise
+            
     except Exception as e:
         print(f"Error conectando a MySQL: {e}")
         return None
 
-# Cache para mejorar performance
-CACHE = {
-    'categories': None,
-    'categories_time': None,
-    'products': {},
-    'tables': None,
-    'tables_time': None
-}
-
-CACHE_DURATION = 60  # segundos
-
 class DecimalEncoder(json.JSONEncoder):
     def default(self, obj):
         if isinstance(obj, Decimal):
@@ -953,17 +1180,225 @@ class DecimalEncoder(json.JSONEncoder):
 
 def get_cached_or_fetch(cache_key, fetch_func, *args):
     """Helper para manejar cache usando el nuevo sistema"""
-    cached_data = get_from_cache(cache_key)
-    if cached_data:
-        return cached_data
+    return get_cached_response(cache_key, fetch_func, *args)[0]
+
+def get_cached_response(cache_key, fetch_func, *args):
+    """
+    (datos, hash del contenido) de una respuesta cacheada. El hash entra en el
+    ETag: una escritura hecha por fuera de este servidor no pasa por change_bus,
+    pero cambia el ETag en cuanto la entrada se vuelve a armar (CACHE_TTL).
+    """
+    entry = get_cache_entry(cache_key)
+    if entry and entry[0]:
+        return entry[0], entry[2]
     
     result = fetch_func(*args)
-    set_cache(cache_key, result)
-    return result
+    return result, set_cache(cache_key, result)
+
+# ============================================================
+# REGLAS DE INVALIDACIÓN (core/change_bus.py): tabla -> cachés que dependen de ella
+# ============================================================
+
+# Tablas de las que depende cada respuesta cacheada (también arman su ETag)
+RESPONSE_DEPENDENCIES = {
+    'categories': ('categories',),
+    'products': ('products', 'categories', 'subcategories'),
+    'tables': ('tables', 'floor_layout'),
+}
+
+def drop_response_cache(prefix):
+    for key in [key for key in list(cache) if key.startswith(prefix)]:
+        cache.pop(key, None)
+
+@change_bus.depends('response:categories', RESPONSE_DEPENDENCIES['categories'])
+def invalidate_categories_response(event):
+    drop_response_cache('categories')
+
+@change_bus.depends('response:products', RESPONSE_DEPENDENCIES['products'])
+def invalidate_products_response(event):
+    drop_response_cache('products_')
+
+@change_bus.depends('response:tables', RESPONSE_DEPENDENCIES['tables'])
+def invalidate_tables_response(event):
+    drop_response_cache('tables')
+
+@change_bus.depends('restaurant_data', ('products', 'categories', 'subcategories', 'ingredients', 'product_ingredients'))
+def invalidate_restaurant_data(event):
+    # Se recarga completo en el próximo get_restaurant_data()
+    restaurant_data_cache['last_updated'] = None
+
+@change_bus.depends('ai_responses', ('products', 'categories', 'ingredients', 'product_ingredients'))
+def invalidate_ai_responses(event):
+    ai_response_cache['pairings'].clear()
+    ai_response_cache['recommendations'].clear()
+
+@change_bus.depends('customer_index', ('customers',))
+def refresh_customer_index(event):
+    if event.get('id') is None or not customer_index.is_ready():
+        return
+    rows = execute_mysql_query(
+        "SELECT id, first_name, last_name, email, phone, company_id, is_active FROM customers WHERE id = %s",
+        (event['id'],)
+    )
+    if rows:
+        customer_index.upsert(rows[0])
+
+# ============================================================
+# PLANO DEL SALÓN (core/floor_layout.py): lotes de posiciones + autosave con debounce
+# ============================================================
+
+def write_area_settings(area_id, settings, company_id=1):
+    """Guardar la configuración de un área en MySQL"""
+    query = """
+    INSERT INTO area_settings 
+    (area_id, company_id, final_x_position, final_y_position, zoom_level, 
+     grid_size, show_grid, background_color)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+    final_x_position = VALUES(final_x_position),
+    final_y_position = VALUES(final_y_position),
+    zoom_level = VALUES(zoom_level),
+    grid_size = VALUES(grid_size),
+    show_grid = VALUES(show_grid),
+    background_color = VALUES(background_color),
+    updated_at = CURRENT_TIMESTAMP
+    """
+    
+    params = (
+        area_id, company_id,
+        settings.get('final_x_position', 0),
+        settings.get('final_y_position', 0),
+        settings.get('zoom_level', 1.0),
+        settings.get('grid_size', 20),
+        settings.get('show_grid', True),
+        settings.get('background_color', '#F3F4F6')
+    )
+    
+    if execute_mysql_query_with_recovery(query, params) is None:
+        raise Exception("No se puede guardar la configuración del área en la base de datos")
+
+def write_map_settings(settings, company_id=1):
+    """Guardar la configuración general del mapa en MySQL"""
+    query = """
+    INSERT INTO map_settings 
+    (company_id, map_x_position, map_y_position, global_zoom,
+     grid_enabled, snap_to_grid, grid_color, canvas_width, canvas_height, auto_save)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+    map_x_position = VALUES(map_x_position),
+    map_y_position = VALUES(map_y_position),
+    global_zoom = VALUES(global_zoom),
+    grid_enabled = VALUES(grid_enabled),
+    snap_to_grid = VALUES(snap_to_grid),
+    grid_color = VALUES(grid_color),
+    canvas_width = VALUES(canvas_width),
+    canvas_height = VALUES(canvas_height),
+    auto_save = VALUES(auto_save),
+    updated_at = CURRENT_TIMESTAMP
+    """
+    
+    params = (
+        company_id,
+        settings.get('map_x_position', 0),
+        settings.get('map_y_position', 0),
+        settings.get('global_zoom', 1.0),
+        settings.get('grid_enabled', True),
+        settings.get('snap_to_grid', True),
+        settings.get('grid_color', '#E5E7EB'),
+        settings.get('canvas_width', 1200),
+        settings.get('canvas_height', 800),
+        settings.get('auto_save', True)
+    )
+    
+    if execute_mysql_query_with_recovery(query, params) is None:
+        raise Exception("No se puede guardar la configuración del mapa en la base de datos")
+
+def write_layout_settings(key, settings):
+    # Claves del debouncer: ('area', area_id, company_id) o ('map', company_id)
+    if key[0] == 'area':
+        write_area_settings(key[1], settings, key[2])
+    else:
+        write_map_settings(settings, key[1])
+
+# El editor guarda zoom/posición en cada movimiento: se escribe una vez cuando deja de mandar cambios
+layout_autosave = SettingsDebouncer(
+    write_layout_settings,
+    delay=float(os.environ.get('LAYOUT_AUTOSAVE_DELAY', 1.5)),
+    max_delay=float(os.environ.get('LAYOUT_AUTOSAVE_MAX_DELAY', 10))
+)
+atexit.register(layout_autosave.flush)
 
 class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
+    def parse_request(self):
+        """
+        Abrir el deadline del request según su ruta (core/deadlines.py) y pasar
+        por el control de admisión (core/admission.py). Si la clase del request
+        no consigue lugar a tiempo se responde 503 con Retry-After y el handler
+        no se ejecuta.
+        """
+        self._request_started = time.perf_counter()
+        if not super().parse_request():
+            return False
+        path = urlparse(self.path).path
+        self._deadline = begin_request(self.command, path)
+        self._timing = request_timing.begin(self.command, path)
+        replica.reset_request()
+        
+        klass = route_class(self.command, path) if admission_controller else None
+        if klass and not admission_controller.acquire(klass, max_wait=self._deadline.remaining()):
+            logger.warning(f"[ADMISSION] Rechazado {self.command} {path} ({klass}): sin lugar")
+            self.send_response(503)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Retry-After', str(RETRY_AFTER[klass]))
+            self.end_headers()
+            self.wfile.write(json.dumps({'error': 'Servidor ocupado, reintentá en unos segundos'}).encode())
+            return False
+        self._admission_class = klass
+        return True
+    
+    def handle_one_request(self):
+        """Cada request corre con su presupuesto; al terminar se registran las métricas de la ruta"""
+        self._deadline = None
+        self._timing = None
+        self._admission_class = None
+        self._request_started = None
+        self._status = None
+        try:
+            super().handle_one_request()
+        except DeadlineExceeded as e:
+            logger.warning(f"[DEADLINE] {e}")
+            self.send_error_response(504, 'Tiempo de respuesta agotado')
+        except request_timing.QueryBudgetExceeded as e:
+            # Modo estricto (QUERY_BUDGET_STRICT=1): un N+1 hace fallar el request en vez de pasar desapercibido
+            logger.error(f"[TIMING] {e}")
+            self.send_error_response(500, f'Presupuesto de consultas superado: {e}')
+        finally:
+            if self._admission_class:
+                admission_controller.release(self._admission_class)
+                self._admission_class = None
+            end_request(self._deadline)
+            self._deadline = None
+            if self._request_started is not None and self._status is not None:
+                route = route_label(urlparse(self.path).path)
+                HTTP_REQUESTS.labels(self.command, route, self._status).inc()
+                HTTP_LATENCY.labels(self.command, route).observe(time.perf_counter() - self._request_started)
+            if self._timing is not None:
+                # Access log estructurado: una línea JSON por request con el desglose de tiempos
+                fields = request_timing.end(self._timing, self._status, method=self.command,
+                                            path=urlparse(self.path).path, worker=os.getpid())
+                request_timing.access_logger.info(json.dumps(fields))
+                self._timing = None
+    
+    def send_response(self, code, message=None):
+        """Guardar el código para las métricas del request"""
+        self._status = code
+        super().send_response(code, message)
+    
     def end_headers(self):
-        """Add CORS headers"""
+        """Add CORS headers + Server-Timing (consultas, DB, LLM y serialización del request)"""
+        timing = getattr(self, '_timing', None)
+        if timing is not None:
+            self.send_header('Server-Timing', timing.server_timing())
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, PUT, DELETE, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
@@ -998,6 +1433,60 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                 'database': 'MySQL Aiven'
             })
             return
+        
+        # Métricas en formato Prometheus (rutas, pool, consultas, caches, Gemini)
+        elif path == '/metrics':
+            body = metrics_registry.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', METRICS_CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        
+        # Métricas de prompts de IA: tamaño y latencia de Gemini por tipo de intent
+        elif path == '/api/ai/stats':
+            self.send_json_response(prompt_assembler.get_stats())
+            return
+        
+        # Clasificador local de intención: fracción de turnos resueltos sin IA y latencias
+        elif path == '/api/ai/intent-stats':
+            self.send_json_response(intent_classifier.get_stats())
+            return
+        
+        # Presupuestos de tiempo por ruta: requests, consultas abortadas y percentiles
+        elif path == '/api/db/deadlines':
+            self.send_json_response(deadline_stats.get_stats())
+            return
+        
+        # Presupuestos de consultas por ruta: promedio, máximo y requests que los superaron (N+1)
+        elif path == '/api/db/query-budgets':
+            self.send_json_response(request_timing.budget_stats.get_stats())
+            return
+        
+        # Consultas más pesadas por fingerprint con su último EXPLAIN y los índices sugeridos
+        elif path == '/api/db/slow-queries':
+            try:
+                limit = int(query.get('limit', ['20'])[0])
+            except ValueError:
+                limit = 20
+            self.send_json_response(index_advisor.get_report(limit, query.get('order', ['total'])[0]))
+            return
+        
+        # Réplica de lectura: estado, lag y destino de las lecturas de reportes
+        elif path == '/api/db/replica':
+            self.send_json_response(replica_router.get_stats() if replica_router else {'enabled': False})
+            return
+        
+        # Bus de cambios: eventos por tabla e invalidaciones por caché
+        elif path == '/api/cache/changes':
+            self.send_json_response(change_bus.get_stats())
+            return
+        
+        # Control de admisión: requests en curso, en cola y rechazados por clase de prioridad
+        elif path == '/api/admission':
+            self.send_json_response(admission_controller.get_stats() if admission_controller else {'enabled': False})
+            return
             
         # Crear tabla kitchen_queue_items
         elif path == '/api/create-kitchen-table':
@@ -1138,8 +1627,11 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
         # Categorías
         elif path in ['/api/categories', '/api/v1/products/categories']:
             try:
-                categories = get_cached_or_fetch('categories', self.get_categories_data)
-                self.send_json_response(categories)
+                categories, digest = get_cached_response('categories', self.get_categories_data)
+                etag = change_bus.etag(RESPONSE_DEPENDENCIES['categories'], content=digest)
+                if self.not_modified(etag):
+                    return
+                self.send_json_response(categories, etag=etag)
             except Exception as e:
                 import traceback
                 error_details = {
@@ -1167,14 +1659,11 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                 
                 # Intentar obtener de cache primero
                 cache_key = f"products_{category_id}_{subcategory_id}"
-                cached_data = get_from_cache(cache_key)
-                
-                if cached_data:
-                    self.send_json_response(cached_data)
-                else:
-                    products = self.get_products_data(category_id, subcategory_id)
-                    set_cache(cache_key, products)  # Guardar en cache
-                    self.send_json_response(products)
+                products, digest = get_cached_response(cache_key, self.get_products_data, category_id, subcategory_id)
+                etag = change_bus.etag(RESPONSE_DEPENDENCIES['products'], cache_key, content=digest)
+                if self.not_modified(etag):
+                    return
+                self.send_json_response(products, etag=etag)
             except Exception as e:
                 self.send_error_response(503, f"Error de base de datos: {str(e)}")
             
@@ -1241,6 +1730,24 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                 print(f"Error en proxy de imagen: {str(e)}")
                 self.send_error(500)
         
+        # Estado/mapa de variantes de la imagen de un producto
+        elif path.startswith('/api/products/') and path.endswith('/image'):
+            try:
+                product_id = int(path.split('/')[3])
+                job = image_pipeline.get_job(product_id)
+                variants = image_variant_store.get(product_id)
+                if job is None and variants is None:
+                    self.send_error_response(404, "El producto no tiene variantes de imagen")
+                else:
+                    self.send_json_response({
+                        'product_id': product_id,
+                        'status': job['status'] if job else 'done',
+                        'error': job.get('error') if job else None,
+                        'variants': variants
+                    })
+            except ValueError:
+                self.send_error_response(400, "ID de producto inválido")
+        
         # Producto individual
         elif path.startswith('/api/products/') and path != '/api/products/upload':
             try:
@@ -1255,8 +1762,11 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                 
         # Mesas
         elif path == '/api/tables':
-            tables = get_cached_or_fetch('tables', self.get_tables_data)
-            self.send_json_response(tables)
+            tables, digest = get_cached_response('tables', self.get_tables_data)
+            etag = change_bus.etag(RESPONSE_DEPENDENCIES['tables'], content=digest)
+            if self.not_modified(etag):
+                return
+            self.send_json_response(tables, etag=etag)
         
         # Objetos decorativos del restaurante
         elif path == '/api/decorative-objects':
@@ -1266,23 +1776,6 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                 connection = connection_pool.get_connection()
                 cursor = connection.cursor(dictionary=True)
                 
-                # Primero crear tabla si no existe
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS decorative_objects (
-                        id VARCHAR(50) PRIMARY KEY,
-                        type VARCHAR(50) NOT NULL,
-                        x INT NOT NULL DEFAULT 0,
-                        y INT NOT NULL DEFAULT 0,
-                        width INT NOT NULL DEFAULT 50,
-                        height INT NOT NULL DEFAULT 50,
-                        rotation INT NOT NULL DEFAULT 0,
-                        locked BOOLEAN DEFAULT FALSE,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
-                    )
-                """)
-                connection.commit()
-                
                 cursor.execute("SELECT * FROM decorative_objects ORDER BY y, x")
                 objects = cursor.fetchall()
                 self.send_json_response(objects)
@@ -1302,20 +1795,6 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                 connection = connection_pool.get_connection()
                 cursor = connection.cursor(dictionary=True)
                 
-                # Crear tabla si no existe
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS restaurant_layouts (
-                        id INT AUTO_INCREMENT PRIMARY KEY,
-                        name VARCHAR(100) NOT NULL,
-                        description TEXT,
-                        layout_data JSON,
-                        is_active BOOLEAN DEFAULT FALSE,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
-                    )
-                """)
-                connection.commit()
-                
                 cursor.execute("SELECT * FROM restaurant_layouts ORDER BY is_active DESC, created_at DESC")
                 layouts = cursor.fetchall()
                 self.send_json_response(layouts)
@@ -1420,31 +1899,32 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                 cursor.execute(query)
                 rows = cursor.fetchall()
                 
-                orders = []
-                for row in rows:
-                    order_id = row[0]
-                    
-                    # Obtener items de cada orden
-                    items_query = """
-                    SELECT oi.id, oi.product_id, oi.quantity, oi.price, oi.notes,
+                # Items de todas las órdenes en una sola consulta (antes era una por orden: N+1)
+                items_by_order = {}
+                if rows:
+                    placeholders = ', '.join(['%s'] * len(rows))
+                    items_query = f"""
+                    SELECT oi.order_id, oi.id, oi.product_id, oi.quantity, oi.price, oi.notes,
                            p.name as product_name
                     FROM order_items oi
                     LEFT JOIN products p ON oi.product_id = p.id
-                    WHERE oi.order_id = %s
+                    WHERE oi.order_id IN ({placeholders})
+                    ORDER BY oi.order_id, oi.id
                     """
-                    cursor.execute(items_query, (order_id,))
-                    items_rows = cursor.fetchall()
-                    
-                    items = []
-                    for item_row in items_rows:
-                        items.append({
-                            'id': item_row[0],
-                            'product_id': item_row[1],
-                            'product_name': item_row[5],
-                            'quantity': item_row[2],
-                            'price': float(item_row[3]) if item_row[3] else 0,
-                            'notes': item_row[4]
+                    cursor.execute(items_query, [row[0] for row in rows])
+                    for item_row in cursor.fetchall():
+                        items_by_order.setdefault(item_row[0], []).append({
+                            'id': item_row[1],
+                            'product_id': item_row[2],
+                            'product_name': item_row[6],
+                            'quantity': item_row[3],
+                            'price': float(item_row[4]) if item_row[4] else 0,
+                            'notes': item_row[5]
                         })
+                
+                orders = []
+                for row in rows:
+                    items = items_by_order.get(row[0], [])
                     
                     orders.append({
                         'id': row[0],
@@ -1776,6 +2256,10 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                 logger.error(f"Error obteniendo KPIs de rendimiento: {e}")
                 self.send_error_response(500, str(e))
         
+        # Exportación de pedidos e items en streaming (CSV/NDJSON, gzip opcional)
+        elif path == '/api/exports/orders':
+            self.stream_orders_export(query)
+        
         # Debug: Análisis de estructura de BD
         elif path == '/api/debug/database-structure':
             try:
@@ -2150,8 +2634,8 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
         # Obtener costos de ingredientes por producto
         elif path == '/api/ingredients/product-costs':
             try:
-                query = "SELECT * FROM v_product_ingredients_cost ORDER BY total_ingredient_cost DESC"
-                costs = execute_mysql_query_with_recovery(query)
+                # Totales guardados en products por core/product_costs.py (sin agrupar product_ingredients)
+                costs = execute_mysql_query_with_recovery(product_costs.PRODUCT_COSTS_QUERY)
                 self.send_json_response(costs or [])
             except Exception as e:
                 logger.error(f"Error obteniendo costos por producto: {e}")
@@ -2194,6 +2678,14 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                 
         elif path == '/api/auth/logout':
             self.send_json_response({'success': True, 'message': 'Logged out'})
+        
+        # Correr ya el EXPLAIN de las consultas más pesadas (además del análisis periódico)
+        elif path == '/api/db/slow-queries/analyze':
+            try:
+                reports = index_advisor.analyze(execute_mysql_query)
+                self.send_json_response({'analyzed': len(reports), **index_advisor.get_report()})
+            except Exception as e:
+                self.send_error_response(500, str(e))
             
         elif path == '/api/orders':
             content_length = int(self.headers.get('Content-Length', 0))
@@ -2295,8 +2787,7 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                     # Obtener el ID de la mesa creada
                     table_id = cursor.lastrowid
                     
-                    # Limpiar caché
-                    CACHE['tables'] = None
+                    change_bus.emit('tables', table_id)
                     
                     self.send_json_response({
                         'success': True,
@@ -2328,22 +2819,6 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                     connection = connection_pool.get_connection()
                     cursor = connection.cursor()
                     
-                    # Crear tabla si no existe
-                    cursor.execute("""
-                        CREATE TABLE IF NOT EXISTS decorative_objects (
-                            id VARCHAR(50) PRIMARY KEY,
-                            type VARCHAR(50) NOT NULL,
-                            x INT NOT NULL DEFAULT 0,
-                            y INT NOT NULL DEFAULT 0,
-                            width INT NOT NULL DEFAULT 50,
-                            height INT NOT NULL DEFAULT 50,
-                            rotation INT NOT NULL DEFAULT 0,
-                            locked BOOLEAN DEFAULT FALSE,
-                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
-                        )
-                    """)
-                    
                     # Insertar o actualizar objeto
                     query = """
                         INSERT INTO decorative_objects (id, type, x, y, width, height, rotation, locked)
@@ -2393,19 +2868,6 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                     connection = connection_pool.get_connection()
                     cursor = connection.cursor()
                     
-                    # Crear tabla si no existe
-                    cursor.execute("""
-                        CREATE TABLE IF NOT EXISTS restaurant_layouts (
-                            id INT AUTO_INCREMENT PRIMARY KEY,
-                            name VARCHAR(100) NOT NULL,
-                            description TEXT,
-                            layout_data JSON,
-                            is_active BOOLEAN DEFAULT FALSE,
-                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
-                        )
-                    """)
-                    
                     # Guardar layout
                     layout_data_json = json.dumps(data.get('layout_data', {}))
                     
@@ -2501,6 +2963,7 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                     connection.commit()
                     
                     ingredient_id = cursor.lastrowid
+                    change_bus.emit('ingredients', ingredient_id)
                     
                     # Agregar alérgenos si se proporcionan
                     if data.get('allergen_ids'):
@@ -2530,6 +2993,47 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                 logger.error(f"Error creando ingrediente: {e}")
                 self.send_error_response(500, str(e))
         
+        # Subir foto de producto: se responde enseguida y las variantes se generan en segundo plano
+        elif path.startswith('/api/products/') and path.endswith('/image'):
+            try:
+                product_id = int(path.split('/')[3])
+                content_length = int(self.headers.get('Content-Length', 0))
+                max_bytes = int(float(os.environ.get('IMAGE_MAX_UPLOAD_MB', 15)) * 1024 * 1024)
+                if content_length <= 0 or content_length > max_bytes * 4 // 3 + 1024:
+                    self.send_error_response(413, f"Imagen vacía o mayor a {max_bytes // (1024 * 1024)}MB")
+                    return
+                body = self.rfile.read(content_length)
+                
+                # Acepta bytes crudos (Content-Type: image/*) o JSON {"image": "data:image/...;base64,..."}
+                if self.headers.get('Content-Type', '').startswith('image/'):
+                    image_bytes = body
+                else:
+                    image_data = json.loads(body).get('image', '')
+                    if 'base64,' in image_data:
+                        image_data = image_data.split('base64,', 1)[1]
+                    image_bytes = base64.b64decode(image_data)
+                
+                product = execute_mysql_query("SELECT id, name FROM products WHERE id = %s", (product_id,))
+                if not product:
+                    self.send_error_response(404, "Producto no encontrado")
+                    return
+                
+                job = image_pipeline.submit(product_id, product[0]['name'], image_bytes)
+                self.send_json_response({
+                    'product_id': product_id,
+                    'status': job['status'],
+                    'hash': job['hash'],
+                    'variants': job.get('variants'),
+                    'status_url': f"/api/products/{product_id}/image"
+                }, 202 if job['status'] == 'processing' else 200)
+            except (ValueError, binascii.Error) as e:
+                self.send_error_response(400, f"Imagen inválida: {e}")
+            except RuntimeError as e:
+                self.send_error_response(503, str(e))
+            except Exception as e:
+                logger.error(f"Error subiendo imagen de producto: {e}")
+                self.send_error_response(500, str(e))
+        
         # Agregar ingrediente a producto específico
         elif path.startswith('/api/products/') and path.endswith('/ingredients'):
             try:
@@ -2558,6 +3062,9 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                         self.send_error_response(409, "El ingrediente ya está asignado a este producto")
                         return
                     
+                    # El pool está en autocommit: la relación y el costo del producto van en una transacción
+                    connection.start_transaction()
+                    
                     # Insertar nueva relación producto-ingrediente
                     query = """
                     INSERT INTO product_ingredients (
@@ -2579,9 +3086,11 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                     )
                     
                     cursor.execute(query, values)
-                    connection.commit()
-                    
                     relation_id = cursor.lastrowid
+                    # La contribución sale del precio del ingrediente; el total del producto se actualiza acá
+                    product_costs.on_recipe_changed(cursor, product_id)
+                    connection.commit()
+                    change_bus.emit('product_ingredients', product_id)
                     
                     self.send_json_response({
                         'success': True,
@@ -2644,7 +3153,8 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                 self.send_error_response(500, str(e))
         
         elif path == '/api/webhooks/mercadopago':
-            # Procesar webhook de MercadoPago
+            # Webhook de MercadoPago: solo se persiste el evento y se responde al instante.
+            # El estado del pago se consulta y aplica en segundo plano (webhook_inbox).
             if not MERCADOPAGO_AVAILABLE:
                 self.send_response(200)
                 self.end_headers()
@@ -2654,26 +3164,27 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
             post_data = self.rfile.read(content_length)
             
             try:
-                data = json.loads(post_data)
-                print(f"🔔 Webhook recibido de MercadoPago: {data.get('type')}")
-                
-                # Procesar el webhook
-                result = process_webhook(data)
-                
-                if result:
-                    # Actualizar el estado de la orden en la base de datos
-                    if result.get('status') == 'approved':
-                        order_id = result.get('external_reference')
-                        print(f"✅ Pago aprobado para orden #{order_id}")
-                        # TODO: Actualizar estado de pago en la BD
-                    
-                # Siempre responder 200 OK a MercadoPago
+                data = json.loads(post_data) if post_data else {}
+            except json.JSONDecodeError:
+                data = {}
+            
+            payment_id = extract_payment_id(data, parse_qs(urlparse(self.path).query))
+            if not payment_id:
+                # Notificaciones que no son de pagos: nada que hacer
                 self.send_response(200)
                 self.end_headers()
-            except Exception as e:
-                print(f"❌ Error procesando webhook: {str(e)}")
+                return
+            
+            try:
+                is_new = webhook_inbox.enqueue(payment_id, 'payment', data)
+                print(f"🔔 Webhook MercadoPago pago {payment_id} {'encolado' if is_new else '(re-entrega)'}")
                 self.send_response(200)
                 self.end_headers()
+            except Exception as e:
+                # Sin persistir no hay garantía: pedir a MercadoPago que reintente
+                logger.error(f"Error guardando webhook de MercadoPago {payment_id}: {e}")
+                self.send_response(503)
+                self.end_headers()
         
         elif path == '/api/chat/menu-ai':
             # 🧠 SISTEMA DE CONTEXTO PERSISTENTE (como ChatGPT)
@@ -2706,7 +3217,7 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                             'status': 'context_ready',
                             'stats': {
                                 'products_loaded': len(restaurant_data.get('products', [])),
-                                'categories_loaded': len(set([p['category_name'] for p in restaurant_data.get('products', []) if p['category_name']])),
+                                'categories_loaded': len(restaurant_data['catalog'].category_names),
                                 'ingredients_loaded': len(restaurant_data.get('ingredients_by_product', {}))
                             }
                         })
@@ -2714,6 +3225,7 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                 
                 # 🤖 PASO 2: AI INTERPRETA CON CONTEXTO PERSISTENTE
                 products_data = thread['restaurant_data'].get('products', [])
+                catalog = thread['restaurant_data']['catalog']
                 user_intent = self.interpret_user_intent_with_ai_persistent(user_message, thread_id, context)
                 
                 # 🎯 PASO 3: EJECUTAR ACCIÓN SEGÚN LA INTENCIÓN INTERPRETADA
@@ -2775,7 +3287,8 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                     
                     # Obtener maridajes reales de la BD usando IA controlada
                     pairing_response, pairing_products = self.generate_pairings_response_with_ai(
-                        user_message, product['name'], product['category_name'], products_data
+                        user_message, product['name'], product['category_name'], products_data,
+                        product_id=product.get('id')
                     )
                     
                     send_response_with_thread({
@@ -2834,7 +3347,7 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                     print(f"🔍 DEBUG: Mensaje del usuario: '{user_message}'")
                     
                     recommendation_response, recommendation_products = self.generate_intelligent_recommendations(
-                        user_message, products_data, thread_id
+                        user_message, catalog, thread_id
                     )
                     
                     print(f"🔍 DEBUG: Categorías devueltas: {list(recommendation_products.keys())}")
@@ -2853,14 +3366,10 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                     # Usuario hace una pregunta general sobre productos (ej: "tenés pastas?", "hay alguna pastita rica?")
                     print(f"\n🔍 GENERAL INQUIRY: Buscando productos relevantes para: '{user_message}'")
                     
-                    # Usar IA para entender qué categoría o tipo de producto busca
-                    categories_list = list(set([p['category_name'] for p in products_data if p.get('category_name')]))
-                    
                     # Buscar productos relevantes usando IA
                     relevant_products = self.find_relevant_products_with_ai(
                         user_message, 
-                        products_data,
-                        categories_list,
+                        catalog,
                         thread_id
                     )
                     
@@ -2955,7 +3464,7 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                 category = data.get('category', '')
                 
                 # Generar maridajes inteligentes con IA (usa caché internamente)
-                pairings = self.generate_ai_pairings(product_name, category)
+                pairings = self.generate_ai_pairings(product_name, category, product_id)
                 
                 # Obtener ingredientes desde caché
                 ingredients = []
@@ -3042,7 +3551,7 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                 """
                 
                 # Generar respuesta
-                response = model.generate_content(prompt)
+                response = gemini_generate(model, prompt, 'chat')
                 
                 # Buscar productos mencionados en la respuesta para enviar imágenes
                 mentioned_products = []
@@ -3070,43 +3579,6 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                     'error': str(e)
                 })
         
-        elif path == '/api/webhooks/mercadopago':
-            # Webhook de MercadoPago para notificaciones de pago
-            content_length = int(self.headers.get('Content-Length', 0))
-            post_data = self.rfile.read(content_length)
-            
-            try:
-                data = json.loads(post_data)
-                logger.info(f"Webhook MercadoPago recibido: {data}")
-                
-                # Procesar webhook
-                payment_info = process_webhook(data)
-                
-                if payment_info:
-                    # Actualizar el estado de la orden en la BD
-                    order_id = payment_info.get('external_reference')
-                    payment_status = payment_info.get('status')
-                    
-                    if order_id and payment_status == 'approved':
-                        # Actualizar orden como pagada
-                        query = """
-                        UPDATE orders 
-                        SET payment_status = 'paid',
-                            payment_method = 'mercadopago',
-                            payment_id = %s,
-                            updated_at = NOW()
-                        WHERE id = %s
-                        """
-                        execute_mysql_query_with_recovery(query, (payment_info.get('payment_id'), order_id))
-                        logger.info(f"Orden {order_id} marcada como pagada")
-                
-                self.send_response(200)
-                self.end_headers()
-            except Exception as e:
-                logger.error(f"Error procesando webhook: {str(e)}")
-                self.send_response(200)  # Siempre responder 200 a MercadoPago
-                self.end_headers()
-                
         elif path.startswith('/api/tables/') and '/status' in path:
             # Update table status
             table_id = path.split('/')[3]
@@ -3117,8 +3589,7 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                 data = json.loads(post_data)
                 status = data.get('status')
                 
-                # Clear tables cache
-                CACHE['tables'] = None
+                change_bus.emit('tables', table_id)
                 
                 self.send_json_response({
                     'success': True,
@@ -3133,6 +3604,48 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
             order_id = path.split('/')[3]
             self.send_json_response({'success': True, 'order_id': order_id})
         
+        elif path == '/api/floor-plan/batch':
+            # Lote del editor del plano: posiciones de mesas/objetos + settings en un solo request
+            content_length = int(self.headers.get('Content-Length', 0))
+            post_data = self.rfile.read(content_length)
+            
+            try:
+                data = json.loads(post_data)
+                immediate = bool(data.get('immediate', False))
+                versions = {}
+                check_batch_settings(data)
+                
+                if data.get('tables') or data.get('decorative_objects'):
+                    connection = connection_pool.get_connection()
+                    try:
+                        versions = apply_layout_batch(connection, data)
+                    finally:
+                        connection.close()
+                    # Un solo evento para todo el lote (invalida /api/tables en todos los workers)
+                    change_bus.emit('floor_layout')
+                
+                for area in data.get('area_settings') or []:
+                    self.save_area_settings(int(area['area_id']), area, area.get('company_id', 1), immediate)
+                if data.get('map_settings'):
+                    map_settings = data['map_settings']
+                    self.save_map_settings(map_settings, map_settings.get('company_id', 1), immediate)
+                
+                self.send_json_response({
+                    'success': True,
+                    'versions': versions,
+                    'updated': sum(len(ids) for ids in versions.values()),
+                    'autosave': layout_autosave.get_stats()
+                })
+                
+            except LayoutConflict as e:
+                # Nada se aplicó: el editor recarga esos elementos y reintenta
+                self.send_json_response({'success': False, 'error': str(e), 'conflicts': e.conflicts}, status=409)
+            except (LayoutError, KeyError, ValueError) as e:
+                self.send_error_response(400, f"Lote inválido: {e}")
+            except Exception as e:
+                logger.error(f"Error aplicando lote del plano: {e}")
+                self.send_error_response(500, str(e))
+        
         elif path.startswith('/api/area-settings/'):
             # Guardar configuración de área
             area_id = path.split('/')[-1]
@@ -3143,8 +3656,9 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                 area_id = int(area_id)
                 data = json.loads(post_data)
                 company_id = data.get('company_id', 1)
+                immediate = bool(data.pop('immediate', False))
                 
-                result = self.save_area_settings(area_id, data, company_id)
+                result = self.save_area_settings(area_id, data, company_id, immediate)
                 self.send_json_response(result)
                 
             except ValueError:
@@ -3163,8 +3677,9 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
             try:
                 data = json.loads(post_data)
                 company_id = data.get('company_id', 1)
+                immediate = bool(data.pop('immediate', False))
                 
-                result = self.save_map_settings(data, company_id)
+                result = self.save_map_settings(data, company_id, immediate)
                 self.send_json_response(result)
                 
             except json.JSONDecodeError:
@@ -3282,6 +3797,7 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                     connection.commit()
                     
                     new_id = cursor.lastrowid
+                    change_bus.emit('categories', new_id)
                     self.send_json_response({'id': new_id, **data})
                 finally:
                     if cursor: cursor.close()
@@ -3321,6 +3837,7 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                     connection.commit()
                     
                     new_id = cursor.lastrowid
+                    change_bus.emit('subcategories', new_id)
                     self.send_json_response({'id': new_id, **data})
                 finally:
                     if cursor: cursor.close()
@@ -3360,6 +3877,7 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                     connection.commit()
                     
                     new_id = cursor.lastrowid
+                    change_bus.emit('products', new_id)
                     self.send_json_response({'id': new_id, **data})
                 finally:
                     if cursor: cursor.close()
@@ -3602,6 +4120,9 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                     update_fields.append("updated_at = NOW()")
                     values.append(ingredient_id)
                     
+                    # El pool está en autocommit: el precio y los costos recalculados van en una transacción
+                    connection.start_transaction()
+                    
                     query = f"""
                     UPDATE ingredients 
                     SET {', '.join(update_fields)}
@@ -3609,11 +4130,15 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                     """
                     
                     cursor.execute(query, values)
+                    # Nuevo precio: recalcular solo los productos que usan este ingrediente
+                    affected = product_costs.on_ingredient_changed(cursor, ingredient_id) if 'cost_per_unit' in data else []
                     connection.commit()
+                    change_bus.emit('ingredients', ingredient_id)
                     
                     self.send_json_response({
                         'success': True,
-                        'message': 'Ingrediente actualizado exitosamente'
+                        'message': 'Ingrediente actualizado exitosamente',
+                        'products_recalculated': len(affected)
                     })
                     
                 except Exception as e:
@@ -3670,7 +4195,7 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                     UPDATE tables 
                     SET x = %s, y = %s, width = %s, height = %s, 
                         rotation = %s, shape = %s, capacity = %s,
-                        status = %s, number = %s
+                        status = %s, number = %s, version = version + 1
                     WHERE id = %s
                     """
                     params = (
@@ -3688,8 +4213,7 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                     cursor.execute(query, params)
                     connection.commit()
                     
-                    # Clear cache
-                    CACHE['tables'] = None
+                    change_bus.emit('tables', table_id)
                     
                     self.send_json_response({'success': True, 'table_id': table_id})
                     
@@ -3717,7 +4241,8 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                     
                     query = """
                         UPDATE decorative_objects 
-                        SET x = %s, y = %s, width = %s, height = %s, rotation = %s, locked = %s
+                        SET x = %s, y = %s, width = %s, height = %s, rotation = %s, locked = %s,
+                            version = version + 1
                         WHERE id = %s
                     """
                     params = (
@@ -3732,6 +4257,8 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                     cursor.execute(query, params)
                     connection.commit()
                     
+                    change_bus.emit('floor_layout')
+                    
                     self.send_json_response({
                         'success': True,
                         'message': 'Objeto decorativo actualizado'
@@ -3765,6 +4292,84 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                 logger.error(f"Error actualizando item de cocina: {e}")
                 self.send_error_response(500, str(e))
                 
+        # Reemplazar la receta de un producto (cantidades) y recalcular su costo
+        elif path.startswith('/api/products/') and path.endswith('/ingredients'):
+            try:
+                product_id = int(path.split('/')[-2])
+                content_length = int(self.headers.get('Content-Length', 0))
+                data = json.loads(self.rfile.read(content_length))
+                items = data.get('ingredients', []) if isinstance(data, dict) else data
+                
+                connection = None
+                cursor = None
+                try:
+                    connection = connection_pool.get_connection()
+                    cursor = connection.cursor()
+                    # El pool está en autocommit: sin transacción explícita un item inválido a mitad
+                    # de la receta dejaría confirmados los anteriores y el costo del producto desactualizado
+                    connection.start_transaction()
+                    
+                    # Upsert por (product_id, ingredient_id); lo que no vino queda inactivo.
+                    # executemany arma un solo INSERT multi-fila: la receta cuesta lo mismo con 3 o 30 items
+                    ingredient_ids = [int(item['ingredient_id']) for item in items]
+                    if items:
+                        cursor.executemany("""
+                            INSERT INTO product_ingredients (
+                                product_id, ingredient_id, quantity, unit_id, unit_name,
+                                preparation_notes, is_optional, is_active
+                            ) VALUES (%s, %s, %s, %s, %s, %s, %s, TRUE)
+                            ON DUPLICATE KEY UPDATE
+                                quantity = VALUES(quantity), unit_id = VALUES(unit_id),
+                                unit_name = VALUES(unit_name), preparation_notes = VALUES(preparation_notes),
+                                is_optional = VALUES(is_optional), is_active = TRUE
+                        """, [(
+                            product_id,
+                            item['ingredient_id'],
+                            item.get('quantity', 0),
+                            item.get('unit_id', 1),
+                            item.get('unit_name', ''),
+                            item.get('preparation_notes', ''),
+                            item.get('is_optional', False)
+                        ) for item in items])
+                    
+                    if ingredient_ids:
+                        placeholders = ', '.join(['%s'] * len(ingredient_ids))
+                        cursor.execute(
+                            f"UPDATE product_ingredients SET is_active = FALSE "
+                            f"WHERE product_id = %s AND ingredient_id NOT IN ({placeholders})",
+                            [product_id] + ingredient_ids
+                        )
+                    else:
+                        cursor.execute("UPDATE product_ingredients SET is_active = FALSE WHERE product_id = %s", (product_id,))
+                    
+                    product_costs.on_recipe_changed(cursor, product_id)
+                    connection.commit()
+                    change_bus.emit('product_ingredients', product_id)
+                    
+                    cursor.execute(
+                        "SELECT total_ingredient_cost, ingredient_count FROM products WHERE id = %s", (product_id,)
+                    )
+                    row = cursor.fetchone()
+                    self.send_json_response({
+                        'success': True,
+                        'product_id': product_id,
+                        'total_ingredient_cost': row[0] if row else 0,
+                        'ingredient_count': row[1] if row else 0
+                    })
+                except Exception as e:
+                    if connection:
+                        connection.rollback()
+                    raise e
+                finally:
+                    if cursor: cursor.close()
+                    if connection: connection.close()
+                    
+            except (json.JSONDecodeError, KeyError, TypeError, ValueError):
+                self.send_error_response(400, "Receta inválida: se espera una lista de {ingredient_id, quantity}")
+            except Exception as e:
+                logger.error(f"Error actualizando receta del producto: {e}")
+                self.send_error_response(500, str(e))
+        
         elif path.startswith('/api/products/'):
             # Update product
             product_id = path.split('/')[-1]
@@ -3814,6 +4419,7 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                         category_id
                     ))
                     connection.commit()
+                    change_bus.emit('categories', category_id)
                     
                     self.send_json_response({'id': category_id, **data})
                 finally:
@@ -3855,6 +4461,7 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                         subcategory_id
                     ))
                     connection.commit()
+                    change_bus.emit('subcategories', subcategory_id)
                     
                     self.send_json_response({'id': subcategory_id, **data})
                 finally:
@@ -3897,6 +4504,7 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                         product_id
                     ))
                     connection.commit()
+                    change_bus.emit('products', product_id)
                     
                     self.send_json_response({'id': product_id, **data})
                 finally:
@@ -4054,8 +4662,7 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                     cursor.execute(query, (table_id,))
                     connection.commit()
                     
-                    # Limpiar caché
-                    CACHE['tables'] = None
+                    change_bus.emit('tables', table_id)
                     
                     self.send_json_response({'success': True, 'deleted': table_id})
                 finally:
@@ -4089,6 +4696,7 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                     query = "UPDATE categories SET is_active = 0 WHERE id = %s"
                     cursor.execute(query, (category_id,))
                     connection.commit()
+                    change_bus.emit('categories', category_id)
                     
                     self.send_json_response({'success': True, 'deleted': category_id})
                 finally:
@@ -4112,6 +4720,7 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                     query = "UPDATE subcategories SET is_active = 0 WHERE id = %s"
                     cursor.execute(query, (subcategory_id,))
                     connection.commit()
+                    change_bus.emit('subcategories', subcategory_id)
                     
                     self.send_json_response({'success': True, 'deleted': subcategory_id})
                 finally:
@@ -4135,6 +4744,7 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                     query = "UPDATE products SET available = 0 WHERE id = %s"
                     cursor.execute(query, (product_id,))
                     connection.commit()
+                    change_bus.emit('products', product_id)
                     
                     self.send_json_response({'success': True, 'deleted': product_id})
                 finally:
@@ -4284,6 +4894,7 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
             for product in result:
                 if not product.get('image_url'):
                     product['image_url'] = f"{S3_BASE_URL}/{IMAGE_BASE_PATH}hamburguesa-clasica.jpg"
+                image_variant_store.enrich(product)
             return result
         
         # NO FALLBACK - Si no hay BD, error
@@ -4304,7 +4915,7 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
             # Las URLs ya están completas en la BD, no modificar
             if not product.get('image_url'):
                 product['image_url'] = f"{S3_BASE_URL}/{IMAGE_BASE_PATH}hamburguesa-clasica.jpg"
-            return product
+            return image_variant_store.enrich(product)
         elif result is not None and len(result) == 0:
             return None
         
@@ -4315,7 +4926,7 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
         """Get restaurant tables from MySQL database ONLY"""
         query = """
         SELECT id, number, capacity, location, status,
-               x, y, width, height, rotation, shape
+               x, y, width, height, rotation, shape, version
         FROM tables 
         ORDER BY number ASC
         """
@@ -4491,6 +5102,13 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
             result = execute_mysql_query_with_recovery(query, None)
             if result is not None:
                 return result
+        elif customer_index.is_ready():
+            # Índice de trigramas en memoria: sin LIKE '%q%' sobre toda la tabla
+            return self.fetch_customers_by_ids(
+                customer_index.search(search, limit=10),
+                "id, first_name, last_name, email, phone, loyalty_points, "
+                "total_visits, total_spent, is_active, created_at, updated_at"
+            )
         else:
             # Si hay búsqueda, filtrar por criterio
             query = """
@@ -4546,7 +5164,7 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
             
             # Crear modelo y generar respuesta
             model = genai.GenerativeModel('gemini-1.5-flash')
-            response = model.generate_content(prompt)
+            response = gemini_generate(model, prompt, 'ingredient_suggestions')
             
             if not response or not response.text:
                 raise Exception("La IA no generó respuesta")
@@ -4652,28 +5270,26 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
             cursor.execute(query, params)
             order_id = cursor.lastrowid
             
-            # Insertar items de la orden
+            # Insertar items de la orden: executemany arma un único INSERT multi-fila
+            item_params = []
             for item in order_data.get('items', []):
                 product = item.get('product', {})
-                quantity = item.get('quantity', 1)
-                price = product.get('price', 0)
-                
+                item_params.append((
+                    order_id,
+                    product.get('id'),
+                    item.get('quantity', 1),
+                    product.get('price', 0),
+                    item.get('notes', '')
+                ))
+            
+            if item_params:
                 item_query = """
                 INSERT INTO order_items (
                     order_id, product_id, quantity, 
                     price, notes
                 ) VALUES (%s, %s, %s, %s, %s)
                 """
-                
-                item_params = (
-                    order_id,
-                    product.get('id'),
-                    quantity,
-                    price,
-                    item.get('notes', '')
-                )
-                
-                cursor.execute(item_query, item_params)
+                cursor.executemany(item_query, item_params)
             
             connection.commit()
             return order_id
@@ -4890,29 +5506,8 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
             return False
     
     def create_tables_table(self):
-        """Create tables table if it doesn't exist"""
+        """Insert sample tables (the table itself is created by the schema bootstrap)"""
         try:
-            # Crear tabla si no existe
-            create_query = """
-            CREATE TABLE IF NOT EXISTS tables (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                number INT NOT NULL UNIQUE,
-                capacity INT NOT NULL DEFAULT 4,
-                location VARCHAR(50),
-                status VARCHAR(20) DEFAULT 'available',
-                x INT DEFAULT 0,
-                y INT DEFAULT 0,
-                width INT DEFAULT 100,
-                height INT DEFAULT 100,
-                rotation INT DEFAULT 0,
-                shape VARCHAR(20) DEFAULT 'square',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
-            )
-            """
-            
-            result = execute_mysql_query_with_recovery(create_query)
-            
             # Insertar mesas de ejemplo
             insert_query = """
             INSERT IGNORE INTO tables (number, capacity, location, status, x, y, shape) VALUES
@@ -4943,27 +5538,8 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
             raise
     
     def create_decorative_objects_table(self):
-        """Create decorative_objects table if it doesn't exist"""
+        """Insert sample decorative objects (the table itself is created by the schema bootstrap)"""
         try:
-            # Crear tabla si no existe
-            create_query = """
-            CREATE TABLE IF NOT EXISTS decorative_objects (
-                id VARCHAR(50) PRIMARY KEY,
-                type VARCHAR(50) NOT NULL,
-                x INT DEFAULT 0,
-                y INT DEFAULT 0,
-                width INT DEFAULT 100,
-                height INT DEFAULT 100,
-                rotation INT DEFAULT 0,
-                locked BOOLEAN DEFAULT FALSE,
-                environment VARCHAR(50) DEFAULT 'main',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
-            )
-            """
-            
-            result = execute_mysql_query_with_recovery(create_query)
-            
             # Insertar objetos decorativos de ejemplo
             insert_query = """
             INSERT IGNORE INTO decorative_objects (id, type, x, y, width, height, rotation, locked, environment) VALUES
@@ -5052,33 +5628,6 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
     
     def get_users_data(self):
         """Get users from MySQL database"""
-        # Crear tabla si no existe
-        create_query = """
-        CREATE TABLE IF NOT EXISTS app_users (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            username VARCHAR(100) UNIQUE NOT NULL,
-            email VARCHAR(255) UNIQUE NOT NULL,
-            password VARCHAR(255) NOT NULL,
-            full_name VARCHAR(255) NOT NULL,
-            company_id INT NOT NULL DEFAULT 1,
-            role_id INT NOT NULL DEFAULT 1,
-            is_active TINYINT(1) DEFAULT 1,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
-        )
-        """
-        execute_mysql_query_with_recovery(create_query, None)
-        
-        # Insertar datos por defecto si no existen
-        insert_default = """
-        INSERT IGNORE INTO app_users (username, email, password, full_name, company_id, role_id) 
-        VALUES 
-        ('admin', 'admin@gastro.com', 'admin123', 'Administrador', 1, 1),
-        ('chef1', 'chef@gastro.com', 'chef123', 'Chef Principal', 1, 2),
-        ('mozo1', 'mozo1@gastro.com', 'mozo123', 'Mozo 1', 1, 3)
-        """
-        execute_mysql_query_with_recovery(insert_default, None)
-        
         query = """
         SELECT id, username, email, full_name, company_id, role_id, is_active,
                created_at, updated_at
@@ -5109,33 +5658,6 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
     
     def get_areas_data(self):
         """Get areas from MySQL database"""
-        # Crear tabla si no existe
-        create_query = """
-        CREATE TABLE IF NOT EXISTS areas (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            name VARCHAR(255) NOT NULL,
-            description TEXT,
-            capacity INT NOT NULL DEFAULT 0,
-            outdoor TINYINT(1) DEFAULT 0,
-            color VARCHAR(7) DEFAULT '#3B82F6',
-            company_id INT NOT NULL DEFAULT 1,
-            is_active TINYINT(1) DEFAULT 1,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
-        )
-        """
-        execute_mysql_query_with_recovery(create_query, None)
-        
-        # Insertar datos por defecto si no existen
-        insert_default = """
-        INSERT IGNORE INTO areas (name, description, capacity, outdoor, color, company_id) 
-        VALUES 
-        ('Salón Principal', 'Área principal del restaurante', 50, 0, '#3B82F6', 1),
-        ('Terraza', 'Área exterior con vista', 24, 1, '#10B981', 1),
-        ('Salón VIP', 'Área exclusiva', 12, 0, '#8B5CF6', 1)
-        """
-        execute_mysql_query_with_recovery(insert_default, None)
-        
         query = """
         SELECT id, name, description, capacity, outdoor, color, company_id, is_active,
                created_at, updated_at
@@ -5167,8 +5689,30 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
         
         raise Exception("No se puede acceder a la base de datos para obtener addresses")
     
+    def fetch_customers_by_ids(self, customer_ids, columns):
+        """Leer clientes por clave primaria respetando el orden de relevancia del índice"""
+        if not customer_ids:
+            return []
+        placeholders = ", ".join(["%s"] * len(customer_ids))
+        query = f"SELECT {columns} FROM customers WHERE id IN ({placeholders})"
+        
+        result = execute_mysql_query_with_recovery(query, tuple(customer_ids))
+        if result is None:
+            raise Exception("No se puede buscar clientes")
+        
+        by_id = {row['id']: row for row in result}
+        return [by_id[customer_id] for customer_id in customer_ids if customer_id in by_id]
+    
     def search_customers(self, search_term):
         """Search customers by name or phone"""
+        if customer_index.is_ready():
+            # Prefijo, substring, dígitos de teléfono y tolerancia a errores de tipeo
+            return self.fetch_customers_by_ids(
+                customer_index.search(search_term, limit=10),
+                "id, first_name, last_name, email, phone, dni, "
+                "loyalty_points, total_visits, total_spent, notes"
+            )
+        
         query = """
         SELECT id, first_name, last_name, email, phone, dni, 
                loyalty_points, total_visits, total_spent, notes
@@ -5220,42 +5764,26 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
         
         result = execute_mysql_query_with_recovery(query, (area_id, company_id))
         if result is not None:
+            # Lo que todavía está en el autosave es más nuevo que lo guardado
+            pending = layout_autosave.pending(('area', int(area_id), int(company_id)))
+            if pending:
+                return {**(result[0] if result else {'area_id': area_id, 'company_id': company_id}), **pending}
             return result[0] if result else None
         
         raise Exception("No se puede acceder a la base de datos para obtener configuración del área")
     
-    def save_area_settings(self, area_id, settings, company_id=1):
-        """Save area settings to MySQL database"""
-        query = """
-        INSERT INTO area_settings 
-        (area_id, company_id, final_x_position, final_y_position, zoom_level, 
-         grid_size, show_grid, background_color)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        ON DUPLICATE KEY UPDATE
-        final_x_position = VALUES(final_x_position),
-        final_y_position = VALUES(final_y_position),
-        zoom_level = VALUES(zoom_level),
-        grid_size = VALUES(grid_size),
-        show_grid = VALUES(show_grid),
-        background_color = VALUES(background_color),
-        updated_at = CURRENT_TIMESTAMP
+    def save_area_settings(self, area_id, settings, company_id=1, immediate=False):
         """
+        Guardar configuración de área: por defecto queda en el autosave con
+        debounce; immediate=True la escribe ya (junto con lo que estaba pendiente)
+        """
+        key = ('area', int(area_id), int(company_id))
+        if not immediate:
+            layout_autosave.submit(key, settings)
+            return {"success": True, "pending": True, "message": "Configuración del área en cola de guardado"}
         
-        params = (
-            area_id, company_id,
-            settings.get('final_x_position', 0),
-            settings.get('final_y_position', 0),
-            settings.get('zoom_level', 1.0),
-            settings.get('grid_size', 20),
-            settings.get('show_grid', True),
-            settings.get('background_color', '#F3F4F6')
-        )
-        
-        result = execute_mysql_query_with_recovery(query, params)
-        if result is not None:
-            return {"success": True, "message": "Configuración del área guardada correctamente"}
-        
-        raise Exception("No se puede guardar la configuración del área en la base de datos")
+        write_area_settings(area_id, {**layout_autosave.take(key), **settings}, company_id)
+        return {"success": True, "message": "Configuración del área guardada correctamente"}
     
     def get_map_settings(self, company_id=1):
         """Get map settings from MySQL database"""
@@ -5269,48 +5797,76 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
         
         result = execute_mysql_query_with_recovery(query, (company_id,))
         if result is not None:
+            pending = layout_autosave.pending(('map', int(company_id)))
+            if pending:
+                return {**(result[0] if result else {'company_id': company_id}), **pending}
             return result[0] if result else None
         
         raise Exception("No se puede acceder a la base de datos para obtener configuración del mapa")
     
-    def save_map_settings(self, settings, company_id=1):
-        """Save map settings to MySQL database"""
-        query = """
-        INSERT INTO map_settings 
-        (company_id, map_x_position, map_y_position, global_zoom,
-         grid_enabled, snap_to_grid, grid_color, canvas_width, canvas_height, auto_save)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        ON DUPLICATE KEY UPDATE
-        map_x_position = VALUES(map_x_position),
-        map_y_position = VALUES(map_y_position),
-        global_zoom = VALUES(global_zoom),
-        grid_enabled = VALUES(grid_enabled),
-        snap_to_grid = VALUES(snap_to_grid),
-        grid_color = VALUES(grid_color),
-        canvas_width = VALUES(canvas_width),
-        canvas_height = VALUES(canvas_height),
-        auto_save = VALUES(auto_save),
-        updated_at = CURRENT_TIMESTAMP
+    def save_map_settings(self, settings, company_id=1, immediate=False):
+        """Guardar configuración del mapa (mismo esquema de autosave que save_area_settings)"""
+        key = ('map', int(company_id))
+        if not immediate:
+            layout_autosave.submit(key, settings)
+            return {"success": True, "pending": True, "message": "Configuración del mapa en cola de guardado"}
+        
+        write_map_settings({**layout_autosave.take(key), **settings}, company_id)
+        return {"success": True, "message": "Configuración del mapa guardada correctamente"}
+    
+    def stream_orders_export(self, query):
+        """
+        Exportar pedidos (o pedidos + items) por rango de fechas sin cargar el
+        resultado en memoria: cursor sin buffer -> lotes -> chunks HTTP (core/order_export.py)
         """
+        try:
+            export = OrderExport(query)
+        except ExportError as e:
+            self.send_error_response(400, str(e))
+            return
         
-        params = (
-            company_id,
-            settings.get('map_x_position', 0),
-            settings.get('map_y_position', 0),
-            settings.get('global_zoom', 1.0),
-            settings.get('grid_enabled', True),
-            settings.get('snap_to_grid', True),
-            settings.get('grid_color', '#E5E7EB'),
-            settings.get('canvas_width', 1200),
-            settings.get('canvas_height', 800),
-            settings.get('auto_save', True)
-        )
+        # Lectura larga: a la réplica si está sana, si no al primario con conexión propia
+        config = replica_router.config if replica_router and replica_router.use_replica() else MYSQL_CONFIG
+        try:
+            connection, cursor = open_export_cursor(config, export)
+        except Exception as e:
+            logger.error(f"[EXPORT] No se pudo iniciar la exportación: {e}")
+            self.send_error_response(500, str(e))
+            return
         
-        result = execute_mysql_query_with_recovery(query, params)
-        if result is not None:
-            return {"success": True, "message": "Configuración del mapa guardada correctamente"}
+        compress = export.gzip_file or 'gzip' in self.headers.get('Accept-Encoding', '')
+        # Chunked solo existe en HTTP/1.1; a un cliente HTTP/1.0 se le envía el cuerpo hasta cerrar
+        chunked = self.request_version == 'HTTP/1.1'
+        if chunked:
+            self.protocol_version = 'HTTP/1.1'
+        self.close_connection = True
         
-        raise Exception("No se puede guardar la configuración del mapa en la base de datos")
+        started = time.time()
+        rows = 0
+        writer = None
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/gzip' if export.gzip_file else FORMATS[export.format])
+            self.send_header('Content-Disposition', f'attachment; filename="{export.filename}"')
+            if compress and not export.gzip_file:
+                self.send_header('Content-Encoding', 'gzip')
+            if chunked:
+                self.send_header('Transfer-Encoding', 'chunked')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            
+            writer = StreamWriter(self.wfile, chunked=chunked, compress=compress)
+            rows = write_export(writer, cursor, export)
+            writer.close()
+            logger.info(f"[EXPORT] {export.filename}: {rows} filas, {writer.bytes_in} bytes "
+                        f"({writer.bytes_out} enviados) en {time.time() - started:.1f}s")
+        except (BrokenPipeError, ConnectionResetError):
+            logger.warning(f"[EXPORT] Cliente desconectado tras {rows} filas: {export.filename}")
+        except Exception as e:
+            # Los headers ya salieron: se corta sin el chunk final para que el cliente vea la descarga incompleta
+            logger.error(f"[EXPORT] Error exportando {export.filename}: {e}")
+        finally:
+            close_export_cursor(connection, cursor)
     
     def get_sales_report(self, start_date=None, end_date=None):
         """Get sales report with key metrics"""
@@ -5333,7 +5889,7 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
         AND DATE(o.created_at) BETWEEN %s AND %s
         """
         
-        sales_data = execute_mysql_query_with_recovery(sales_query, (start_date, end_date))
+        sales_data = execute_read_query(sales_query, (start_date, end_date))
         
         # Ventas por día
         daily_sales_query = """
@@ -5349,7 +5905,7 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
         LIMIT 30
         """
         
-        daily_sales = execute_mysql_query_with_recovery(daily_sales_query, (start_date, end_date))
+        daily_sales = execute_read_query(daily_sales_query, (start_date, end_date))
         
         # Productos más vendidos
         top_products_query = """
@@ -5370,7 +5926,7 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
         LIMIT 10
         """
         
-        top_products = execute_mysql_query_with_recovery(top_products_query, (start_date, end_date))
+        top_products = execute_read_query(top_products_query, (start_date, end_date))
         
         # Categorías más vendidas
         category_sales_query = """
@@ -5389,7 +5945,7 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
         ORDER BY revenue DESC
         """
         
-        category_sales = execute_mysql_query_with_recovery(category_sales_query, (start_date, end_date))
+        category_sales = execute_read_query(category_sales_query, (start_date, end_date))
         
         return {
             'period': {'start_date': start_date, 'end_date': end_date},
@@ -5410,7 +5966,7 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
         GROUP BY status
         """
         
-        table_status = execute_mysql_query_with_recovery(table_status_query, None)
+        table_status = execute_read_query(table_status_query, None)
         
         # Rotación de mesas (últimas 24 horas)
         turnover_query = """
@@ -5426,7 +5982,7 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
         ORDER BY orders_count DESC
         """
         
-        table_turnover = execute_mysql_query_with_recovery(turnover_query, None)
+        table_turnover = execute_read_query(turnover_query, None)
         
         # Ocupación por hora del día (última semana)
         hourly_occupancy_query = """
@@ -5440,7 +5996,7 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
         ORDER BY hour
         """
         
-        hourly_occupancy = execute_mysql_query_with_recovery(hourly_occupancy_query, None)
+        hourly_occupancy = execute_read_query(hourly_occupancy_query, None)
         
         return {
             'table_status': table_status or [],
@@ -5461,7 +6017,7 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
         FROM customers
         """
         
-        customer_summary = execute_mysql_query_with_recovery(customer_summary_query, None)
+        customer_summary = execute_read_query(customer_summary_query, None)
         
         # Top clientes
         top_customers_query = """
@@ -5483,7 +6039,7 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
         LIMIT 10
         """
         
-        top_customers = execute_mysql_query_with_recovery(top_customers_query, None)
+        top_customers = execute_read_query(top_customers_query, None)
         
         # Distribución de clientes por tipo
         customer_distribution_query = """
@@ -5502,7 +6058,7 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
         ORDER BY avg_spent DESC
         """
         
-        customer_distribution = execute_mysql_query_with_recovery(customer_distribution_query, None)
+        customer_distribution = execute_read_query(customer_distribution_query, None)
         
         return {
             'summary': customer_summary[0] if customer_summary else {},
@@ -5532,7 +6088,7 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
         ORDER BY p.stock_quantity ASC
         """
         
-        low_stock = execute_mysql_query_with_recovery(low_stock_query, None)
+        low_stock = execute_read_query(low_stock_query, None)
         
         # Valor del inventario
         inventory_value_query = """
@@ -5548,7 +6104,7 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
         ORDER BY inventory_value DESC
         """
         
-        inventory_value = execute_mysql_query_with_recovery(inventory_value_query, None)
+        inventory_value = execute_read_query(inventory_value_query, None)
         
         # Rotación de inventario (últimos 30 días)
         inventory_turnover_query = """
@@ -5572,7 +6128,7 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
         LIMIT 20
         """
         
-        inventory_turnover = execute_mysql_query_with_recovery(inventory_turnover_query, None)
+        inventory_turnover = execute_read_query(inventory_turnover_query, None)
         
         return {
             'low_stock_items': low_stock or [],
@@ -5593,7 +6149,7 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
             (SELECT COUNT(DISTINCT customer_id) FROM orders WHERE DATE(created_at) = CURDATE()) as unique_customers_today
         """
         
-        kpis = execute_mysql_query_with_recovery(kpis_query, None)
+        kpis = execute_read_query(kpis_query, None)
         
         # Comparación con período anterior
         comparison_query = """
@@ -5617,22 +6173,41 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
         AND status IN ('completed', 'paid')
         """
         
-        comparison = execute_mysql_query_with_recovery(comparison_query, None)
+        comparison = execute_read_query(comparison_query, None)
         
         return {
             'current_kpis': kpis[0] if kpis else {},
             'period_comparison': comparison or []
         }
     
-    def send_json_response(self, data):
-        """Send JSON response"""
-        self.send_response(200)
+    def send_json_response(self, data, status=200, etag=None):
+        """Send JSON response (serializado antes de los headers para medirlo en Server-Timing)"""
+        serialize_start = time.perf_counter()
+        body = json.dumps(data, cls=DecimalEncoder).encode()
+        request_timing.record_serialization(time.perf_counter() - serialize_start)
+        self.send_response(status)
         self.send_header('Content-Type', 'application/json')
+        if etag:
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def not_modified(self, etag):
+        """Responder 304 si el cliente ya tiene la versión actual (If-None-Match)"""
+        if etag not in (self.headers.get('If-None-Match') or ''):
+            return False
+        self.send_response(304)
+        self.send_header('ETag', etag)
         self.end_headers()
-        self.wfile.write(json.dumps(data, cls=DecimalEncoder).encode())
+        return True
     
     def send_error_response(self, code, message):
         """Send error response"""
+        # Un 500 causado por un deadline vencido se informa como 504
+        deadline = current_deadline()
+        if code == 500 and deadline and deadline.timed_out:
+            code = 504
         self.send_response(code)
         self.send_header('Content-Type', 'application/json')
         self.end_headers()
@@ -5669,7 +6244,11 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
                 # NO agregar CORS aquí porque end_headers() ya lo hace
                 self.send_header('Content-Type', mime_type)
                 self.send_header('Content-Length', str(len(content)))
-                self.send_header('Cache-Control', 'public, max-age=3600')  # Cache por 1 hora
+                if '/variants/' in path:
+                    # Nombre con hash del contenido: nunca cambia
+                    self.send_header('Cache-Control', 'public, max-age=31536000, immutable')
+                else:
+                    self.send_header('Cache-Control', 'public, max-age=3600')  # Cache por 1 hora
                 # end_headers() agregará los CORS automáticamente
                 self.end_headers()
                 self.wfile.write(content)
@@ -5750,7 +6329,10 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
             ))
             
             connection.commit()
-            return cursor.lastrowid
+            customer_id = cursor.lastrowid
+            customer_index.upsert({**data, 'id': customer_id, 'is_active': 1})
+            change_bus.emit('customers', customer_id, local=False)
+            return customer_id
 
         finally:
             if cursor:
@@ -5880,6 +6462,8 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
             ))
             
             connection.commit()
+            customer_index.upsert({**data, 'id': customer_id})
+            change_bus.emit('customers', customer_id, local=False)
             return True
         finally:
             if cursor:
@@ -5965,7 +6549,7 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
             if connection:
                 connection.close()
 
-    def find_relevant_products_with_ai(self, user_message, products_data, categories_list, thread_id):
+    def find_relevant_products_with_ai(self, user_message, catalog, thread_id):
         """
         Encuentra productos relevantes usando IA para entender variaciones del lenguaje.
         Ej: "tenés pastas", "alguna pastita rica", "que hay de fideos" -> todas buscan pastas
@@ -5976,52 +6560,15 @@ class CompleteServerHandler(http.server.SimpleHTTPRequestHandler):
             # Configurar Gemini
             if not hasattr(self, '_genai_configured'):
                 if GEMINI_API_KEY:
-                    genai.configure(api_key=GEMINI_API_KEY)
+                    genai.configure(**GEMINI_CONFIG)
                     self._genai_configured = True
                 else:
                     # Fallback sin IA
-                    return self.find_products_by_keywords(user_message, products_data)
-            
-            # Crear lista de productos resumida para el contexto
-            product_samples = {}
-            for product in products_data[:100]:  # Limitar para no sobrecargar el prompt
-                cat = product.get('category_name', 'General')
-                if cat not in product_samples:
-                    product_samples[cat] = []
-                if len(product_samples[cat]) < 3:  # Solo 3 ejemplos por categoría
-                    product_samples[cat].append(product['name'])
-            
-            prompt = f"""SISTEMA: Eres un asistente inteligente que entiende variaciones del lenguaje y sinónimos.
-
-MENSAJE DEL USUARIO: "{user_message}"
-
-CATEGORÍAS DISPONIBLES:
-{', '.join(categories_list)}
-
-PRODUCTOS DISPONIBLES (muestra):
-{chr(10).join([f"- {cat}: {', '.join(prods[:3])}" for cat, prods in product_samples.items()])}
-
-TAREA: Analizar el mensaje del usuario y determinar qué productos busca, considerando:
-1. Variaciones del lenguaje (diminutivos, aumentativos, coloquialismos)
-2. Sinónimos y términos relacionados
-3. Descripciones indirectas (ej: "algo liviano" podría referirse a productos con ciertas características)
-
-El usuario podría usar términos coloquiales, diminutivos o descripciones vagas.
-Tu trabajo es interpretar la INTENCIÓN real detrás del mensaje.
-
-RESPONDE EN JSON:
-{{
-  "search_categories": ["categorías relevantes de la lista disponible"],
-  "search_keywords": ["palabras clave extraídas del mensaje"],
-  "search_description": ["características que busca el usuario"],
-  "confidence": 0-100
-}}
-
-Si el usuario no busca algo específico, devuelve arrays vacíos.
-RESPONDE SOLO JSON:"""
+                    return self.find_products_by_keywords(user_message, catalog.products)
             
-            model = genai.GenerativeModel('gemini-1.5-flash')
-            response = model.generate_content(prompt)
+            # Instrucciones + categorías y muestras como prefijo cacheado; solo el mensaje es dinámico
+            prompt = prompt_assembler.build('general_inquiry', catalog, user_message)
+            response = prompt_assembler.generate(genai, prompt)
             
             # Parsear respuesta
             import json
@@ -6032,40 +6579,29 @@ RESPONDE SOLO JSON:"""
                 ai_response = json.loads(json_match.group(0))
                 
                 relevant_products = []
+                seen_ids = set()
                 
-                # Buscar por categorías
+                # Buscar por categorías (índice por categoría del snapshot)
                 if ai_response.get('search_categories'):
                     for cat in ai_response['search_categories']:
-                        for product in products_data:
-                            if product.get('category_name', '').lower() == cat.lower():
-                                relevant_products.append({
-                                    'id': product['id'],
-                                    'name': product['name'],
-                                    'description': product['description'],
-                                    'price': float(product['price']),
-                                    'category': product['category_name'],
-                                    'image_url': product.get('image_url')
-                                })
+                        for product in catalog.in_category(cat):
+                            if product.id not in seen_ids:
+                                seen_ids.add(product.id)
+                                relevant_products.append(product.to_card())
                 
                 # También buscar por keywords si no hay suficientes resultados
                 if len(relevant_products) < 4 and ai_response.get('search_keywords'):
                     for keyword in ai_response['search_keywords']:
                         keyword_lower = keyword.lower()
-                        for product in products_data:
+                        for product in catalog.products:
                             # Evitar duplicados
-                            if any(p['id'] == product['id'] for p in relevant_products):
+                            if product.id in seen_ids:
                                 continue
                             
-                            if (keyword_lower in product['name'].lower() or 
-                                keyword_lower in product.get('description', '').lower()):
-                                relevant_products.append({
-                                    'id': product['id'],
-                                    'name': product['name'],
-                                    'description': product['description'],
-                                    'price': float(product['price']),
-                                    'category': product['category_name'],
-                                    'image_url': product.get('image_url')
-                                })
+                            if (keyword_lower in product.name_lower or 
+                                keyword_lower in (product.description or '').lower()):
+                                seen_ids.add(product.id)
+                                relevant_products.append(product.to_card())
                                 
                                 if len(relevant_products) >= 12:  # Límite razonable
                                     break
@@ -6075,7 +6611,7 @@ RESPONDE SOLO JSON:"""
                 
         except Exception as e:
             print(f"   ⚠️ Error en IA, usando búsqueda por keywords: {e}")
-            return self.find_products_by_keywords(user_message, products_data)
+            return self.find_products_by_keywords(user_message, catalog.products)
     
     def find_products_by_keywords(self, user_message, products_data):
         """Fallback: búsqueda simple por keywords sin IA - totalmente dinámica"""
@@ -6138,6 +6674,7 @@ RESPONDE SOLO JSON:"""
         logger.info(f"[AI_INTENT] Thread ID: {thread_id}")
         logger.info(f"[AI_INTENT] Mensaje usuario: '{user_message}'")
         logger.info(f"[AI_INTENT] Contexto recibido: {context}")
+        intent_start = time.time()
         
         # 🎯 DETECCIÓN RÁPIDA DE SALUDOS SIN IA (Fallback) - REFORZADA
         message_lower = user_message.lower().strip()
@@ -6180,6 +6717,7 @@ RESPONDE SOLO JSON:"""
             ]
             import random
             greeting_msg = random.choice(greeting_responses)
+            intent_classifier.record_turn('rules', time.time() - intent_start)
             return {
                 'intent_type': 'greeting',
                 'target_product': None,
@@ -6208,6 +6746,7 @@ RESPONDE SOLO JSON:"""
                     "¡Genial! ¿Necesitás algo más?",
                     "¡Perfecto! Acá estoy si querés algo más."
                 ]
+                intent_classifier.record_turn('rules', time.time() - intent_start)
                 return {
                     'intent_type': 'casual_conversation',
                     'target_product': None,
@@ -6216,14 +6755,38 @@ RESPONDE SOLO JSON:"""
                     'recommended_products': []
                 }
         
-        # Si no es saludo ni charla casual, continuar con IA
+        # ⚡ CLASIFICADOR LOCAL: reglas + modelo TF-IDF entrenado con decisiones previas de la IA
+        thread = conversation_threads.get(thread_id)
+        if thread and thread['context_initialized']:
+            local_intent = intent_classifier.classify(
+                user_message, thread['restaurant_data']['catalog'], context, started=intent_start
+            )
+            if local_intent:
+                logger.info(f"[LOCAL_INTENT] {local_intent['intent_type']} ({local_intent['source']}, "
+                            f"confianza {local_intent['confidence']})")
+                target_product = local_intent['target_product']
+                thread['conversation_history'].append({
+                    'type': 'user',
+                    'message': user_message,
+                    'timestamp': time.time()
+                })
+                thread['conversation_history'].append({
+                    'type': 'assistant',
+                    'intent': local_intent['intent_type'],
+                    'response': local_intent['response_text'],
+                    'target_product_id': target_product['id'] if target_product else None,
+                    'timestamp': time.time()
+                })
+                return local_intent
+        
+        # Si no es saludo, charla casual ni intención local clara, continuar con IA
         try:
             import google.generativeai as genai
             
             # Configurar Gemini si no está configurado
             if not hasattr(self, '_genai_configured'):
                 if GEMINI_API_KEY:
-                    genai.configure(api_key=GEMINI_API_KEY)
+                    genai.configure(**GEMINI_CONFIG)
                     self._genai_configured = True
                 else:
                     raise Exception("No hay API key de Gemini configurada")
@@ -6250,61 +6813,21 @@ RESPONDE SOLO JSON:"""
                 'timestamp': time.time()
             })
             
-            # 🧠 HISTORIAL DE CONVERSACIÓN para contexto
-            conversation_context = ""
-            if len(thread['conversation_history']) > 0:
-                last_messages = thread['conversation_history'][-4:]  # Últimos 4 mensajes
-                for msg in last_messages:
-                    if msg['type'] == 'user':
-                        conversation_context += f"USUARIO: {msg['message']}\n"
-                    else:
-                        conversation_context += f"ASISTENTE: {msg.get('intent', 'response')} sobre producto ID {msg.get('target_product_id', 'N/A')}\n"
-            
-            # 🚀 PROMPT SÚPER LIVIANO (sin dataset - ya lo tiene en memoria)
-            prompt = f"""CONTINUANDO CONVERSACIÓN EN THREAD {thread_id}.
-
-HISTORIAL RECIENTE:
-{conversation_context}
-
-USUARIO DICE AHORA: "{user_message}"{context_info}
-
-MODELO DE DATOS DEL SISTEMA:
-- Categorías (nivel 1): Grupos principales de productos
-- Subcategorías (nivel 2): Divisiones opcionales dentro de categorías  
-- Productos (nivel 3): Los items que se venden
-- Ingredientes/Componentes (nivel 4): Partes que componen cada producto (tabla 'ingredients')
-
-JERARQUÍA: Categoría → Subcategoría → Producto → Ingredientes/Componentes
-
-CONCEPTO CLAVE: Cuando alguien pregunta "qué tiene [producto]", está preguntando por el NIVEL 4 (ingredientes/componentes).
-
-DETERMINA LA INTENCIÓN Y RESPONDE JSON:
-
-{{
-  "intent_type": "casual_conversation|greeting|specific_product_ingredients|specific_product_info|product_pairings|smart_beverage_recommendation|product_recommendations|general_inquiry",
-  "target_product_id": "ID del producto si aplica o null",
-  "response_text": "Respuesta natural en español argentino",
-  "confidence": "0-100"
-}}
-
-CRITERIOS DE CLASIFICACIÓN (EN ORDEN DE PRIORIDAD):
-1. Si es SALUDO (hola, cómo estás, buen día, qué tal, etc): "greeting"
-2. Si es CHARLA CASUAL (gracias, de nada, adiós, chau, hasta luego, etc): "casual_conversation"
-3. Si pregunta sobre COMPOSICIÓN/CONTENIDO de un producto específico (qué tiene, qué lleva, qué incluye, qué trae, componentes, partes, detalles): "specific_product_ingredients"
-4. Si pregunta sobre COMBINACIONES/COMPLEMENTOS de un producto (qué combina, qué va bien con, qué recomiendas con): "product_pairings"
-5. Si contexto tiene producto seleccionado Y pregunta sobre complementos: "smart_beverage_recommendation"
-6. Si pregunta PRECIO o INFORMACIÓN GENERAL de un producto específico: "specific_product_info"
-7. Si pide RECOMENDACIONES sin producto específico: "product_recommendations"
-8. Si no está claro o es consulta general: "general_inquiry"
-
-REGLA FUNDAMENTAL: Cuando el usuario pregunta "qué tiene [PRODUCTO]" o variantes similares, está preguntando por los COMPONENTES/DETALLES INTERNOS del producto -> "specific_product_ingredients"
-
-REGLA CRÍTICA: Si el usuario saluda o hace conversación casual, NO recomiendes productos. Solo responde de forma amigable.
-
-RESPONDE SOLO JSON:"""
+            # 🧠 HISTORIAL DE CONVERSACIÓN para contexto (sin el mensaje actual; el
+            # presupuesto de tokens descarta primero los más viejos)
+            history_lines = []
+            for msg in thread['conversation_history'][-(CHAT_HISTORY_MESSAGES + 1):-1]:
+                if msg['type'] == 'user':
+                    history_lines.append(f"USUARIO: {msg['message']}")
+                else:
+                    history_lines.append(f"ASISTENTE: {msg.get('intent', 'response')} sobre producto ID {msg.get('target_product_id', 'N/A')}")
             
-            model = genai.GenerativeModel('gemini-1.5-flash')
-            response = model.generate_content(prompt)
+            # 🚀 Prefijo estático (instrucciones + digest del menú) cacheado por versión del catálogo
+            prompt = prompt_assembler.build(
+                'intent', thread['restaurant_data']['catalog'], user_message,
+                history=history_lines, context_info=context_info
+            )
+            response = prompt_assembler.generate(genai, prompt)
             
             logger.info(f"[AI_RESPONSE] Raw response: {response.text[:200]}...")
             
@@ -6319,47 +6842,29 @@ RESPONDE SOLO JSON:"""
                     logger.error(f"[AI_JSON_ERROR] No se pudo parsear JSON: {e}")
                     raise Exception("Error parsing AI response")
                 
-                # Buscar producto en el thread data
-                products_data = thread['restaurant_data'].get('products', [])
-                target_product = None
-                if ai_response.get('target_product_id'):
-                    target_product = next((p for p in products_data 
-                                         if str(p['id']) == str(ai_response['target_product_id'])), None)
+                # Buscar producto en el snapshot del catálogo (lookup por id)
+                catalog = thread['restaurant_data']['catalog']
+                target_product = catalog.get(ai_response.get('target_product_id'))
                 
                 if not target_product and ai_response['intent_type'] in ['specific_product_ingredients', 'specific_product_info', 'product_pairings']:
-                    # Buscar por nombre usando múltiples estrategias
+                    # Buscar por nombre: coincidencia exacta/contenida y luego por palabras (índice invertido)
                     logger.info(f"[PRODUCT_SEARCH] Buscando producto para mensaje: '{user_message}'")
                     
-                    message_lower = user_message.lower()
-                    best_product = None
-                    max_matches = 0
-                    
-                    for product in products_data:
-                        product_name_lower = product['name'].lower()
-                        
-                        # Estrategia 1: Coincidencia exacta o contiene
-                        if product_name_lower in message_lower or message_lower in product_name_lower:
-                            target_product = product
-                            logger.info(f"[PRODUCT_FOUND] Coincidencia exacta: {product['name']} (ID: {product['id']})")
-                            break
-                        
-                        # Estrategia 2: Coincidencia de palabras
-                        product_words = product_name_lower.split()
-                        message_words = message_lower.split()
-                        matches = sum(1 for word in product_words if word in message_words)
-                        
-                        if matches > max_matches and matches > 0:
-                            max_matches = matches
-                            best_product = product
-                    
-                    # Si no hay coincidencia exacta, usar la mejor coincidencia de palabras
-                    if not target_product and best_product and max_matches > 0:
-                        target_product = best_product
-                        logger.info(f"[PRODUCT_FOUND] Mejor coincidencia: {target_product['name']} (ID: {target_product['id']}) con {max_matches} palabras coincidentes")
+                    target_product, matches = catalog.find_in_message(user_message)
+                    if target_product and matches == 0:
+                        logger.info(f"[PRODUCT_FOUND] Coincidencia exacta: {target_product.name} (ID: {target_product.id})")
+                    elif target_product:
+                        logger.info(f"[PRODUCT_FOUND] Mejor coincidencia: {target_product.name} (ID: {target_product.id}) con {matches} palabras coincidentes")
                     
                     if not target_product:
                         logger.warning(f"[PRODUCT_NOT_FOUND] No se encontró producto para: '{user_message}'")
                 
+                # Registrar la decisión (métricas + datos de entrenamiento del clasificador local)
+                intent_classifier.record_llm_decision(
+                    user_message, ai_response['intent_type'], ai_response.get('confidence'),
+                    time.time() - intent_start, context
+                )
+                
                 # Agregar respuesta IA al historial
                 thread['conversation_history'].append({
                     'type': 'assistant',
@@ -6383,6 +6888,7 @@ RESPONDE SOLO JSON:"""
         except Exception as e:
             logger.error(f"Error en interpretación persistente: {e}")
         
+        intent_classifier.record_turn('fallback', time.time() - intent_start)
         # Fallback
         return {
             'intent_type': 'product_recommendations',
@@ -6400,7 +6906,7 @@ RESPONDE SOLO JSON:"""
             # Configurar Gemini si no está configurado
             if not hasattr(self, '_genai_configured'):
                 if GEMINI_API_KEY:
-                    genai.configure(api_key=GEMINI_API_KEY)
+                    genai.configure(**GEMINI_CONFIG)
                     self._genai_configured = True
                 else:
                     raise Exception("No hay API key de Gemini configurada")
@@ -6459,7 +6965,7 @@ Respuesta: {{"intent_type":"specific_product_ingredients","target_product_id":"1
 RESPONDE SOLO JSON:"""
             
             model = genai.GenerativeModel('gemini-1.5-flash')
-            response = model.generate_content(prompt)
+            response = gemini_generate(model, prompt, 'intent')
             
             # Parsear respuesta JSON de la IA
             import json
@@ -6522,7 +7028,7 @@ RESPONDE SOLO JSON:"""
             # Configurar Gemini si no está configurado
             if not hasattr(self, '_genai_configured'):
                 if GEMINI_API_KEY:
-                    genai.configure(api_key=GEMINI_API_KEY)
+                    genai.configure(**GEMINI_CONFIG)
                     self._genai_configured = True
                 else:
                     raise Exception("No hay API key de Gemini configurada")
@@ -6557,7 +7063,7 @@ EJEMPLO BUENO (natural):
 RESPONDE de forma natural:"""            
             
             model = genai.GenerativeModel('gemini-1.5-flash')
-            response = model.generate_content(prompt)
+            response = gemini_generate(model, prompt, 'ingredients')
             
             return response.text.strip()
             
@@ -6567,101 +7073,59 @@ RESPONDE de forma natural:"""
             ingredients_names = [ing['name'] for ing in real_ingredients]
             return f"El {product_name} contiene: {', '.join(ingredients_names)}."
     
-    def generate_pairings_response_with_ai(self, user_message, product_name, product_category, all_products):
-        """Generar maridajes usando SOLO productos reales de la BD"""
+    def generate_pairings_response_with_ai(self, user_message, product_name, product_category, all_products, product_id=None):
+        """Maridajes desde el historial real de pedidos; la IA solo redacta la respuesta"""
+        if product_id is None:
+            product_id = find_product_id_by_name(product_name)
+        
+        # Productos que realmente se piden junto al plato (modelo de canasta)
+        selected_products = [{
+            'id': p['id'],
+            'name': p['name'],
+            'description': p['description'],
+            'price': p['price'],
+            'category': p['category_name'],
+            'image_url': p['image_url']
+        } for p in get_basket_pairings(product_id, limit=4)]
+        
+        # Sin historial para este producto: opciones de otras categorías de la carta
+        if not selected_products:
+            selected_products = [{
+                'id': p['id'],
+                'name': p['name'],
+                'description': p['description'],
+                'price': float(p['price']),
+                'category': p['category_name'],
+                'image_url': p['image_url']
+            } for p in all_products if p['category_name'] != product_category][:3]
+        
+        product_names = ", ".join(p['name'] for p in selected_products)
+        default_response = f"Para acompañar el {product_name}, nuestros clientes suelen pedir: {product_names}."
+        
+        if not GEMINI_AVAILABLE or not selected_products:
+            return default_response, selected_products
+        
         try:
-            import google.generativeai as genai
-            
-            # Configurar Gemini si no está configurado
-            if not hasattr(self, '_genai_configured'):
-                if GEMINI_API_KEY:
-                    genai.configure(api_key=GEMINI_API_KEY)
-                    self._genai_configured = True
-                else:
-                    raise Exception("No hay API key de Gemini configurada")
-            
-            # Obtener TODAS las categorías disponibles dinámicamente
-            all_categories = list(set([p['category_name'] for p in all_products if p['category_name']]))
-            categories_info = chr(10).join([f"- {cat}" for cat in all_categories])
-            
-            # La IA decidirá dinámicamente qué categorías son apropiadas para acompañar
-            
-            # Preparar TODOS los productos disponibles
-            all_products_list = chr(10).join([
-                f"- {p['name']} (${p['price']}) - {p['category_name']} - {p.get('description', '')}" 
-                for p in all_products[:30]  # Limitar para optimizar IA
+            # La selección ya está hecha: Gemini solo redacta, no elige productos
+            products_text = chr(10).join([
+                f"- {p['name']} (${p['price']:.0f}) - {p['category']}" for p in selected_products
             ])
-            
-            # Prompt DINÁMICO: La IA interpreta qué categorías son acompañamientos
-            prompt = f"""TAREA: Recomendar maridajes/acompañamientos para {product_name} ({product_category}).
-            
-USUARIO PREGUNTÓ: "{user_message}"
-            
-CATEGORÍAS DISPONIBLES:
-{categories_info}
-
-TODOS LOS PRODUCTOS DISPONIBLES:
-{all_products_list}
+            prompt = f"""Cliente preguntó: "{user_message}"
+Plato: {product_name} ({product_category})
 
-INSTRUCCIONES INTELIGENTES:
-1. INTERPRETAR dinámicamente qué categorías/productos pueden acompañar a {product_name}
-2. NO hardcodear - DEDUCIR qué combina bien
-3. Considerar: entradas, guarniciones, ensaladas, sides, etc.
-4. USAR SOLO productos de la lista
-5. Explicar por qué combinan gastronómicamente
-6. Responder en español argentino natural
-
-EJEMPLO INTELIGENTE:
-"Analizando las categorías, para acompañar {product_name} identifico que [categorías] son apropiadas.
-Te recomiendo: [productos que complementen]"
+Acompañamientos (ya elegidos, NO agregar otros):
+{products_text}
 
-INTERPRETA DINÁMICAMENTE Y RESPONDE:"""            
+Redactá en español argentino natural, máximo 3 oraciones, por qué combinan con {product_name}."""
             
             model = genai.GenerativeModel('gemini-1.5-flash')
-            response = "Bueno, empecemos con estas opciones populares... "
-            
-            # Seleccionar productos mencionados en la respuesta
-            response_text = response.text.strip()
-            selected_products = []
-            
-            # Buscar productos mencionados en la respuesta IA
-            for product in all_products:
-                if product['name'].lower() in response_text.lower():
-                    selected_products.append({
-                        'id': product['id'],
-                        'name': product['name'],
-                        'description': product['description'],
-                        'price': float(product['price']),
-                        'category': product['category_name'],
-                        'image_url': product['image_url']
-                    })
-            
-            # Si no seleccionó ningún producto, fallback dinámico
-            if not selected_products:
-                selected_products = [{
-                    'id': p['id'],
-                    'name': p['name'],
-                    'description': p['description'],
-                    'price': float(p['price']),
-                    'category': p['category_name'],
-                    'image_url': p['image_url']
-                } for p in all_products[:3]]
-            
-            return response_text, selected_products[:4]
+            response = gemini_generate(model, prompt, 'pairings_text')
+            response_text = response.text.strip() if response and response.text else default_response
+            return response_text, selected_products
             
         except Exception as e:
-            logger.error(f"Error generando maridajes: {e}")
-            # Fallback: respuesta simple con primeros productos
-            fallback_products = [{
-                'id': p['id'],
-                'name': p['name'],
-                'description': p['description'],
-                'price': float(p['price']),
-                'category': p['category_name'],
-                'image_url': p['image_url']
-            } for p in all_products[:3]]
-            
-            return f"Para acompañar el {product_name}, te sugerimos nuestras opciones de la carta.", fallback_products
+            logger.error(f"Error redactando maridajes con IA: {e}")
+            return default_response, selected_products
     
     def generate_smart_beverage_recommendation(self, user_message, selected_food, selected_pairing, weather, temperature, time_of_day, all_products):
         """Generar recomendación inteligente de bebida según contexto"""
@@ -6671,7 +7135,7 @@ INTERPRETA DINÁMICAMENTE Y RESPONDE:"""
             # Configurar Gemini si no está configurado
             if not hasattr(self, '_genai_configured'):
                 if GEMINI_API_KEY:
-                    genai.configure(api_key=GEMINI_API_KEY)
+                    genai.configure(**GEMINI_CONFIG)
                     self._genai_configured = True
                 else:
                     raise Exception("No hay API key de Gemini configurada")
@@ -6733,7 +7197,7 @@ Te recomiendo:
 INTERPRETA DINÁMICAMENTE Y RESPONDE:"""            
             
             model = genai.GenerativeModel('gemini-1.5-flash')
-            response = model.generate_content(prompt)
+            response = gemini_generate(model, prompt, 'beverage')
             
             # Buscar productos mencionados en la respuesta IA
             response_text = response.text.strip()
@@ -6812,8 +7276,8 @@ INTERPRETA DINÁMICAMENTE Y RESPONDE:"""
             logger.error(f"Error obteniendo ingredientes del producto {product_id}: {e}")
             return []
 
-    def generate_ai_pairings(self, product_name, category):
-        """Generar maridajes inteligentes usando IA con productos desde caché"""
+    def generate_ai_pairings(self, product_name, category, product_id=None):
+        """Generar maridajes: primero el modelo de canasta local, la IA solo si no hay historial"""
         global ai_response_cache
         
         try:
@@ -6824,7 +7288,19 @@ INTERPRETA DINÁMICAMENTE Y RESPONDE:"""
             if (cache_key in ai_response_cache['pairings'] and 
                 current_time - ai_response_cache['pairings'][cache_key]['timestamp'] < ai_response_cache['cache_duration']):
                 logger.info(f"[AI_CACHE] Usando maridajes cacheados para {product_name}")
+                CACHE_LOOKUPS.labels('ai_pairings', 'hit').inc()
                 return ai_response_cache['pairings'][cache_key]['data']
+            CACHE_LOOKUPS.labels('ai_pairings', 'miss').inc()
+            
+            # 🧺 Modelo de canasta: co-compras reales, servido desde memoria
+            if product_id is None:
+                product_id = find_product_id_by_name(product_name)
+            basket_pairings = get_basket_pairings(product_id, limit=8)
+            if basket_pairings:
+                for pairing in basket_pairings:
+                    pairing['description'] = pairing.pop('reason')
+                logger.info(f"[PAIRING] {len(basket_pairings)} maridajes de historial para {product_name}")
+                return basket_pairings
             
             # Obtener productos para maridajes desde caché
             restaurant_data = get_restaurant_data()
@@ -6908,7 +7384,7 @@ Ejemplos de matching:
 JSON: {{"pairings":[{{"product_id":ID,"reason":"1 línea","type":"appetizer/side/wine/beverage/cocktail"}}]}}"""
             
             logger.info(f"[AI] Consultando Gemini para maridajes de {product_name} (tokens reducidos)")
-            response = model.generate_content(prompt)
+            response = gemini_generate(model, prompt, 'pairings')
             
             # Parsear respuesta JSON
             import json
@@ -7015,9 +7491,16 @@ JSON: {{"pairings":[{{"product_id":ID,"reason":"1 línea","type":"appetizer/side
         # Este punto no debería alcanzarse nunca
         raise Exception("Error inesperado en generate_ai_pairings")
     
-    def get_fallback_pairings(self, product_name, category):
+    def get_fallback_pairings(self, product_name, category, product_id=None):
         """Maridajes de respaldo cuando falla la IA - obtiene productos reales de la BD"""
         try:
+            # Primero el historial de pedidos (sin IA ni consultas a la BD)
+            if product_id is None:
+                product_id = find_product_id_by_name(product_name)
+            basket_pairings = get_basket_pairings(product_id, limit=8)
+            if basket_pairings:
+                return basket_pairings
+            
             # Obtener productos reales de la base de datos
             query = """
             SELECT p.id, p.name, p.description, p.price, p.image_url, 
@@ -7328,6 +7811,7 @@ JSON: {{"pairings":[{{"product_id":ID,"reason":"1 línea","type":"appetizer/side
                     """, (name, price, cat_id, subcat_id, desc))
                 
                 connection.commit()
+                change_bus.emit('products')
                 
                 # Obtener los productos recién creados
                 cursor.execute("SELECT id, name, price FROM products WHERE available = 1")
@@ -7558,42 +8042,14 @@ JSON: {{"pairings":[{{"product_id":ID,"reason":"1 línea","type":"appetizer/side
                 connection.close()
 
     def create_addresses_table(self):
-        """Crear la tabla addresses que falta en el sistema"""
+        """Migrar customers.address a la tabla addresses (la tabla la crea el bootstrap de esquema)"""
         connection = None
         cursor = None
         try:
             connection = connection_pool.get_connection()
             cursor = connection.cursor()
 
-            # 1. Crear tabla addresses
-            create_table_query = """
-            CREATE TABLE IF NOT EXISTS addresses (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                customer_id INT NOT NULL,
-                address_type ENUM('home', 'work', 'other') DEFAULT 'home',
-                street_address VARCHAR(255) NOT NULL,
-                city VARCHAR(100) NOT NULL,
-                state_province VARCHAR(100),
-                postal_code VARCHAR(20),
-                country VARCHAR(100) DEFAULT 'Argentina',
-                latitude DECIMAL(10, 8),
-                longitude DECIMAL(11, 8),
-                is_default BOOLEAN DEFAULT FALSE,
-                delivery_instructions TEXT,
-                formatted_address TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-                
-                FOREIGN KEY (customer_id) REFERENCES customers(id) ON DELETE CASCADE,
-                INDEX idx_customer_id (customer_id),
-                INDEX idx_address_type (address_type),
-                INDEX idx_is_default (is_default)
-            )
-            """
-            
-            cursor.execute(create_table_query)
-            
-            # 2. Migrar datos existentes del campo customers.address
+            # Migrar datos existentes del campo customers.address
             migrate_query = """
             INSERT IGNORE INTO addresses (customer_id, address_type, street_address, city, is_default, delivery_instructions)
             SELECT 
@@ -7612,7 +8068,7 @@ JSON: {{"pairings":[{{"product_id":ID,"reason":"1 línea","type":"appetizer/side
             
             connection.commit()
             
-            # 3. Verificar resultado
+            # Verificar resultado
             cursor.execute("SELECT COUNT(*) FROM addresses")
             total_addresses = cursor.fetchone()[0]
             
@@ -7704,7 +8160,7 @@ JSON: {{"pairings":[{{"product_id":ID,"reason":"1 línea","type":"appetizer/side
             if connection:
                 connection.close()
     
-    def generate_intelligent_recommendations(self, user_message, products_data, thread_id):
+    def generate_intelligent_recommendations(self, user_message, catalog, thread_id):
         """Generar recomendaciones inteligentes usando IA - variedad vs específico"""
         try:
             import google.generativeai as genai
@@ -7712,34 +8168,19 @@ JSON: {{"pairings":[{{"product_id":ID,"reason":"1 línea","type":"appetizer/side
             # Configurar Gemini si no está configurado
             if not hasattr(self, '_genai_configured'):
                 if GEMINI_API_KEY:
-                    genai.configure(api_key=GEMINI_API_KEY)
+                    genai.configure(**GEMINI_CONFIG)
                     self._genai_configured = True
                 else:
                     raise Exception("No hay API key de Gemini configurada")
             
-            # Obtener categorías disponibles para análisis inteligente
-            categories = list(set([p['category_name'] for p in products_data if p['category_name']]))
+            # Categorías y muestras por categoría precalculadas en el snapshot del catálogo
+            categories = list(catalog.category_names)
             
             # 🔍 DEBUG: Ver qué hay en la base de datos
             print(f"\n🔍 DEBUG CATEGORÍAS EN BD:")
             print(f"   Total categorías: {len(categories)}")
             print(f"   Categorías: {categories}")
-            print(f"   Total productos: {len(products_data)}")
-            
-            # Crear dataset compacto por categoría (solo primeros productos de cada categoría)
-            category_products = {}
-            for product in products_data:
-                cat = product['category_name']
-                if cat and cat not in category_products:
-                    category_products[cat] = []
-                if cat and len(category_products[cat]) < 3:  # Max 3 por categoría
-                    category_products[cat].append(product)
-            
-            # Prompt inteligente para análisis de especificidad
-            categories_text = ", ".join(categories)
-            products_sample = ""
-            for cat, prods in category_products.items():
-                products_sample += f"\n{cat}: " + ", ".join([p['name'] for p in prods])
+            print(f"   Total productos: {len(catalog)}")
             
             # Obtener configuración del rubro desde la base de datos
             rubro_connection = None
@@ -7812,49 +8253,10 @@ JSON: {{"pairings":[{{"product_id":ID,"reason":"1 línea","type":"appetizer/side
                 if rubro_connection:
                     rubro_connection.close()
             
-            main_categories_text = ", ".join(main_categories)
-            import json
-            main_categories_json = json.dumps(main_categories, ensure_ascii=False)
-            
-            prompt = f"""Eres un experto en {business_type}. Analiza el mensaje del cliente y determina qué categorías mostrar.
-
-MENSAJE DEL CLIENTE: "{user_message}"
-
-DATOS DISPONIBLES:
-- Tipo de negocio: {business_type}
-- Categorías existentes: {categories_text}
-- Productos disponibles por categoría:{products_sample}
-
-TU TAREA:
-Usando ÚNICAMENTE los datos proporcionados arriba, analiza semánticamente qué está pidiendo el cliente y selecciona las categorías más relevantes.
-
-PROCESO DE ANÁLISIS:
-1. Identifica la intención del mensaje (qué busca el cliente)
-2. Relaciona esa intención con las categorías disponibles
-3. Selecciona hasta 4 categorías que mejor respondan a la consulta
-4. NO uses conocimiento externo, solo los datos proporcionados
-
-EJEMPLOS DE ANÁLISIS (genéricos):
-- Si el mensaje habla de "ver opciones" → mostrar categorías variadas principales
-- Si menciona algo específico → buscar categorías relacionadas con ese concepto
-- Si pide una acción (como "tomar", "usar", "comprar") → analizar qué categorías se relacionan con esa acción en el contexto del negocio
-
-RESPONDE EN JSON:
-{{{{
-  "query_type": "general|specific|action_based",
-  "detected_intent": "explicación breve de qué entendiste",
-  "target_categories": ["array con las categorías seleccionadas"],
-  "confidence": 0-100,
-  "response_text": "respuesta natural en español argentino"
-}}}}
-
-IMPORTANTE: 
-- Analiza el contexto del negocio para entender qué significa cada palabra
-- No asumas significados, usa los datos disponibles
-- Si no estás seguro, incluye categorías variadas"""
-            
-            model = genai.GenerativeModel('gemini-1.5-flash')
-            response = model.generate_content(prompt)
+            # El prefijo depende del rubro y de la versión del catálogo, no del mensaje
+            prompt = prompt_assembler.build('product_recommendations', catalog, user_message,
+                                            business_type=business_type)
+            response = prompt_assembler.generate(genai, prompt)
             
             logger.info(f"[AI_RECOMMENDATIONS] Raw: {response.text[:200]}...")
             
@@ -7880,94 +8282,20 @@ IMPORTANTE:
                     target_categories = []
                     response_text = '¡Acá tenés algunas opciones variadas!'
                 
-                # Seleccionar productos según el análisis inteligente de la IA
-                selected_products = []
-                
                 # La IA ya determinó qué categorías mostrar basándose en el análisis semántico
                 if target_categories:
-                    # Usar las categorías que la IA seleccionó
-                    allowed_categories = set(target_categories)
                     logger.info(f"[AI_SELECTED] Using AI-selected categories: {target_categories}")
+                    selected_categories = catalog.first_per_category(target_categories, 4)
                 else:
                     # Fallback: si la IA no pudo determinar, usar categorías variadas
-                    allowed_categories = set(categories[:4])  # Primeras 4 categorías disponibles
                     logger.info(f"[FALLBACK] AI couldn't determine, using first 4 categories")
+                    selected_categories = categories[:4]
                 
-                # Recolectar productos de las categorías seleccionadas por la IA
-                used_categories = set()
-                
-                for product in products_data:
-                    if len(selected_products) >= 4:
-                        break
-                    cat = product['category_name']
-                    if cat and cat in allowed_categories and cat not in used_categories:
-                        selected_products.append(product)
-                        used_categories.add(cat)
-                        logger.info(f"[AI_BASED] Added {product['name']} from {cat}")
-                
-                # Si hay categorías específicas pero pocos productos, agregar más de esas categorías
-                if len(selected_products) < 4 and target_categories:
-                    for product in products_data:
-                        if len(selected_products) >= 4:
-                            break
-                        cat = product['category_name']
-                        if cat and cat in allowed_categories:
-                            selected_products.append(product)
-                            logger.info(f"[ADDITIONAL] Added more from {cat}: {product['name']}")
-                            
-                else:
-                    # FALLBACK: variedad de categorías (como antes)
-                    used_categories = set()
-                    for product in products_data:
-                        if len(selected_products) >= 4:
-                            break
-                        cat = product['category_name']
-                        if cat and cat not in used_categories:
-                            selected_products.append(product)
-                            used_categories.add(cat)
-                            logger.info(f"[FALLBACK] Added {product['name']} from {cat}")
-                
-                # Organizar productos por categorías para carruseles (MÁXIMO 4 CATEGORÍAS)
-                categorized_products = {}
-                
-                # Agrupar productos por categoría, limitando a 4 categorías
-                for product in selected_products:
-                    category = product['category_name']
-                    
-                    # LÍMITE: Solo 4 categorías máximo
-                    if len(categorized_products) >= 4 and category not in categorized_products:
-                        break
-                        
-                    if category not in categorized_products:
-                        categorized_products[category] = []
-                    
-                    # Máximo 6 productos por carrusel
-                    if len(categorized_products[category]) < 6:
-                        categorized_products[category].append({
-                            'id': product['id'],
-                            'name': product['name'],
-                            'description': product['description'],
-                            'price': float(product['price']),
-                            'category': category,
-                            'image_url': product['image_url']
-                        })
-                
-                # Expandir cada categoría con más productos para hacer carruseles completos
-                for category in categorized_products:
-                    if len(categorized_products[category]) < 4:  # Llenar hasta 4 productos mínimo por carrusel
-                        for product in products_data:
-                            if len(categorized_products[category]) >= 6:  # Máximo 6 por carrusel
-                                break
-                            if (product['category_name'] == category and 
-                                product['id'] not in [p['id'] for p in categorized_products[category]]):
-                                categorized_products[category].append({
-                                    'id': product['id'],
-                                    'name': product['name'],
-                                    'description': product['description'],
-                                    'price': float(product['price']),
-                                    'category': category,
-                                    'image_url': product['image_url']
-                                })
+                # Organizar productos por categorías para carruseles (MÁXIMO 4 CATEGORÍAS, 6 por carrusel)
+                categorized_products = {
+                    category: [product.to_card(category) for product in catalog.in_category(category)[:6]]
+                    for category in selected_categories
+                }
                 
                 # Contar productos totales
                 total_products = sum(len(products) for products in categorized_products.values())
@@ -7989,39 +8317,13 @@ IMPORTANTE:
         
         # Fallback: productos variados POR CATEGORÍA
         print(f"\n⚠️ FALLBACK ACTIVADO en generate_intelligent_recommendations")
-        print(f"   Usando productos variados de {len(products_data)} disponibles")
-        
-        # Obtener productos variados de diferentes categorías
-        categorized_fallback = {}
-        used_categories = set()
+        print(f"   Usando productos variados de {len(catalog)} disponibles")
         
-        for product in products_data:
-            category = product.get('category_name')
-            if category and category not in used_categories and len(categorized_fallback) < 4:
-                if category not in categorized_fallback:
-                    categorized_fallback[category] = []
-                
-                categorized_fallback[category].append({
-                    'id': product['id'],
-                    'name': product['name'],
-                    'description': product['description'], 
-                    'price': float(product['price']),
-                    'category': category,
-                    'image_url': product['image_url']
-                })
-                used_categories.add(category)
-                
-                # Agregar más productos de la misma categoría
-                for p in products_data:
-                    if p['category_name'] == category and p['id'] != product['id'] and len(categorized_fallback[category]) < 4:
-                        categorized_fallback[category].append({
-                            'id': p['id'],
-                            'name': p['name'],
-                            'description': p['description'], 
-                            'price': float(p['price']),
-                            'category': category,
-                            'image_url': p['image_url']
-                        })
+        # Primeras 4 categorías del menú, hasta 4 productos de cada una
+        categorized_fallback = {
+            category: [product.to_card(category) for product in catalog.in_category(category)[:4]]
+            for category in catalog.category_names[:4]
+        }
         
         print(f"   Fallback con categorías: {list(categorized_fallback.keys())}")
         
@@ -8039,6 +8341,124 @@ class ThreadedTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
     """Servidor TCP con threading para manejar múltiples conexiones simultáneas"""
     allow_reuse_address = True
 
+def run_schema_bootstrap():
+    """
+    Aplicar las migraciones de esquema pendientes (core/schema_bootstrap.py).
+    Corre una vez antes de levantar el servidor (y antes del fork de workers),
+    con una conexión propia porque en modo pre-fork el supervisor no tiene pool.
+    SCHEMA_BOOTSTRAP=0 lo desactiva si el esquema se administra por fuera.
+    """
+    if os.environ.get('SCHEMA_BOOTSTRAP', '1') == '0':
+        print("⏭️ Bootstrap de esquema desactivado (SCHEMA_BOOTSTRAP=0)")
+        return None
+    import mysql.connector
+    bootstrap = SchemaBootstrap(
+        get_connection=lambda: mysql.connector.connect(
+            **MYSQL_CONFIG, ssl_disabled=False, autocommit=True, connect_timeout=20
+        )
+    )
+    try:
+        report = bootstrap.run()
+    except Exception as e:
+        print(f"⚠️ Bootstrap de esquema no ejecutado: {e}")
+        logger.error(f"Error en bootstrap de esquema: {e}")
+        return None
+    print_report(report)
+    return report
+
+# Tareas únicas del servidor (recálculos, asesor de índices, bandeja de webhooks):
+# en modo pre-fork corren solo en este worker; el resto solo carga sus cachés
+SINGLETON_WORKER_ID = 0
+
+def publish_model_reload(name):
+    """Avisar a los otros workers que el modelo `name` se guardó de nuevo"""
+    invalidation_channel.publish({'scope': 'model', 'name': name}, include_self=False)
+
+@invalidation_channel.subscribe
+def reload_saved_model(event):
+    if event.get('scope') != 'model':
+        return
+    if event.get('name') == 'pairing':
+        pairing_engine.load()
+    elif event.get('name') == 'intent':
+        intent_classifier.load()
+
+def start_process_services():
+    """Cachés de cada proceso (requieren el pool inicializado)"""
+    # Modelo de maridajes: cargar el último calculado (lo recalcula el worker de tareas únicas)
+    pairing_engine.load()
+    print(f"🧺 Modelo de maridajes: {pairing_engine.get_stats()['products']} productos")
+    
+    # Clasificador local de intención: cargar el modelo (lo reentrena el worker de tareas únicas)
+    intent_classifier.load()
+    print(f"⚡ Clasificador de intención: modelo {'activo' if intent_classifier.get_stats()['model']['enabled'] else 'sin entrenar (solo reglas)'}")
+    
+    # Réplica de lectura para reportes: pool propio y chequeo de lag periódico
+    if replica_router:
+        replica_router.start()
+        print(f"📚 Réplica de lectura: {replica_router.config['host']} (lag máximo {replica_router.max_lag}s)")
+    
+    # Mapa de variantes de imágenes de productos
+    try:
+        print(f"🖼️ Variantes de imágenes: {image_variant_store.load()} productos")
+    except Exception as e:
+        print(f"⚠️ No se pudo cargar el mapa de variantes de imágenes: {e}")
+
+def start_customer_index():
+    """Índice de búsqueda de clientes (carga en segundo plano; mientras tanto se usa SQL)"""
+    customer_index.start_background_refresh(
+        execute_mysql_query,
+        interval=int(os.environ.get('CUSTOMER_INDEX_REFRESH_SECONDS', 1800))
+    )
+
+def start_singleton_services():
+    """Tareas que deben correr una sola vez por servidor, no una por worker"""
+    # Modelo de maridajes: recalcular periódicamente y avisar a los otros workers
+    pairing_engine.start_background_refresh(
+        execute_mysql_query,
+        interval=int(os.environ.get('PAIRING_REFRESH_SECONDS', 6 * 3600)),
+        on_saved=lambda: publish_model_reload('pairing')
+    )
+    
+    # Clasificador local de intención: reentrenar con el log de decisiones de la IA
+    intent_classifier.start_background_training(
+        interval=int(os.environ.get('INTENT_MODEL_REFRESH_SECONDS', 6 * 3600)),
+        on_saved=lambda: publish_model_reload('intent')
+    )
+    
+    # Asesor de índices: EXPLAIN periódico de las consultas con más tiempo acumulado
+    index_advisor.start_background(
+        execute_mysql_query,
+        interval=int(os.environ.get('QUERY_ADVISOR_INTERVAL_SECONDS', 900))
+    )
+    
+    # Workers de la bandeja de webhooks de MercadoPago (los demás procesos solo encolan)
+    if webhook_inbox:
+        webhook_inbox.start()
+        print(f"🔔 Bandeja de webhooks MercadoPago: {webhook_inbox.workers} workers")
+
+def start_background_services():
+    """Servicios en segundo plano en modo un solo proceso"""
+    start_process_services()
+    start_customer_index()
+    start_singleton_services()
+
+def start_worker(worker_id):
+    """Inicialización de cada worker pre-fork: pool MySQL propio (no se comparte tras fork)"""
+    if not init_pool():
+        raise Exception(f"Worker {worker_id}: no se pudo conectar a la base de datos")
+    start_process_services()
+    # El índice de clientes ocupa ~1.2KB por cliente en cada proceso que lo arma:
+    # por defecto solo el worker de tareas únicas, el resto busca por SQL
+    if worker_id == SINGLETON_WORKER_ID or os.environ.get('CUSTOMER_INDEX_ALL_WORKERS', '0') == '1':
+        start_customer_index()
+    if worker_id == SINGLETON_WORKER_ID:
+        start_singleton_services()
+
+def stop_worker(worker_id):
+    """Al reciclar o detener un worker: escribir el autosave pendiente (os._exit no corre atexit)"""
+    layout_autosave.flush()
+
 # Start server simplificado y correcto
 if __name__ == "__main__":
     print("=" * 60)
@@ -8066,6 +8486,25 @@ if __name__ == "__main__":
     print("  ... y más")
     print("\n✨ Servidor listo para recibir conexiones\n")
     
+    # DDL una sola vez al arrancar: los handlers solo hacen DML
+    run_schema_bootstrap()
+    
+    # Modo pre-fork: WORKERS > 1 levanta un supervisor con N procesos sobre el mismo puerto
+    WORKERS = int(os.environ.get('WORKERS', 1))
+    if WORKERS > 1:
+        print(f"🔀 Modo pre-fork: {WORKERS} workers (SO_REUSEPORT)")
+        run_prefork(
+            CompleteServerHandler, ThreadedTCPServer, PORT, WORKERS,
+            on_worker_start=start_worker,
+            on_worker_stop=stop_worker,
+            max_requests=int(os.environ.get('WORKER_MAX_REQUESTS', 0)),
+            max_requests_jitter=int(os.environ.get('WORKER_MAX_REQUESTS_JITTER', 0)),
+            max_rss_mb=int(os.environ.get('WORKER_MAX_RSS_MB', 0)),
+            health_interval=float(os.environ.get('WORKER_HEALTH_INTERVAL', 10)),
+            graceful_timeout=float(os.environ.get('WORKER_GRACEFUL_TIMEOUT', 30))
+        )
+        exit(0)
+    
     # Inicializar pool una vez al inicio
     print("🔄 Inicializando pool de conexiones...")
     if not init_pool():
@@ -8073,6 +8512,8 @@ if __name__ == "__main__":
         exit(1)
     print("✅ Pool inicializado correctamente")
     
+    start_background_services()
+    
     # Crear y ejecutar servidor
     try:
         print(f"🚀 Iniciando servidor en puerto {PORT}...")
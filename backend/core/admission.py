@@ -0,0 +1,167 @@
+"""
+Control de admisión por prioridad para complete_server
+
+Con el pool de 10 conexiones agotado, los threads de los handlers se apilan
+esperando MySQL y la cocina compite de igual a igual con dashboards y el
+chat de IA. Cada request se clasifica por ruta:
+
+  - critical:   pedidos, cocina, mesas, pagos, login
+  - normal:     catálogo, clientes y el resto
+  - background: reportes, exportaciones, chat/IA, setup y debug
+
+Cada clase tiene un límite de requests en curso y todas comparten un total
+(el tamaño del pool). Una clase no entra mientras haya requests de una clase
+más prioritaria esperando lugar, y si la espera supera el máximo de su clase
+el request se rechaza con 503 + Retry-After en lugar de quedarse colgado.
+Los críticos pueden usar todo el total; normal y background no, así siempre
+queda lugar para la cocina.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+CRITICAL = 'critical'
+NORMAL = 'normal'
+BACKGROUND = 'background'
+PRIORITY = (CRITICAL, NORMAL, BACKGROUND)
+
+# Prefijo de ruta -> clase (prefijo más largo primero); lo que no figura es NORMAL
+ROUTE_CLASSES = {
+    '/api/orders': CRITICAL,
+    '/api/kitchen': CRITICAL,
+    '/api/tables': CRITICAL,
+    '/api/payment': CRITICAL,
+    '/api/webhooks': CRITICAL,
+    '/api/auth': CRITICAL,
+    '/api/reports': BACKGROUND,
+    '/api/exports': BACKGROUND,
+    '/api/chat': BACKGROUND,
+    '/api/ai': BACKGROUND,
+    '/api/setup': BACKGROUND,
+    '/api/debug': BACKGROUND,
+    '/api/test-db': BACKGROUND,
+    '/api/create-': BACKGROUND,
+    '/api/add-': BACKGROUND,
+    '/api/fix-': BACKGROUND,
+}
+# Sin control de admisión: health checks, estáticos y los propios endpoints de métricas
+EXEMPT_PREFIXES = ('/health', '/api/health', '/static/', '/api/admission', '/api/db/', '/metrics')
+
+TOTAL_LIMIT = int(os.environ.get('ADMISSION_TOTAL', 10))
+CLASS_LIMITS = {
+    CRITICAL: int(os.environ.get('ADMISSION_LIMIT_CRITICAL', TOTAL_LIMIT)),
+    NORMAL: int(os.environ.get('ADMISSION_LIMIT_NORMAL', 6)),
+    BACKGROUND: int(os.environ.get('ADMISSION_LIMIT_BACKGROUND', 3)),
+}
+# Espera máxima en cola (segundos) antes de rechazar
+MAX_WAIT = {
+    CRITICAL: float(os.environ.get('ADMISSION_WAIT_CRITICAL', 10)),
+    NORMAL: float(os.environ.get('ADMISSION_WAIT_NORMAL', 1.0)),
+    BACKGROUND: float(os.environ.get('ADMISSION_WAIT_BACKGROUND', 0.25)),
+}
+RETRY_AFTER = {CRITICAL: 1, NORMAL: 2, BACKGROUND: 5}
+LATENCY_WINDOW = 500
+
+_ROUTE_CLASSES = tuple(sorted(ROUTE_CLASSES.items(), key=lambda item: len(item[0]), reverse=True))
+
+
+def route_class(method, path):
+    """Clase de prioridad de un request, o None si está exento"""
+    if method == 'OPTIONS' or path.startswith(EXEMPT_PREFIXES):
+        return None
+    for prefix, klass in _ROUTE_CLASSES:
+        if path.startswith(prefix):
+            return klass
+    return NORMAL
+
+
+class AdmissionController:
+    """
+    Semáforo con prioridades:
+    - acquire(): espera lugar hasta el máximo de la clase; False = rechazar con 503
+    - release(): libera el lugar y despierta a los que esperan
+    - get_stats(): en curso, en cola, admitidos, rechazados y espera por clase
+    """
+
+    def __init__(self, total=TOTAL_LIMIT, limits=None, max_wait=None):
+        self.total = total
+        self.limits = dict(limits or CLASS_LIMITS)
+        self.max_wait = dict(max_wait or MAX_WAIT)
+        self._cond = threading.Condition()
+        self._active_total = 0
+        self._active = {klass: 0 for klass in PRIORITY}
+        self._waiting = {klass: 0 for klass in PRIORITY}
+        self._admitted = {klass: 0 for klass in PRIORITY}
+        self._rejected = {klass: 0 for klass in PRIORITY}
+        self._waits = {klass: deque(maxlen=LATENCY_WINDOW) for klass in PRIORITY}
+
+    def _has_room(self, klass):
+        return self._active_total < self.total and self._active[klass] < self.limits[klass]
+
+    def _can_admit(self, klass):
+        if not self._has_room(klass):
+            return False
+        # Una clase más prioritaria esperando (y con lugar propio) pasa primero
+        for higher in PRIORITY[:PRIORITY.index(klass)]:
+            if self._waiting[higher] and self._active[higher] < self.limits[higher]:
+                return False
+        return True
+
+    def acquire(self, klass, max_wait=None):
+        """Reservar lugar para un request de la clase; False si la espera supera el máximo"""
+        max_wait = self.max_wait[klass] if max_wait is None else min(max_wait, self.max_wait[klass])
+        start = time.monotonic()
+        with self._cond:
+            if not self._can_admit(klass):
+                self._waiting[klass] += 1
+                try:
+                    while not self._can_admit(klass):
+                        remaining = max_wait - (time.monotonic() - start)
+                        if remaining <= 0:
+                            self._rejected[klass] += 1
+                            return False
+                        self._cond.wait(remaining)
+                finally:
+                    self._waiting[klass] -= 1
+            self._active[klass] += 1
+            self._active_total += 1
+            self._admitted[klass] += 1
+            self._waits[klass].append(time.monotonic() - start)
+            return True
+
+    def release(self, klass):
+        with self._cond:
+            self._active[klass] -= 1
+            self._active_total -= 1
+            self._cond.notify_all()
+
+    def get_stats(self):
+        with self._cond:
+            classes = {}
+            for klass in PRIORITY:
+                waits = sorted(self._waits[klass])
+
+                def percentile(p):
+                    if not waits:
+                        return 0.0
+                    return round(waits[min(len(waits) - 1, int(p * len(waits)))] * 1000, 1)
+
+                classes[klass] = {
+                    'limit': self.limits[klass],
+                    'max_wait_ms': int(self.max_wait[klass] * 1000),
+                    'active': self._active[klass],
+                    'waiting': self._waiting[klass],
+                    'admitted': self._admitted[klass],
+                    'rejected': self._rejected[klass],
+                    'wait_p50_ms': percentile(0.50),
+                    'wait_p95_ms': percentile(0.95),
+                }
+            return {'total_limit': self.total, 'active': self._active_total, 'classes': classes}
+
+
+# Instancia global (ADMISSION_CONTROL=0 la desactiva)
+admission_controller = AdmissionController() if os.environ.get('ADMISSION_CONTROL', '1') != '0' else None
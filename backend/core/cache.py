@@ -1,14 +1,30 @@
 """
 Redis cache configuration and utilities.
+
+Invalidation is tag-based: every cached entry is registered in one Redis set
+per tag (e.g. ``tag:category:5``, ``tag:products``). Invalidating a tag only
+touches that tag's members, so it costs O(entries under the tag) instead of
+the O(total keys) blocking ``KEYS pattern`` scan.
+
+Reads go through ``TieredCache``: a small per-process L1 of decoded objects
+in front of Redis (L2), with single-flight recomputation, probabilistic early
+refresh (XFetch) and stale values served when MySQL or Redis misbehave.
 """
 import redis.asyncio as redis
-from typing import Optional, Any
+from typing import Optional, Any, Awaitable, Callable, Dict, Iterable, List, Union
+from collections import OrderedDict, defaultdict
+import asyncio
 import json
+import math
+import random
+import time
 import structlog
 from functools import wraps
 import hashlib
+import uuid
 
 from .config import settings
+from .metrics import registry
 
 logger = structlog.get_logger()
 
@@ -61,58 +77,407 @@ def make_cache_key(*args, **kwargs) -> str:
     return key_str
 
 
-def cache_result(prefix: str, ttl: int = 60):
+TAG_PREFIX = "tag:"
+# Tag sets outlive their members a little so late registrations are not lost
+TAG_TTL_SLACK = 60
+# Batch size for SSCAN/UNLINK when purging large tags
+INVALIDATION_BATCH = 500
+
+
+def tag_key(tag: str) -> str:
+    """Redis key of the member set for a tag"""
+    return f"{TAG_PREFIX}{tag}"
+
+
+async def set_with_tags(client, key: str, value: str, ttl: int, tags: Iterable[str] = ()):
+    """
+    Store a value and register it under its tags in a single round trip.
+    
+    A tag set only ever gets a longer TTL: a short-lived entry must not cut
+    the expiry of the set that still tracks longer-lived ones. NX sets the
+    TTL of a fresh set, GT only extends an existing one (Redis >= 7).
+    """
+    tags = list(tags)
+    async with client.pipeline(transaction=False) as pipe:
+        pipe.setex(key, ttl, value)
+        for tag in tags:
+            pipe.sadd(tag_key(tag), key)
+            pipe.expire(tag_key(tag), ttl + TAG_TTL_SLACK, nx=True)
+            pipe.expire(tag_key(tag), ttl + TAG_TTL_SLACK, gt=True)
+        await pipe.execute()
+
+
+async def invalidate_tags(client, *tags: str) -> int:
+    """
+    Delete every entry registered under the given tags.
+    
+    The tag set is renamed first, so entries cached while the purge runs
+    register in a fresh set and are not lost. Members are then removed in
+    SSCAN batches with UNLINK, never blocking Redis on one huge command.
+    """
+    deleted = 0
+    for tag in tags:
+        purge_key = f"{tag_key(tag)}:purge:{uuid.uuid4().hex}"
+        try:
+            await client.rename(tag_key(tag), purge_key)
+        except Exception:
+            # ResponseError "no such key": nothing cached under this tag
+            continue
+        
+        cursor = 0
+        while True:
+            cursor, members = await client.sscan(purge_key, cursor=cursor, count=INVALIDATION_BATCH)
+            if members:
+                deleted += await client.unlink(*members)
+            if cursor == 0:
+                break
+        await client.unlink(purge_key)
+    
+    tiered_cache.evict_tags(tags)
+    return deleted
+
+
+class _L1Entry:
+    """Decoded value held in the in-process tier"""
+    __slots__ = ("value", "fresh_until", "stale_until", "tags")
+    
+    def __init__(self, value: Any, fresh_until: float, stale_until: float, tags: Iterable[str]):
+        self.value = value
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+        self.tags = frozenset(tags)
+
+
+class RefreshInProgress(Exception):
+    """Another process holds the recompute lock for this key"""
+
+
+STAT_FIELDS = ("l1_hits", "l2_hits", "misses", "coalesced", "early_refreshes", "stale_served", "errors")
+
+
+class TieredCache:
     """
-    Decorator to cache async function results.
+    Two-tier cache: per-process L1 of decoded objects, Redis as L2.
+    
+    - L1 entries live at most ``l1_ttl`` seconds, so writes made through
+      other processes become visible quickly without cross-process messaging.
+    - L2 values are stored in an envelope with their logical expiry and the
+      time it took to compute them. They are kept ``stale_ttl`` seconds past
+      expiry so a stale copy exists when the database or Redis is slow.
+    - Concurrent misses for a key share one computation (single-flight) and,
+      when a stale copy exists, a short Redis lock keeps other processes from
+      recomputing it at the same time.
+    - Hits close to expiry are refreshed early in the background with
+      probability given by XFetch (``now - delta * beta * ln(rand) >= expiry``).
+    """
+    
+    def __init__(
+        self,
+        l1_ttl: float = 5,
+        l1_max_entries: int = 2000,
+        stale_ttl: int = 300,
+        redis_timeout: float = 0.25,
+        stale_grace: float = 1.0,
+        beta: float = 1.0,
+        lock_ttl: int = 30
+    ):
+        self.l1_ttl = l1_ttl
+        self.l1_max_entries = l1_max_entries
+        self.stale_ttl = stale_ttl
+        self.redis_timeout = redis_timeout
+        self.stale_grace = stale_grace
+        self.beta = beta
+        self.lock_ttl = lock_ttl
+        self._l1: "OrderedDict[str, _L1Entry]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._generation = 0
+        self._stats: Dict[str, Dict[str, int]] = defaultdict(lambda: dict.fromkeys(STAT_FIELDS, 0))
+    
+    async def get_or_compute(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[Any]],
+        ttl: int,
+        tags: Iterable[str] = (),
+        prefix: Optional[str] = None,
+        client: Any = None
+    ) -> Any:
+        """
+        Return the cached value for key, computing it with ``fetch()`` on a miss.
+        
+        Args:
+            key: Cache key
+            fetch: Zero-argument coroutine function producing the value
+            ttl: Freshness in seconds
+            tags: Invalidation tags for the entry
+            prefix: Stats bucket (defaults to the first segment of the key)
+            client: Redis client for L2; None keeps the entry in L1 only
+        """
+        stats = self._stats[prefix or key.split(":", 1)[0]]
+        tags = list(tags)
+        now = time.time()
+        stale = None
+        
+        entry = self._l1.get(key)
+        if entry is not None:
+            if now < entry.fresh_until:
+                self._l1.move_to_end(key)
+                stats["l1_hits"] += 1
+                return entry.value
+            if now < entry.stale_until:
+                stale = entry
+            else:
+                del self._l1[key]
+        
+        if client is not None:
+            try:
+                raw = await asyncio.wait_for(client.get(key), self.redis_timeout)
+            except Exception as e:
+                stats["errors"] += 1
+                logger.warning("Cache get error", key=key, error=str(e))
+                if stale is not None:
+                    stats["stale_served"] += 1
+                    return stale.value
+                raw = None
+            
+            if raw:
+                value, expiry, delta = self._decode(raw, now)
+                if now < expiry:
+                    stats["l2_hits"] += 1
+                    self._store_l1(key, value, expiry, tags)
+                    if self._xfetch(expiry, delta, now) and key not in self._inflight:
+                        stats["early_refreshes"] += 1
+                        self._start_refresh(key, fetch, ttl, tags, client, stats, use_lock=True)
+                    return value
+                stale = _L1Entry(value, expiry, expiry + self.stale_ttl, tags)
+        
+        stats["misses"] += 1
+        if key in self._inflight:
+            stats["coalesced"] += 1
+        task = self._start_refresh(key, fetch, ttl, tags, client, stats, use_lock=stale is not None)
+        
+        if stale is None:
+            try:
+                return await asyncio.shield(task)
+            except RefreshInProgress:
+                # Joined a locked background refresh but have nothing to serve
+                return await fetch()
+        
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), self.stale_grace)
+        except Exception as e:
+            stats["stale_served"] += 1
+            if not isinstance(e, (RefreshInProgress, asyncio.TimeoutError)):
+                logger.warning("Serving stale cache entry", key=key, error=str(e))
+            return stale.value
+    
+    def _xfetch(self, expiry: float, delta: float, now: float) -> bool:
+        """Probabilistic early expiration (Vattani et al., XFetch)"""
+        if delta <= 0:
+            return False
+        return now - delta * self.beta * math.log(1.0 - random.random()) >= expiry
+    
+    def _decode(self, raw: str, now: float):
+        """Unpack an L2 envelope; plain JSON from older writers counts as fresh"""
+        data = json.loads(raw)
+        if isinstance(data, dict) and data.get("_tc") == 1:
+            return data["v"], data["e"], data["d"]
+        return data, now + self.l1_ttl, 0.0
+    
+    def _store_l1(self, key: str, value: Any, expiry: float, tags: Iterable[str]):
+        now = time.time()
+        self._l1[key] = _L1Entry(value, min(now + self.l1_ttl, expiry), expiry + self.stale_ttl, tags)
+        self._l1.move_to_end(key)
+        while len(self._l1) > self.l1_max_entries:
+            self._l1.popitem(last=False)
+    
+    def _start_refresh(self, key, fetch, ttl, tags, client, stats, use_lock: bool) -> asyncio.Future:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._refresh(key, fetch, ttl, tags, client, stats, use_lock))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._refresh_done(key, t))
+        return task
+    
+    def _refresh_done(self, key: str, task: asyncio.Future):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Background refreshes nobody awaits must not log "never retrieved"
+            task.exception()
+    
+    async def _refresh(self, key, fetch, ttl, tags, client, stats, use_lock: bool) -> Any:
+        lock_key = f"lock:{key}"
+        if use_lock and client is not None:
+            try:
+                acquired = await asyncio.wait_for(
+                    client.set(lock_key, "1", ex=self.lock_ttl, nx=True), self.redis_timeout
+                )
+            except Exception:
+                # Redis unreachable: recompute locally rather than wait for it
+                acquired = True
+                lock_key = None
+            if not acquired:
+                raise RefreshInProgress(key)
+        else:
+            lock_key = None
+        
+        generation = self._generation
+        try:
+            start = time.perf_counter()
+            value = await fetch()
+            delta = time.perf_counter() - start
+        finally:
+            if lock_key:
+                try:
+                    await asyncio.wait_for(client.unlink(lock_key), self.redis_timeout)
+                except Exception:
+                    pass
+        
+        if generation != self._generation:
+            # Invalidated while computing: hand the value to current waiters only
+            return value
+        
+        expiry = time.time() + ttl
+        self._store_l1(key, value, expiry, tags)
+        if client is not None:
+            envelope = json.dumps({"_tc": 1, "v": value, "e": expiry, "d": delta}, default=str)
+            try:
+                await asyncio.wait_for(
+                    set_with_tags(client, key, envelope, ttl + self.stale_ttl, tags), self.redis_timeout
+                )
+            except Exception as e:
+                stats["errors"] += 1
+                logger.warning("Cache set error", key=key, error=str(e))
+        return value
+    
+    def evict_tags(self, tags: Iterable[str]):
+        """Drop L1 entries registered under any of the tags"""
+        tags = set(tags)
+        self._generation += 1
+        for key in [k for k, entry in self._l1.items() if entry.tags & tags]:
+            del self._l1[key]
+    
+    def clear(self):
+        """Drop every L1 entry"""
+        self._generation += 1
+        self._l1.clear()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit ratios per key prefix plus L1 occupancy"""
+        prefixes = {}
+        for prefix, counters in self._stats.items():
+            hits = counters["l1_hits"] + counters["l2_hits"]
+            lookups = hits + counters["misses"]
+            prefixes[prefix] = {
+                **counters,
+                "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+                "l1_hit_ratio": round(counters["l1_hits"] / lookups, 4) if lookups else 0.0,
+            }
+        return {
+            "l1_entries": len(self._l1),
+            "l1_max_entries": self.l1_max_entries,
+            "inflight": len(self._inflight),
+            "prefixes": prefixes,
+        }
+
+
+tiered_cache = TieredCache(
+    l1_ttl=settings.CACHE_L1_TTL,
+    l1_max_entries=settings.CACHE_L1_MAX_ENTRIES,
+    stale_ttl=settings.CACHE_STALE_TTL,
+    redis_timeout=settings.CACHE_REDIS_TIMEOUT,
+    stale_grace=settings.CACHE_STALE_GRACE,
+    beta=settings.CACHE_XFETCH_BETA
+)
+
+
+def _tiered_cache_metrics():
+    """Lookup outcomes per key prefix and L1 occupancy, read at scrape time"""
+    stats = tiered_cache.get_stats()
+    lookups = []
+    for prefix, counters in stats["prefixes"].items():
+        for result in ("l1_hits", "l2_hits", "misses", "stale_served"):
+            lookups.append(({"prefix": prefix, "result": result}, counters[result]))
+    return [
+        ("gastro_tiered_cache_lookups_total", "counter", "TieredCache lookups by key prefix and outcome", lookups),
+        ("gastro_tiered_cache_errors_total", "counter", "Redis errors seen by TieredCache",
+         [({"prefix": prefix}, counters["errors"]) for prefix, counters in stats["prefixes"].items()]),
+        ("gastro_tiered_cache_l1_entries", "gauge", "Entries held in the per-process L1", [({}, stats["l1_entries"])]),
+    ]
+
+
+registry.register_collector(_tiered_cache_metrics)
+
+
+def cache_result(prefix: str, ttl: int = 60,
+                 tags: Optional[Union[List[str], Callable[..., List[str]]]] = None):
+    """
+    Decorator to cache async function results in the two-tier cache.
     
     Args:
-        prefix: Cache key prefix
+        prefix: Cache key prefix (also the stats bucket)
         ttl: Time to live in seconds
+        tags: Invalidation tags, either a static list or a callable receiving
+            the decorated function's arguments (e.g. ``lambda category_id, **_:
+            [f"category:{category_id}"]``). The prefix is always a tag.
     """
     def decorator(func):
         @wraps(func)
         async def wrapper(*args, **kwargs):
-            # Skip caching if Redis not available
+            # Without Redis the entry still lives in the in-process tier
             cache = await get_redis()
-            if not cache:
-                return await func(*args, **kwargs)
             
             # Generate cache key
             cache_key = f"{prefix}:{make_cache_key(*args, **kwargs)}"
             
-            try:
-                # Try to get from cache
-                cached = await cache.get(cache_key)
-                if cached:
-                    logger.debug("Cache hit", key=cache_key)
-                    return json.loads(cached)
-            except Exception as e:
-                logger.warning("Cache get error", error=str(e))
-            
-            # Execute function
-            result = await func(*args, **kwargs)
-            
-            # Store in cache
-            try:
-                await cache.setex(
-                    cache_key,
-                    ttl,
-                    json.dumps(result, default=str)
-                )
-                logger.debug("Cache set", key=cache_key, ttl=ttl)
-            except Exception as e:
-                logger.warning("Cache set error", error=str(e))
+            entry_tags = [prefix]
+            if callable(tags):
+                entry_tags.extend(tags(*args, **kwargs))
+            elif tags:
+                entry_tags.extend(tags)
             
-            return result
+            return await tiered_cache.get_or_compute(
+                cache_key,
+                lambda: func(*args, **kwargs),
+                ttl,
+                tags=entry_tags,
+                prefix=prefix,
+                client=cache
+            )
         
         return wrapper
     return decorator
 
 
+async def invalidate_tag(*tags: str) -> int:
+    """
+    Invalidate cache entries registered under the given tags.
+    
+    Args:
+        tags: Tags such as "products" or "category:5"
+    """
+    cache = await get_redis()
+    if not cache:
+        tiered_cache.evict_tags(tags)
+        return 0
+    
+    try:
+        deleted = await invalidate_tags(cache, *tags)
+        logger.info("Cache invalidated", tags=tags, count=deleted)
+        return deleted
+    except Exception as e:
+        logger.error("Cache invalidation error", error=str(e))
+        return 0
+
+
 async def invalidate_cache(pattern: str):
     """
     Invalidate cache entries matching pattern.
     
+    Fallback for keys that were not cached with tags. Uses incremental SCAN
+    (never KEYS) so Redis keeps serving other clients; prefer invalidate_tag.
+    
     Args:
         pattern: Redis key pattern (e.g., "products:*")
     """
@@ -121,12 +486,17 @@ async def invalidate_cache(pattern: str):
         return 0
     
     try:
-        keys = await cache.keys(pattern)
-        if keys:
-            deleted = await cache.delete(*keys)
-            logger.info("Cache invalidated", pattern=pattern, count=deleted)
-            return deleted
-        return 0
+        deleted = 0
+        batch = []
+        async for key in cache.scan_iter(match=pattern, count=INVALIDATION_BATCH):
+            batch.append(key)
+            if len(batch) >= INVALIDATION_BATCH:
+                deleted += await cache.unlink(*batch)
+                batch = []
+        if batch:
+            deleted += await cache.unlink(*batch)
+        logger.info("Cache invalidated", pattern=pattern, count=deleted)
+        return deleted
     except Exception as e:
         logger.error("Cache invalidation error", error=str(e))
         return 0
@@ -160,7 +530,7 @@ class CacheManager:
         
         key = f"categories:counts:{include_counts}"
         try:
-            await cache.setex(key, ttl, json.dumps(data, default=str))
+            await set_with_tags(cache, key, json.dumps(data, default=str), ttl, ["categories"])
         except Exception as e:
             logger.warning("Failed to cache categories", error=str(e))
     
@@ -187,21 +557,22 @@ class CacheManager:
         
         key = f"products:cat:{category_id}:skip:{skip}:limit:{limit}"
         try:
-            await cache.setex(key, ttl, json.dumps(data, default=str))
+            await set_with_tags(
+                cache, key, json.dumps(data, default=str), ttl,
+                ["products", f"category:{category_id}"]
+            )
         except Exception as e:
             logger.warning("Failed to cache products", error=str(e))
     
     @staticmethod
     async def invalidate_products(category_id: Optional[int] = None):
-        """Invalidate product cache"""
+        """Invalidate product cache (one category, or every product entry)"""
         if category_id:
-            pattern = f"products:cat:{category_id}:*"
+            await invalidate_tag(f"category:{category_id}")
         else:
-            pattern = "products:*"
-        
-        await invalidate_cache(pattern)
+            await invalidate_tag("products")
     
     @staticmethod
     async def invalidate_categories():
         """Invalidate category cache"""
-        await invalidate_cache("categories:*")
\ No newline at end of file
+        await invalidate_tag("categories")
\ No newline at end of file
@@ -0,0 +1,233 @@
+"""
+Snapshot inmutable del catálogo para el motor de chat
+
+Se construye una vez por load_restaurant_data() y lo comparten todos los
+threads de conversación. Cada turno del chat resuelve productos por id,
+nombre o categoría con lookups en diccionarios en lugar de recorrer la lista
+completa de productos, y los textos que van al prompt (lista de categorías,
+muestras por categoría) ya vienen armados.
+
+Los productos son registros con __slots__ (sin __dict__ por instancia) que
+además aceptan acceso tipo dict (product['name'], product.get('image_url'))
+para que el código existente que esperaba filas de MySQL siga funcionando.
+"""
+import hashlib
+import re
+import unicodedata
+
+SAMPLES_PER_CATEGORY = 3
+
+_PUNCTUATION_RE = re.compile(r'[^\w\s]')
+
+
+def normalize_text(value):
+    """Minúsculas, sin acentos y con espacios simples: 'Café  Cortado' -> 'cafe cortado'"""
+    if not value:
+        return ''
+    text = unicodedata.normalize('NFKD', str(value).lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(text.split())
+
+
+def clean_words(value):
+    """Minúsculas y sin puntuación, conservando acentos: '¿La Coca-Cola?' -> ['la', 'coca', 'cola']"""
+    return _PUNCTUATION_RE.sub(' ', (value or '').lower()).split()
+
+
+class CatalogProduct:
+    """Producto del catálogo (solo lectura)"""
+
+    __slots__ = ('id', 'name', 'description', 'price', 'category_id', 'category_name',
+                 'subcategory_name', 'image_url', 'available', 'position', 'name_lower', 'name_clean',
+                 'name_words')
+
+    def __init__(self, row, position):
+        self.id = row['id']
+        self.name = row['name']
+        self.description = row.get('description')
+        self.price = row.get('price')
+        self.category_id = row.get('category_id')
+        self.category_name = row.get('category_name')
+        self.subcategory_name = row.get('subcategory_name')
+        self.image_url = row.get('image_url')
+        self.available = row.get('available')
+        self.position = position
+        self.name_lower = (row['name'] or '').lower()
+        # Palabras del nombre tokenizadas igual que los mensajes (clean_words)
+        self.name_words = tuple(clean_words(self.name_lower))
+        self.name_clean = ' '.join(self.name_words)
+
+    # Acceso tipo dict para el código que trabajaba con filas de MySQL
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        value = getattr(self, key, default)
+        return default if value is None and default is not None else value
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def to_card(self, category=None):
+        """Formato de producto que devuelven los endpoints del chat"""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'description': self.description,
+            'price': float(self.price or 0),
+            'category': category or self.category_name,
+            'image_url': self.image_url
+        }
+
+    def __repr__(self):
+        return f"CatalogProduct({self.id}, {self.name!r})"
+
+
+class CatalogSnapshot:
+    """
+    Índices del catálogo construidos una sola vez.
+
+    - by_id: id -> producto (también acepta el id como string)
+    - by_name: nombre normalizado -> producto
+    - by_category: categoría normalizada -> tupla de productos (orden del menú)
+    - category_names: categorías en orden de aparición
+    - category_samples: categoría -> primeros nombres de producto
+    - categories_text / samples_text: textos listos para los prompts
+    - version: hash de ids, nombres y categorías; cambia solo si cambia lo
+      que ve el modelo, y es la clave de los prefijos de prompt cacheados
+    """
+
+    def __init__(self, rows, samples_per_category=SAMPLES_PER_CATEGORY):
+        self.products = tuple(CatalogProduct(row, i) for i, row in enumerate(rows))
+
+        by_id = {}
+        by_name = {}
+        by_category = {}
+        category_names = []
+        word_index = {}
+        for product in self.products:
+            by_id[product.id] = product
+            by_id[str(product.id)] = product
+            by_name.setdefault(normalize_text(product.name), product)
+            if product.category_name:
+                key = normalize_text(product.category_name)
+                if key not in by_category:
+                    by_category[key] = []
+                    category_names.append(product.category_name)
+                by_category[key].append(product)
+            for word in set(product.name_words):
+                word_index.setdefault(word, []).append(product)
+
+        self.by_id = by_id
+        self.by_name = by_name
+        self.by_category = {key: tuple(products) for key, products in by_category.items()}
+        self.category_names = tuple(category_names)
+        self._word_index = {word: tuple(products) for word, products in word_index.items()}
+
+        self.category_samples = {
+            name: tuple(p.name for p in self.by_category[normalize_text(name)][:samples_per_category])
+            for name in self.category_names
+        }
+        self.categories_text = ', '.join(self.category_names)
+        self.samples_text = ''.join(
+            f"\n{name}: {', '.join(samples)}" for name, samples in self.category_samples.items()
+        )
+
+        digest = hashlib.blake2b(digest_size=8)
+        for product in self.products:
+            digest.update(f"{product.id}\x1f{product.name}\x1f{product.category_name}\x1e".encode())
+        self.version = digest.hexdigest()
+
+    def __len__(self):
+        return len(self.products)
+
+    def get(self, product_id):
+        if product_id is None:
+            return None
+        return self.by_id.get(product_id) or self.by_id.get(str(product_id).strip())
+
+    def by_product_name(self, name):
+        return self.by_name.get(normalize_text(name))
+
+    def in_category(self, category_name):
+        return self.by_category.get(normalize_text(category_name), ())
+
+    def category_label(self, category_name):
+        """Nombre canónico de una categoría escrita con otra capitalización/acentos"""
+        products = self.in_category(category_name)
+        return products[0].category_name if products else None
+
+    def with_words(self, words):
+        """Productos que comparten alguna palabra (ya tokenizada con clean_words), en orden del menú"""
+        found = {}
+        for word in words:
+            for product in self._word_index.get(word, ()):
+                found[product.position] = product
+        return [found[position] for position in sorted(found)]
+
+    @staticmethod
+    def _contains(product, message_lower, message_clean):
+        """Estrategia 1: el nombre está en el mensaje o el mensaje en el nombre (con y sin puntuación)"""
+        if product.name_lower in message_lower or message_lower in product.name_lower:
+            return True
+        return bool(message_clean) and (product.name_clean in message_clean or message_clean in product.name_clean)
+
+    def find_in_message(self, message):
+        """
+        Producto mencionado en un mensaje libre. Mismas estrategias que usaba
+        el chat, evaluadas solo sobre productos que comparten alguna palabra
+        con el mensaje (índice invertido) y en el orden del menú:
+          1. el nombre está contenido en el mensaje (o el mensaje en el nombre)
+          2. el producto con más palabras del nombre presentes en el mensaje
+        Mensaje e índice se tokenizan igual (clean_words: sin ¿?¡!.,-). Si
+        ninguna palabra completa coincide ("napo") se recorre el catálogo con
+        la estrategia 1, como antes del índice.
+
+        Devuelve (producto, palabras coincidentes); 0 palabras = estrategia 1.
+        """
+        message_lower = message.lower()
+        message_words = clean_words(message_lower)
+        message_clean = ' '.join(message_words)
+        message_words = set(message_words)
+        candidates = {}
+        for word in message_words:
+            for product in self._word_index.get(word, ()):
+                candidates[product.position] = product
+
+        if not candidates:
+            for product in self.products:
+                if self._contains(product, message_lower, message_clean):
+                    return product, 0
+            return None, 0
+
+        best_product = None
+        max_matches = 0
+        for position in sorted(candidates):
+            product = candidates[position]
+            if self._contains(product, message_lower, message_clean):
+                return product, 0
+            matches = sum(1 for word in product.name_words if word in message_words)
+            if matches > max_matches:
+                max_matches = matches
+                best_product = product
+        return best_product, max_matches
+
+    def samples_lines(self, per_category, bullet=''):
+        """Una línea por categoría con hasta per_category ejemplos ('' = solo categorías)"""
+        if per_category <= 0:
+            return ''
+        return '\n'.join(
+            f"{bullet}{name}: {', '.join(samples[:per_category])}"
+            for name, samples in self.category_samples.items()
+        )
+
+    def first_per_category(self, categories, limit):
+        """Categorías pedidas (en orden del menú) que existen, hasta limit"""
+        wanted = {normalize_text(c) for c in categories}
+        return [name for name in self.category_names if normalize_text(name) in wanted][:limit]
+
+
+EMPTY_CATALOG = CatalogSnapshot([])
@@ -0,0 +1,109 @@
+"""
+Bus de eventos de cambio para los cachés en memoria de complete_server
+
+Cada handler que escribe emite (tabla, id) después del commit; cada caché se
+registra con las tablas de las que depende y se invalida cuando cambia
+alguna. Así los TTL pueden ser largos (son solo una red de seguridad para
+escrituras hechas por fuera de este servidor) sin servir datos viejos.
+
+- emit() aplica las reglas en este proceso y publica el evento por el
+  InvalidationChannel de core/prefork.py: en modo pre-fork el resto de los
+  workers lo aplica al recibirlo.
+- Cada tabla tiene una versión (timestamp del último cambio, no un contador:
+  sigue siendo monótona entre workers y reinicios). etag() arma un ETag
+  débil con las versiones de las tablas de las que depende una respuesta
+  y el hash del contenido cacheado: las versiones cubren las escrituras de
+  este servidor y el hash las hechas por fuera (scripts, otro backend), que
+  cambian el ETag cuando el caché se vuelve a armar.
+"""
+import hashlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ChangeBus:
+    """
+    - depends(nombre, tablas): decorador que registra la invalidación de un caché
+    - emit(tabla, id): publicar una escritura (local + otros workers)
+    - etag(tablas, clave): ETag de una respuesta que depende de esas tablas
+    """
+
+    def __init__(self, channel):
+        self.channel = channel
+        self._rules = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+        self._stats = {'emitted': 0, 'received': 0, 'errors': 0, 'by_table': {}, 'by_cache': {}}
+        channel.subscribe(self._on_channel)
+
+    def depends(self, cache_name, tables):
+        """Registrar callback(event) para invalidar el caché cache_name cuando cambie alguna de las tablas"""
+        def decorator(callback):
+            for table in tables:
+                self._rules.setdefault(table, []).append((cache_name, callback))
+            return callback
+        return decorator
+
+    def emit(self, table, id=None, local=True):
+        """
+        Publicar que cambió una fila (o toda la tabla si id es None).
+        local=False si este proceso ya actualizó sus cachés a mano.
+        """
+        event = {'scope': 'change', 'table': table, 'id': id, 'at': time.time()}
+        with self._lock:
+            self._stats['emitted'] += 1
+        if local:
+            self.apply(event)
+        else:
+            self._bump(table, event['at'])
+        self.channel.publish(event, include_self=False)
+
+    def _on_channel(self, event):
+        if event.get('scope') == 'change':
+            with self._lock:
+                self._stats['received'] += 1
+            self.apply(event)
+
+    def _bump(self, table, at):
+        with self._lock:
+            self._versions[table] = max(self._versions.get(table, 0), at)
+            self._stats['by_table'][table] = self._stats['by_table'].get(table, 0) + 1
+
+    def apply(self, event):
+        """Subir la versión de la tabla y correr las invalidaciones que dependen de ella"""
+        table = event['table']
+        self._bump(table, event.get('at') or time.time())
+        for cache_name, callback in self._rules.get(table, ()):
+            try:
+                callback(event)
+                with self._lock:
+                    self._stats['by_cache'][cache_name] = self._stats['by_cache'].get(cache_name, 0) + 1
+            except Exception as e:
+                with self._lock:
+                    self._stats['errors'] += 1
+                logger.error(f"[CHANGES] Error invalidando {cache_name} por {table}: {e}")
+
+    def version(self, table):
+        # 0 si no cambió desde que arrancó el proceso: igual en todos los workers (y tras
+        # reciclarlos), así el ETag no depende de qué worker atiende; lo escrito antes del
+        # arranque o por fuera del bus lo cubre el hash del contenido
+        return self._versions.get(table, 0)
+
+    def etag(self, tables, key='', content=''):
+        """ETag débil: cambia cuando cambia cualquiera de las tablas o el contenido (hash)"""
+        token = '|'.join(f"{table}:{self.version(table):.6f}" for table in tables) + f"|{key}|{content}"
+        return f'W/"{hashlib.sha1(token.encode()).hexdigest()[:20]}"'
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'emitted': self._stats['emitted'],
+                'received_from_workers': self._stats['received'],
+                'errors': self._stats['errors'],
+                'changes_by_table': dict(self._stats['by_table']),
+                'invalidations_by_cache': dict(self._stats['by_cache']),
+                'rules': {table: [name for name, _ in rules] for table, rules in self._rules.items()},
+            }
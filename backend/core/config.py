@@ -28,6 +28,13 @@ class Settings(BaseSettings):
     DB_POOL_RECYCLE: int = 3600
     DB_POOL_PRE_PING: bool = True
     
+    # Optional read replica for reporting queries (falls back to the primary)
+    DB_REPLICA_HOST: Optional[str] = None
+    DB_REPLICA_PORT: Optional[int] = None
+    DB_REPLICA_MAX_LAG: float = 5.0
+    DB_REPLICA_CHECK_INTERVAL: float = 5.0
+    DB_REPLICA_ALLOW_STANDALONE: bool = False
+    
     # JWT Configuration
     JWT_SECRET_KEY: str = secrets.token_urlsafe(32)
     JWT_ALGORITHM: str = "HS256"
@@ -58,6 +65,14 @@ class Settings(BaseSettings):
     # Redis (optional for caching)
     REDIS_URL: Optional[str] = "redis://localhost:6379"
     
+    # Two-tier cache (in-process L1 in front of Redis L2)
+    CACHE_L1_TTL: int = 5
+    CACHE_L1_MAX_ENTRIES: int = 2000
+    CACHE_STALE_TTL: int = 300
+    CACHE_REDIS_TIMEOUT: float = 0.25
+    CACHE_STALE_GRACE: float = 1.0
+    CACHE_XFETCH_BETA: float = 1.0
+    
     @property
     def DATABASE_URL(self) -> str:
         """Generate MySQL connection URL"""
@@ -66,6 +81,16 @@ class Settings(BaseSettings):
             f"{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}?charset=utf8mb4"
         )
     
+    @property
+    def READ_DATABASE_URL(self) -> Optional[str]:
+        """MySQL connection URL for the read replica, if one is configured"""
+        if not self.DB_REPLICA_HOST:
+            return None
+        return (
+            f"mysql+aiomysql://{self.DB_USER}:{self.DB_PASSWORD}@"
+            f"{self.DB_REPLICA_HOST}:{self.DB_REPLICA_PORT or self.DB_PORT}/{self.DB_NAME}?charset=utf8mb4"
+        )
+    
     @property
     def SYNC_DATABASE_URL(self) -> str:
         """Generate synchronous MySQL connection URL for Alembic"""
@@ -0,0 +1,373 @@
+"""
+Índice de búsqueda de clientes por trigramas (en memoria)
+
+Reemplaza el `LIKE '%q%'` sobre customers, que no puede usar índices y
+recorre la tabla completa en cada tecla de la pantalla de pedidos
+telefónicos. Indexa nombre, email y dígitos del teléfono:
+- prefijo: trigramas con padding ("$$ju", "$ju") por cada palabra
+- substring: lista de postings más corta + verificación directa
+- fuzzy: conteo de trigramas compartidos cuando no alcanzan los exactos
+
+El índice solo devuelve IDs; los datos se leen por clave primaria para que
+loyalty_points/total_spent estén siempre actualizados.
+"""
+import logging
+import re
+import sys
+import threading
+import time
+import unicodedata
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CUSTOMER_INDEX_QUERY = """
+SELECT id, first_name, last_name, email, phone, company_id, is_active
+FROM customers
+"""
+
+_NON_DIGITS = re.compile(r'\D+')
+_WORD_SPLIT = re.compile(r'[^a-z0-9]+')
+
+
+def normalize_text(value) -> str:
+    """Minúsculas y sin acentos ('José Pérez' -> 'jose perez')"""
+    if not value:
+        return ''
+    value = unicodedata.normalize('NFKD', str(value))
+    return ''.join(c for c in value if not unicodedata.combining(c)).lower().strip()
+
+
+def phone_digits(value) -> str:
+    return _NON_DIGITS.sub('', str(value)) if value else ''
+
+
+def trigrams(token: str, pad: bool = True) -> set:
+    """Trigramas de una palabra; con padding el prefijo queda indexado"""
+    if pad:
+        token = f"$${token}"
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+
+class _Doc:
+    __slots__ = ('id', 'name', 'email', 'phone', 'company_id', 'is_active', 'grams')
+
+    def __init__(self, customer_id, name, email, phone, company_id, is_active, grams):
+        self.id = customer_id
+        self.name = name
+        self.email = email
+        self.phone = phone
+        self.company_id = company_id
+        self.is_active = is_active
+        self.grams = grams
+
+
+class CustomerSearchIndex:
+    """
+    Índice invertido trigrama -> [customer_id].
+    Las actualizaciones agregan postings nuevos y dejan los viejos como
+    "stale" (se descartan al verificar); cuando superan el umbral se
+    compacta el índice.
+    """
+
+    def __init__(self, fuzzy_threshold: float = 0.45, compact_ratio: float = 0.25):
+        self.fuzzy_threshold = fuzzy_threshold
+        self.compact_ratio = compact_ratio
+
+        self._docs: Dict[int, _Doc] = {}
+        self._postings: Dict[str, List[int]] = {}
+        self._total_postings = 0
+        self._stale_postings = 0
+        self._lock = threading.RLock()
+        self._ready = False
+        self._loaded_at = None
+        self.metrics = {'searches': 0, 'fuzzy_searches': 0, 'upserts': 0, 'compactions': 0}
+
+    # ============================================
+    # CONSTRUCCIÓN Y ACTUALIZACIÓN
+    # ============================================
+
+    def _make_doc(self, row: Dict) -> _Doc:
+        name = normalize_text(f"{row.get('first_name') or ''} {row.get('last_name') or ''}")
+        email = normalize_text(row.get('email'))
+        phone = phone_digits(row.get('phone'))
+
+        grams = set()
+        for token in _WORD_SPLIT.split(name):
+            if token:
+                grams |= trigrams(token)
+        for token in _WORD_SPLIT.split(email.split('@')[0]):
+            if token:
+                grams |= trigrams(token)
+        if email:
+            grams |= trigrams(email, pad=False)
+        if phone:
+            # Sin padding: se busca por cualquier tramo del número (ej: sin código de área)
+            grams |= trigrams(phone, pad=False) | trigrams(phone)
+
+        is_active = row.get('is_active')
+        # Tupla de strings internados: ~5x menos memoria que un frozenset por cliente
+        return _Doc(int(row['id']), name, email, phone, row.get('company_id'),
+                    True if is_active is None else bool(is_active),
+                    tuple(sys.intern(g) for g in grams))
+
+    def _add_postings(self, doc: _Doc):
+        for gram in doc.grams:
+            self._postings.setdefault(gram, []).append(doc.id)
+        self._total_postings += len(doc.grams)
+
+    def build(self, rows: Iterable[Dict]):
+        """Reconstruir el índice completo (swap atómico)"""
+        start = time.time()
+        docs = {}
+        postings: Dict[str, List[int]] = {}
+        total = 0
+        for row in rows:
+            doc = self._make_doc(row)
+            docs[doc.id] = doc
+            for gram in doc.grams:
+                postings.setdefault(gram, []).append(doc.id)
+            total += len(doc.grams)
+
+        with self._lock:
+            self._docs = docs
+            self._postings = postings
+            self._total_postings = total
+            self._stale_postings = 0
+            self._ready = True
+            self._loaded_at = time.time()
+
+        logger.info(f"[CUSTOMER_SEARCH] Índice construido: {len(docs)} clientes, "
+                    f"{len(postings)} trigramas en {time.time() - start:.2f}s")
+
+    def load(self, execute_query: Callable):
+        rows = execute_query(CUSTOMER_INDEX_QUERY)
+        if rows is None:
+            raise Exception("No se pudieron leer los clientes para el índice de búsqueda")
+        self.build(rows)
+
+    def upsert(self, row: Dict):
+        """Alta/modificación incremental de un cliente"""
+        if not self._ready:
+            return
+        with self._lock:
+            old = self._docs.get(int(row['id']))
+            if old is not None:
+                # Un UPDATE parcial no trae company_id/is_active: conservar los indexados
+                row = dict(row)
+                row.setdefault('company_id', old.company_id)
+                row.setdefault('is_active', old.is_active)
+            doc = self._make_doc(row)
+            if old is not None:
+                # Solo los trigramas nuevos generan postings; los que ya no aplican quedan stale
+                old_grams, new_grams = set(old.grams), set(doc.grams)
+                self._stale_postings += len(old_grams - new_grams)
+                for gram in new_grams - old_grams:
+                    self._postings.setdefault(gram, []).append(doc.id)
+                self._total_postings += len(new_grams - old_grams)
+            else:
+                self._add_postings(doc)
+            self._docs[doc.id] = doc
+            self.metrics['upserts'] += 1
+
+            if self._stale_postings > self._total_postings * self.compact_ratio:
+                self._compact()
+
+    def remove(self, customer_id: int):
+        with self._lock:
+            old = self._docs.pop(int(customer_id), None)
+            if old is not None:
+                self._stale_postings += len(old.grams)
+
+    def _compact(self):
+        postings: Dict[str, List[int]] = {}
+        total = 0
+        for doc in self._docs.values():
+            for gram in doc.grams:
+                postings.setdefault(gram, []).append(doc.id)
+            total += len(doc.grams)
+        self._postings = postings
+        self._total_postings = total
+        self._stale_postings = 0
+        self.metrics['compactions'] += 1
+
+    def is_ready(self) -> bool:
+        return self._ready
+
+    def start_background_refresh(self, execute_query: Callable, interval: int = 1800):
+        """
+        Carga inicial en segundo plano (mientras tanto se usa SQL) y
+        reconstrucción periódica para incorporar cambios de otros procesos.
+        """
+        def _loop():
+            while True:
+                try:
+                    self.load(execute_query)
+                except Exception as e:
+                    logger.error(f"[CUSTOMER_SEARCH] Error cargando índice: {e}")
+                time.sleep(interval)
+
+        threading.Thread(target=_loop, name='customer-index', daemon=True).start()
+
+    # ============================================
+    # BÚSQUEDA
+    # ============================================
+
+    def search(self, query: str, limit: int = 10, company_id: Optional[int] = None,
+               active_only: bool = True, fuzzy: bool = True) -> List[int]:
+        """IDs de clientes ordenados por relevancia (a igual score, los más recientes)"""
+        text = normalize_text(query)
+        if not text:
+            return []
+        digits = phone_digits(text)
+        is_phone_query = len(digits) >= 3 and len(digits) >= len(text.replace(' ', '')) * 0.7
+
+        with self._lock:
+            self.metrics['searches'] += 1
+
+            def accept(doc):
+                if doc is None or (active_only and not doc.is_active):
+                    return False
+                return company_id is None or doc.company_id == company_id
+
+            if is_phone_query:
+                scored = self._search_phone(digits, accept, limit)
+            else:
+                scored = self._search_text(text, accept, limit)
+
+            if fuzzy and len(scored) < limit and not is_phone_query and len(text) >= 4:
+                self.metrics['fuzzy_searches'] += 1
+                found = {customer_id for _, customer_id in scored}
+                scored.extend(self._search_fuzzy(text, accept, found, limit - len(scored)))
+
+        scored.sort(key=lambda item: (-item[0], -item[1]))
+        return [customer_id for _, customer_id in scored[:limit]]
+
+    def _candidates(self, grams: set) -> List[int]:
+        """Postings del trigrama más selectivo (lista más corta)"""
+        shortest = None
+        for gram in grams:
+            posting = self._postings.get(gram)
+            if not posting:
+                return []
+            if shortest is None or len(posting) < len(shortest):
+                shortest = posting
+        return shortest or []
+
+    def _scan(self, candidates: List[int], score_doc, accept, limit: int, max_score) -> List[tuple]:
+        """
+        Recorrer candidatos de más nuevo a más viejo. Se corta apenas hay
+        `limit` resultados con el score máximo posible (caso típico al tipear
+        un prefijo: no hace falta verificar toda la lista).
+        """
+        results = []
+        seen = set()
+        best = 0
+        for customer_id in reversed(candidates):
+            if customer_id in seen:
+                continue
+            seen.add(customer_id)
+            doc = self._docs.get(customer_id)
+            if not accept(doc):
+                continue
+            score = score_doc(doc)
+            if score:
+                results.append((score, customer_id))
+                if score == max_score:
+                    best += 1
+                    if best >= limit:
+                        break
+        return results
+
+    def _search_text(self, text: str, accept, limit: int) -> List[tuple]:
+        tokens = [t for t in _WORD_SPLIT.split(text) if t]
+        if not tokens:
+            return []
+
+        # Todas las palabras deben aparecer: el trigrama más raro define los candidatos
+        grams = set()
+        for token in tokens:
+            grams |= trigrams(token) if len(token) < 3 else trigrams(token, pad=False)
+
+        def score_doc(doc):
+            name = doc.name
+            score = 0
+            for token in tokens:
+                if token in name:
+                    score += 3 if (name.startswith(token) or f" {token}" in name) else 2
+                elif token in doc.email:
+                    score += 1
+                else:
+                    return 0
+            if name.startswith(text):
+                score += 2
+            return score
+
+        return self._scan(self._candidates(grams), score_doc, accept, limit,
+                          max_score=3 * len(tokens) + 2)
+
+    def _search_phone(self, digits: str, accept, limit: int) -> List[tuple]:
+        def score_doc(doc):
+            if digits not in doc.phone:
+                return 0
+            return 3 if doc.phone.startswith(digits) or doc.phone.endswith(digits) else 2
+
+        return self._scan(self._candidates(trigrams(digits, pad=False)), score_doc, accept, limit,
+                          max_score=3)
+
+    def _search_fuzzy(self, text: str, accept, exclude: set, limit: int) -> List[tuple]:
+        """
+        Coincidencia aproximada (errores de tipeo) por trigramas compartidos.
+        El conteo se hace con Counter (en C); solo se verifican los candidatos
+        con más trigramas en común hasta completar `limit`.
+        """
+        query_grams = set()
+        for token in _WORD_SPLIT.split(text):
+            if token:
+                query_grams |= trigrams(token)
+        if not query_grams:
+            return []
+
+        counts = Counter()
+        for gram in query_grams:
+            counts.update(self._postings.get(gram, ()))
+
+        min_shared = max(2, int(len(query_grams) * self.fuzzy_threshold + 0.999))
+        candidates = [(shared, customer_id) for customer_id, shared in counts.items()
+                      if shared >= min_shared]
+        candidates.sort(reverse=True)
+
+        results = []
+        for upper_bound, customer_id in candidates:
+            # El conteo es cota superior (puede incluir postings stale): cortar si ya no mejora
+            if len(results) >= limit and upper_bound <= results[-1][0]:
+                break
+            if customer_id in exclude:
+                continue
+            doc = self._docs.get(customer_id)
+            if not accept(doc):
+                continue
+            shared = sum(1 for g in doc.grams if g in query_grams)
+            if shared >= min_shared:
+                results.append((shared, customer_id))
+                results.sort(reverse=True)
+
+        # Score < 1: siempre por debajo de cualquier coincidencia exacta
+        return [(shared / (len(query_grams) + 1), customer_id) for shared, customer_id in results[:limit]]
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                'ready': self._ready,
+                'customers': len(self._docs),
+                'trigrams': len(self._postings),
+                'postings': self._total_postings,
+                'stale_postings': self._stale_postings,
+                'loaded_at': self._loaded_at,
+                **self.metrics,
+            }
+
+
+# Instancia global compartida por complete_server y api/customers.py
+customer_index = CustomerSearchIndex()
@@ -4,10 +4,15 @@ Database connection and session management.
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from typing import AsyncGenerator
+import time
 
 from .config import settings
+from .deadlines import bound_query, note_query_error
+from .replica import REPLICA_STATUS_QUERIES, replica_lag_from_status
+from .metrics import registry, observe_query
+from . import request_timing
 
 # Create async engine for application use
 engine = create_async_engine(
@@ -20,6 +25,75 @@ engine = create_async_engine(
     echo=settings.DEBUG,
 )
 
+
+# Statements issued inside a request get the request's remaining time budget as a
+# MAX_EXECUTION_TIME hint; timeouts are counted per route (see core/deadlines.py)
+def _bound_statement(conn, cursor, statement, parameters, context, executemany):
+    return bound_query(statement), parameters
+
+
+def _note_statement_timeout(exception_context):
+    note_query_error(exception_context.original_exception)
+    if exception_context.statement:
+        observe_query(exception_context.statement, 0, ok=False)
+
+
+# Per-fingerprint statement latency and rows for /metrics and the index advisor (see core/metrics.py, core/query_analytics.py)
+def _start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    # Counted before it runs: in strict mode an over-budget statement is never sent
+    request_timing.claim_query()
+    conn.info["query_start"] = time.perf_counter()
+
+
+def _observe_statement(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop("query_start", None)
+    if started is not None:
+        rows = cursor.rowcount if cursor.rowcount is not None and cursor.rowcount >= 0 else None
+        observe_query(statement, time.perf_counter() - started, params=parameters, rows=rows)
+
+
+def _instrument(sync_engine):
+    event.listen(sync_engine, "before_cursor_execute", _bound_statement, retval=True)
+    event.listen(sync_engine, "before_cursor_execute", _start_statement_timer)
+    event.listen(sync_engine, "after_cursor_execute", _observe_statement)
+    event.listen(sync_engine, "handle_error", _note_statement_timeout)
+
+
+_instrument(engine.sync_engine)
+
+# Optional read replica for reporting queries (see get_read_db)
+read_engine = create_async_engine(
+    settings.READ_DATABASE_URL,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+    echo=settings.DEBUG,
+) if settings.READ_DATABASE_URL else None
+
+if read_engine is not None:
+    _instrument(read_engine.sync_engine)
+
+
+def _pool_metrics():
+    """Connection pool occupancy, read at scrape time"""
+    pools = [("primary", engine.sync_engine.pool)]
+    if read_engine is not None:
+        pools.append(("replica", read_engine.sync_engine.pool))
+    return [
+        ("gastro_db_pool_size", "gauge", "Configured connection pool size",
+         [({"pool": name}, pool.size()) for name, pool in pools]),
+        ("gastro_db_pool_in_use", "gauge", "Connections checked out of the pool",
+         [({"pool": name}, pool.checkedout()) for name, pool in pools]),
+        ("gastro_db_pool_overflow", "gauge", "Connections opened beyond pool_size",
+         [({"pool": name}, max(pool.overflow(), 0)) for name, pool in pools]),
+    ]
+
+
+registry.register_collector(_pool_metrics)
+
+
 # Create sync engine for Alembic migrations
 sync_engine = create_engine(
     settings.SYNC_DATABASE_URL,
@@ -47,6 +121,17 @@ SyncSessionLocal = sessionmaker(
     autoflush=False,
 )
 
+ReadSessionLocal = async_sessionmaker(
+    read_engine,
+    class_=AsyncSession,
+    expire_on_commit=False,
+    autocommit=False,
+    autoflush=False,
+) if read_engine is not None else None
+
+# Last replica lag check, refreshed at most every DB_REPLICA_CHECK_INTERVAL seconds
+replica_state = {"healthy": False, "lag": None, "checked_at": 0.0}
+
 # Base class for models
 Base = declarative_base()
 
@@ -66,6 +151,50 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
             await session.close()
 
 
+async def _replica_is_fresh() -> bool:
+    """Check replication lag (cached); any error marks the replica unavailable"""
+    now = time.monotonic()
+    if now - replica_state["checked_at"] < settings.DB_REPLICA_CHECK_INTERVAL:
+        return replica_state["healthy"]
+    replica_state["checked_at"] = now
+    
+    try:
+        async with read_engine.connect() as conn:
+            row = None
+            for query in REPLICA_STATUS_QUERIES:
+                try:
+                    row = (await conn.exec_driver_sql(query)).mappings().first()
+                    break
+                except Exception:
+                    continue
+        if row is None:
+            lag = 0 if settings.DB_REPLICA_ALLOW_STANDALONE else None
+        else:
+            lag = replica_lag_from_status(row)
+        replica_state.update(healthy=lag is not None and lag <= settings.DB_REPLICA_MAX_LAG, lag=lag)
+    except Exception:
+        replica_state.update(healthy=False, lag=None)
+    return replica_state["healthy"]
+
+
+async def get_read_db() -> AsyncGenerator[AsyncSession, None]:
+    """
+    Dependency for read-only reporting queries.
+    Uses the read replica when configured and within the allowed lag,
+    otherwise the primary. Never write through this session.
+    """
+    if read_engine is not None and await _replica_is_fresh():
+        session_factory = ReadSessionLocal
+    else:
+        session_factory = AsyncSessionLocal
+    
+    async with session_factory() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
+
+
 async def init_db():
     """Initialize database tables"""
     async with engine.begin() as conn:
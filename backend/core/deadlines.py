@@ -0,0 +1,250 @@
+"""
+Presupuestos de tiempo por request y límite por consulta MySQL
+
+Cada request arranca con un deadline según su ruta (ROUTE_BUDGETS, prefijo
+más largo). Las consultas que se ejecutan dentro del request reciben el
+tiempo que queda como hint MAX_EXECUTION_TIME: MySQL aborta el SELECT al
+vencer (error 3024) y la conexión vuelve al pool en lugar de quedar tomada
+por un reporte sobre un rango enorme o un LIKE sin índice. Si el presupuesto
+ya se agotó, la consulta ni siquiera pide conexión (DeadlineExceeded).
+
+El deadline vive en un ContextVar: sirve para los threads de complete_server
+(un contexto por thread) y para las tareas asyncio de FastAPI.
+
+Los contadores por ruta (requests, consultas abortadas, requests fuera de
+presupuesto, percentiles) sirven para ajustar los presupuestos.
+"""
+import contextvars
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUDGET = float(os.environ.get('REQUEST_BUDGET_SECONDS', 10))
+# Tiempo que se reserva para serializar y enviar la respuesta después de la última consulta
+RESPONSE_RESERVE = 0.2
+# Presupuesto por prefijo de ruta, en segundos
+ROUTE_BUDGETS = {
+    '/api/orders': 5.0,
+    '/api/kitchen': 5.0,
+    '/api/tables': 5.0,
+    '/api/products': 5.0,
+    '/api/categories': 5.0,
+    '/api/subcategories': 5.0,
+    '/api/menu': 5.0,
+    '/api/customers': 5.0,
+    '/api/payment': 10.0,
+    '/api/webhooks': 10.0,
+    '/api/reports': 20.0,
+    # Exportaciones en streaming: corren en conexión propia, sin MAX_EXECUTION_TIME
+    '/api/exports': 900.0,
+    '/api/chat': 30.0,
+    '/api/debug': 30.0,
+    '/api/setup': 60.0,
+    '/api/v1/orders': 5.0,
+    '/api/v1/products': 5.0,
+    '/api/v1/tables': 5.0,
+    '/api/v1/payments': 10.0,
+}
+# Códigos MySQL de consulta abortada: MAX_EXECUTION_TIME vencido y KILL QUERY
+QUERY_TIMEOUT_ERRNOS = (3024, 1317)
+MAX_ROUTES = 500
+LATENCY_WINDOW = 500
+
+_SELECT_RE = re.compile(r'^(\s*)select\b', re.IGNORECASE)
+_ID_SEGMENT_RE = re.compile(r'/\d+(?=/|$)')
+
+
+def _load_budgets():
+    """ROUTE_BUDGETS + overrides de entorno: ROUTE_BUDGETS="/api/reports=30,/api/orders=3" """
+    budgets = dict(ROUTE_BUDGETS)
+    for item in os.environ.get('ROUTE_BUDGETS', '').split(','):
+        prefix, _, seconds = item.strip().partition('=')
+        if prefix and seconds:
+            try:
+                budgets[prefix] = float(seconds)
+            except ValueError:
+                logger.warning(f"[DEADLINE] Presupuesto inválido en ROUTE_BUDGETS: {item}")
+    # Prefijos más largos primero
+    return tuple(sorted(budgets.items(), key=lambda item: len(item[0]), reverse=True))
+
+
+class DeadlineExceeded(Exception):
+    """El request agotó su presupuesto (antes de la consulta o durante ella)"""
+
+
+class QueryTimeout(DeadlineExceeded):
+    """MySQL abortó la consulta por MAX_EXECUTION_TIME"""
+
+
+class Deadline:
+    """Deadline de un request: ruta, presupuesto y lo que pasó con sus consultas"""
+
+    __slots__ = ('route', 'budget', 'started', 'expires_at', 'queries', 'timed_out')
+
+    def __init__(self, route, budget):
+        self.route = route
+        self.budget = budget
+        self.started = time.monotonic()
+        self.expires_at = self.started + budget
+        self.queries = 0
+        self.timed_out = False
+
+    def remaining(self):
+        return self.expires_at - time.monotonic()
+
+    def query_timeout_ms(self):
+        """Milisegundos disponibles para la próxima consulta (DeadlineExceeded si no queda nada)"""
+        available = self.remaining() - RESPONSE_RESERVE
+        if available <= 0:
+            self.timed_out = True
+            raise DeadlineExceeded(f"{self.route}: presupuesto de {self.budget:.1f}s agotado")
+        return max(1, int(available * 1000))
+
+    def bound_query(self, query):
+        """Agregar MAX_EXECUTION_TIME al SELECT (MySQL solo lo aplica a SELECT de lectura)"""
+        timeout_ms = self.query_timeout_ms()
+        self.queries += 1
+        if '/*+' in query:
+            return query
+        return _SELECT_RE.sub(lambda m: f"{m.group(1)}SELECT /*+ MAX_EXECUTION_TIME({timeout_ms}) */", query, count=1)
+
+
+_current = contextvars.ContextVar('request_deadline', default=None)
+
+
+def current_deadline():
+    return _current.get()
+
+
+def bound_query(query):
+    """Query con el límite del request actual (sin cambios fuera de un request)"""
+    deadline = _current.get()
+    return deadline.bound_query(query) if deadline else query
+
+
+def is_query_timeout(error):
+    """¿El error es una consulta abortada por tiempo? (mysql.connector, PyMySQL o SQLAlchemy)"""
+    error = getattr(error, 'orig', None) or error
+    errno = getattr(error, 'errno', None)
+    if errno is None and getattr(error, 'args', None):
+        errno = error.args[0]
+    return errno in QUERY_TIMEOUT_ERRNOS
+
+
+def note_query_error(error):
+    """Marcar el request actual si la consulta se abortó por tiempo; devuelve True en ese caso"""
+    if not is_query_timeout(error):
+        return False
+    deadline = _current.get()
+    if deadline:
+        deadline.timed_out = True
+        deadline_stats.record_query_timeout(deadline.route)
+    logger.warning(f"[DEADLINE] Consulta abortada por tiempo en {deadline.route if deadline else 'sin request'}")
+    return True
+
+
+# ============================================================
+# MÉTRICAS POR RUTA
+# ============================================================
+
+class DeadlineStats:
+    """Contadores por ruta para ajustar los presupuestos (thread-safe)"""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def _entry(self, route, budget=None):
+        entry = self._routes.get(route)
+        if entry is None:
+            if len(self._routes) >= MAX_ROUTES:
+                route = 'other'
+                entry = self._routes.get(route)
+            if entry is None:
+                entry = self._routes[route] = {
+                    'requests': 0, 'over_budget': 0, 'query_timeouts': 0, 'deadline_exceeded': 0,
+                    'budget': budget, 'elapsed': deque(maxlen=self.window),
+                }
+        if budget is not None:
+            entry['budget'] = budget
+        return entry
+
+    def record_request(self, deadline, elapsed):
+        with self._lock:
+            entry = self._entry(deadline.route, deadline.budget)
+            entry['requests'] += 1
+            entry['elapsed'].append(elapsed)
+            if elapsed > deadline.budget:
+                entry['over_budget'] += 1
+            if deadline.timed_out:
+                entry['deadline_exceeded'] += 1
+
+    def record_query_timeout(self, route):
+        with self._lock:
+            self._entry(route)['query_timeouts'] += 1
+
+    def get_stats(self):
+        with self._lock:
+            routes = {}
+            for route, entry in self._routes.items():
+                elapsed = sorted(entry['elapsed'])
+
+                def percentile(p):
+                    if not elapsed:
+                        return 0.0
+                    return round(elapsed[min(len(elapsed) - 1, int(p * len(elapsed)))] * 1000, 1)
+
+                routes[route] = {
+                    'budget_ms': int(entry['budget'] * 1000) if entry['budget'] else None,
+                    'requests': entry['requests'],
+                    'deadline_exceeded': entry['deadline_exceeded'],
+                    'query_timeouts': entry['query_timeouts'],
+                    'over_budget': entry['over_budget'],
+                    'p50_ms': percentile(0.50),
+                    'p95_ms': percentile(0.95),
+                    'p99_ms': percentile(0.99),
+                }
+            return {
+                'default_budget_ms': int(DEFAULT_BUDGET * 1000),
+                'budgets_ms': {prefix: int(seconds * 1000) for prefix, seconds in _BUDGETS},
+                'routes': routes,
+            }
+
+
+deadline_stats = DeadlineStats()
+_BUDGETS = _load_budgets()
+
+
+# ============================================================
+# CICLO DE VIDA DEL REQUEST
+# ============================================================
+
+def route_budget(path):
+    """(clave de ruta para métricas, presupuesto en segundos)"""
+    for prefix, seconds in _BUDGETS:
+        if path.startswith(prefix):
+            return prefix, seconds
+    return _ID_SEGMENT_RE.sub('/{id}', path), DEFAULT_BUDGET
+
+
+def begin_request(method, path):
+    """Abrir el deadline del request actual"""
+    route, budget = route_budget(path)
+    deadline = Deadline(f"{method} {route}", budget)
+    _current.set(deadline)
+    return deadline
+
+
+def end_request(deadline):
+    """Cerrar el deadline: registrar métricas y limpiar el contexto"""
+    if deadline is None:
+        return
+    deadline_stats.record_request(deadline, time.monotonic() - deadline.started)
+    if _current.get() is deadline:
+        _current.set(None)
@@ -0,0 +1,225 @@
+"""
+Cambios del plano del salón en lote + autosave con debounce
+
+El editor del plano mandaba un PUT por elemento movido (mesa u objeto
+decorativo), cada uno con su conexión, su UPDATE de todas las columnas y su
+commit. Ahora un lote de deltas {id, x, y, rotation, ..., version} se aplica
+en una sola transacción:
+
+  1. SELECT ... FOR UPDATE de las filas del lote (una consulta por tipo),
+     dentro de una transacción explícita (el pool trabaja en autocommit)
+  2. versionado optimista: si la versión que trae el cliente no es la actual
+     (otro editor guardó antes) se rechaza el lote completo con los valores
+     vigentes, sin aplicar nada
+  3. un único INSERT ... ON DUPLICATE KEY UPDATE multi-fila por tipo con la
+     fila actual + el delta y version + 1
+
+Las configuraciones de área y de mapa (zoom, posición, grilla) se guardan
+con SettingsDebouncer: se conserva la última versión de cada clave y se
+escribe una vez cuando el editor deja de mandar cambios.
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_ITEMS = 500
+# Áreas por lote: con immediate cada una es un INSERT (presupuesto de consultas de la ruta)
+MAX_BATCH_AREAS = 8
+
+# tipo de elemento -> (tabla, columnas editables, columnas obligatorias sin default)
+LAYOUT_KINDS = {
+    'tables': ('tables', ('x', 'y', 'width', 'height', 'rotation', 'shape', 'capacity'), ('number',)),
+    'decorative_objects': ('decorative_objects', ('x', 'y', 'width', 'height', 'rotation', 'locked', 'environment'), ('type',)),
+}
+
+
+class LayoutError(ValueError):
+    """Lote mal formado (se responde 400)"""
+
+
+class LayoutConflict(Exception):
+    """Alguna fila cambió desde que el cliente la leyó (se responde 409)"""
+
+    def __init__(self, conflicts):
+        super().__init__(f"{len(conflicts)} elementos con versión desactualizada")
+        self.conflicts = conflicts
+
+
+def _normalize_items(kind, items, fields):
+    """Deltas por id (si un id se repite, gana el último delta y la primera versión)"""
+    if not isinstance(items, list):
+        raise LayoutError(f"{kind} debe ser una lista")
+    deltas = {}
+    for item in items:
+        if not isinstance(item, dict) or item.get('id') in (None, ''):
+            raise LayoutError(f"Cada elemento de {kind} necesita un id")
+        item_id = str(item['id'])
+        entry = deltas.setdefault(item_id, {'version': item.get('version'), 'changes': {}})
+        entry['changes'].update({field: item[field] for field in fields if field in item})
+    return deltas
+
+
+def check_batch_settings(batch):
+    """Validar las configuraciones del lote antes de escribir nada (LayoutError -> 400)"""
+    areas = batch.get('area_settings') or []
+    if len(areas) > MAX_BATCH_AREAS:
+        raise LayoutError(f"Máximo {MAX_BATCH_AREAS} áreas por lote")
+
+
+def apply_layout_batch(connection, batch):
+    """
+    Aplicar el lote en una transacción. Devuelve {tipo: {id: nueva_versión}}.
+    Lanza LayoutConflict (sin aplicar nada) si alguna versión no coincide.
+    """
+    total = sum(len(batch.get(kind) or []) for kind in LAYOUT_KINDS)
+    if total > MAX_BATCH_ITEMS:
+        raise LayoutError(f"Máximo {MAX_BATCH_ITEMS} elementos por lote")
+
+    cursor = connection.cursor(dictionary=True)
+    try:
+        # El pool usa autocommit: sin transacción explícita el FOR UPDATE suelta los bloqueos
+        # apenas termina el SELECT y cada upsert se confirmaría por separado
+        connection.start_transaction()
+        plans = []
+        conflicts = []
+        for kind, (table, fields, required) in LAYOUT_KINDS.items():
+            deltas = _normalize_items(kind, batch.get(kind) or [], fields)
+            if not deltas:
+                continue
+            columns = ('id', 'version') + required + fields
+            placeholders = ', '.join(['%s'] * len(deltas))
+            cursor.execute(
+                f"SELECT {', '.join(columns)} FROM {table} WHERE id IN ({placeholders}) FOR UPDATE",
+                list(deltas)
+            )
+            current = {str(row['id']): row for row in cursor.fetchall()}
+
+            rows = []
+            for item_id, delta in deltas.items():
+                row = current.get(item_id)
+                if row is None:
+                    conflicts.append({'kind': kind, 'id': item_id, 'reason': 'not_found'})
+                elif delta['version'] is not None and int(delta['version']) != row['version']:
+                    conflicts.append({'kind': kind, 'id': item_id, 'reason': 'stale', 'current': row})
+                else:
+                    rows.append({**row, **delta['changes'], 'version': row['version'] + 1})
+            plans.append((kind, table, columns, rows))
+
+        if conflicts:
+            raise LayoutConflict(conflicts)
+
+        versions = {}
+        for kind, table, columns, rows in plans:
+            if not rows:
+                continue
+            # Todas las filas existen (están bloqueadas): el upsert actualiza en una sola sentencia.
+            # Las columnas obligatorias solo van en el INSERT para que sea válido; no se tocan.
+            row_placeholders = '(' + ', '.join(['%s'] * len(columns)) + ')'
+            fields = LAYOUT_KINDS[kind][1]
+            updates = ', '.join(f"{column} = VALUES({column})" for column in ('version',) + fields)
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES "
+                f"{', '.join([row_placeholders] * len(rows))} ON DUPLICATE KEY UPDATE {updates}",
+                [row[column] for row in rows for column in columns]
+            )
+            versions[kind] = {str(row['id']): row['version'] for row in rows}
+        connection.commit()
+        return versions
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+# ============================================================
+# AUTOSAVE CON DEBOUNCE
+# ============================================================
+
+class SettingsDebouncer:
+    """
+    Autosave coalescido por clave:
+    - submit(): guarda los cambios pendientes (se combinan con los anteriores)
+    - se escriben `delay` segundos después del último cambio, o a lo sumo
+      `max_delay` segundos después del primero si el editor no para
+    - pending(): lo pendiente de una clave, para que las lecturas lo vean
+    - flush(): escribir ya (guardado explícito o apagado del servidor)
+    """
+
+    def __init__(self, writer, delay=1.5, max_delay=10.0):
+        self.writer = writer
+        self.delay = delay
+        self.max_delay = max_delay
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self.stats = {'submitted': 0, 'written': 0, 'errors': 0}
+
+    def submit(self, key, settings):
+        now = time.monotonic()
+        with self._cond:
+            entry = self._pending.get(key)
+            if entry is None:
+                entry = self._pending[key] = {'settings': {}, 'first': now}
+            entry['settings'].update(settings)
+            entry['last'] = now
+            self.stats['submitted'] += 1
+            self._ensure_thread()
+            self._cond.notify()
+
+    def pending(self, key):
+        with self._cond:
+            entry = self._pending.get(key)
+            return dict(entry['settings']) if entry else None
+
+    def take(self, key):
+        """Sacar lo pendiente de una clave para escribirlo ya por otra vía ({} si no hay)"""
+        with self._cond:
+            entry = self._pending.pop(key, None)
+            return entry['settings'] if entry else {}
+
+    def _due(self, entry):
+        return min(entry['last'] + self.delay, entry['first'] + self.max_delay)
+
+    def _take(self, keys=None, now=None):
+        with self._cond:
+            if keys is None:
+                keys = [key for key, entry in self._pending.items() if now is None or self._due(entry) <= now]
+            return [(key, self._pending.pop(key)['settings']) for key in keys if key in self._pending]
+
+    def flush(self, keys=None):
+        """Escribir ya las claves indicadas (todas si keys es None)"""
+        for key, settings in self._take(keys):
+            self._write(key, settings)
+
+    def _write(self, key, settings):
+        try:
+            self.writer(key, settings)
+            self.stats['written'] += 1
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.error(f"[LAYOUT] Error guardando configuración {key}: {e}")
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name='layout-autosave', daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                wait = min(self._due(entry) for entry in self._pending.values()) - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+            for key, settings in self._take(now=time.monotonic()):
+                self._write(key, settings)
+
+    def get_stats(self):
+        with self._cond:
+            return {**self.stats, 'pending': len(self._pending),
+                    'coalesced': self.stats['submitted'] - self.stats['written'] - len(self._pending) - self.stats['errors']}
@@ -0,0 +1,430 @@
+"""
+Pipeline de imágenes de productos: variantes multi-resolución en WebP y JPEG
+
+Cada foto subida se procesa en un pool de procesos (Pillow es CPU-bound y
+no libera el GIL), generando un juego de anchos fijos:
+
+    thumb  -> 160px  (miniaturas, listados de cocina)
+    card   -> 400px  (grilla del menú)
+    detail -> 1200px (vista de detalle)
+
+en WebP y JPEG. Los archivos se nombran con un hash del contenido original,
+así que una URL nunca cambia de contenido y se puede cachear para siempre
+(Cache-Control immutable). El resultado es un mapa de variantes con
+`srcset` listo para usar en <img>/<picture>.
+
+El almacenamiento es intercambiable: S3 (producción) o disco local
+(desarrollo / sin credenciales), servido por /static/products/.
+"""
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+logger = logging.getLogger('gastro_server')
+
+# Cambiar si cambia el procesamiento: genera nombres nuevos y no pisa cachés
+PIPELINE_VERSION = 'v1'
+
+VARIANT_WIDTHS = {
+    'thumb': int(os.environ.get('IMAGE_THUMB_WIDTH', 160)),
+    'card': int(os.environ.get('IMAGE_CARD_WIDTH', 400)),
+    'detail': int(os.environ.get('IMAGE_DETAIL_WIDTH', 1200)),
+}
+WEBP_QUALITY = int(os.environ.get('IMAGE_WEBP_QUALITY', 80))
+JPEG_QUALITY = int(os.environ.get('IMAGE_JPEG_QUALITY', 82))
+
+CONTENT_TYPES = {'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Trabajos terminados que se siguen informando en /api/products/{id}/image;
+# después de eso el estado sale de variant_store
+JOB_TTL = int(os.environ.get('IMAGE_JOB_TTL', 3600))
+MAX_JOBS = int(os.environ.get('IMAGE_MAX_JOBS', 500))
+
+VARIANTS_TABLE_DDL = """
+    CREATE TABLE IF NOT EXISTS product_image_variants (
+        product_id INT PRIMARY KEY,
+        source_hash CHAR(16) NOT NULL,
+        variants TEXT NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    )
+"""
+
+
+def source_hash(image_bytes):
+    """Hash del original + versión del pipeline (nombre inmutable de las variantes)"""
+    return hashlib.sha256(PIPELINE_VERSION.encode() + image_bytes).hexdigest()[:16]
+
+
+def slugify(name):
+    slug = re.sub(r'[^a-z0-9]+', '-', (name or 'producto').lower()).strip('-')
+    return slug[:60] or 'producto'
+
+
+def _flatten(img):
+    """JPEG no soporta transparencia: componer sobre fondo blanco"""
+    if img.mode == 'RGB':
+        return img
+    background = Image.new('RGB', img.size, (255, 255, 255))
+    background.paste(img, mask=img.split()[-1])
+    return background
+
+
+def render_variants(image_bytes, widths=None, webp_quality=WEBP_QUALITY, jpeg_quality=JPEG_QUALITY):
+    """
+    Generar las variantes de una imagen (se ejecuta dentro del pool de procesos)
+
+    Nunca agranda: si el original es más chico que un ancho, esa variante
+    queda con el ancho original. Se redimensiona en cascada (del más grande
+    al más chico) para no re-escalar el original completo cada vez.
+
+    Returns:
+        dict nombre -> {'width', 'height', 'webp': bytes, 'jpeg': bytes}
+    """
+    widths = widths or VARIANT_WIDTHS
+    img = Image.open(io.BytesIO(image_bytes))
+
+    # JPEG grandes: decodificar directamente a una escala reducida
+    largest = max(widths.values())
+    if img.format == 'JPEG' and img.width > largest * 2:
+        img.draft('RGB', (largest, int(img.height * largest / img.width)))
+
+    img = ImageOps.exif_transpose(img)
+    has_alpha = img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+    current = img.convert('RGBA' if has_alpha else 'RGB')
+
+    results = {}
+    for name, width in sorted(widths.items(), key=lambda item: -item[1]):
+        target = min(width, current.width)
+        if target != current.width:
+            height = max(1, round(current.height * target / current.width))
+            current = current.resize((target, height), Image.Resampling.LANCZOS)
+
+        webp = io.BytesIO()
+        current.save(webp, format='WEBP', quality=webp_quality, method=4)
+        jpeg = io.BytesIO()
+        _flatten(current).save(jpeg, format='JPEG', quality=jpeg_quality, optimize=True, progressive=True)
+
+        results[name] = {
+            'width': current.width,
+            'height': current.height,
+            'webp': webp.getvalue(),
+            'jpeg': jpeg.getvalue(),
+        }
+    return results
+
+
+def build_srcset(variants, fmt):
+    """'url 160w, url 400w, url 1200w' (sin anchos repetidos)"""
+    seen = {}
+    for variant in variants.values():
+        seen.setdefault(variant['width'], variant[fmt])
+    return ', '.join(f"{url} {width}w" for width, url in sorted(seen.items()))
+
+
+# ============================================================
+# BACKENDS DE ALMACENAMIENTO
+# ============================================================
+
+class LocalImageStorage:
+    """Guarda las variantes en disco; complete_server las sirve en /static/products/"""
+
+    def __init__(self, root, url_prefix):
+        self.root = root
+        self.url_prefix = url_prefix.rstrip('/')
+
+    def exists(self, key):
+        return os.path.isfile(os.path.join(self.root, key))
+
+    def put(self, key, data, content_type):
+        path = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Escritura atómica: nunca se sirve un archivo a medio escribir
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return self.url(key)
+
+    def url(self, key):
+        return f"{self.url_prefix}/{key}"
+
+
+class S3ImageStorage:
+    """Sube las variantes a S3 con caché inmutable de un año"""
+
+    def __init__(self, s3_client, bucket, base_url, prefix=''):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.base_url = base_url.rstrip('/')
+        self.prefix = prefix
+
+    def exists(self, key):
+        try:
+            self.s3_client.head_object(Bucket=self.bucket, Key=self.prefix + key)
+            return True
+        except Exception:
+            return False
+
+    def put(self, key, data, content_type):
+        self.s3_client.put_object(
+            Bucket=self.bucket,
+            Key=self.prefix + key,
+            Body=data,
+            ContentType=content_type,
+            CacheControl=IMMUTABLE_CACHE_CONTROL
+        )
+        return self.url(key)
+
+    def url(self, key):
+        return f"{self.base_url}/{self.prefix}{key}"
+
+
+# ============================================================
+# MAPA DE VARIANTES POR PRODUCTO
+# ============================================================
+
+class ImageVariantStore:
+    """Mapa producto -> variantes, persistido en MySQL y cacheado en memoria"""
+
+    def __init__(self, get_connection):
+        self.get_connection = get_connection
+        self.variants = {}
+        self.lock = threading.Lock()
+
+    def ensure_table(self):
+        connection = self.get_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(VARIANTS_TABLE_DDL)
+            connection.commit()
+            cursor.close()
+        finally:
+            connection.close()
+
+    def load(self):
+        """Cargar todos los mapas (una fila chica por producto con foto)"""
+        connection = self.get_connection()
+        try:
+            cursor = connection.cursor(dictionary=True)
+            cursor.execute("SELECT product_id, variants FROM product_image_variants")
+            loaded = {row['product_id']: json.loads(row['variants']) for row in cursor.fetchall()}
+            cursor.close()
+        finally:
+            connection.close()
+        with self.lock:
+            self.variants = loaded
+        return len(loaded)
+
+    def get(self, product_id):
+        try:
+            return self.variants.get(int(product_id))
+        except (TypeError, ValueError):
+            return None
+
+    def save(self, product_id, manifest, image_url=None):
+        connection = self.get_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute("""
+                INSERT INTO product_image_variants (product_id, source_hash, variants)
+                VALUES (%s, %s, %s)
+                ON DUPLICATE KEY UPDATE source_hash = VALUES(source_hash), variants = VALUES(variants)
+            """, (product_id, manifest['hash'], json.dumps(manifest)))
+            if image_url:
+                # Clientes viejos que solo leen image_url reciben la variante optimizada
+                cursor.execute("UPDATE products SET image_url = %s WHERE id = %s", (image_url, product_id))
+            connection.commit()
+            cursor.close()
+        finally:
+            connection.close()
+        with self.lock:
+            self.variants[int(product_id)] = manifest
+
+    def enrich(self, product):
+        """Agregar image_variants/srcset a un producto del API (si tiene)"""
+        manifest = self.get(product.get('id'))
+        if manifest:
+            product['image_variants'] = manifest['variants']
+            product['srcset'] = manifest['srcset']
+        return product
+
+
+# ============================================================
+# PIPELINE
+# ============================================================
+
+def _process_context():
+    """
+    Contexto del pool de render. Nunca fork: el pool se crea adentro del servidor
+    con hilos, y un hijo forkeado con un lock tomado (pool MySQL, logging) se cuelga.
+    forkserver precargando solo este módulo; spawn donde no existe (Windows).
+    """
+    try:
+        context = multiprocessing.get_context('forkserver')
+    except ValueError:
+        return multiprocessing.get_context('spawn')
+    context.set_forkserver_preload([__name__])
+    return context
+
+
+class ImagePipeline:
+    """
+    Procesa uploads fuera del request: render en procesos, subida en hilos
+    """
+
+    def __init__(self, storage, variant_store=None, workers=2, upload_threads=4, key_prefix='variants/',
+                 on_stored=None):
+        self.storage = storage
+        # callback(product_id) cuando las variantes quedan guardadas (invalidar cachés de productos)
+        self.on_stored = on_stored
+        self.variant_store = variant_store
+        self.workers = workers
+        self.upload_threads = upload_threads
+        self.key_prefix = key_prefix
+        # Se crean al primer uso: en modo pre-fork cada worker tiene los suyos
+        self._process_pool = None
+        self._upload_pool = None
+        self._pool_lock = threading.Lock()
+        self._jobs_lock = threading.Lock()
+        self.jobs = {}
+        self.stats = {'processed': 0, 'failed': 0, 'deduplicated': 0}
+
+    def _pools(self):
+        with self._pool_lock:
+            if self._process_pool is None:
+                self._process_pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=_process_context())
+                self._upload_pool = ThreadPoolExecutor(max_workers=self.upload_threads,
+                                                       thread_name_prefix='image-upload')
+            return self._process_pool, self._upload_pool
+
+    def variant_key(self, slug, digest, width, fmt):
+        return f"{self.key_prefix}{slug}-{digest}-{width}w.{EXTENSIONS[fmt]}"
+
+    def submit(self, product_id, product_name, image_bytes):
+        """
+        Encolar una imagen; devuelve enseguida el estado del trabajo
+
+        El mapa de variantes queda disponible en variant_store al terminar.
+        """
+        if not PIL_AVAILABLE:
+            raise RuntimeError("Pillow no está instalado: pip install Pillow")
+
+        digest = source_hash(image_bytes)
+        job = {'product_id': product_id, 'hash': digest, 'status': 'processing'}
+        with self._jobs_lock:
+            self.jobs[product_id] = job
+            self._prune_jobs()
+
+        current = self.variant_store.get(product_id) if self.variant_store else None
+        if current and current.get('hash') == digest:
+            # Misma foto subida de nuevo: nada que procesar
+            self.stats['deduplicated'] += 1
+            job.update(status='done', variants=current, finished_at=time.monotonic())
+            return job
+
+        process_pool, upload_pool = self._pools()
+        future = process_pool.submit(render_variants, image_bytes)
+        future.add_done_callback(
+            lambda f: upload_pool.submit(self._store, job, slugify(product_name), digest, f)
+        )
+        return job
+
+    def _store(self, job, slug, digest, render_future):
+        try:
+            rendered = render_future.result()
+            manifest = self.store_variants(slug, digest, rendered)
+            if self.variant_store:
+                self.variant_store.save(job['product_id'], manifest, image_url=manifest['full'])
+            job.update(status='done', variants=manifest, finished_at=time.monotonic())
+            self.stats['processed'] += 1
+            if self.on_stored:
+                self.on_stored(job['product_id'])
+            logger.info(f"🖼️ Variantes generadas para producto {job['product_id']} ({digest})")
+        except Exception as e:
+            job.update(status='failed', error=str(e), finished_at=time.monotonic())
+            self.stats['failed'] += 1
+            logger.error(f"Error procesando imagen del producto {job['product_id']}: {e}")
+
+    def store_variants(self, slug, digest, rendered):
+        """Subir las variantes renderizadas y devolver el mapa con srcset"""
+        variants = {}
+        for name, variant in rendered.items():
+            entry = {'width': variant['width'], 'height': variant['height']}
+            for fmt in ('webp', 'jpeg'):
+                key = self.variant_key(slug, digest, variant['width'], fmt)
+                entry[fmt] = self.storage.put(key, variant[fmt], CONTENT_TYPES[fmt])
+                entry[f'{fmt}_bytes'] = len(variant[fmt])
+            variants[name] = entry
+
+        default = variants.get('card') or next(iter(variants.values()))
+        largest = max(variants.values(), key=lambda variant: variant['width'])
+        return {
+            'hash': digest,
+            'version': PIPELINE_VERSION,
+            'variants': variants,
+            'srcset': {
+                'webp': build_srcset(variants, 'webp'),
+                'jpeg': build_srcset(variants, 'jpeg'),
+            },
+            'default': default['jpeg'],
+            'full': largest['jpeg'],
+        }
+
+    def process_sync(self, product_name, image_bytes):
+        """Procesar en el proceso actual (scripts y migraciones masivas)"""
+        digest = source_hash(image_bytes)
+        return self.store_variants(slugify(product_name), digest, render_variants(image_bytes))
+
+    def _prune_jobs(self):
+        """
+        Olvidar trabajos terminados hace más de JOB_TTL y, si aun así quedan más
+        de MAX_JOBS, los terminados más viejos. Los que están en proceso no se tocan.
+        Llamar con _jobs_lock tomado.
+        """
+        now = time.monotonic()
+        finished = sorted(
+            (job['finished_at'], product_id) for product_id, job in self.jobs.items() if 'finished_at' in job
+        )
+        overflow = len(self.jobs) - MAX_JOBS
+        for finished_at, product_id in finished:
+            if now - finished_at <= JOB_TTL and overflow <= 0:
+                break
+            del self.jobs[product_id]
+            overflow -= 1
+
+    def get_job(self, product_id):
+        with self._jobs_lock:
+            self._prune_jobs()
+            return self.jobs.get(product_id)
+
+    def get_stats(self):
+        with self._jobs_lock:
+            self._prune_jobs()
+            in_progress = sum(1 for job in self.jobs.values() if job['status'] == 'processing')
+            tracked = len(self.jobs)
+        return {
+            **self.stats,
+            'workers': self.workers,
+            'in_progress': in_progress,
+            'tracked_jobs': tracked,
+        }
+
+    def shutdown(self):
+        if self._process_pool:
+            self._process_pool.shutdown(wait=False, cancel_futures=True)
+            self._upload_pool.shutdown(wait=False)
@@ -0,0 +1,505 @@
+"""
+Clasificador local de intención para el chat del menú
+
+Se ejecuta antes de llamar a Gemini y resuelve sin round-trip los turnos
+de alta confianza:
+  1. Reglas: patrones de palabras clave ("qué tiene", "precio de", "con qué
+     acompaño", "recomendame", "tenés pizzas?") combinados con el índice de
+     nombres del catálogo. Las intenciones que necesitan un producto solo se
+     resuelven si el producto mencionado se identifica con claridad.
+  2. Modelo lineal: TF-IDF (palabras y bigramas) + regresión softmax en
+     NumPy, entrenado con las decisiones que la IA ya tomó (data/intent_log.jsonl).
+     Solo responde si la probabilidad supera INTENT_MODEL_THRESHOLD y si en
+     la validación tuvo una precisión mínima.
+
+Todo lo que no supera esos umbrales sigue yendo a la IA, y cada respuesta
+de la IA con buena confianza se agrega al log de entrenamiento. Sin NumPy
+solo funcionan las reglas.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+from collections import Counter, deque
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+from core.catalog import normalize_text, clean_words
+
+logger = logging.getLogger(__name__)
+
+_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+DEFAULT_LOG_PATH = os.path.join(_DATA_DIR, 'intent_log.jsonl')
+DEFAULT_MODEL_PATH = os.path.join(_DATA_DIR, 'intent_model.json')
+
+MODEL_THRESHOLD = float(os.environ.get('INTENT_MODEL_THRESHOLD', 0.85))
+# Decisiones de la IA con menos confianza no se usan para entrenar
+MIN_LOG_CONFIDENCE = 70
+MIN_TRAINING_SAMPLES = 60
+MAX_TRAINING_SAMPLES = 20000
+MAX_FEATURES = 3000
+# Precisión mínima en validación para que el modelo responda turnos
+MIN_HOLDOUT_ACCURACY = 0.85
+LATENCY_WINDOW = 500
+
+PRODUCT_INTENTS = frozenset({'specific_product_ingredients', 'specific_product_info', 'product_pairings'})
+# Intenciones que el clasificador local puede resolver (saludos y charla casual ya se resuelven antes)
+LOCAL_INTENTS = PRODUCT_INTENTS | {'product_recommendations', 'general_inquiry', 'smart_beverage_recommendation'}
+
+# Reglas sobre texto normalizado (minúsculas, sin acentos ni puntuación), en orden de prioridad
+PRODUCT_RULES = (
+    ('product_pairings', re.compile(
+        r'\b(con que (lo |la |le |los |las )?(acompan|combin|va|marid|pega)'
+        r'|que (va|combina|acompana|pega) (bien )?con|maridaj|acompanamiento'
+        r'|recomend\w* (para acompanar|con))')),
+    ('specific_product_ingredients', re.compile(
+        r'\b(que (tiene|lleva|trae|incluye)|ingrediente'
+        r'|de que (esta|es|son|estan) (hech|compuest)|como (esta|es|viene) (hech|prepar))')),
+    ('specific_product_info', re.compile(
+        r'\b(precio|cuanto (sale|cuesta|vale|esta|salen|cuestan|valen)|a cuanto)')),
+)
+BEVERAGE_RULE = re.compile(r'\b(tomar|beber|bebida|trago|vino|cerveza|gaseosa)')
+RECOMMENDATION_RULE = re.compile(
+    r'\b(recomend|suger|que me (das|ofreces|aconsejas)|que hay de (bueno|rico)|que (pido|como hoy)|sorprendeme)')
+INQUIRY_RULE = re.compile(r'\b(tenes|tienen|hay|venden|hacen)\b')
+
+_PUNCTUATION_RE = re.compile(r'[^\w\s]')
+CONTEXT_FEATURE = '__ctx__'
+
+
+def clean_message(message):
+    """Minúsculas y sin puntuación, conservando acentos (igual que CatalogProduct.name_words)"""
+    return ' '.join(clean_words(message))
+
+
+def message_features(message, has_context=False):
+    """Tokens para el modelo: palabras y bigramas normalizados (+ marca de contexto)"""
+    words = _PUNCTUATION_RE.sub(' ', normalize_text(message)).split()
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    if has_context:
+        features.append(CONTEXT_FEATURE)
+    return features
+
+
+def _percentile(values, p):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+# ============================================================
+# MODELO TF-IDF + SOFTMAX
+# ============================================================
+
+class TfidfLinearModel:
+    """Regresión logística multinomial sobre vectores TF-IDF normalizados (L2)"""
+
+    def __init__(self, vocabulary, idf, weights, bias, labels):
+        self.vocabulary = vocabulary
+        self.idf = np.asarray(idf, dtype=np.float32)
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = np.asarray(bias, dtype=np.float32)
+        self.labels = tuple(labels)
+
+    @classmethod
+    def fit(cls, samples, epochs=300, learning_rate=4.0, l2=1e-4):
+        """samples: lista de (features, label, peso)"""
+        labels = sorted({label for _, label, _ in samples})
+        label_index = {label: i for i, label in enumerate(labels)}
+
+        df = Counter()
+        for features, _, weight in samples:
+            df.update({f: weight for f in set(features)})
+        kept = [f for f, count in df.most_common(MAX_FEATURES) if count >= 2]
+        vocabulary = {f: i for i, f in enumerate(kept)}
+        total = sum(weight for _, _, weight in samples)
+        idf = np.array([np.log((1 + total) / (1 + df[f])) + 1 for f in kept], dtype=np.float32)
+
+        model = cls(vocabulary, idf, np.zeros((len(kept), len(labels))), np.zeros(len(labels)), labels)
+        X = model.transform([features for features, _, _ in samples])
+        Y = np.zeros((len(samples), len(labels)), dtype=np.float32)
+        Y[np.arange(len(samples)), [label_index[label] for _, label, _ in samples]] = 1
+        sample_weight = np.array([weight for _, _, weight in samples], dtype=np.float32)
+        sample_weight /= sample_weight.sum()
+
+        W = model.weights
+        b = model.bias
+        for _ in range(epochs):
+            probs = _softmax(X @ W + b)
+            grad = (probs - Y) * sample_weight[:, None]
+            W -= learning_rate * (X.T @ grad + l2 * W)
+            b -= learning_rate * grad.sum(axis=0)
+        return model
+
+    def transform(self, feature_lists):
+        X = np.zeros((len(feature_lists), len(self.vocabulary)), dtype=np.float32)
+        for row, features in enumerate(feature_lists):
+            for feature, count in Counter(features).items():
+                col = self.vocabulary.get(feature)
+                if col is not None:
+                    X[row, col] = count * self.idf[col]
+        norms = np.linalg.norm(X, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return X / norms
+
+    def predict(self, features):
+        """(intención, probabilidad) de un mensaje; solo toca las filas de W de sus tokens"""
+        counts = Counter(f for f in features if f in self.vocabulary)
+        if not counts:
+            return None, 0.0
+        cols = np.fromiter((self.vocabulary[f] for f in counts), dtype=np.int64)
+        values = np.fromiter(counts.values(), dtype=np.float32) * self.idf[cols]
+        values /= np.linalg.norm(values)
+        probs = _softmax((values @ self.weights[cols] + self.bias)[None, :])[0]
+        best = int(probs.argmax())
+        return self.labels[best], float(probs[best])
+
+    def to_dict(self):
+        return {
+            'vocabulary': list(self.vocabulary),
+            'idf': self.idf.round(5).tolist(),
+            'weights': self.weights.round(5).tolist(),
+            'bias': self.bias.round(5).tolist(),
+            'labels': list(self.labels),
+        }
+
+    @classmethod
+    def from_dict(cls, payload):
+        vocabulary = {f: i for i, f in enumerate(payload['vocabulary'])}
+        return cls(vocabulary, payload['idf'], payload['weights'], payload['bias'], payload['labels'])
+
+
+def _softmax(Z):
+    Z = Z - Z.max(axis=1, keepdims=True)
+    E = np.exp(Z)
+    return E / E.sum(axis=1, keepdims=True)
+
+
+# ============================================================
+# CLASIFICADOR
+# ============================================================
+
+class IntentClassifier:
+    """
+    Fast-path local de intenciones:
+    - classify(): reglas y modelo; None = consultar a la IA
+    - record_llm_decision(): guarda la decisión de la IA para entrenar
+    - train()/save()/load(): modelo persistido en data/intent_model.json
+    - get_stats(): fracción de turnos resueltos localmente y latencias
+    """
+
+    def __init__(self, threshold=MODEL_THRESHOLD, log_path=DEFAULT_LOG_PATH):
+        self.threshold = threshold
+        self.log_path = log_path
+        self._model = None
+        self._model_info = {'trained_at': None, 'samples': 0, 'labels': [], 'holdout_accuracy': None, 'enabled': False}
+        self._lock = threading.Lock()
+        self._log_lock = threading.Lock()
+        self._turns = Counter()
+        self._latencies = {}
+        self._logged = 0
+        self._refresh_thread = None
+        self._stop_event = threading.Event()
+
+    # ============================================
+    # CLASIFICACIÓN
+    # ============================================
+
+    def classify(self, message, catalog, context=None, started=None):
+        """Intención resuelta localmente (mismo formato que la IA) o None"""
+        started = started or time.time()
+        has_context = bool(context and context.get('selectedFood'))
+        normalized = _PUNCTUATION_RE.sub(' ', normalize_text(message))
+
+        result = self._classify_rules(message, normalized, catalog, has_context)
+        if result is None:
+            result = self._classify_model(message, catalog, has_context)
+        if result is not None:
+            self.record_turn(result['source'], time.time() - started)
+        return result
+
+    def _classify_rules(self, message, normalized, catalog, has_context):
+        if has_context and BEVERAGE_RULE.search(normalized):
+            return self._result('smart_beverage_recommendation', None, 'rules', 95)
+
+        for intent, pattern in PRODUCT_RULES:
+            if pattern.search(normalized):
+                product = self._match_product(message, catalog)
+                # Sin producto claro decide la IA (puede ser una categoría, un producto ambiguo, etc.)
+                return self._result(intent, product, 'rules', 95) if product else None
+
+        if RECOMMENDATION_RULE.search(normalized):
+            return self._result('product_recommendations', None, 'rules', 90)
+
+        if INQUIRY_RULE.search(normalized) and self._mentions_category(normalized, catalog):
+            return self._result('general_inquiry', None, 'rules', 90)
+        return None
+
+    def _classify_model(self, message, catalog, has_context):
+        model = self._model
+        if model is None or not self._model_info['enabled']:
+            return None
+        intent, probability = model.predict(message_features(message, has_context))
+        if intent is None or probability < self.threshold:
+            return None
+        product = None
+        if intent in PRODUCT_INTENTS:
+            product = self._match_product(message, catalog)
+            if not product:
+                return None
+        return self._result(intent, product, 'model', int(probability * 100))
+
+    def _match_product(self, message, catalog):
+        """
+        Producto claramente mencionado (si no, decide la IA):
+          1. su nombre completo está en el mensaje (el más largo si hay varios)
+          2. están al menos la mitad de sus palabras significativas (más de 2 letras)
+        Mensaje y nombres se tokenizan igual (clean_message / CatalogProduct.name_words).
+        Si dos productos empatan en el mejor puntaje la mención es ambigua ("la
+        milanesa" con Napolitana y de Pollo en la carta) y se devuelve None.
+        """
+        text = clean_message(message)
+        padded = f" {text} "
+        named = [product for product in catalog.with_words(text.split())
+                 if product.name_clean and f" {product.name_clean} " in padded]
+        if named:
+            longest = max(len(product.name_clean) for product in named)
+            named = [product for product in named if len(product.name_clean) == longest]
+            return named[0] if len(named) == 1 else None
+
+        # Sin artículos ni preposiciones ("la", "de") que coinciden con cualquier nombre
+        words = {w for w in text.split() if len(w) > 2}
+        best, best_score = [], 0
+        for product in catalog.with_words(words):
+            content = [w for w in product.name_words if len(w) > 2]
+            hits = sum(1 for w in content if w in words)
+            if not hits or hits * 2 < len(content):
+                continue
+            score = hits / len(content)
+            if score > best_score:
+                best, best_score = [product], score
+            elif score == best_score:
+                best.append(product)
+        return best[0] if len(best) == 1 else None
+
+    def _mentions_category(self, normalized, catalog):
+        words = set(normalized.split())
+        for key in catalog.by_category:
+            if key in normalized or key.rstrip('s') in words:
+                return True
+        return False
+
+    def _result(self, intent, product, source, confidence):
+        return {
+            'intent_type': intent,
+            'target_product': product,
+            'response_text': self._response_text(intent, product),
+            'confidence': confidence,
+            'recommended_products': [],
+            'source': source,
+        }
+
+    def _response_text(self, intent, product):
+        if intent == 'specific_product_info':
+            text = f"{product.name} sale ${float(product.price or 0):.0f}."
+            return f"{text} {product.description}" if product.description else text
+        if intent == 'specific_product_ingredients':
+            return f"Te cuento qué tiene {product.name}:"
+        if intent == 'general_inquiry':
+            return '¡Por supuesto! Te muestro nuestras opciones:'
+        # Maridajes, bebidas y recomendaciones arman su propio texto en el handler
+        return ''
+
+    # ============================================
+    # DATOS DE ENTRENAMIENTO
+    # ============================================
+
+    def record_llm_decision(self, message, intent, confidence, latency, context=None):
+        """Registrar un turno resuelto por la IA y guardar la decisión para entrenar"""
+        self.record_turn('llm', latency)
+        try:
+            confidence = int(float(confidence))
+        except (TypeError, ValueError):
+            confidence = 0
+        if intent not in LOCAL_INTENTS or confidence < MIN_LOG_CONFIDENCE or not self.log_path:
+            return
+
+        line = json.dumps({
+            'message': message,
+            'intent': intent,
+            'confidence': confidence,
+            'context': bool(context and context.get('selectedFood')),
+            'ts': int(time.time()),
+        }, ensure_ascii=False)
+        try:
+            with self._log_lock:
+                os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+                with open(self.log_path, 'a', encoding='utf-8') as f:
+                    f.write(line + '\n')
+                self._logged += 1
+        except OSError as e:
+            logger.warning(f"[INTENT] No se pudo guardar la decisión de la IA: {e}")
+
+    def load_samples(self, path=None):
+        """Últimas decisiones del log agrupadas: [(features, intención, repeticiones)]"""
+        path = path or self.log_path
+        if not path or not os.path.exists(path):
+            return []
+        with open(path, 'r', encoding='utf-8') as f:
+            lines = deque(f, maxlen=MAX_TRAINING_SAMPLES)
+
+        counts = Counter()
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry.get('intent') in LOCAL_INTENTS and entry.get('message'):
+                counts[(normalize_text(entry['message']), bool(entry.get('context')), entry['intent'])] += 1
+        return [(message_features(text, ctx), intent, n) for (text, ctx, intent), n in counts.items()]
+
+    # ============================================
+    # ENTRENAMIENTO
+    # ============================================
+
+    def train(self, samples=None):
+        """Entrenar con el log; validación con 1 de cada 5 mensajes (partición por hash)"""
+        if not NUMPY_AVAILABLE:
+            logger.info("[INTENT] NumPy no disponible: solo reglas")
+            return self.get_stats()
+        start = time.time()
+        samples = self.load_samples() if samples is None else samples
+        labels = {label for _, label, _ in samples}
+        if sum(weight for _, _, weight in samples) < MIN_TRAINING_SAMPLES or len(labels) < 2:
+            logger.info(f"[INTENT] Datos insuficientes para entrenar ({len(samples)} mensajes distintos)")
+            return self.get_stats()
+
+        train_set, holdout = [], []
+        for sample in samples:
+            bucket = zlib.crc32(' '.join(sample[0]).encode()) % 5
+            (holdout if bucket == 0 else train_set).append(sample)
+
+        accuracy = None
+        if holdout and len({label for _, label, _ in train_set}) >= 2:
+            candidate = TfidfLinearModel.fit(train_set)
+            hits = sum(weight for features, label, weight in holdout if candidate.predict(features)[0] == label)
+            accuracy = round(hits / sum(weight for _, _, weight in holdout), 4)
+
+        model = TfidfLinearModel.fit(samples)
+        with self._lock:
+            self._model = model
+            self._model_info = {
+                'trained_at': time.time(),
+                'samples': sum(weight for _, _, weight in samples),
+                'labels': list(model.labels),
+                'holdout_accuracy': accuracy,
+                'enabled': accuracy is not None and accuracy >= MIN_HOLDOUT_ACCURACY,
+                'train_seconds': round(time.time() - start, 3),
+            }
+        logger.info(f"[INTENT] Modelo entrenado: {self._model_info['samples']} ejemplos, "
+                    f"precisión {accuracy}, habilitado={self._model_info['enabled']}")
+        return self.get_stats()
+
+    # ============================================
+    # PERSISTENCIA
+    # ============================================
+
+    def save(self, path=DEFAULT_MODEL_PATH):
+        if self._model is None:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        payload = {'info': self._model_info, 'model': self._model.to_dict()}
+        # Temporal por proceso: dos procesos guardando a la vez no se pisan antes del replace
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, path)
+        logger.info(f"[INTENT] Modelo guardado en {path}")
+
+    def load(self, path=DEFAULT_MODEL_PATH):
+        if not NUMPY_AVAILABLE or not os.path.exists(path):
+            return False
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                payload = json.load(f)
+            model = TfidfLinearModel.from_dict(payload['model'])
+            with self._lock:
+                self._model = model
+                self._model_info = payload.get('info', self._model_info)
+            logger.info(f"[INTENT] Modelo cargado desde {path}: {len(model.vocabulary)} términos")
+            return True
+        except Exception as e:
+            logger.error(f"[INTENT] Error cargando modelo {path}: {e}")
+            return False
+
+    def start_background_training(self, interval=6 * 3600, path=DEFAULT_MODEL_PATH, on_saved=None):
+        """
+        Reentrenar con el log cada `interval` segundos en un hilo daemon.
+        on_saved() se llama después de cada guardado (avisar a los otros workers que recarguen).
+        """
+        if not NUMPY_AVAILABLE or (self._refresh_thread and self._refresh_thread.is_alive()):
+            return
+
+        def _loop():
+            while not self._stop_event.is_set():
+                try:
+                    self.train()
+                    self.save(path)
+                    if on_saved and self._model is not None:
+                        on_saved()
+                except Exception as e:
+                    logger.error(f"[INTENT] Error reentrenando modelo: {e}")
+                self._stop_event.wait(interval)
+
+        self._stop_event.clear()
+        self._refresh_thread = threading.Thread(target=_loop, name='intent-training', daemon=True)
+        self._refresh_thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    # ============================================
+    # MÉTRICAS
+    # ============================================
+
+    def record_turn(self, source, latency):
+        """source: rules | model | llm | fallback"""
+        with self._lock:
+            self._turns[source] += 1
+            self._latencies.setdefault(source, deque(maxlen=LATENCY_WINDOW)).append(latency)
+
+    def get_stats(self):
+        with self._lock:
+            total = sum(self._turns.values())
+            local = self._turns['rules'] + self._turns['model']
+            by_source = {}
+            for source, latencies in self._latencies.items():
+                values = sorted(latencies)
+                by_source[source] = {
+                    'turns': self._turns[source],
+                    'latency_avg_ms': round(sum(values) / len(values) * 1000, 2) if values else 0.0,
+                    'latency_p50_ms': round(_percentile(values, 0.50) * 1000, 2),
+                    'latency_p95_ms': round(_percentile(values, 0.95) * 1000, 2),
+                }
+            return {
+                'turns': total,
+                'local_turns': local,
+                'local_fraction': round(local / total, 4) if total else 0.0,
+                'by_source': by_source,
+                'threshold': self.threshold,
+                'logged_decisions': self._logged,
+                'numpy': NUMPY_AVAILABLE,
+                'model': dict(self._model_info),
+            }
+
+
+# Instancia global
+intent_classifier = IntentClassifier()
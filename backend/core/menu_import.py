@@ -0,0 +1,462 @@
+"""
+Importación masiva de menús (CSV / JSON / NDJSON)
+
+Reemplaza el patrón de los scripts expand_products_* (un INSERT y un SELECT
+de categoría por producto, commits sueltos) por:
+  - Lectura en streaming: el archivo se procesa en lotes sin cargarlo entero
+  - Una sola precarga de categorías, subcategorías y productos existentes
+  - Categorías/subcategorías faltantes creadas con un INSERT multi-fila por lote
+  - Productos escritos con INSERT multi-fila ... ON DUPLICATE KEY UPDATE
+    (un statement y un commit por lote)
+  - Modo dry-run: lee, valida y clasifica sin escribir nada
+
+Como products no tiene un índice único por nombre, el upsert usa la PK: los
+productos que ya existen (misma categoría y nombre normalizado) se insertan
+con su id y el ON DUPLICATE KEY UPDATE los actualiza; los nuevos van con id
+NULL y MySQL les asigna uno.
+
+Columnas reconocidas (también en español): name/nombre, price/precio,
+category/categoria, subcategory/subcategoria, description/descripcion,
+image_url/imagen, available/disponible.
+"""
+import csv
+import json
+import logging
+import os
+import time
+from decimal import Decimal, InvalidOperation
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = int(os.getenv('MENU_IMPORT_BATCH_SIZE', '500'))
+JSON_READ_BLOCK = 64 * 1024
+
+FIELD_ALIASES = {
+    'name': ('name', 'nombre', 'producto'),
+    'price': ('price', 'precio'),
+    'category': ('category', 'categoria', 'categoría', 'category_name'),
+    'subcategory': ('subcategory', 'subcategoria', 'subcategoría', 'subcategory_name'),
+    'description': ('description', 'descripcion', 'descripción'),
+    'image_url': ('image_url', 'imagen', 'image'),
+    'available': ('available', 'disponible'),
+}
+
+PRODUCT_COLUMNS = ('id', 'name', 'description', 'price', 'category_id', 'subcategory_id', 'image_url', 'available')
+UPDATE_COLUMNS = ('name', 'description', 'price', 'category_id', 'subcategory_id', 'image_url', 'available')
+
+TRUE_VALUES = {'1', 'true', 'si', 'sí', 'yes', 'y', 'x'}
+FALSE_VALUES = {'0', 'false', 'no', 'n'}
+
+
+class MenuImportError(ValueError):
+    """Registro del archivo que no se puede importar"""
+
+
+def normalize_name(value):
+    """Clave de comparación: sin espacios extra y en minúsculas"""
+    return ' '.join(str(value).split()).lower()
+
+
+# ============================================================
+# LECTURA EN STREAMING
+# ============================================================
+
+def detect_format(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        return 'csv'
+    if ext in ('.ndjson', '.jsonl'):
+        return 'ndjson'
+    if ext == '.json':
+        return 'json'
+    raise MenuImportError(f"Formato no soportado: {ext} (usar .csv, .json o .ndjson)")
+
+
+def _iter_json_array(f):
+    """Recorre un array JSON de objetos leyendo el archivo por bloques"""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    started = False
+    eof = False
+
+    while True:
+        # Saltar espacios y separadores entre elementos
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos < len(buffer) or eof:
+                break
+            chunk = f.read(JSON_READ_BLOCK)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+
+        if pos >= len(buffer):
+            if started:
+                raise MenuImportError("JSON incompleto: falta ']'")
+            return
+        if not started:
+            if buffer[pos] != '[':
+                raise MenuImportError("El JSON debe ser un array de productos (o usar NDJSON)")
+            started = True
+            pos += 1
+            continue
+        if buffer[pos] == ']':
+            return
+
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise MenuImportError("JSON inválido")
+            chunk = f.read(JSON_READ_BLOCK)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+        yield item
+        pos = end
+        if pos > JSON_READ_BLOCK:
+            buffer = buffer[pos:]
+            pos = 0
+
+
+def iter_menu_records(path, fmt=None):
+    """
+    Genera (número de registro, dict) sin cargar el archivo completo
+
+    Una línea NDJSON mal formada no corta la importación: llega como
+    MenuImportError y el importador la cuenta como registro inválido.
+    """
+    fmt = fmt or detect_format(path)
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        if fmt == 'csv':
+            sample = f.read(4096)
+            f.seek(0)
+            try:
+                dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+            except csv.Error:
+                dialect = csv.excel
+            for number, row in enumerate(csv.DictReader(f, dialect=dialect), start=2):
+                yield number, row
+        elif fmt == 'ndjson':
+            for number, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield number, json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield number, MenuImportError(f"JSON inválido: {e.msg} (columna {e.colno})")
+        else:
+            for number, item in enumerate(_iter_json_array(f), start=1):
+                yield number, item
+
+
+def iter_chunks(records, size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _field(raw, name):
+    for alias in FIELD_ALIASES[name]:
+        value = raw.get(alias)
+        if value is not None and str(value).strip() != '':
+            return value.strip() if isinstance(value, str) else value
+    return None
+
+
+def _parse_price(value):
+    text = str(value).replace('$', '').replace(' ', '')
+    if ',' in text and '.' in text:
+        text = text.replace('.', '').replace(',', '.')
+    elif ',' in text:
+        text = text.replace(',', '.')
+    try:
+        price = Decimal(text)
+    except InvalidOperation:
+        raise MenuImportError(f"precio inválido: {value!r}")
+    if price < 0:
+        raise MenuImportError(f"precio negativo: {value!r}")
+    return price.quantize(Decimal('0.01'))
+
+
+def _parse_bool(value):
+    if value is None:
+        return 1
+    if isinstance(value, bool):
+        return int(value)
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return 1
+    if text in FALSE_VALUES:
+        return 0
+    raise MenuImportError(f"disponible inválido: {value!r}")
+
+
+def parse_record(raw):
+    """Valida y normaliza un registro del archivo"""
+    if isinstance(raw, MenuImportError):
+        raise raw
+    if not isinstance(raw, dict):
+        raise MenuImportError("el registro no es un objeto")
+    name = _field(raw, 'name')
+    if not name:
+        raise MenuImportError("falta el nombre")
+    category = _field(raw, 'category')
+    if not category:
+        raise MenuImportError("falta la categoría")
+    price = _field(raw, 'price')
+    if price is None:
+        raise MenuImportError("falta el precio")
+    return {
+        'name': ' '.join(str(name).split()),
+        'price': _parse_price(price),
+        'category': ' '.join(str(category).split()),
+        'subcategory': _field(raw, 'subcategory'),
+        'description': _field(raw, 'description') or '',
+        'image_url': _field(raw, 'image_url'),
+        'available': _parse_bool(_field(raw, 'available')),
+    }
+
+
+# ============================================================
+# IMPORTADOR
+# ============================================================
+
+class MenuImporter:
+    """
+    Motor de importación por lotes.
+
+    Args:
+        get_connection: callable que devuelve una conexión mysql.connector
+        batch_size: registros por lote (un INSERT y un commit por lote)
+        dry_run: no escribe nada, solo informa qué haría
+        update_existing: si es False los productos existentes se dejan intactos
+        progress: callable(stats) llamado al terminar cada lote
+    """
+
+    def __init__(self, get_connection, batch_size=DEFAULT_BATCH_SIZE, dry_run=False,
+                 update_existing=True, progress=None):
+        self.get_connection = get_connection
+        self.batch_size = max(1, int(batch_size))
+        self.dry_run = dry_run
+        self.update_existing = update_existing
+        self.progress = progress
+
+        self.categories = {}      # nombre normalizado -> id
+        self.subcategories = {}   # (category_id, nombre normalizado) -> id
+        self.products = {}        # (category_id, nombre normalizado) -> id
+        self._next_fake_id = -1
+
+        self.stats = {
+            'read': 0, 'inserted': 0, 'updated': 0, 'unchanged': 0, 'invalid': 0,
+            'categories_created': 0, 'subcategories_created': 0,
+            'batches': 0, 'queries': 0, 'elapsed': 0.0, 'rows_per_sec': 0.0,
+        }
+        self.errors = []
+
+    def _execute(self, cursor, query, params=None):
+        self.stats['queries'] += 1
+        cursor.execute(query, params)
+
+    def prefetch(self, cursor):
+        """Una consulta por tabla: todo lo necesario para resolver nombres"""
+        self._execute(cursor, "SELECT id, name FROM categories")
+        for row in cursor.fetchall():
+            self.categories.setdefault(normalize_name(row['name']), row['id'])
+
+        self._execute(cursor, "SELECT id, category_id, name FROM subcategories")
+        for row in cursor.fetchall():
+            self.subcategories.setdefault((row['category_id'], normalize_name(row['name'])), row['id'])
+
+        self._execute(cursor, "SELECT id, category_id, name FROM products")
+        for row in cursor.fetchall():
+            self.products.setdefault((row['category_id'], normalize_name(row['name'])), row['id'])
+
+        logger.info(f"[IMPORT] Precarga: {len(self.categories)} categorías, "
+                    f"{len(self.subcategories)} subcategorías, {len(self.products)} productos")
+
+    def _fake_id(self):
+        self._next_fake_id -= 1
+        return self._next_fake_id
+
+    def _resolve_categories(self, cursor, records):
+        missing = {}
+        for record in records:
+            key = normalize_name(record['category'])
+            if key not in self.categories:
+                missing.setdefault(key, record['category'])
+        if not missing:
+            return
+
+        self.stats['categories_created'] += len(missing)
+        if self.dry_run:
+            for key in missing:
+                self.categories[key] = self._fake_id()
+            return
+
+        names = list(missing.values())
+        self._execute(
+            cursor,
+            "INSERT INTO categories (name, is_active) VALUES " + ', '.join(['(%s, 1)'] * len(names)),
+            names
+        )
+        self._execute(
+            cursor,
+            f"SELECT id, name FROM categories WHERE name IN ({', '.join(['%s'] * len(names))})",
+            names
+        )
+        for row in cursor.fetchall():
+            self.categories.setdefault(normalize_name(row['name']), row['id'])
+
+    def _resolve_subcategories(self, cursor, records):
+        missing = {}
+        for record in records:
+            if not record['subcategory']:
+                continue
+            key = (self.categories[normalize_name(record['category'])], normalize_name(record['subcategory']))
+            if key not in self.subcategories:
+                missing.setdefault(key, record['subcategory'])
+        if not missing:
+            return
+
+        self.stats['subcategories_created'] += len(missing)
+        if self.dry_run:
+            for key in missing:
+                self.subcategories[key] = self._fake_id()
+            return
+
+        params = []
+        for (category_id, _), name in missing.items():
+            params.extend((name, category_id))
+        self._execute(
+            cursor,
+            "INSERT INTO subcategories (name, category_id, is_active) VALUES "
+            + ', '.join(['(%s, %s, 1)'] * len(missing)),
+            params
+        )
+        category_ids = sorted({category_id for category_id, _ in missing})
+        self._execute(
+            cursor,
+            f"SELECT id, category_id, name FROM subcategories WHERE category_id IN ({', '.join(['%s'] * len(category_ids))})",
+            category_ids
+        )
+        for row in cursor.fetchall():
+            self.subcategories.setdefault((row['category_id'], normalize_name(row['name'])), row['id'])
+
+    def _write_products(self, cursor, records):
+        # Último registro gana si el mismo producto se repite dentro del lote
+        rows = {}
+        for record in records:
+            category_id = self.categories[normalize_name(record['category'])]
+            subcategory_id = None
+            if record['subcategory']:
+                subcategory_id = self.subcategories[(category_id, normalize_name(record['subcategory']))]
+            key = (category_id, normalize_name(record['name']))
+            rows[key] = (
+                self.products.get(key), record['name'], record['description'], record['price'],
+                category_id, subcategory_id, record['image_url'], record['available']
+            )
+
+        new_keys = [key for key, row in rows.items() if row[0] is None]
+        existing = len(rows) - len(new_keys)
+        self.stats['inserted'] += len(new_keys)
+        if self.update_existing:
+            self.stats['updated'] += existing
+        else:
+            self.stats['unchanged'] += existing
+            rows = {key: row for key, row in rows.items() if row[0] is None}
+
+        if self.dry_run:
+            for key in new_keys:
+                self.products[key] = self._fake_id()
+            return
+        if not rows:
+            return
+
+        if self.update_existing:
+            on_duplicate = ', '.join(f"{column} = VALUES({column})" for column in UPDATE_COLUMNS)
+        else:
+            on_duplicate = "id = id"
+        placeholders = '(' + ', '.join(['%s'] * len(PRODUCT_COLUMNS)) + ')'
+        params = [value for row in rows.values() for value in row]
+        self._execute(
+            cursor,
+            f"INSERT INTO products ({', '.join(PRODUCT_COLUMNS)}) VALUES "
+            + ', '.join([placeholders] * len(rows))
+            + f" ON DUPLICATE KEY UPDATE {on_duplicate}",
+            params
+        )
+
+        if new_keys:
+            # Ids de los nuevos para que un lote posterior los actualice en vez de duplicarlos
+            names = sorted({rows[key][1] for key in new_keys})
+            self._execute(
+                cursor,
+                f"SELECT id, category_id, name FROM products WHERE name IN ({', '.join(['%s'] * len(names))})",
+                names
+            )
+            for row in cursor.fetchall():
+                self.products.setdefault((row['category_id'], normalize_name(row['name'])), row['id'])
+
+    def _process_batch(self, cursor, connection, batch):
+        records = []
+        for number, raw in batch:
+            try:
+                records.append(parse_record(raw))
+            except MenuImportError as e:
+                self.stats['invalid'] += 1
+                self.errors.append((number, str(e)))
+
+        if records:
+            self._resolve_categories(cursor, records)
+            self._resolve_subcategories(cursor, records)
+            self._write_products(cursor, records)
+            if not self.dry_run:
+                connection.commit()
+
+    def run(self, records):
+        """
+        Importa un iterable de (número, dict), típicamente iter_menu_records().
+
+        Cada lote es su propia transacción: si un lote falla se hace rollback
+        de ese lote y los anteriores quedan confirmados.
+        """
+        start = time.perf_counter()
+        connection = self.get_connection()
+        cursor = connection.cursor(dictionary=True)
+        try:
+            self.prefetch(cursor)
+            for batch in iter_chunks(records, self.batch_size):
+                try:
+                    self._process_batch(cursor, connection, batch)
+                except Exception:
+                    if not self.dry_run:
+                        connection.rollback()
+                    raise
+                self.stats['read'] += len(batch)
+                self.stats['batches'] += 1
+                self.stats['elapsed'] = time.perf_counter() - start
+                self.stats['rows_per_sec'] = self.stats['read'] / self.stats['elapsed'] if self.stats['elapsed'] else 0.0
+                if self.progress:
+                    self.progress(dict(self.stats))
+        finally:
+            cursor.close()
+            connection.close()
+
+        self.stats['elapsed'] = time.perf_counter() - start
+        self.stats['rows_per_sec'] = self.stats['read'] / self.stats['elapsed'] if self.stats['elapsed'] else 0.0
+        logger.info(f"[IMPORT] {self.stats['read']} registros en {self.stats['elapsed']:.2f}s "
+                    f"({self.stats['rows_per_sec']:.0f}/s, {self.stats['queries']} consultas)")
+        return dict(self.stats)
+
+    def import_file(self, path, fmt=None):
+        return self.run(iter_menu_records(path, fmt))
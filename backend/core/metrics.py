@@ -0,0 +1,534 @@
+"""
+Métricas en formato de exposición de Prometheus (texto 0.0.4) sin dependencias
+
+Lo usan complete_server (GET /metrics) y la app FastAPI (GET /metrics):
+  - contadores e histogramas que se actualizan en el camino caliente
+    (requests por ruta, latencia de consultas por fingerprint, espera del pool,
+    lookups de cache, llamadas a Gemini)
+  - cada consulta, espera del pool y llamada al LLM también suma al desglose
+    del request en curso (core/request_timing.py, header Server-Timing)
+  - collectors: funciones que se consultan solo al hacer scrape y leen
+    estadísticas que ya existen (pool, SmartCache, TieredCache, WebSockets,
+    admisión, deadlines, réplica), sin costo por request
+
+Camino caliente: la serie (combinación de labels) se busca en un dict sin
+lock; el lock del registro se toma solo la primera vez que aparece una serie.
+Cada serie tiene su propio lock, así dos rutas distintas nunca compiten.
+La cantidad de series por métrica está acotada (MAX_SERIES): lo que sobra
+se cuenta con todos los labels en "other".
+
+Con prefork (WORKERS > 1) cada worker tiene su registro y el scrape ve al
+worker que atendió el request; el label worker identifica cuál.
+"""
+import bisect
+import math
+import os
+import re
+import threading
+import time
+import zlib
+
+from core import request_timing
+from core.query_analytics import query_stats
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+MAX_SERIES = int(os.environ.get('METRICS_MAX_SERIES', 500))
+
+# Latencia de requests y consultas (segundos)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Llamadas al LLM: de cientos de milisegundos a decenas de segundos
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+# ============================================================
+# MÉTRICAS
+# ============================================================
+
+class _Metric:
+    type = None
+
+    def __init__(self, registry, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._registry_lock = registry._lock
+        self._children = {}
+
+    def labels(self, *values):
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._registry_lock:
+                child = self._children.get(values)
+                if child is None:
+                    if len(self._children) >= MAX_SERIES:
+                        values = ('other',) * len(self.labelnames)
+                        child = self._children.get(values)
+                    if child is None:
+                        child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self):
+        raise NotImplementedError
+
+
+class _CounterChild:
+    __slots__ = ('_lock', 'value')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def __init__(self, registry, name, help, labelnames=()):
+        # Formato 0.0.4: la familia se llama igual que la muestra (con _total)
+        super().__init__(registry, f"{name}_total", help, labelnames)
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def samples(self):
+        for values, child in list(self._children.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, values)}", child.value
+
+
+class _HistogramChild:
+    __slots__ = ('_lock', '_upper', 'counts', 'sum')
+
+    def __init__(self, upper):
+        self._lock = threading.Lock()
+        self._upper = upper
+        self.counts = [0] * (len(upper) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self._upper, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, registry, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def samples(self):
+        for values, child in list(self._children.items()):
+            with child._lock:
+                counts = list(child.counts)
+                total = child.sum
+            cumulative = 0
+            for upper, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{_format_value(float(upper))}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, values, le)}", cumulative
+            yield f"{self.name}_sum{_format_labels(self.labelnames, values)}", total
+            yield f"{self.name}_count{_format_labels(self.labelnames, values)}", cumulative
+
+
+# ============================================================
+# REGISTRO
+# ============================================================
+
+class MetricsRegistry:
+    """
+    Métricas propias + collectors de estadísticas existentes.
+
+    Un collector es un callable sin argumentos que devuelve una lista de
+    (nombre, tipo, ayuda, [(labels_dict, valor), ...]); se ejecuta solo en render().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter(self, name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(self, name, help, labelnames, buckets))
+
+    def _add(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self):
+        """Texto listo para el scrape"""
+        worker = f'worker="{os.getpid()}"'
+        lines = []
+        for metric in list(self._metrics):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for sample, value in metric.samples():
+                lines.append(f"{sample} {_format_value(value)}")
+
+        for collector in list(self._collectors):
+            try:
+                families = collector()
+            except Exception as e:
+                lines.append(f"# collector {getattr(collector, '__name__', collector)} falló: {_escape(e)}")
+                continue
+            for name, kind, help, samples in families:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    if value is None:
+                        continue
+                    names, values = tuple(labels), tuple(labels.values())
+                    lines.append(f"{name}{_format_labels(names, values)} {_format_value(value)}")
+
+        lines.append("# HELP gastro_worker_info Proceso que respondió el scrape")
+        lines.append("# TYPE gastro_worker_info gauge")
+        lines.append(f"gastro_worker_info{{{worker}}} 1")
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+HTTP_REQUESTS = registry.counter(
+    'gastro_http_requests', 'Requests HTTP por ruta y código', ('method', 'route', 'status'))
+HTTP_LATENCY = registry.histogram(
+    'gastro_http_request_duration_seconds', 'Duración de requests HTTP por ruta', ('method', 'route'))
+DB_QUERY_LATENCY = registry.histogram(
+    'gastro_db_query_duration_seconds', 'Duración de consultas por fingerprint', ('fingerprint',))
+DB_QUERY_ERRORS = registry.counter(
+    'gastro_db_query_errors', 'Consultas con error por fingerprint', ('fingerprint',))
+DB_POOL_WAIT = registry.histogram(
+    'gastro_db_pool_wait_seconds', 'Espera para obtener una conexión del pool', ('pool',))
+CACHE_LOOKUPS = registry.counter(
+    'gastro_cache_lookups', 'Lookups de cache por resultado (hit/miss)', ('cache', 'result'))
+LLM_CALLS = registry.counter(
+    'gastro_llm_calls', 'Llamadas al LLM por tipo de intent y resultado', ('kind', 'outcome'))
+LLM_LATENCY = registry.histogram(
+    'gastro_llm_request_duration_seconds', 'Latencia de llamadas al LLM por tipo de intent', ('kind',),
+    buckets=LLM_BUCKETS)
+
+
+# ============================================================
+# RUTAS Y FINGERPRINTS (cardinalidad acotada)
+# ============================================================
+
+_ID_SEGMENT_RE = re.compile(r'/\d+(?=/|$)')
+_HINT_RE = re.compile(r'/\*.*?\*/', re.DOTALL)
+_STRING_RE = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_RE = re.compile(r'%s|%\(\w+\)s|:\w+')
+_IN_LIST_RE = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_SPACE_RE = re.compile(r'\s+')
+_FINGERPRINT_CACHE_SIZE = 2048
+_fingerprints = {}
+
+
+def route_label(path):
+    """Ruta con ids reemplazados; todo lo que no es API (frontend, estáticos) va a un solo label"""
+    if not path.startswith('/api/') and path not in ('/health', '/metrics', '/'):
+        return 'static'
+    return _ID_SEGMENT_RE.sub('/{id}', path)
+
+
+def normalize_query(query):
+    """SQL sin hints, literales ni listas IN variables: la misma forma da el mismo texto"""
+    query = _HINT_RE.sub(' ', query)
+    query = _STRING_RE.sub('?', query)
+    query = _PLACEHOLDER_RE.sub('?', query)
+    query = _NUMBER_RE.sub('?', query)
+    query = _IN_LIST_RE.sub('IN (?+)', query)
+    return _SPACE_RE.sub(' ', query).strip()
+
+
+def query_fingerprint(query):
+    """(fingerprint, texto normalizado); cacheado por texto de la consulta"""
+    cached = _fingerprints.get(query)
+    if cached is None:
+        normalized = normalize_query(query)
+        cached = (f"{zlib.crc32(normalized.encode()):08x}", normalized)
+        if len(_fingerprints) >= _FINGERPRINT_CACHE_SIZE:
+            _fingerprints.clear()
+        _fingerprints[query] = cached
+    return cached
+
+
+_fingerprint_texts = {}
+
+
+def observe_query(query, seconds, ok=True, params=None, rows=None):
+    """
+    Latencia (o error) de una consulta, agrupada por fingerprint.
+    params/rows alimentan las estadísticas del asesor de índices (core/query_analytics.py).
+    """
+    fingerprint, normalized = query_fingerprint(query)
+    if fingerprint not in _fingerprint_texts and len(_fingerprint_texts) < MAX_SERIES:
+        _fingerprint_texts[fingerprint] = normalized[:300]
+    query_stats.record(fingerprint, normalized, query, params, seconds, ok, rows)
+    if ok:
+        DB_QUERY_LATENCY.labels(fingerprint).observe(seconds)
+        # La consulta ya se contó en request_timing.claim_query() antes de ejecutarse
+        request_timing.record_db_time(seconds)
+    else:
+        DB_QUERY_ERRORS.labels(fingerprint).inc()
+
+
+def observe_rows(query, rows):
+    """Filas leídas con fetch* de una consulta ya observada"""
+    query_stats.add_rows(query_fingerprint(query)[0], rows)
+
+
+def observe_pool_wait(pool, seconds):
+    DB_POOL_WAIT.labels(pool).observe(seconds)
+    request_timing.record_pool_wait(seconds)
+
+
+def observe_llm(kind, seconds, ok=True):
+    """Llamada al LLM: contador por resultado, latencia y desglose del request"""
+    LLM_CALLS.labels(kind, 'ok' if ok else 'error').inc()
+    LLM_LATENCY.labels(kind).observe(seconds)
+    request_timing.record_llm(seconds)
+
+
+# ============================================================
+# POOL INSTRUMENTADO (mysql.connector)
+# ============================================================
+
+class _InstrumentedCursor:
+    """
+    Cursor que mide cada execute (latencia por fingerprint + conteo del request)
+    y suma el tiempo de fetch al desglose del request. Las filas leídas se
+    reportan al ejecutar la siguiente consulta o al cerrar. El resto pasa directo.
+    """
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._last_query = None
+        self._rows = 0
+
+    def _flush_rows(self):
+        if self._last_query is not None and self._rows:
+            observe_rows(self._last_query, self._rows)
+        self._last_query = None
+        self._rows = 0
+
+    def _timed(self, method, operation, params=None, *args, **kwargs):
+        self._flush_rows()
+        request_timing.claim_query()
+        start = time.perf_counter()
+        try:
+            result = method(operation, params, *args, **kwargs)
+        except Exception:
+            observe_query(operation, 0, ok=False)
+            raise
+        self._last_query = operation
+        observe_query(operation, time.perf_counter() - start, params=params)
+        return result
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        return self._timed(self._cursor.execute, operation, params, *args, **kwargs)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        # Solo se guarda la forma de la consulta; los parámetros de un lote no sirven para EXPLAIN
+        self._flush_rows()
+        request_timing.claim_query()
+        start = time.perf_counter()
+        try:
+            result = self._cursor.executemany(operation, seq_params, *args, **kwargs)
+        except Exception:
+            observe_query(operation, 0, ok=False)
+            raise
+        observe_query(operation, time.perf_counter() - start, params=False)
+        return result
+
+    def _fetch(self, method, *args):
+        start = time.perf_counter()
+        try:
+            result = method(*args)
+        finally:
+            request_timing.record_db_time(time.perf_counter() - start)
+        if isinstance(result, list):
+            self._rows += len(result)
+        elif result is not None:
+            self._rows += 1
+        return result
+
+    def fetchall(self):
+        return self._fetch(self._cursor.fetchall)
+
+    def fetchone(self):
+        return self._fetch(self._cursor.fetchone)
+
+    def fetchmany(self, *args):
+        return self._fetch(self._cursor.fetchmany, *args)
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def close(self):
+        self._flush_rows()
+        return self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class _InstrumentedConnection:
+    """Conexión del pool cuyos cursores están instrumentados"""
+
+    def __init__(self, connection):
+        object.__setattr__(self, '_connection', connection)
+
+    def cursor(self, *args, **kwargs):
+        return _InstrumentedCursor(self._connection.cursor(*args, **kwargs))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._connection.close()
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._connection, name, value)
+
+
+class InstrumentedPool:
+    """
+    Envoltorio de MySQLConnectionPool: mide la espera de get_connection() y
+    devuelve conexiones con cursores instrumentados, así los handlers que usan
+    el pool directamente (sin execute_mysql_query) también cuentan consultas.
+    """
+
+    def __init__(self, pool, name='primary'):
+        self._pool = pool
+        self._name = name
+
+    def get_connection(self):
+        start = time.perf_counter()
+        connection = self._pool.get_connection()
+        observe_pool_wait(self._name, time.perf_counter() - start)
+        return _InstrumentedConnection(connection)
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+
+def _fingerprint_info():
+    return [('gastro_db_query_fingerprint_info', 'gauge', 'Texto normalizado de cada fingerprint de consulta',
+             [({'fingerprint': fp, 'query': text}, 1) for fp, text in list(_fingerprint_texts.items())])]
+
+
+registry.register_collector(_fingerprint_info)
+
+
+# ============================================================
+# COLLECTORS REUTILIZABLES
+# ============================================================
+
+def admission_collector(controller):
+    """Requests en curso, en cola y rechazados por clase (core/admission.py)"""
+    def collect():
+        stats = controller.get_stats()['classes']
+        return [
+            ('gastro_admission_active', 'gauge', 'Requests admitidos en curso por clase',
+             [({'class': klass}, entry['active']) for klass, entry in stats.items()]),
+            ('gastro_admission_waiting', 'gauge', 'Requests esperando admisión por clase',
+             [({'class': klass}, entry['waiting']) for klass, entry in stats.items()]),
+            ('gastro_admission_rejected_total', 'counter', 'Requests rechazados con 503 por clase',
+             [({'class': klass}, entry['rejected']) for klass, entry in stats.items()]),
+        ]
+    return collect
+
+
+def deadline_collector(stats):
+    """Consultas abortadas y requests fuera de presupuesto por ruta (core/deadlines.py)"""
+    def collect():
+        routes = stats.get_stats()['routes']
+        return [
+            ('gastro_deadline_query_timeouts_total', 'counter', 'Consultas abortadas por MAX_EXECUTION_TIME',
+             [({'route': route}, entry['query_timeouts']) for route, entry in routes.items()]),
+            ('gastro_deadline_exceeded_total', 'counter', 'Requests que agotaron su presupuesto',
+             [({'route': route}, entry['deadline_exceeded']) for route, entry in routes.items()]),
+        ]
+    return collect
+
+
+def smart_cache_collector(cache):
+    """Hits/misses y ocupación de SmartCache (core/smart_cache.py)"""
+    def collect():
+        stats = cache.get_stats()
+        return [
+            ('gastro_smart_cache_lookups_total', 'counter', 'Lookups de SmartCache por resultado',
+             [({'result': 'hit'}, stats['hits']), ({'result': 'miss'}, stats['misses'])]),
+            ('gastro_smart_cache_bytes', 'gauge', 'Bytes ocupados por SmartCache',
+             [({}, stats['memory_bytes'])]),
+            ('gastro_smart_cache_items', 'gauge', 'Entradas en SmartCache',
+             [({}, stats['total_items'])]),
+        ]
+    return collect
+
+
+def query_budget_collector(stats):
+    """Consultas por request y excesos del presupuesto por ruta (core/request_timing.py)"""
+    def collect():
+        routes = stats.get_stats()['routes']
+        return [
+            ('gastro_request_queries_max', 'gauge', 'Máximo de consultas en un request por ruta',
+             [({'route': route}, entry['max_queries']) for route, entry in routes.items()]),
+            ('gastro_request_query_budget', 'gauge', 'Presupuesto de consultas por request de cada ruta',
+             [({'route': route}, entry['budget']) for route, entry in routes.items()]),
+            ('gastro_query_budget_exceeded_total', 'counter', 'Requests que superaron el presupuesto de consultas',
+             [({'route': route}, entry['over_budget']) for route, entry in routes.items()]),
+        ]
+    return collect
@@ -0,0 +1,260 @@
+"""
+Exportación en streaming de pedidos e items (CSV / NDJSON)
+
+Para los cierres de mes: cada fila sale del cursor sin buffer de MySQL
+(fetchmany por lotes) directo al socket, con Transfer-Encoding: chunked y
+gzip opcional en el momento. La memoria queda constante sin importar el
+rango de fechas: nunca hay más de un lote de filas ni un chunk en memoria.
+
+Parámetros (query string):
+  from, to     fechas YYYY-MM-DD (to inclusive); por defecto el mes en curso
+  company_id   filtra por empresa
+  status       filtra por estado del pedido
+  scope        items (una fila por item, por defecto) | orders (una por pedido)
+  format       csv (por defecto) | ndjson
+  gzip=1       descarga comprimida (.gz); con Accept-Encoding: gzip se comprime
+               en tránsito sin cambiar el archivo
+"""
+import csv
+import io
+import json
+import logging
+import zlib
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+logger = logging.getLogger(__name__)
+
+BATCH_ROWS = 2000
+# Tamaño mínimo de cada chunk HTTP (se acumulan filas hasta llegar)
+CHUNK_BYTES = 64 * 1024
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+ORDER_COLUMNS = (
+    ('order_id', 'o.id'),
+    ('created_at', 'o.created_at'),
+    ('company_id', 'o.company_id'),
+    ('table_number', 'o.table_number'),
+    ('customer_id', 'o.customer_id'),
+    ('waiter_id', 'o.waiter_id'),
+    ('status', 'o.status'),
+    ('payment_status', 'o.payment_status'),
+    ('subtotal', 'o.subtotal'),
+    ('tax', 'o.tax'),
+    ('total', 'o.total'),
+)
+ITEM_COLUMNS = (
+    ('item_id', 'oi.id'),
+    ('product_id', 'oi.product_id'),
+    ('product_name', 'p.name'),
+    ('category_name', 'c.name'),
+    ('quantity', 'oi.quantity'),
+    ('unit_price', 'oi.price'),
+    ('line_total', 'oi.quantity * oi.price'),
+    ('item_notes', 'oi.notes'),
+)
+
+
+class ExportError(ValueError):
+    """Parámetros de exportación inválidos (se responde 400)"""
+
+
+def _parse_date(value, name):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        raise ExportError(f"{name} debe tener formato YYYY-MM-DD")
+
+
+class OrderExport:
+    """Parámetros validados + SQL de la exportación"""
+
+    def __init__(self, params):
+        def param(name, default=None):
+            value = params.get(name, [default])
+            return value[0] if isinstance(value, list) else value
+
+        today = date.today()
+        self.date_from = _parse_date(param('from'), 'from') if param('from') else today.replace(day=1)
+        self.date_to = _parse_date(param('to'), 'to') if param('to') else today
+        if self.date_to < self.date_from:
+            raise ExportError("to no puede ser anterior a from")
+
+        company_id = param('company_id')
+        try:
+            self.company_id = int(company_id) if company_id not in (None, '') else None
+        except ValueError:
+            raise ExportError("company_id debe ser numérico")
+        self.status = param('status') or None
+
+        self.scope = param('scope', 'items')
+        if self.scope not in ('items', 'orders'):
+            raise ExportError("scope debe ser items u orders")
+        self.format = param('format', 'csv')
+        if self.format not in FORMATS:
+            raise ExportError(f"format debe ser uno de: {', '.join(FORMATS)}")
+        self.gzip_file = param('gzip') in ('1', 'true')
+
+    @property
+    def columns(self):
+        if self.scope == 'items':
+            return ORDER_COLUMNS + ITEM_COLUMNS
+        return ORDER_COLUMNS
+
+    @property
+    def filename(self):
+        name = f"{'pedidos_items' if self.scope == 'items' else 'pedidos'}_{self.date_from}_{self.date_to}.{self.format}"
+        return f"{name}.gz" if self.gzip_file else name
+
+    def query(self):
+        """SQL + parámetros; rango sobre created_at sin DATE() para usar el índice"""
+        select = ', '.join(f"{expr} AS {name}" for name, expr in self.columns)
+        sql = f"SELECT {select} FROM orders o"
+        if self.scope == 'items':
+            sql += (" LEFT JOIN order_items oi ON oi.order_id = o.id"
+                    " LEFT JOIN products p ON p.id = oi.product_id"
+                    " LEFT JOIN categories c ON c.id = p.category_id")
+        sql += " WHERE o.created_at >= %s AND o.created_at < %s"
+        args = [self.date_from, self.date_to + timedelta(days=1)]
+        if self.company_id is not None:
+            sql += " AND o.company_id = %s"
+            args.append(self.company_id)
+        if self.status:
+            sql += " AND o.status = %s"
+            args.append(self.status)
+        sql += " ORDER BY o.id, oi.id" if self.scope == 'items' else " ORDER BY o.id"
+        return sql, tuple(args)
+
+
+# ============================================================
+# ESCRITURA EN STREAMING
+# ============================================================
+
+class StreamWriter:
+    """
+    Escribe al socket en chunks HTTP (o crudo si el cliente es HTTP/1.0),
+    comprimiendo con gzip en el momento si se pidió
+    """
+
+    def __init__(self, wfile, chunked=True, compress=False):
+        self.wfile = wfile
+        self.chunked = chunked
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+        self._buffer = []
+        self._buffered = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def write(self, data):
+        self.bytes_in += len(data)
+        if self._compressor:
+            data = self._compressor.compress(data)
+        if data:
+            self._buffer.append(data)
+            self._buffered += len(data)
+        if self._buffered >= CHUNK_BYTES:
+            self.flush()
+
+    def flush(self):
+        if not self._buffered:
+            return
+        payload = b''.join(self._buffer)
+        self._buffer = []
+        self._buffered = 0
+        self._send(payload)
+
+    def _send(self, payload):
+        if self.chunked:
+            self.wfile.write(f"{len(payload):X}\r\n".encode() + payload + b"\r\n")
+        else:
+            self.wfile.write(payload)
+        self.bytes_out += len(payload)
+
+    def close(self):
+        """Vaciar el compresor y cerrar el stream (chunk final de tamaño 0)"""
+        if self._compressor:
+            tail = self._compressor.flush()
+            if tail:
+                self._buffer.append(tail)
+                self._buffered += len(tail)
+        self.flush()
+        if self.chunked:
+            self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return value
+
+
+def write_export(writer, cursor, export):
+    """Volcar el cursor al writer lote por lote; devuelve la cantidad de filas"""
+    names = [name for name, _ in export.columns]
+    rows_written = 0
+
+    if export.format == 'csv':
+        # Un solo StringIO reutilizado por lote; BOM para que Excel reconozca UTF-8
+        text = io.StringIO()
+        csv_writer = csv.writer(text)
+        csv_writer.writerow(names)
+        writer.write(('﻿' + text.getvalue()).encode())
+
+    while True:
+        rows = cursor.fetchmany(BATCH_ROWS)
+        if not rows:
+            break
+        if export.format == 'csv':
+            text.seek(0)
+            text.truncate()
+            csv_writer.writerows([_csv_value(v) for v in row] for row in rows)
+            writer.write(text.getvalue().encode())
+        else:
+            writer.write(''.join(
+                json.dumps(dict(zip(names, row)), default=_json_default, ensure_ascii=False) + '\n'
+                for row in rows
+            ).encode())
+        rows_written += len(rows)
+    return rows_written
+
+
+def open_export_cursor(config, export):
+    """
+    Conexión dedicada (fuera del pool: una exportación larga no le quita
+    conexiones a la cocina) y cursor sin buffer con la consulta ya ejecutada.
+    """
+    import mysql.connector
+
+    connection = mysql.connector.connect(connect_timeout=10, ssl_disabled=False, **config)
+    try:
+        cursor = connection.cursor(buffered=False)
+        # Si el cliente lee lento, MySQL no corta el envío de filas
+        cursor.execute("SET SESSION net_write_timeout = 600")
+        sql, args = export.query()
+        cursor.execute(sql, args)
+        return connection, cursor
+    except Exception:
+        connection.close()
+        raise
+
+
+def close_export_cursor(connection, cursor):
+    for resource in (cursor, connection):
+        try:
+            resource.close()
+        except Exception:
+            pass
@@ -0,0 +1,132 @@
+"""
+Keyset (cursor) pagination helpers.
+
+OFFSET pagination makes MySQL read and discard every row before the
+requested page, so deep pages get linearly slower. Keyset pagination
+remembers the sort key of the last row returned and asks for rows strictly
+after it, which the index resolves with a single range seek.
+
+Cursors are opaque to clients: base64url-encoded JSON of the last row's
+sort values. Totals are expensive COUNT(*) queries, so they are cached in
+the two-tier cache under the same tags the listings use and dropped when
+those tags are invalidated on writes.
+"""
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Sequence
+
+from sqlalchemy import and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .cache import get_redis, tiered_cache
+from .database import AsyncSessionLocal
+
+# Totals only need to be roughly right between writes
+COUNT_TTL = 300
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor cannot be decoded"""
+
+
+def _to_json(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    if isinstance(value, date):
+        return {"d": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"dec": str(value)}
+    return value
+
+
+def _from_json(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "dt" in value:
+            return datetime.fromisoformat(value["dt"])
+        if "d" in value:
+            return date.fromisoformat(value["d"])
+        if "dec" in value:
+            return Decimal(value["dec"])
+    return value
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Encode the sort key of the last row of a page"""
+    payload = json.dumps([_to_json(v) for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """
+    Decode a cursor produced by encode_cursor.
+
+    Raises:
+        InvalidCursor: if the cursor is malformed or has the wrong arity
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor("Invalid cursor") from e
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor("Invalid cursor")
+    return [_from_json(v) for v in values]
+
+
+def keyset_after(columns: Sequence[Any], values: Sequence[Any], descending: bool = False):
+    """
+    WHERE clause selecting rows strictly after ``values`` in ``columns`` order.
+
+    Expanded as ``a >= x AND (a > x OR (a = x AND b > y) ...)``: the leading
+    bound on the first column gives the optimizer an index range to seek
+    to, and the OR only filters the handful of ties at the boundary.
+    """
+    clauses = []
+    for i, column in enumerate(columns):
+        equal_prefix = [columns[j] == values[j] for j in range(i)]
+        step = column < values[i] if descending else column > values[i]
+        clauses.append(and_(*equal_prefix, step) if equal_prefix else step)
+    bound = columns[0] <= values[0] if descending else columns[0] >= values[0]
+    return and_(bound, or_(*clauses))
+
+
+def page_from_rows(rows: List[Any], limit: int, key: Callable[[Any], Sequence[Any]]) -> Dict[str, Any]:
+    """
+    Split a ``limit + 1`` fetch into the page and the cursor for the next one.
+    """
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "items": rows,
+        "has_more": has_more,
+        "next_cursor": encode_cursor(key(rows[-1])) if has_more and rows else None,
+    }
+
+
+async def cached_count(
+    key: str,
+    count: Callable[[AsyncSession], Awaitable[int]],
+    tags: Iterable[str],
+    ttl: int = COUNT_TTL
+) -> int:
+    """
+    Total row count for a listing, cached and invalidated with its tags.
+
+    Args:
+        key: Cache key for the filter combination (e.g. "count:products:cat:5")
+        count: Coroutine function running the COUNT query on the session it
+            receives. The cache may call it after the request ends (early
+            refresh) or for other waiters, so it gets a session of its own
+            instead of the request's.
+        tags: Tags whose invalidation makes the total stale
+    """
+    async def load() -> int:
+        async with AsyncSessionLocal() as session:
+            return await count(session)
+    
+    client = await get_redis()
+    return await tiered_cache.get_or_compute(
+        key, load, ttl, tags=list(tags), prefix="count", client=client
+    )
@@ -0,0 +1,310 @@
+"""
+Motor local de maridajes basado en canasta de compras (market basket)
+
+Calcula asociaciones producto→producto (support, confidence, lift) a partir
+del historial real de order_items y las guarda como una tabla compacta de
+top-K vecinos en memoria. Las consultas "¿qué va con X?" se resuelven con un
+lookup de diccionario; la IA solo se usa para redactar la respuesta.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from itertools import combinations
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Historial de pedidos que alimenta el modelo
+ORDER_BASKETS_QUERY = """
+SELECT oi.order_id, oi.product_id
+FROM order_items oi
+JOIN orders o ON o.id = oi.order_id
+WHERE o.status NOT IN ('cancelled')
+  AND o.created_at >= NOW() - INTERVAL %s DAY
+"""
+
+DEFAULT_MODEL_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'pairing_model.json'
+)
+
+# Cantidad de pedidos procesados por bloque en la ruta vectorizada
+_CHUNK_ORDERS = 4096
+
+
+class PairingEngine:
+    """
+    Tabla de vecinos top-K por producto:
+    - build(): cuenta co-ocurrencias (NumPy si está disponible, Python puro si no)
+    - neighbours(): lookup O(1) sobre una tabla inmutable
+    - save()/load(): persistencia en JSON para arrancar sin recalcular
+    - start_background_refresh(): recálculo periódico en un hilo daemon
+    """
+
+    def __init__(self, top_k: int = 12, min_pair_count: int = 2, min_confidence: float = 0.02):
+        self.top_k = top_k
+        self.min_pair_count = min_pair_count
+        self.min_confidence = min_confidence
+
+        # product_id -> ((neighbour_id, support, confidence, lift), ...)
+        self._table: Dict[int, Tuple[Tuple[int, float, float, float], ...]] = {}
+        self._stats = {
+            'orders': 0,
+            'products': 0,
+            'pairs': 0,
+            'built_at': None,
+            'build_seconds': 0.0,
+            'backend': None,
+            'lookups': 0,
+            'hits': 0,
+        }
+        self._lock = threading.Lock()
+        self._refresh_thread = None
+        self._stop_event = threading.Event()
+
+    # ============================================
+    # CONSTRUCCIÓN DEL MODELO
+    # ============================================
+
+    def build(self, rows: Iterable[Tuple[int, int]]) -> Dict:
+        """
+        Construir el modelo a partir de filas (order_id, product_id).
+        Reemplaza la tabla de forma atómica al terminar.
+        """
+        start = time.time()
+
+        baskets = defaultdict(set)
+        for order_id, product_id in rows:
+            if order_id is None or product_id is None:
+                continue
+            baskets[int(order_id)].add(int(product_id))
+
+        # Pedidos de un solo producto cuentan para el soporte individual
+        basket_list = [tuple(b) for b in baskets.values() if b]
+        total_orders = len(basket_list)
+
+        if total_orders == 0:
+            logger.warning("[PAIRING] Sin historial de pedidos, el modelo queda vacío")
+            self._swap({}, total_orders, 0, 0, start, 'empty')
+            return self.get_stats()
+
+        if NUMPY_AVAILABLE:
+            item_counts, pair_counts = self._count_numpy(basket_list)
+            backend = 'numpy'
+        else:
+            item_counts, pair_counts = self._count_python(basket_list)
+            backend = 'python'
+
+        table = self._rank(item_counts, pair_counts, total_orders)
+        self._swap(table, total_orders, len(item_counts), len(pair_counts), start, backend)
+        return self.get_stats()
+
+    def _count_python(self, baskets: List[Tuple[int, ...]]):
+        """Conteo de co-ocurrencias en Python puro (fallback sin NumPy)"""
+        item_counts = Counter()
+        pair_counts = Counter()
+        for basket in baskets:
+            items = sorted(basket)
+            item_counts.update(items)
+            pair_counts.update(combinations(items, 2))
+        return item_counts, pair_counts
+
+    def _count_numpy(self, baskets: List[Tuple[int, ...]]):
+        """
+        Conteo vectorizado: matriz pedido×producto por bloques y C = Bᵀ·B.
+        La diagonal de C son los conteos individuales.
+        """
+        product_ids = sorted({pid for basket in baskets for pid in basket})
+        index = {pid: i for i, pid in enumerate(product_ids)}
+        n = len(product_ids)
+
+        cooc = np.zeros((n, n), dtype=np.int64)
+        for offset in range(0, len(baskets), _CHUNK_ORDERS):
+            chunk = baskets[offset:offset + _CHUNK_ORDERS]
+            row_idx = np.fromiter(
+                (r for r, basket in enumerate(chunk) for _ in basket), dtype=np.int64
+            )
+            col_idx = np.fromiter(
+                (index[pid] for basket in chunk for pid in basket), dtype=np.int64
+            )
+            matrix = np.zeros((len(chunk), n), dtype=np.int32)
+            matrix[row_idx, col_idx] = 1
+            cooc += matrix.T @ matrix
+
+        diag = np.diag(cooc)
+        item_counts = {product_ids[i]: int(diag[i]) for i in range(n) if diag[i]}
+
+        upper = np.triu(cooc, k=1)
+        rows_nz, cols_nz = np.nonzero(upper >= self.min_pair_count)
+        pair_counts = {
+            (product_ids[a], product_ids[b]): int(upper[a, b])
+            for a, b in zip(rows_nz.tolist(), cols_nz.tolist())
+        }
+        return item_counts, pair_counts
+
+    def _rank(self, item_counts, pair_counts, total_orders):
+        """Calcular support/confidence/lift y quedarse con los top-K por producto"""
+        candidates = defaultdict(list)
+
+        for (a, b), n_ab in pair_counts.items():
+            if n_ab < self.min_pair_count:
+                continue
+            support = n_ab / total_orders
+            for src, dst in ((a, b), (b, a)):
+                confidence = n_ab / item_counts[src]
+                if confidence < self.min_confidence:
+                    continue
+                lift = confidence / (item_counts[dst] / total_orders)
+                candidates[src].append((dst, round(support, 6), round(confidence, 4), round(lift, 4)))
+
+        table = {}
+        for product_id, neighbours in candidates.items():
+            # Lift primero (asociación real), confidence como desempate
+            neighbours.sort(key=lambda n: (n[3], n[2]), reverse=True)
+            table[product_id] = tuple(neighbours[:self.top_k])
+        return table
+
+    def _swap(self, table, total_orders, products, pairs, start, backend):
+        with self._lock:
+            self._table = table
+            self._stats.update({
+                'orders': total_orders,
+                'products': products,
+                'pairs': pairs,
+                'built_at': time.time(),
+                'build_seconds': round(time.time() - start, 3),
+                'backend': backend,
+            })
+        logger.info(f"[PAIRING] Modelo construido ({backend}): {total_orders} pedidos, "
+                    f"{products} productos, {pairs} pares en {self._stats['build_seconds']}s")
+
+    def build_from_db(self, execute_query: Callable, days: int = 365) -> Dict:
+        """Construir usando la función de consultas del servidor"""
+        rows = execute_query(ORDER_BASKETS_QUERY, (days,)) or []
+        return self.build((r['order_id'], r['product_id']) for r in rows)
+
+    # ============================================
+    # CONSULTAS
+    # ============================================
+
+    def neighbours(self, product_id, k: Optional[int] = None,
+                   exclude: Optional[set] = None) -> List[Dict]:
+        """Vecinos de un producto ordenados por lift"""
+        self._stats['lookups'] += 1
+        try:
+            entries = self._table.get(int(product_id), ())
+        except (TypeError, ValueError):
+            return []
+
+        if entries:
+            self._stats['hits'] += 1
+
+        result = []
+        for neighbour_id, support, confidence, lift in entries:
+            if exclude and neighbour_id in exclude:
+                continue
+            result.append({
+                'product_id': neighbour_id,
+                'support': support,
+                'confidence': confidence,
+                'lift': lift,
+            })
+            if k and len(result) >= k:
+                break
+        return result
+
+    def has_model(self) -> bool:
+        return bool(self._table)
+
+    def get_stats(self) -> Dict:
+        stats = dict(self._stats)
+        stats['hit_rate'] = (stats['hits'] / stats['lookups']) if stats['lookups'] else 0
+        return stats
+
+    # ============================================
+    # PERSISTENCIA
+    # ============================================
+
+    def save(self, path: str = DEFAULT_MODEL_PATH):
+        """Guardar la tabla de vecinos en JSON"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        payload = {
+            'stats': {k: self._stats[k] for k in ('orders', 'products', 'pairs', 'built_at', 'backend')},
+            'top_k': self.top_k,
+            'table': {str(pid): [list(n) for n in neighbours] for pid, neighbours in self._table.items()},
+        }
+        # Temporal por proceso: dos procesos guardando a la vez no se pisan antes del replace
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+        logger.info(f"[PAIRING] Modelo guardado en {path}")
+
+    def load(self, path: str = DEFAULT_MODEL_PATH) -> bool:
+        """Cargar una tabla previamente calculada (si existe)"""
+        if not os.path.exists(path):
+            return False
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                payload = json.load(f)
+            table = {
+                int(pid): tuple(tuple(n) for n in neighbours)
+                for pid, neighbours in payload.get('table', {}).items()
+            }
+            with self._lock:
+                self._table = table
+                self._stats.update(payload.get('stats', {}))
+            logger.info(f"[PAIRING] Modelo cargado desde {path}: {len(table)} productos")
+            return True
+        except Exception as e:
+            logger.error(f"[PAIRING] Error cargando modelo {path}: {e}")
+            return False
+
+    # ============================================
+    # RECÁLCULO PERIÓDICO
+    # ============================================
+
+    def start_background_refresh(self, execute_query: Callable, interval: int = 3600,
+                                 days: int = 365, path: Optional[str] = DEFAULT_MODEL_PATH,
+                                 on_saved: Optional[Callable[[], None]] = None):
+        """
+        Recalcular el modelo cada `interval` segundos en un hilo daemon.
+        on_saved() se llama después de cada guardado (avisar a los otros workers que recarguen).
+        """
+        if self._refresh_thread and self._refresh_thread.is_alive():
+            return
+
+        def _loop():
+            while not self._stop_event.is_set():
+                try:
+                    self.build_from_db(execute_query, days=days)
+                    if path:
+                        self.save(path)
+                        if on_saved:
+                            on_saved()
+                except Exception as e:
+                    logger.error(f"[PAIRING] Error recalculando modelo: {e}")
+                self._stop_event.wait(interval)
+
+        self._stop_event.clear()
+        self._refresh_thread = threading.Thread(target=_loop, name='pairing-refresh', daemon=True)
+        self._refresh_thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+
+# Instancia global
+pairing_engine = PairingEngine(
+    top_k=int(os.environ.get('PAIRING_TOP_K', 12)),
+    min_pair_count=int(os.environ.get('PAIRING_MIN_PAIR_COUNT', 2)),
+)
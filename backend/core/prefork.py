@@ -0,0 +1,487 @@
+"""
+Modo pre-fork para complete_server: N procesos worker sobre el mismo puerto
+
+Un proceso supervisor hace fork de N workers. Cada worker abre su propio
+socket con SO_REUSEPORT (el kernel reparte las conexiones), su propio pool
+MySQL y sus propios cachés en memoria. El supervisor:
+- reinicia workers caídos (con backoff si mueren al arrancar)
+- hace health check HTTP a cada worker por un puerto privado en 127.0.0.1
+- hace restart gradual con SIGHUP (nuevo worker sano antes de bajar el viejo)
+- reenvía mensajes de invalidación entre workers (InvalidationChannel)
+
+Los workers se reciclan solos al superar max_requests o max_rss_mb:
+dejan de aceptar conexiones, terminan los requests en curso y salen.
+"""
+import http.client
+import json
+import logging
+import os
+import random
+import selectors
+import signal
+import socket
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================
+# CANAL DE INVALIDACIÓN ENTRE PROCESOS
+# ============================================
+
+class InvalidationChannel:
+    """
+    Pub/sub de invalidaciones para cachés por proceso.
+    - Modo un solo proceso: publish() llama a los suscriptores locales.
+    - Modo pre-fork: además envía el mensaje al supervisor, que lo reenvía
+      al resto de los workers.
+    """
+
+    def __init__(self):
+        self._subscribers: List[Callable[[Dict], None]] = []
+        self._sock: Optional[socket.socket] = None
+        self._send_lock = threading.Lock()
+
+    def subscribe(self, callback: Callable[[Dict], None]):
+        self._subscribers.append(callback)
+        return callback
+
+    def publish(self, event: Dict, include_self: bool = True):
+        """Publicar una invalidación. include_self=False si el origen ya la aplicó."""
+        event = dict(event, pid=os.getpid())
+        if include_self:
+            self._dispatch(event)
+        if self._sock is not None:
+            self._send({'type': 'invalidate', 'event': event})
+
+    def _dispatch(self, event: Dict):
+        for callback in self._subscribers:
+            try:
+                callback(event)
+            except Exception as e:
+                logger.error(f"[INVALIDATION] Error en suscriptor {callback.__name__}: {e}")
+
+    def _send(self, message: Dict):
+        data = (json.dumps(message, default=str) + '\n').encode()
+        with self._send_lock:
+            try:
+                self._sock.sendall(data)
+            except OSError as e:
+                logger.error(f"[INVALIDATION] No se pudo enviar al supervisor: {e}")
+
+    def attach(self, sock: socket.socket):
+        """Conectar al supervisor (se llama dentro del worker)"""
+        self._sock = sock
+        threading.Thread(target=self._reader, name='invalidation-reader', daemon=True).start()
+
+    def _reader(self):
+        buffer = b''
+        while True:
+            try:
+                chunk = self._sock.recv(65536)
+            except OSError:
+                return
+            if not chunk:
+                return
+            buffer += chunk
+            while b'\n' in buffer:
+                line, buffer = buffer.split(b'\n', 1)
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    continue
+                if message.get('type') == 'invalidate':
+                    self._dispatch(message['event'])
+
+
+# Instancia global: los cachés de cada proceso se suscriben acá
+invalidation_channel = InvalidationChannel()
+
+
+# ============================================
+# WORKER
+# ============================================
+
+def _current_rss_mb() -> float:
+    """RSS actual del proceso (Linux /proc; fallback al pico de getrusage)"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _make_server_class(base_class, reuse_port: bool):
+    class WorkerServer(base_class):
+        allow_reuse_address = True
+        allow_reuse_port = reuse_port
+        daemon_threads = False  # server_close() espera los requests en curso
+        block_on_close = True
+        requests_handled = 0
+
+        def process_request(self, request, client_address):
+            self.requests_handled += 1
+            super().process_request(request, client_address)
+
+    return WorkerServer
+
+
+class _Worker:
+    def __init__(self, options: Dict, worker_id: int, sock: socket.socket):
+        self.options = options
+        self.worker_id = worker_id
+        self.sock = sock
+        self.server = None
+        self.health_server = None
+        self._stopping = threading.Event()
+        self.max_requests = options['max_requests']
+        if self.max_requests and options['max_requests_jitter']:
+            # Jitter para que no se reciclen todos a la vez
+            self.max_requests += random.randint(0, options['max_requests_jitter'])
+
+    def run(self):
+        signal.signal(signal.SIGTERM, lambda *_: self.stop('SIGTERM'))
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+        invalidation_channel.attach(self.sock)
+
+        if self.options['on_worker_start']:
+            self.options['on_worker_start'](self.worker_id)
+
+        server_class = _make_server_class(self.options['server_class'], reuse_port=True)
+        self.server = server_class(('0.0.0.0', self.options['port']), self.options['handler_class'])
+
+        # Puerto privado para el health check del supervisor
+        health_class = _make_server_class(self.options['server_class'], reuse_port=False)
+        self.health_server = health_class(('127.0.0.1', 0), self.options['handler_class'])
+        self.health_server.daemon_threads = True
+        threading.Thread(target=self.health_server.serve_forever, name='health', daemon=True).start()
+
+        invalidation_channel._send({
+            'type': 'hello',
+            'worker_id': self.worker_id,
+            'health_port': self.health_server.server_address[1],
+        })
+
+        threading.Thread(target=self._monitor, name='recycle-monitor', daemon=True).start()
+        logger.info(f"[PREFORK] Worker {self.worker_id} (pid {os.getpid()}) escuchando en :{self.options['port']}")
+
+        self.server.serve_forever()
+
+        # Drenar: server_close() espera a los threads de requests en curso
+        self.server.server_close()
+        self.health_server.shutdown()
+        if self.options['on_worker_stop']:
+            self.options['on_worker_stop'](self.worker_id)
+        logger.info(f"[PREFORK] Worker {self.worker_id} (pid {os.getpid()}) finalizado "
+                    f"tras {self.server.requests_handled} requests")
+
+    def stop(self, reason: str):
+        if self._stopping.is_set():
+            return
+        self._stopping.set()
+        logger.info(f"[PREFORK] Worker {self.worker_id} (pid {os.getpid()}) deteniéndose: {reason}")
+        if self.server is None:
+            # Todavía inicializando: no hay requests en curso que drenar
+            os._exit(0)
+        # shutdown() bloquea hasta que serve_forever termina: nunca llamarlo desde su mismo hilo
+        threading.Thread(target=self.server.shutdown, daemon=True).start()
+
+    def _monitor(self):
+        max_rss_mb = self.options['max_rss_mb']
+        while not self._stopping.is_set():
+            time.sleep(1)
+            if self.max_requests and self.server.requests_handled >= self.max_requests:
+                self.stop(f"reciclado tras {self.server.requests_handled} requests")
+            elif max_rss_mb and _current_rss_mb() > max_rss_mb:
+                self.stop(f"reciclado por memoria ({_current_rss_mb():.0f}MB > {max_rss_mb}MB)")
+
+
+# ============================================
+# SUPERVISOR
+# ============================================
+
+class _WorkerProcess:
+    def __init__(self, worker_id, pid, sock):
+        self.worker_id = worker_id
+        self.pid = pid
+        self.sock = sock
+        self.buffer = b''
+        self.started_at = time.time()
+        self.health_port = None
+        self.health_failures = 0
+        self.retiring = False
+
+
+class PreforkSupervisor:
+
+    def __init__(self, handler_class, server_class, port: int, workers: int = 2,
+                 on_worker_start: Optional[Callable[[int], None]] = None,
+                 on_worker_stop: Optional[Callable[[int], None]] = None,
+                 max_requests: int = 0, max_requests_jitter: int = 0, max_rss_mb: int = 0,
+                 health_path: str = '/health', health_interval: float = 10.0,
+                 health_timeout: float = 2.0, health_failures: int = 3,
+                 graceful_timeout: float = 30.0):
+        self.options = {
+            'handler_class': handler_class,
+            'server_class': server_class,
+            'port': port,
+            'on_worker_start': on_worker_start,
+            'on_worker_stop': on_worker_stop,
+            'max_requests': max_requests,
+            'max_requests_jitter': max_requests_jitter,
+            'max_rss_mb': max_rss_mb,
+        }
+        self.num_workers = workers
+        self.health_path = health_path
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.health_failures = health_failures
+        self.graceful_timeout = graceful_timeout
+
+        self.workers: Dict[int, _WorkerProcess] = {}
+        self.selector = selectors.DefaultSelector()
+        self._stopping = False
+        self._reload_requested = False
+        self._fast_deaths = 0
+        self.stats = {'spawned': 0, 'respawned': 0, 'health_kills': 0, 'messages_relayed': 0}
+
+    # ---------- ciclo de vida de workers ----------
+
+    def spawn(self, worker_id: int) -> _WorkerProcess:
+        parent_sock, child_sock = socket.socketpair()
+        pid = os.fork()
+        if pid == 0:
+            # Proceso hijo
+            exit_code = 0
+            try:
+                parent_sock.close()
+                for worker in self.workers.values():
+                    worker.sock.close()
+                self.selector.close()
+                _Worker(self.options, worker_id, child_sock).run()
+            except Exception as e:
+                logger.error(f"[PREFORK] Worker {worker_id} falló: {e}")
+                exit_code = 1
+            finally:
+                logging.shutdown()
+                os._exit(exit_code)
+
+        child_sock.close()
+        parent_sock.setblocking(False)
+        worker = _WorkerProcess(worker_id, pid, parent_sock)
+        self.workers[pid] = worker
+        self.selector.register(parent_sock, selectors.EVENT_READ, worker)
+        self.stats['spawned'] += 1
+        logger.info(f"[PREFORK] Worker {worker_id} iniciado (pid {pid})")
+        return worker
+
+    def _remove(self, worker: _WorkerProcess):
+        self.workers.pop(worker.pid, None)
+        try:
+            self.selector.unregister(worker.sock)
+        except (KeyError, ValueError):
+            pass
+        worker.sock.close()
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            worker = self.workers.get(pid)
+            if worker is None:
+                continue
+            self._remove(worker)
+            code = os.waitstatus_to_exitcode(status)
+            lifetime = time.time() - worker.started_at
+            logger.info(f"[PREFORK] Worker {worker.worker_id} (pid {pid}) terminó con código {code} "
+                        f"tras {lifetime:.0f}s")
+
+            if self._stopping or worker.retiring:
+                continue
+
+            # Protección contra crash-loop: backoff si mueren apenas arrancan
+            if lifetime < 5:
+                self._fast_deaths += 1
+                time.sleep(min(30, 0.5 * (2 ** min(self._fast_deaths, 6))))
+            else:
+                self._fast_deaths = 0
+            self.stats['respawned'] += 1
+            self.spawn(worker.worker_id)
+
+    # ---------- canal de mensajes ----------
+
+    def _handle_messages(self, worker: _WorkerProcess):
+        try:
+            chunk = worker.sock.recv(65536)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            chunk = b''
+        if not chunk:
+            try:
+                self.selector.unregister(worker.sock)
+            except (KeyError, ValueError):
+                pass
+            return
+
+        worker.buffer += chunk
+        while b'\n' in worker.buffer:
+            line, worker.buffer = worker.buffer.split(b'\n', 1)
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+
+            if message.get('type') == 'hello':
+                worker.health_port = message.get('health_port')
+            elif message.get('type') == 'invalidate':
+                # Reenviar a todos los demás workers
+                data = line + b'\n'
+                for other in list(self.workers.values()):
+                    if other is worker:
+                        continue
+                    try:
+                        # Timeout corto: un worker colgado no debe bloquear al supervisor
+                        other.sock.settimeout(1.0)
+                        other.sock.sendall(data)
+                    except OSError:
+                        pass
+                    finally:
+                        other.sock.setblocking(False)
+                self.stats['messages_relayed'] += 1
+
+    # ---------- health checks ----------
+
+    def _is_healthy(self, worker: _WorkerProcess) -> bool:
+        if not worker.health_port:
+            return False
+        connection = http.client.HTTPConnection('127.0.0.1', worker.health_port, timeout=self.health_timeout)
+        try:
+            connection.request('GET', self.health_path)
+            return connection.getresponse().status == 200
+        except (OSError, http.client.HTTPException):
+            return False
+        finally:
+            connection.close()
+
+    def _health_check(self):
+        for worker in list(self.workers.values()):
+            if worker.retiring:
+                continue
+            if not worker.health_port:
+                # Todavía arrancando: tolerar hasta graceful_timeout
+                if time.time() - worker.started_at > self.graceful_timeout:
+                    worker.health_failures += 1
+                else:
+                    continue
+            elif self._is_healthy(worker):
+                worker.health_failures = 0
+                continue
+            else:
+                worker.health_failures += 1
+
+            if worker.health_failures >= self.health_failures:
+                logger.error(f"[PREFORK] Worker {worker.worker_id} (pid {worker.pid}) no responde, se reinicia")
+                self.stats['health_kills'] += 1
+                self._kill(worker.pid, signal.SIGKILL)
+
+    # ---------- restart gradual / apagado ----------
+
+    def _kill(self, pid: int, sig):
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def _wait_ready(self, worker: _WorkerProcess) -> bool:
+        deadline = time.time() + self.graceful_timeout
+        while time.time() < deadline:
+            for key, _ in self.selector.select(timeout=0.2):
+                self._handle_messages(key.data)
+            self._reap()
+            if worker.health_port and self._is_healthy(worker):
+                return True
+            if worker.pid not in self.workers:
+                return False
+        return False
+
+    def rolling_restart(self):
+        """Reemplazar cada worker por uno nuevo; el viejo se baja cuando el nuevo está sano"""
+        logger.info("[PREFORK] Restart gradual de workers")
+        for old in list(self.workers.values()):
+            if old.retiring:
+                continue
+            new = self.spawn(old.worker_id)
+            if not self._wait_ready(new):
+                logger.error(f"[PREFORK] El nuevo worker {new.worker_id} no quedó sano; se mantiene el anterior")
+                new.retiring = True
+                self._kill(new.pid, signal.SIGKILL)
+                continue
+            old.retiring = True
+            self._kill(old.pid, signal.SIGTERM)
+
+    def shutdown(self):
+        self._stopping = True
+        for worker in list(self.workers.values()):
+            self._kill(worker.pid, signal.SIGTERM)
+
+        deadline = time.time() + self.graceful_timeout
+        while self.workers and time.time() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        for worker in list(self.workers.values()):
+            logger.warning(f"[PREFORK] Worker {worker.worker_id} no terminó a tiempo, SIGKILL")
+            self._kill(worker.pid, signal.SIGKILL)
+        self._reap()
+
+    # ---------- loop principal ----------
+
+    def run(self):
+        signal.signal(signal.SIGTERM, lambda *_: setattr(self, '_stopping', True))
+        signal.signal(signal.SIGINT, lambda *_: setattr(self, '_stopping', True))
+        signal.signal(signal.SIGHUP, lambda *_: setattr(self, '_reload_requested', True))
+
+        for worker_id in range(self.num_workers):
+            self.spawn(worker_id)
+
+        print(f"✅ Supervisor pre-fork (pid {os.getpid()}) con {self.num_workers} workers en "
+              f"puerto {self.options['port']} — SIGHUP: restart gradual, SIGTERM: apagar")
+
+        last_health_check = time.time()
+        while not self._stopping:
+            try:
+                events = self.selector.select(timeout=0.5)
+            except InterruptedError:
+                events = []
+            for key, _ in events:
+                self._handle_messages(key.data)
+
+            self._reap()
+
+            if self._reload_requested:
+                self._reload_requested = False
+                self.rolling_restart()
+
+            if time.time() - last_health_check >= self.health_interval:
+                last_health_check = time.time()
+                self._health_check()
+
+        print("\n👋 Deteniendo workers...")
+        self.shutdown()
+
+
+def run_prefork(handler_class, server_class, port: int, workers: int, **options):
+    """Arrancar el supervisor (bloquea hasta SIGTERM/SIGINT)"""
+    if not hasattr(socket, 'SO_REUSEPORT'):
+        raise RuntimeError("SO_REUSEPORT no disponible en esta plataforma; usar WORKERS=1")
+    PreforkSupervisor(handler_class, server_class, port, workers, **options).run()
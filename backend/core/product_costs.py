@@ -0,0 +1,130 @@
+"""
+Costo de ingredientes por producto, calculado de forma incremental
+
+/api/ingredients/product-costs leía v_product_ingredients_cost, que agrupa
+todo product_ingredients en cada llamada, y cost_contribution era un valor
+cargado a mano que no seguía al precio del ingrediente. Ahora:
+
+  - product_ingredients.cost_contribution = quantity * ingredients.cost_per_unit
+    (la cantidad de la receta se expresa en la unidad del ingrediente)
+  - products.total_ingredient_cost / ingredient_count guardan la suma, así que
+    leer costos es un SELECT sobre products
+  - El grafo ingrediente -> productos son las filas de product_ingredients
+    (índices por ingredient_id y por product_id): al cambiar el precio de un
+    ingrediente o una receta se recalculan solo los productos afectados, en la
+    misma transacción que el cambio
+
+Todas las funciones reciben el cursor de la transacción en curso y no hacen
+commit. El pool de complete_server trabaja en autocommit: el handler abre la
+transacción (connection.start_transaction()) antes de escribir la receta o el
+precio y hace commit/rollback del conjunto. recompute_all() es el recálculo completo (migración y
+scripts/recompute_product_costs.py).
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Productos por UPDATE al recalcular totales (acota el tamaño del IN y los locks)
+BATCH_SIZE = 500
+
+PRODUCT_COSTS_QUERY = """
+    SELECT
+        p.id AS product_id,
+        p.name AS product_name,
+        p.ingredient_count AS total_ingredients,
+        p.total_ingredient_cost,
+        ROUND(p.total_ingredient_cost / p.ingredient_count, 2) AS average_ingredient_cost,
+        p.ingredient_cost_updated_at
+    FROM products p
+    WHERE p.ingredient_count > 0
+    ORDER BY p.total_ingredient_cost DESC
+"""
+
+
+def _first_column(rows):
+    return [row['product_id'] if isinstance(row, dict) else row[0] for row in rows]
+
+
+def _recompute_totals(cursor, product_ids):
+    """Sumar las contribuciones activas de cada producto y guardarlas en products"""
+    product_ids = sorted(set(int(product_id) for product_id in product_ids))
+    for start in range(0, len(product_ids), BATCH_SIZE):
+        batch = product_ids[start:start + BATCH_SIZE]
+        placeholders = ', '.join(['%s'] * len(batch))
+        # LEFT JOIN: un producto que se quedó sin ingredientes vuelve a 0
+        cursor.execute(f"""
+            UPDATE products p
+            LEFT JOIN (
+                SELECT product_id, SUM(cost_contribution) AS total, COUNT(*) AS items
+                FROM product_ingredients
+                WHERE product_id IN ({placeholders}) AND is_active = TRUE
+                GROUP BY product_id
+            ) costs ON costs.product_id = p.id
+            SET p.total_ingredient_cost = COALESCE(costs.total, 0),
+                p.ingredient_count = COALESCE(costs.items, 0),
+                p.ingredient_cost_updated_at = NOW()
+            WHERE p.id IN ({placeholders})
+        """, batch + batch)
+    return product_ids
+
+
+def on_ingredient_changed(cursor, ingredient_id):
+    """
+    El precio de un ingrediente cambió: actualizar sus contribuciones y los
+    totales de los productos que lo usan. Devuelve los ids de producto afectados.
+    """
+    cursor.execute(
+        "SELECT DISTINCT product_id FROM product_ingredients WHERE ingredient_id = %s",
+        (ingredient_id,)
+    )
+    product_ids = _first_column(cursor.fetchall())
+    if not product_ids:
+        return []
+
+    cursor.execute("""
+        UPDATE product_ingredients pi
+        JOIN ingredients i ON i.id = pi.ingredient_id
+        SET pi.cost_contribution = ROUND(pi.quantity * COALESCE(i.cost_per_unit, 0), 2)
+        WHERE pi.ingredient_id = %s
+    """, (ingredient_id,))
+    _recompute_totals(cursor, product_ids)
+    logger.info(f"[COSTS] Ingrediente {ingredient_id}: {len(product_ids)} productos recalculados")
+    return product_ids
+
+
+def on_recipe_changed(cursor, product_id):
+    """La receta de un producto cambió (alta, cantidad o baja de ingredientes)"""
+    cursor.execute("""
+        UPDATE product_ingredients pi
+        JOIN ingredients i ON i.id = pi.ingredient_id
+        SET pi.cost_contribution = ROUND(pi.quantity * COALESCE(i.cost_per_unit, 0), 2)
+        WHERE pi.product_id = %s
+    """, (product_id,))
+    _recompute_totals(cursor, [product_id])
+
+
+def recompute_all(cursor, product_ids=None, only_missing=False):
+    """
+    Recalcular todo (o solo los productos indicados) desde cero, por lotes
+    de productos. Devuelve la cantidad de productos recalculados.
+
+    only_missing=True calcula solo las contribuciones vacías (NULL o 0) y
+    respeta las cargadas a mano; los totales se suman igual.
+    """
+    if product_ids is None:
+        cursor.execute("SELECT id FROM products ORDER BY id")
+        product_ids = [row['id'] if isinstance(row, dict) else row[0] for row in cursor.fetchall()]
+
+    product_ids = sorted(set(int(product_id) for product_id in product_ids))
+    for start in range(0, len(product_ids), BATCH_SIZE):
+        batch = product_ids[start:start + BATCH_SIZE]
+        placeholders = ', '.join(['%s'] * len(batch))
+        missing = " AND (pi.cost_contribution IS NULL OR pi.cost_contribution = 0)" if only_missing else ""
+        cursor.execute(f"""
+            UPDATE product_ingredients pi
+            JOIN ingredients i ON i.id = pi.ingredient_id
+            SET pi.cost_contribution = ROUND(pi.quantity * COALESCE(i.cost_per_unit, 0), 2)
+            WHERE pi.product_id IN ({placeholders}){missing}
+        """, batch)
+        _recompute_totals(cursor, batch)
+    return len(product_ids)
@@ -0,0 +1,376 @@
+"""
+Armado de prompts para Gemini con prefijos estáticos, presupuesto de tokens y métricas
+
+Cada prompt del chat se separa en dos partes:
+  - Prefijo estático: instrucciones + digest del menú. Se arma una sola vez
+    por (tipo de prompt, versión del catálogo) y va como system_instruction
+    de un GenerativeModel cacheado, así el texto es idéntico byte a byte entre
+    llamadas y califica para el cacheo de contexto del lado del modelo.
+  - Cuerpo dinámico: historial y mensaje del usuario, recortados para que el
+    total entre en el presupuesto del tipo de prompt.
+
+El presupuesto elige el digest del menú más rico que entra (3, 2, 1 ejemplos
+por categoría o solo categorías) dejando lugar para el cuerpo, y del
+historial descarta primero los mensajes más viejos. Los tokens se estiman
+con ~4 caracteres por token (contar con la API costaría otra llamada).
+
+PromptMetrics registra por tipo de intent: llamadas, errores, tokens del
+prompt y latencia de Gemini.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from core.metrics import observe_llm
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4
+DEFAULT_MODEL = os.getenv('GEMINI_MODEL', 'gemini-1.5-flash')
+LATENCY_WINDOW = 500
+
+# Presupuestos en tokens estimados por tipo de prompt
+PROMPT_BUDGETS = {
+    'intent': int(os.getenv('PROMPT_BUDGET_INTENT', '1500')),
+    'general_inquiry': int(os.getenv('PROMPT_BUDGET_INQUIRY', '1500')),
+    'product_recommendations': int(os.getenv('PROMPT_BUDGET_RECOMMENDATIONS', '2000')),
+}
+DEFAULT_BUDGET = 1500
+# Lugar reservado para el cuerpo dinámico al elegir el digest del menú
+BODY_RESERVE_TOKENS = int(os.getenv('PROMPT_BODY_RESERVE', '300'))
+DIGEST_LEVELS = (3, 2, 1, 0)
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+# ============================================================
+# PLANTILLAS: instrucciones estáticas de cada tipo de prompt
+# ============================================================
+
+INTENT_INSTRUCTIONS = """Sos el asistente del menú de un restaurante. Vas a recibir el historial reciente y el último mensaje del usuario.
+
+MODELO DE DATOS DEL SISTEMA:
+- Categorías (nivel 1): Grupos principales de productos
+- Subcategorías (nivel 2): Divisiones opcionales dentro de categorías
+- Productos (nivel 3): Los items que se venden
+- Ingredientes/Componentes (nivel 4): Partes que componen cada producto (tabla 'ingredients')
+
+JERARQUÍA: Categoría → Subcategoría → Producto → Ingredientes/Componentes
+
+CONCEPTO CLAVE: Cuando alguien pregunta "qué tiene [producto]", está preguntando por el NIVEL 4 (ingredientes/componentes).
+
+DETERMINA LA INTENCIÓN Y RESPONDE JSON:
+
+{
+  "intent_type": "casual_conversation|greeting|specific_product_ingredients|specific_product_info|product_pairings|smart_beverage_recommendation|product_recommendations|general_inquiry",
+  "target_product_id": "ID del producto si aplica o null",
+  "response_text": "Respuesta natural en español argentino",
+  "confidence": "0-100"
+}
+
+CRITERIOS DE CLASIFICACIÓN (EN ORDEN DE PRIORIDAD):
+1. Si es SALUDO (hola, cómo estás, buen día, qué tal, etc): "greeting"
+2. Si es CHARLA CASUAL (gracias, de nada, adiós, chau, hasta luego, etc): "casual_conversation"
+3. Si pregunta sobre COMPOSICIÓN/CONTENIDO de un producto específico (qué tiene, qué lleva, qué incluye, qué trae, componentes, partes, detalles): "specific_product_ingredients"
+4. Si pregunta sobre COMBINACIONES/COMPLEMENTOS de un producto (qué combina, qué va bien con, qué recomiendas con): "product_pairings"
+5. Si contexto tiene producto seleccionado Y pregunta sobre complementos: "smart_beverage_recommendation"
+6. Si pregunta PRECIO o INFORMACIÓN GENERAL de un producto específico: "specific_product_info"
+7. Si pide RECOMENDACIONES sin producto específico: "product_recommendations"
+8. Si no está claro o es consulta general: "general_inquiry"
+
+REGLA FUNDAMENTAL: Cuando el usuario pregunta "qué tiene [PRODUCTO]" o variantes similares, está preguntando por los COMPONENTES/DETALLES INTERNOS del producto -> "specific_product_ingredients"
+
+REGLA CRÍTICA: Si el usuario saluda o hace conversación casual, NO recomiendes productos. Solo responde de forma amigable."""
+
+INQUIRY_INSTRUCTIONS = """SISTEMA: Eres un asistente inteligente que entiende variaciones del lenguaje y sinónimos.
+
+TAREA: Analizar el mensaje del usuario y determinar qué productos busca, considerando:
+1. Variaciones del lenguaje (diminutivos, aumentativos, coloquialismos)
+2. Sinónimos y términos relacionados
+3. Descripciones indirectas (ej: "algo liviano" podría referirse a productos con ciertas características)
+
+El usuario podría usar términos coloquiales, diminutivos o descripciones vagas.
+Tu trabajo es interpretar la INTENCIÓN real detrás del mensaje.
+
+RESPONDE EN JSON:
+{
+  "search_categories": ["categorías relevantes de la lista disponible"],
+  "search_keywords": ["palabras clave extraídas del mensaje"],
+  "search_description": ["características que busca el usuario"],
+  "confidence": 0-100
+}
+
+Si el usuario no busca algo específico, devuelve arrays vacíos."""
+
+RECOMMENDATIONS_INSTRUCTIONS = """TU TAREA:
+Usando ÚNICAMENTE los datos proporcionados, analiza semánticamente qué está pidiendo el cliente y selecciona las categorías más relevantes.
+
+PROCESO DE ANÁLISIS:
+1. Identifica la intención del mensaje (qué busca el cliente)
+2. Relaciona esa intención con las categorías disponibles
+3. Selecciona hasta 4 categorías que mejor respondan a la consulta
+4. NO uses conocimiento externo, solo los datos proporcionados
+
+EJEMPLOS DE ANÁLISIS (genéricos):
+- Si el mensaje habla de "ver opciones" → mostrar categorías variadas principales
+- Si menciona algo específico → buscar categorías relacionadas con ese concepto
+- Si pide una acción (como "tomar", "usar", "comprar") → analizar qué categorías se relacionan con esa acción en el contexto del negocio
+
+RESPONDE EN JSON:
+{
+  "query_type": "general|specific|action_based",
+  "detected_intent": "explicación breve de qué entendiste",
+  "target_categories": ["array con las categorías seleccionadas"],
+  "confidence": 0-100,
+  "response_text": "respuesta natural en español argentino"
+}
+
+IMPORTANTE:
+- Analiza el contexto del negocio para entender qué significa cada palabra
+- No asumas significados, usa los datos disponibles
+- Si no estás seguro, incluye categorías variadas"""
+
+
+def _render_intent_prefix(catalog, level, static):
+    menu = f"\n\nMENÚ - CATEGORÍAS: {catalog.categories_text}"
+    if level:
+        menu += f"\nEJEMPLOS POR CATEGORÍA:\n{catalog.samples_lines(level, '- ')}"
+    return INTENT_INSTRUCTIONS + menu
+
+
+def _render_inquiry_prefix(catalog, level, static):
+    menu = f"\n\nCATEGORÍAS DISPONIBLES:\n{catalog.categories_text}"
+    if level:
+        menu += f"\n\nPRODUCTOS DISPONIBLES (muestra):\n{catalog.samples_lines(level, '- ')}"
+    return INQUIRY_INSTRUCTIONS + menu
+
+
+def _render_recommendations_prefix(catalog, level, static):
+    business_type = static.get('business_type', 'negocio')
+    header = (f"Eres un experto en {business_type}. Analiza el mensaje del cliente y determina qué categorías mostrar."
+              f"\n\nDATOS DISPONIBLES:\n- Tipo de negocio: {business_type}"
+              f"\n- Categorías existentes: {catalog.categories_text}")
+    if level:
+        header += f"\n- Productos disponibles por categoría:\n{catalog.samples_lines(level)}"
+    return header + "\n\n" + RECOMMENDATIONS_INSTRUCTIONS
+
+
+PREFIX_RENDERERS = {
+    'intent': _render_intent_prefix,
+    'general_inquiry': _render_inquiry_prefix,
+    'product_recommendations': _render_recommendations_prefix,
+}
+
+
+# ============================================================
+# MÉTRICAS
+# ============================================================
+
+class PromptMetrics:
+    """Tamaño de prompt y latencia de Gemini por tipo de intent (thread-safe)"""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _entry(self, kind):
+        entry = self._stats.get(kind)
+        if entry is None:
+            entry = self._stats[kind] = {
+                'calls': 0, 'errors': 0, 'prompt_tokens': 0, 'prompt_tokens_max': 0,
+                'prefix_tokens': 0, 'trimmed': 0, 'latency_total': 0.0,
+                'latencies': deque(maxlen=self.window),
+            }
+        return entry
+
+    def record(self, kind, prompt_tokens, prefix_tokens, latency, ok=True, trimmed=False):
+        observe_llm(kind, latency, ok)
+        with self._lock:
+            entry = self._entry(kind)
+            entry['calls'] += 1
+            if not ok:
+                entry['errors'] += 1
+            if trimmed:
+                entry['trimmed'] += 1
+            entry['prompt_tokens'] += prompt_tokens
+            entry['prompt_tokens_max'] = max(entry['prompt_tokens_max'], prompt_tokens)
+            entry['prefix_tokens'] = prefix_tokens
+            entry['latency_total'] += latency
+            entry['latencies'].append(latency)
+
+    def get_stats(self):
+        with self._lock:
+            stats = {}
+            for kind, entry in self._stats.items():
+                latencies = sorted(entry['latencies'])
+                calls = entry['calls'] or 1
+
+                def percentile(p):
+                    if not latencies:
+                        return 0.0
+                    return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+
+                stats[kind] = {
+                    'calls': entry['calls'],
+                    'errors': entry['errors'],
+                    'trimmed': entry['trimmed'],
+                    'prompt_tokens_avg': round(entry['prompt_tokens'] / calls, 1),
+                    'prompt_tokens_max': entry['prompt_tokens_max'],
+                    'prefix_tokens': entry['prefix_tokens'],
+                    'latency_avg_ms': round(entry['latency_total'] / calls * 1000, 1),
+                    'latency_p50_ms': round(percentile(0.50), 1),
+                    'latency_p95_ms': round(percentile(0.95), 1),
+                }
+            return stats
+
+
+# ============================================================
+# ARMADO DE PROMPTS
+# ============================================================
+
+class Prompt:
+    """Prompt listo para enviar: prefijo cacheable + cuerpo dinámico"""
+
+    __slots__ = ('kind', 'prefix', 'body', 'prefix_tokens', 'tokens', 'trimmed', 'cache_key')
+
+    def __init__(self, kind, prefix, body, prefix_tokens, trimmed, cache_key):
+        self.kind = kind
+        self.prefix = prefix
+        self.body = body
+        self.prefix_tokens = prefix_tokens
+        self.tokens = prefix_tokens + estimate_tokens(body)
+        self.trimmed = trimmed
+        self.cache_key = cache_key
+
+    @property
+    def text(self):
+        return f"{self.prefix}\n\n{self.body}"
+
+
+class PromptAssembler:
+    """
+    Arma y envía los prompts del chat.
+
+    Los prefijos y los GenerativeModel se cachean por (tipo, versión del
+    catálogo, parámetros estáticos); cuando cambia el catálogo cambia la
+    versión y los viejos se descartan.
+    """
+
+    def __init__(self, model_name=DEFAULT_MODEL, budgets=None, metrics=None):
+        self.model_name = model_name
+        self.budgets = dict(PROMPT_BUDGETS, **(budgets or {}))
+        self.metrics = metrics or PromptMetrics()
+        self._lock = threading.Lock()
+        self._prefixes = {}
+        self._models = {}
+        self._catalog_version = None
+
+    def budget(self, kind):
+        return self.budgets.get(kind, DEFAULT_BUDGET)
+
+    def prefix(self, kind, catalog, **static):
+        """(clave, texto, tokens) del prefijo estático; se calcula una vez por versión"""
+        cache_key = (kind, catalog.version) + tuple(sorted(static.items()))
+        cached = self._prefixes.get(cache_key)
+        if cached is not None:
+            return cached
+
+        render = PREFIX_RENDERERS[kind]
+        limit = self.budget(kind) - BODY_RESERVE_TOKENS
+        for level in DIGEST_LEVELS:
+            text = render(catalog, level, static)
+            tokens = estimate_tokens(text)
+            if tokens <= limit:
+                break
+        if level != DIGEST_LEVELS[0]:
+            logger.info(f"[PROMPT] {kind}: digest del menú reducido a {level} ejemplos por categoría "
+                        f"({tokens} tokens, presupuesto {self.budget(kind)})")
+
+        with self._lock:
+            if self._catalog_version != catalog.version:
+                # Catálogo nuevo: los prefijos y modelos viejos ya no sirven
+                self._prefixes.clear()
+                self._models.clear()
+                self._catalog_version = catalog.version
+            self._prefixes[cache_key] = (cache_key, text, tokens)
+        return cache_key, text, tokens
+
+    def build(self, kind, catalog, message, history=(), context_info='', **static):
+        """
+        Prompt de `kind` para un mensaje. history son líneas ya formateadas
+        (de la más vieja a la más nueva); se descartan desde el principio
+        hasta que el total entra en el presupuesto.
+        """
+        cache_key, prefix, prefix_tokens = self.prefix(kind, catalog, **static)
+        available = self.budget(kind) - prefix_tokens
+
+        lines = list(history)
+        trimmed = False
+
+        def render_body():
+            parts = []
+            if lines:
+                parts.append("HISTORIAL RECIENTE:\n" + "\n".join(lines))
+            parts.append(f'MENSAJE DEL USUARIO: "{message}"{context_info}')
+            parts.append("RESPONDE SOLO JSON:")
+            return "\n\n".join(parts)
+
+        body = render_body()
+        while lines and estimate_tokens(body) > available:
+            lines.pop(0)
+            trimmed = True
+            body = render_body()
+
+        max_chars = max(available, BODY_RESERVE_TOKENS // 2) * CHARS_PER_TOKEN
+        if len(body) > max_chars:
+            message = message[:max(0, len(message) - (len(body) - max_chars))]
+            trimmed = True
+            body = render_body()
+
+        return Prompt(kind, prefix, body, prefix_tokens, trimmed, cache_key)
+
+    def _model(self, genai, prompt):
+        try:
+            model = genai.GenerativeModel(self.model_name, system_instruction=prompt.prefix)
+            uses_system = True
+        except TypeError:
+            # SDK sin system_instruction: el prefijo va adelante del contenido
+            model = genai.GenerativeModel(self.model_name)
+            uses_system = False
+        with self._lock:
+            self._models[prompt.cache_key] = (model, uses_system)
+        return model, uses_system
+
+    def generate(self, genai, prompt):
+        """Llamar a Gemini y registrar tamaño y latencia por tipo de intent"""
+        cached = self._models.get(prompt.cache_key)
+        model, uses_system = cached if cached is not None else self._model(genai, prompt)
+        contents = prompt.body if uses_system else prompt.text
+
+        start = time.perf_counter()
+        try:
+            response = model.generate_content(contents)
+        except Exception:
+            self.metrics.record(prompt.kind, prompt.tokens, prompt.prefix_tokens,
+                                time.perf_counter() - start, ok=False, trimmed=prompt.trimmed)
+            raise
+        self.metrics.record(prompt.kind, prompt.tokens, prompt.prefix_tokens,
+                            time.perf_counter() - start, trimmed=prompt.trimmed)
+        return response
+
+    def get_stats(self):
+        return {
+            'model': self.model_name,
+            'catalog_version': self._catalog_version,
+            'cached_prefixes': len(self._prefixes),
+            'budgets': self.budgets,
+            'by_intent': self.metrics.get_stats(),
+        }
+
+
+prompt_assembler = PromptAssembler()
@@ -0,0 +1,444 @@
+"""
+Estadísticas por fingerprint de consulta y asesor de índices
+
+scripts/apply_indexes.py y apply_optimizations.py crean un puñado de índices
+elegidos a mano; nadie sabe cuáles consultas pesan de verdad. Este módulo
+lo mide sobre el tráfico real:
+
+  - QueryStats: cada consulta que pasa por core/metrics.observe_query
+    (execute_mysql_query y los cursores del pool instrumentado, la réplica y
+    los listeners de SQLAlchemy) suma a su fingerprint: cantidad, tiempo
+    total, máximo, p95 sobre una ventana de las últimas latencias, filas
+    devueltas y errores. La cantidad de fingerprints está acotada
+    (QUERY_ANALYTICS_MAX): al llenarse se descarta el de menor tiempo total.
+  - IndexAdvisor: cada cierto tiempo toma las consultas que más tiempo total
+    consumen, corre EXPLAIN sobre una muestra real (texto + parámetros) y
+    reporta full scans, filesort, tablas temporales y columnas envueltas en
+    funciones dentro del WHERE (DATE(o.created_at) BETWEEN ... no puede usar
+    el índice de created_at). Con las columnas de igualdad, rango y ORDER BY
+    de cada tabla sugiere un índice compuesto si no existe uno equivalente.
+
+El análisis del SQL es heurístico (expresiones regulares sobre el texto
+normalizado): las sugerencias son un punto de partida para revisar, no DDL
+para aplicar a ciegas. Los parámetros de muestra solo se usan para EXPLAIN,
+nunca se exponen. Con prefork cada worker tiene sus propias estadísticas.
+"""
+import collections
+import logging
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+MAX_FINGERPRINTS = int(os.environ.get('QUERY_ANALYTICS_MAX', 500))
+LATENCY_WINDOW = 200
+MAX_SAMPLE_PARAMS = 200
+MAX_SAMPLE_LENGTH = 5000
+# Un full scan sobre menos filas que esto (categorías, roles) no vale un índice
+FULL_SCAN_MIN_ROWS = int(os.environ.get('QUERY_ANALYTICS_FULL_SCAN_ROWS', 500))
+MAX_INDEX_COLUMNS = 4
+
+EXPLAINABLE = ('SELECT', 'UPDATE', 'DELETE')
+DATE_FUNCTIONS = ('DATE', 'YEAR', 'MONTH', 'DAY', 'HOUR', 'WEEK', 'DATE_FORMAT')
+
+_IDENT = r'`?\w+`?(?:\.`?\w+`?)?'
+_CLAUSE_END = r'(?=\bGROUP BY\b|\bORDER BY\b|\bHAVING\b|\bLIMIT\b|\bFOR UPDATE\b|\)\s*$|$)'
+_TABLE_RE = re.compile(
+    r'\b(?:FROM|JOIN|UPDATE)\s+`?(\w+)`?(?:\s+(?:AS\s+)?(?!(?:ON|WHERE|LEFT|RIGHT|INNER|OUTER|CROSS|JOIN|'
+    r'GROUP|ORDER|LIMIT|USING|SET|HAVING|FOR|UNION)\b)`?(\w+)`?)?',
+    re.IGNORECASE)
+_WHERE_RE = re.compile(r'\bWHERE\b(.*?)' + _CLAUSE_END, re.IGNORECASE | re.DOTALL)
+_ORDER_RE = re.compile(r'\bORDER BY\b(.*?)(?=\bLIMIT\b|\bFOR UPDATE\b|$)', re.IGNORECASE | re.DOTALL)
+_EQ_RE = re.compile(rf'(?<![\w.(])({_IDENT})\s*(?:=\s*\?|IN\s*\(\s*\?|IS NULL\b)', re.IGNORECASE)
+_RANGE_RE = re.compile(rf'(?<![\w.(])({_IDENT})\s*(?:>=|<=|>|<|BETWEEN\b)\s*\?', re.IGNORECASE)
+_WRAPPED_RE = re.compile(
+    rf'\b([A-Z_]+)\s*\(\s*({_IDENT})\s*(?:,[^()]*)?\)\s*(?:=|>=|<=|>|<|<>|!=|BETWEEN\b|IN\b|LIKE\b)',
+    re.IGNORECASE)
+
+
+# ============================================================
+# ESTADÍSTICAS POR FINGERPRINT
+# ============================================================
+
+def _sample_params(params):
+    """Parámetros guardables para EXPLAIN: escalares y una cantidad razonable"""
+    if params is None:
+        return ()
+    if isinstance(params, dict):
+        values = params.values()
+    elif isinstance(params, (list, tuple)):
+        values = params
+    else:
+        return None
+    if len(params) > MAX_SAMPLE_PARAMS:
+        return None
+    if not all(value is None or isinstance(value, (str, int, float)) or hasattr(value, 'isoformat')
+               for value in values):
+        return None
+    return params
+
+
+class _Entry:
+    __slots__ = ('normalized', 'sample', 'params', 'count', 'errors', 'total', 'max',
+                 'latencies', 'rows', 'max_rows', 'first_seen', 'last_seen')
+
+    def __init__(self, normalized, now):
+        self.normalized = normalized
+        self.sample = None
+        self.params = None
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self.rows = 0
+        self.max_rows = 0
+        self.first_seen = now
+        self.last_seen = now
+
+    def summary(self):
+        window = sorted(self.latencies)
+        p95 = window[min(len(window) - 1, int(len(window) * 0.95))] if window else 0
+        return {
+            'query': self.normalized[:500],
+            'count': self.count,
+            'errors': self.errors,
+            'total_ms': round(self.total * 1000, 1),
+            'mean_ms': round(self.total / self.count * 1000, 2) if self.count else 0,
+            'p95_ms': round(p95 * 1000, 2),
+            'max_ms': round(self.max * 1000, 2),
+            'rows_mean': round(self.rows / self.count, 1) if self.count else 0,
+            'rows_max': self.max_rows,
+            'first_seen': self.first_seen,
+            'last_seen': self.last_seen,
+        }
+
+
+class QueryStats:
+    """Latencia y filas por fingerprint, acotado a MAX_FINGERPRINTS (thread-safe)"""
+
+    def __init__(self, max_fingerprints=MAX_FINGERPRINTS):
+        self.max_fingerprints = max_fingerprints
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.evicted = 0
+
+    def _entry(self, fingerprint, normalized, now):
+        entry = self._entries.get(fingerprint)
+        if entry is None:
+            if len(self._entries) >= self.max_fingerprints:
+                # Se descarta el fingerprint que menos tiempo acumuló: las consultas caras se conservan
+                cheapest = min(self._entries, key=lambda key: self._entries[key].total)
+                del self._entries[cheapest]
+                self.evicted += 1
+            entry = self._entries[fingerprint] = _Entry(normalized, now)
+        return entry
+
+    def record(self, fingerprint, normalized, query, params, seconds, ok=True, rows=None):
+        if normalized[:7].upper().startswith(('EXPLAIN', 'SHOW')):
+            return
+        now = time.time()
+        with self._lock:
+            entry = self._entry(fingerprint, normalized, now)
+            entry.last_seen = now
+            if not ok:
+                entry.errors += 1
+                return
+            entry.count += 1
+            entry.total += seconds
+            entry.latencies.append(seconds)
+            if seconds >= entry.max or entry.sample is None:
+                # La muestra para EXPLAIN es la ejecución más lenta vista
+                sample_params = _sample_params(params)
+                if sample_params is not None and len(query) <= MAX_SAMPLE_LENGTH:
+                    entry.sample, entry.params = query, sample_params
+            entry.max = max(entry.max, seconds)
+            if rows is not None:
+                entry.rows += rows
+                entry.max_rows = max(entry.max_rows, rows)
+
+    def add_rows(self, fingerprint, rows):
+        """Filas leídas con fetch* después de la ejecución"""
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is not None:
+                entry.rows += rows
+                entry.max_rows = max(entry.max_rows, rows)
+
+    def top(self, limit=20, order='total'):
+        """[(fingerprint, resumen)] de las consultas más pesadas (order: total | mean | p95 | max | count)"""
+        with self._lock:
+            summaries = [(fingerprint, entry.summary()) for fingerprint, entry in self._entries.items()]
+        key = {'total': 'total_ms', 'mean': 'mean_ms', 'p95': 'p95_ms', 'max': 'max_ms', 'count': 'count'}.get(order, 'total_ms')
+        summaries.sort(key=lambda item: item[1][key], reverse=True)
+        return summaries[:limit]
+
+    def sample(self, fingerprint):
+        """(consulta, parámetros, texto normalizado) de la ejecución más lenta, o None"""
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is None or entry.sample is None:
+                return None
+            return entry.sample, entry.params, entry.normalized
+
+    def fingerprints(self):
+        with self._lock:
+            return set(self._entries)
+
+    def reset(self):
+        with self._lock:
+            self._entries.clear()
+            self.evicted = 0
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'fingerprints': len(self._entries),
+                'max_fingerprints': self.max_fingerprints,
+                'evicted': self.evicted,
+                'queries': sum(entry.count for entry in self._entries.values()),
+                'total_ms': round(sum(entry.total for entry in self._entries.values()) * 1000, 1),
+            }
+
+
+# ============================================================
+# ANÁLISIS ESTÁTICO DEL SQL
+# ============================================================
+
+def _strip(identifier):
+    return identifier.replace('`', '')
+
+
+def parse_tables(sql):
+    """{alias o nombre: tabla} de FROM / JOIN / UPDATE"""
+    aliases = {}
+    for table, alias in _TABLE_RE.findall(sql):
+        aliases[table] = table
+        if alias:
+            aliases[alias] = table
+    return aliases
+
+
+def _resolve(column, aliases):
+    """'o.created_at' -> ('orders', 'created_at'); columna sin alias solo si hay una tabla"""
+    column = _strip(column)
+    if '.' in column:
+        alias, name = column.split('.', 1)
+        return (aliases[alias], name) if alias in aliases else None
+    tables = set(aliases.values())
+    return (tables.pop(), column) if len(tables) == 1 else None
+
+
+def analyze_sql(sql):
+    """
+    Columnas relevantes para índices por tabla:
+    {tabla: {'eq': [...], 'range': [...], 'order': [...]}} + columnas envueltas en funciones
+    """
+    aliases = parse_tables(sql)
+    where_match = _WHERE_RE.search(sql)
+    where = where_match.group(1) if where_match else ''
+    columns = {table: {'eq': [], 'range': [], 'order': []} for table in set(aliases.values())}
+
+    def add(kind, raw):
+        resolved = _resolve(raw, aliases)
+        if resolved and resolved[1] not in columns[resolved[0]][kind]:
+            columns[resolved[0]][kind].append(resolved[1])
+
+    wrapped = []
+    for function, column in _WRAPPED_RE.findall(where):
+        resolved = _resolve(column, aliases)
+        wrapped.append({'function': function.upper(), 'column': _strip(column),
+                        'table': resolved[0] if resolved else None})
+        # Reescrita como rango (DATE(x) BETWEEN a AND b -> x >= a AND x < b + 1 día) la columna sirve para el índice
+        if function.upper() in DATE_FUNCTIONS:
+            add('range', column)
+    for column in _EQ_RE.findall(where):
+        add('eq', column)
+    for column in _RANGE_RE.findall(where):
+        add('range', column)
+
+    order_match = _ORDER_RE.search(sql)
+    if order_match:
+        for term in order_match.group(1).split(','):
+            term = re.sub(r'\s+(ASC|DESC)\s*$', '', term.strip(), flags=re.IGNORECASE)
+            if re.fullmatch(_IDENT, term):
+                add('order', term)
+    return columns, wrapped
+
+
+def suggest_index(table, columns, existing):
+    """
+    Índice compuesto: igualdades, luego un rango (o el ORDER BY si no hay rango).
+    None si no hay columnas o si un índice existente ya las cubre como prefijo.
+    """
+    eq = list(columns['eq'])
+    tail = columns['range'][:1] or [column for column in columns['order'] if column not in eq]
+    wanted = (eq + [column for column in tail if column not in eq])[:MAX_INDEX_COLUMNS]
+    if not wanted:
+        return None
+    for index_columns in existing.values():
+        if [column.lower() for column in index_columns[:len(wanted)]] == [column.lower() for column in wanted]:
+            return None
+    name = f"idx_{table}_{'_'.join(wanted)}"[:64]
+    return f"CREATE INDEX {name} ON {table} ({', '.join(wanted)})"
+
+
+# ============================================================
+# ASESOR DE ÍNDICES (EXPLAIN)
+# ============================================================
+
+class IndexAdvisor:
+    """
+    - analyze(execute_query): EXPLAIN de las consultas más pesadas y reporte por fingerprint
+    - explain(execute_query, query, params, normalized): lo mismo para una consulta suelta
+    - start_background(execute_query, interval): analyze() periódico en un hilo daemon
+    """
+
+    def __init__(self, stats, top=10, min_count=3):
+        self.stats = stats
+        self.top = top
+        self.min_count = min_count
+        self.reports = {}
+        self.last_run = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def _indexes(self, execute_query, table, cache):
+        """{nombre del índice: [columnas en orden]} (SHOW INDEX, una vez por tabla y pasada)"""
+        if table not in cache:
+            indexes = {}
+            try:
+                for row in execute_query(f"SHOW INDEX FROM `{table}`") or []:
+                    indexes.setdefault(row['Key_name'], []).append((row['Seq_in_index'], row['Column_name']))
+            except Exception as e:
+                logger.warning(f"[QUERY-ADVISOR] No se pudieron leer los índices de {table}: {e}")
+            cache[table] = {name: [column for _, column in sorted(columns)] for name, columns in indexes.items()}
+        return cache[table]
+
+    def explain(self, execute_query, query, params, normalized, index_cache=None):
+        """Reporte de una consulta: plan, problemas y sugerencias de índices"""
+        index_cache = {} if index_cache is None else index_cache
+        aliases = parse_tables(normalized)
+        columns, wrapped = analyze_sql(normalized)
+        issues = []
+        plan = []
+        flagged = set()
+
+        if normalized.lstrip().upper().startswith(EXPLAINABLE) and params is not None:
+            try:
+                plan = execute_query(f"EXPLAIN {query}", params or None) or []
+            except Exception as e:
+                issues.append({'type': 'explain_failed', 'detail': str(e)[:200]})
+        for row in plan:
+            table = aliases.get(row.get('table'), row.get('table'))
+            extra = row.get('Extra') or ''
+            rows = int(row.get('rows') or 0)
+            if row.get('type') == 'ALL' and rows >= FULL_SCAN_MIN_ROWS:
+                issues.append({'type': 'full_scan', 'table': table, 'rows': rows})
+                flagged.add(table)
+            if 'Using filesort' in extra:
+                issues.append({'type': 'filesort', 'table': table, 'rows': rows})
+                flagged.add(table)
+            if 'Using temporary' in extra:
+                issues.append({'type': 'temporary_table', 'table': table, 'rows': rows})
+
+        for item in wrapped:
+            table = item['table']
+            indexed = bool(table) and any(
+                index_columns and index_columns[0].lower() == item['column'].split('.')[-1].lower()
+                for index_columns in self._indexes(execute_query, table, index_cache).values())
+            issue = {'type': 'function_wrapped_column', 'table': table, 'column': item['column'],
+                     'function': item['function'], 'indexed': indexed}
+            if item['function'] in DATE_FUNCTIONS:
+                column = item['column']
+                issue['rewrite'] = f"{column} >= ? AND {column} < ? + INTERVAL 1 DAY"
+            issues.append(issue)
+            if table:
+                flagged.add(table)
+
+        suggestions = []
+        for table in sorted(table for table in flagged if table in columns):
+            suggestion = suggest_index(table, columns[table], self._indexes(execute_query, table, index_cache))
+            if suggestion:
+                suggestions.append(suggestion)
+
+        return {
+            'query': normalized[:500],
+            'plan': [{key: row.get(key) for key in ('table', 'type', 'key', 'rows', 'filtered', 'Extra')}
+                     for row in plan],
+            'issues': issues,
+            'suggested_indexes': suggestions,
+            'analyzed_at': time.time(),
+        }
+
+    def analyze(self, execute_query, top=None):
+        """EXPLAIN de las consultas con más tiempo total; devuelve los reportes de esta pasada"""
+        index_cache = {}
+        reports = {}
+        for fingerprint, summary in self.stats.top(top or self.top):
+            if summary['count'] < self.min_count:
+                continue
+            sample = self.stats.sample(fingerprint)
+            if sample is None:
+                continue
+            query, params, normalized = sample
+            try:
+                reports[fingerprint] = {**self.explain(execute_query, query, params, normalized, index_cache),
+                                        'stats': summary}
+            except Exception as e:
+                logger.error(f"[QUERY-ADVISOR] Error analizando {fingerprint}: {e}")
+        with self._lock:
+            self.reports.update(reports)
+            # Solo se conservan reportes de fingerprints que siguen en las estadísticas
+            live = self.stats.fingerprints()
+            for fingerprint in [key for key in self.reports if key not in live]:
+                del self.reports[fingerprint]
+            self.last_run = time.time()
+        flagged = sum(1 for report in reports.values() if report['issues'])
+        logger.info(f"[QUERY-ADVISOR] {len(reports)} consultas analizadas, {flagged} con problemas")
+        return reports
+
+    def start_background(self, execute_query, interval=900):
+        """analyze() cada `interval` segundos en un hilo daemon"""
+        if self._thread and self._thread.is_alive():
+            return
+
+        def _loop():
+            while not self._stop_event.wait(interval):
+                try:
+                    self.analyze(execute_query)
+                except Exception as e:
+                    logger.error(f"[QUERY-ADVISOR] Error en el análisis periódico: {e}")
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=_loop, name='query-advisor', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def get_report(self, limit=20, order='total'):
+        """Consultas más pesadas con su último análisis (si lo tienen)"""
+        with self._lock:
+            reports = dict(self.reports)
+            last_run = self.last_run
+        top = []
+        for fingerprint, summary in self.stats.top(limit, order):
+            report = reports.get(fingerprint)
+            top.append({
+                'fingerprint': fingerprint,
+                **summary,
+                'issues': report['issues'] if report else None,
+                'suggested_indexes': report['suggested_indexes'] if report else None,
+                'plan': report['plan'] if report else None,
+            })
+        suggestions = sorted({index for report in reports.values() for index in report['suggested_indexes']})
+        return {**self.stats.get_stats(), 'last_analysis': last_run, 'suggested_indexes': suggestions, 'top': top}
+
+
+# Instancias globales
+query_stats = QueryStats()
+index_advisor = IndexAdvisor(query_stats)
@@ -0,0 +1,268 @@
+"""
+Ruteo de consultas de solo lectura a una réplica MySQL
+
+Los reportes (ventas, mesas, clientes, inventario, KPIs) corren agregados
+pesados; con una réplica configurada se ejecutan en su propio pool y dejan
+el primario para pedidos y cocina. La réplica se usa solo si:
+  - está configurada (MYSQL_REPLICA_HOST) y su pool está disponible
+  - el último chequeo de lag dio menos de REPLICA_MAX_LAG_SECONDS
+  - el request actual no escribió nada todavía (read-your-writes)
+En cualquier otro caso, o si la consulta falla en la réplica, se usa el
+primario.
+
+Configuración por entorno (usuario, clave y base toman los del primario si
+no se indican):
+  MYSQL_REPLICA_HOST, MYSQL_REPLICA_PORT, MYSQL_REPLICA_USER,
+  MYSQL_REPLICA_PASSWORD, MYSQL_REPLICA_DATABASE
+  REPLICA_MAX_LAG_SECONDS (5), REPLICA_CHECK_INTERVAL (5), REPLICA_POOL_SIZE (5)
+  REPLICA_ALLOW_STANDALONE=1 acepta una instancia sin replicación configurada
+  (por ejemplo un segundo MySQL local para probar el ruteo)
+"""
+import contextvars
+import logging
+import os
+import threading
+import time
+
+from core.deadlines import bound_query, note_query_error, QueryTimeout
+from core import request_timing
+from core.metrics import observe_pool_wait, observe_query
+
+logger = logging.getLogger(__name__)
+
+# MySQL 8.0.22+ usa REPLICA/SOURCE; las versiones anteriores SLAVE/MASTER
+REPLICA_STATUS_QUERIES = ('SHOW REPLICA STATUS', 'SHOW SLAVE STATUS')
+_LAG_COLUMNS = ('Seconds_Behind_Source', 'Seconds_Behind_Master')
+_READ_KEYWORDS = ('select', 'show', 'explain', 'describe', 'desc', 'with')
+
+
+def replica_lag_from_status(row):
+    """Segundos de atraso según SHOW REPLICA STATUS (None = replicación detenida)"""
+    for column in _LAG_COLUMNS:
+        if column in row:
+            return row[column]
+    return None
+
+
+def is_read_statement(query):
+    words = query.lstrip(' \t\r\n(').split(None, 1)
+    return bool(words) and words[0].lower() in _READ_KEYWORDS
+
+
+# ============================================================
+# READ-YOUR-WRITES POR REQUEST
+# ============================================================
+
+_request_wrote = contextvars.ContextVar('request_wrote', default=False)
+
+
+def reset_request():
+    """Al comenzar un request: todavía no escribió nada"""
+    _request_wrote.set(False)
+
+
+def note_statement(query):
+    """Registrar que el request actual escribió: desde ahí sus lecturas van al primario"""
+    if not is_read_statement(query):
+        _request_wrote.set(True)
+
+
+class ReplicaRouter:
+    """
+    Pool de la réplica + chequeo periódico de lag:
+    - use_replica(): decide el destino de una lectura (y cuenta el motivo)
+    - execute(): consulta en la réplica (si falla la marca como no disponible)
+    - start(): crea el pool y el hilo de chequeo (una vez por proceso/worker)
+    """
+
+    def __init__(self, config, max_lag=5.0, check_interval=5.0, pool_size=5, allow_standalone=False):
+        self.config = config
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.pool_size = pool_size
+        self.allow_standalone = allow_standalone
+        self._pool = None
+        self._healthy = False
+        self._lag = None
+        self._status = 'not_started'
+        self._last_check = None
+        self._lock = threading.Lock()
+        self._counters = {
+            'replica': 0, 'primary_lag': 0, 'primary_write_in_request': 0,
+            'primary_unavailable': 0, 'replica_errors': 0,
+        }
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    @classmethod
+    def from_env(cls, primary_config):
+        """Router configurado por entorno, o None si no hay réplica"""
+        host = os.environ.get('MYSQL_REPLICA_HOST')
+        if not host:
+            return None
+        config = {
+            'host': host,
+            'port': int(os.environ.get('MYSQL_REPLICA_PORT', primary_config['port'])),
+            'user': os.environ.get('MYSQL_REPLICA_USER', primary_config['user']),
+            'password': os.environ.get('MYSQL_REPLICA_PASSWORD', primary_config['password']),
+            'database': os.environ.get('MYSQL_REPLICA_DATABASE', primary_config['database']),
+        }
+        return cls(
+            config,
+            max_lag=float(os.environ.get('REPLICA_MAX_LAG_SECONDS', 5)),
+            check_interval=float(os.environ.get('REPLICA_CHECK_INTERVAL', 5)),
+            pool_size=int(os.environ.get('REPLICA_POOL_SIZE', 5)),
+            allow_standalone=os.environ.get('REPLICA_ALLOW_STANDALONE', '0') == '1',
+        )
+
+    # ============================================
+    # POOL Y CHEQUEO DE LAG
+    # ============================================
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, name='replica-lag-check', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _loop(self):
+        while not self._stop_event.is_set():
+            self.check()
+            self._stop_event.wait(self.check_interval)
+
+    def _get_pool(self):
+        if self._pool is None:
+            import mysql.connector.pooling
+            self._pool = mysql.connector.pooling.MySQLConnectionPool(
+                pool_name=f"gastro_replica_v{int(time.time())}",
+                pool_size=self.pool_size,
+                pool_reset_session=True,
+                ssl_disabled=False,
+                autocommit=True,
+                connect_timeout=5,
+                **self.config
+            )
+            logger.info(f"[REPLICA] Pool de réplica creado: {self.config['host']}:{self.config['port']}")
+        return self._pool
+
+    def check(self):
+        """Medir el lag de la réplica y actualizar su estado"""
+        connection = None
+        cursor = None
+        try:
+            connection = self._get_pool().get_connection()
+            cursor = connection.cursor(dictionary=True)
+            row = None
+            for query in REPLICA_STATUS_QUERIES:
+                try:
+                    cursor.execute(query)
+                    row = cursor.fetchone()
+                    break
+                except Exception:
+                    continue
+
+            if row is None:
+                lag, status = (0, 'standalone') if self.allow_standalone else (None, 'not_replicating')
+            else:
+                lag = replica_lag_from_status(row)
+                status = 'replicating' if lag is not None else 'replication_stopped'
+            self._set_state(lag is not None and lag <= self.max_lag, lag, status)
+        except Exception as e:
+            self._set_state(False, None, f"error: {e}")
+        finally:
+            if cursor:
+                try:
+                    cursor.close()
+                except Exception:
+                    pass
+            if connection:
+                try:
+                    connection.close()
+                except Exception:
+                    pass
+
+    def _set_state(self, healthy, lag, status):
+        if healthy != self._healthy:
+            log = logger.info if healthy else logger.warning
+            log(f"[REPLICA] {'Disponible' if healthy else 'No disponible'} (lag={lag}, estado={status})")
+        with self._lock:
+            self._healthy = healthy
+            self._lag = lag
+            self._status = status
+            self._last_check = time.time()
+
+    # ============================================
+    # RUTEO
+    # ============================================
+
+    def use_replica(self):
+        """¿La próxima lectura de solo lectura puede ir a la réplica?"""
+        if _request_wrote.get():
+            reason = 'primary_write_in_request'
+        elif self._healthy:
+            reason = 'replica'
+        elif self._lag is not None and self._lag > self.max_lag:
+            reason = 'primary_lag'
+        else:
+            reason = 'primary_unavailable'
+        with self._lock:
+            self._counters[reason] += 1
+        return reason == 'replica'
+
+    def execute(self, query, params=None):
+        """Ejecutar una lectura en la réplica (con el límite de tiempo del request)"""
+        query = bound_query(query)
+        # Fuera del try: pasarse del presupuesto no es un error de la réplica
+        request_timing.claim_query()
+        connection = None
+        cursor = None
+        try:
+            wait_start = time.perf_counter()
+            connection = self._get_pool().get_connection()
+            observe_pool_wait('replica', time.perf_counter() - wait_start)
+            cursor = connection.cursor(dictionary=True)
+            query_start = time.perf_counter()
+            if params:
+                cursor.execute(query, params)
+            else:
+                cursor.execute(query)
+            rows = cursor.fetchall()
+            observe_query(query, time.perf_counter() - query_start, params=params, rows=len(rows))
+            return rows
+        except Exception as e:
+            observe_query(query, 0, ok=False)
+            if note_query_error(e):
+                raise QueryTimeout(str(e)) from e
+            # Hasta el próximo chequeo de lag las lecturas van al primario
+            with self._lock:
+                self._counters['replica_errors'] += 1
+            self._set_state(False, None, f"error: {e}")
+            raise
+        finally:
+            if cursor:
+                try:
+                    cursor.close()
+                except Exception:
+                    pass
+            if connection:
+                try:
+                    connection.close()
+                except Exception:
+                    pass
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'enabled': True,
+                'host': self.config['host'],
+                'healthy': self._healthy,
+                'status': self._status,
+                'lag_seconds': self._lag,
+                'max_lag_seconds': self.max_lag,
+                'last_check': self._last_check,
+                'reads': dict(self._counters),
+            }
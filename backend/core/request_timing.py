@@ -0,0 +1,270 @@
+"""
+Desglose del tiempo de cada request: base de datos, LLM y serialización
+
+Cuando una ruta está lenta, el total no alcanza: hay que saber si son
+idas y vueltas a MySQL, la llamada a Gemini o el json.dumps de una respuesta
+enorme. Cada request abre un RequestTiming (en un ContextVar, igual que el
+deadline de core/deadlines.py) y los puntos instrumentados le suman:
+
+  - consultas y tiempo de base: core/metrics.observe_query (execute_mysql_query
+    vía el pool instrumentado, cursores directos del pool, réplica y los
+    listeners de SQLAlchemy) + lecturas de resultados y espera del pool
+  - llamadas y tiempo de LLM: core/metrics.observe_llm
+  - serialización de la respuesta: send_json_response / TimedJSONResponse
+
+Al cerrar el request se emite como header Server-Timing y como línea de
+access log estructurada.
+
+Presupuesto de consultas por ruta (QUERY_BUDGETS: la ruta exacta
+"MÉTODO /api/x/{id}/y" si está, si no el prefijo más largo): un
+request que lo supera se cuenta y se loguea; con QUERY_BUDGET_STRICT=1
+(tests, CI, pruebas de carga) la consulta que lo supera lanza
+QueryBudgetExceeded antes de ejecutarse, así un N+1 nuevo rompe el test
+en lugar de pasar desapercibido (y no queda escrita a medias).
+"""
+import contextvars
+import logging
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+access_logger = logging.getLogger('gastro.access')
+
+# Consultas por request permitidas por prefijo de ruta o por ruta exacta (con
+# método e ids como {id}) para las subrutas que hacen más que el listado
+QUERY_BUDGETS = {
+    # existe + insert + costos (contribuciones y total)
+    'POST /api/products/{id}/ingredients': 4,
+    # upsert de la receta + desactivar el resto + costos + total devuelto
+    'PUT /api/products/{id}/ingredients': 5,
+    # FOR UPDATE + upsert por tipo (mesas, objetos) + con immediate un INSERT por
+    # área (core/floor_layout.MAX_BATCH_AREAS) y uno del mapa
+    'POST /api/floor-plan/batch': 2 * 2 + 8 + 1,
+    '/api/orders': 3,
+    '/api/kitchen': 4,
+    '/api/tables': 3,
+    '/api/products': 3,
+    '/api/categories': 2,
+    '/api/subcategories': 2,
+    '/api/menu': 6,
+    '/api/customers': 4,
+    '/api/floor-plan': 4,
+    '/api/ingredients': 6,
+    '/api/reports': 12,
+    '/api/chat': 10,
+    '/api/v1/orders': 6,
+    '/api/v1/products': 4,
+    '/api/v1/tables': 4,
+}
+DEFAULT_QUERY_BUDGET = int(os.environ.get('QUERY_BUDGET_DEFAULT', 25))
+STRICT = os.environ.get('QUERY_BUDGET_STRICT', '0') == '1'
+MAX_ROUTES = 500
+
+_ID_SEGMENT_RE = re.compile(r'/\d+(?=/|$)')
+
+
+def _load_budgets():
+    """
+    QUERY_BUDGETS + overrides de entorno:
+    QUERY_BUDGETS="/api/orders=2,/api/reports=20,PUT /api/tables/{id}=3"
+    Las rutas exactas van primero, después los prefijos del más largo al más corto.
+    """
+    budgets = dict(QUERY_BUDGETS)
+    for item in os.environ.get('QUERY_BUDGETS', '').split(','):
+        prefix, _, count = item.strip().partition('=')
+        if prefix and count:
+            try:
+                budgets[prefix] = int(count)
+            except ValueError:
+                logger.warning(f"[TIMING] Presupuesto inválido en QUERY_BUDGETS: {item}")
+    return tuple(sorted(budgets.items(), key=lambda item: (item[0].startswith('/'), -len(item[0]))))
+
+
+class QueryBudgetExceeded(Exception):
+    """El request hizo más consultas que las permitidas para su ruta (solo en modo estricto)"""
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1)
+
+
+class RequestTiming:
+    """Acumulador de un request (un solo thread o tarea lo escribe)"""
+
+    __slots__ = ('route', 'budget', 'started', 'db_queries', 'db_time', 'pool_wait',
+                 'llm_calls', 'llm_time', 'serialize_time')
+
+    def __init__(self, route, budget):
+        self.route = route
+        self.budget = budget
+        self.started = time.perf_counter()
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.pool_wait = 0.0
+        self.llm_calls = 0
+        self.llm_time = 0.0
+        self.serialize_time = 0.0
+
+    def over_budget(self):
+        return self.db_queries > self.budget
+
+    def claim_query(self):
+        """Contar una consulta antes de ejecutarla; en modo estricto no se ejecuta si no entra"""
+        if STRICT and self.db_queries + 1 > self.budget:
+            raise QueryBudgetExceeded(
+                f"{self.route}: {self.db_queries + 1} consultas, presupuesto {self.budget}")
+        self.db_queries += 1
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        """Valor del header Server-Timing (duraciones en ms)"""
+        parts = [f'db;dur={_ms(self.db_time)};desc="{self.db_queries} queries"']
+        if self.pool_wait:
+            parts.append(f'pool;dur={_ms(self.pool_wait)}')
+        if self.llm_calls:
+            parts.append(f'llm;dur={_ms(self.llm_time)};desc="{self.llm_calls} calls"')
+        if self.serialize_time:
+            parts.append(f'serialize;dur={_ms(self.serialize_time)}')
+        parts.append(f'app;dur={_ms(self.elapsed())}')
+        if self.over_budget():
+            parts.append(f'budget;desc="exceeded {self.db_queries}/{self.budget}"')
+        return ', '.join(parts)
+
+    def log_fields(self):
+        return {
+            'route': self.route,
+            'duration_ms': _ms(self.elapsed()),
+            'db_queries': self.db_queries,
+            'db_ms': _ms(self.db_time),
+            'pool_wait_ms': _ms(self.pool_wait),
+            'llm_calls': self.llm_calls,
+            'llm_ms': _ms(self.llm_time),
+            'serialize_ms': _ms(self.serialize_time),
+            'query_budget': self.budget,
+            'over_budget': self.over_budget(),
+        }
+
+
+# ============================================================
+# ESTADÍSTICAS POR RUTA
+# ============================================================
+
+class QueryBudgetStats:
+    """Consultas por request y excesos de presupuesto por ruta (thread-safe)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def record(self, timing):
+        with self._lock:
+            route = timing.route
+            if route not in self._routes and len(self._routes) >= MAX_ROUTES:
+                route = 'other'
+            entry = self._routes.setdefault(route, {
+                'requests': 0, 'queries': 0, 'max_queries': 0, 'over_budget': 0, 'budget': timing.budget,
+            })
+            entry['requests'] += 1
+            entry['queries'] += timing.db_queries
+            entry['max_queries'] = max(entry['max_queries'], timing.db_queries)
+            if timing.over_budget():
+                entry['over_budget'] += 1
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'strict': STRICT,
+                'default_budget': DEFAULT_QUERY_BUDGET,
+                'budgets': dict(_BUDGETS),
+                'routes': {
+                    route: {
+                        'budget': entry['budget'],
+                        'requests': entry['requests'],
+                        'avg_queries': round(entry['queries'] / entry['requests'], 2) if entry['requests'] else 0,
+                        'max_queries': entry['max_queries'],
+                        'over_budget': entry['over_budget'],
+                    }
+                    for route, entry in self._routes.items()
+                },
+            }
+
+
+budget_stats = QueryBudgetStats()
+_BUDGETS = _load_budgets()
+
+
+# ============================================================
+# CICLO DE VIDA DEL REQUEST
+# ============================================================
+
+_current = contextvars.ContextVar('request_timing', default=None)
+
+
+def query_budget(route, path):
+    for key, count in _BUDGETS:
+        if key == route or (key.startswith('/') and path.startswith(key)):
+            return count
+    return DEFAULT_QUERY_BUDGET
+
+
+def begin(method, path):
+    """Abrir el desglose del request actual"""
+    route = f"{method} {_ID_SEGMENT_RE.sub('/{id}', path)}"
+    timing = RequestTiming(route, query_budget(route, path))
+    _current.set(timing)
+    return timing
+
+
+def end(timing, status=None, **extra):
+    """Cerrar el request: estadísticas, aviso de presupuesto y línea de access log"""
+    if timing is None:
+        return
+    if _current.get() is timing:
+        _current.set(None)
+    budget_stats.record(timing)
+    fields = {**timing.log_fields(), 'status': status, **extra}
+    if timing.over_budget():
+        logger.warning(f"[TIMING] {timing.route}: {timing.db_queries} consultas "
+                       f"(presupuesto {timing.budget}) - posible N+1")
+    return fields
+
+
+def current():
+    return _current.get()
+
+
+def claim_query():
+    """Llamar justo antes de ejecutar una consulta (lanza QueryBudgetExceeded en modo estricto)"""
+    timing = _current.get()
+    if timing:
+        timing.claim_query()
+
+
+def record_db_time(seconds):
+    """Tiempo de base del request: ejecución de consultas y lectura de resultados (fetch)"""
+    timing = _current.get()
+    if timing:
+        timing.db_time += seconds
+
+
+def record_pool_wait(seconds):
+    timing = _current.get()
+    if timing:
+        timing.pool_wait += seconds
+
+
+def record_llm(seconds):
+    timing = _current.get()
+    if timing:
+        timing.llm_calls += 1
+        timing.llm_time += seconds
+
+
+def record_serialization(seconds):
+    timing = _current.get()
+    if timing:
+        timing.serialize_time += seconds
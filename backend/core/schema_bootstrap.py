@@ -0,0 +1,349 @@
+"""
+Bootstrap de esquema al arranque
+
+Los handlers del servidor ejecutaban CREATE TABLE IF NOT EXISTS (y un commit)
+en cada request: cada DDL toma un metadata lock y puede quedar en cola detrás
+de un reporte largo. Ahora el DDL vive acá, en un registro ordenado de
+migraciones que se aplica una sola vez al iniciar el servidor; los handlers
+solo hacen DML.
+
+- Cada migración tiene una versión única y pasos idempotentes (IF NOT EXISTS,
+  columnas agregadas solo si faltan), así que es seguro correrlas sobre una
+  base que ya tenía las tablas creadas por la versión anterior del servidor.
+- Las versiones aplicadas se registran en schema_migrations; en los arranques
+  siguientes el costo es un SELECT.
+- GET_LOCK evita que dos procesos (dynos, workers) apliquen lo mismo a la vez.
+- Una migración que falla no se registra: se reintenta en el próximo arranque
+  y el servidor sigue levantando.
+"""
+import logging
+import time
+
+from core.image_pipeline import VARIANTS_TABLE_DDL
+from core.product_costs import recompute_all as recompute_product_costs
+from core.webhook_inbox import INBOX_TABLE_DDL
+
+logger = logging.getLogger(__name__)
+
+LOCK_NAME = 'gastro_schema_bootstrap'
+LOCK_TIMEOUT = 60
+
+MIGRATIONS_TABLE_DDL = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version VARCHAR(100) PRIMARY KEY,
+    description VARCHAR(255),
+    duration_ms INT DEFAULT 0,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+
+# ============================================================
+# HELPERS PARA PASOS IDEMPOTENTES
+# ============================================================
+
+def column_exists(cursor, table, column):
+    cursor.execute("""
+        SELECT 1 FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+    """, (table, column))
+    return cursor.fetchone() is not None
+
+
+def add_column(table, column, definition):
+    """Paso que agrega una columna solo si falta"""
+    def step(cursor):
+        if not column_exists(cursor, table, column):
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    step.__name__ = f"add_column_{table}_{column}"
+    return step
+
+
+def add_index(table, name, columns):
+    """Paso que crea un índice solo si falta"""
+    def step(cursor):
+        cursor.execute("""
+            SELECT 1 FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+        """, (table, name))
+        if cursor.fetchone() is None:
+            cursor.execute(f"CREATE INDEX {name} ON {table} ({columns})")
+    step.__name__ = f"add_index_{table}_{name}"
+    return step
+
+
+def seed_if_empty(table, insert_query):
+    """Datos iniciales solo si la tabla está vacía (no depende de índices únicos)"""
+    def step(cursor):
+        cursor.execute(f"SELECT 1 FROM {table} LIMIT 1")
+        if cursor.fetchone() is None:
+            cursor.execute(insert_query)
+    step.__name__ = f"seed_{table}"
+    return step
+
+
+def backfill_product_costs(cursor):
+    """Calcular las contribuciones que faltan sin pisar las cargadas a mano, y los totales"""
+    recompute_product_costs(cursor, only_missing=True)
+
+
+# ============================================================
+# REGISTRO DE MIGRACIONES (en orden; nunca renombrar una versión aplicada)
+# ============================================================
+
+MIGRATIONS = [
+    ('001_decorative_objects', 'Objetos decorativos del plano del salón', [
+        """
+        CREATE TABLE IF NOT EXISTS decorative_objects (
+            id VARCHAR(50) PRIMARY KEY,
+            type VARCHAR(50) NOT NULL,
+            x INT NOT NULL DEFAULT 0,
+            y INT NOT NULL DEFAULT 0,
+            width INT NOT NULL DEFAULT 50,
+            height INT NOT NULL DEFAULT 50,
+            rotation INT NOT NULL DEFAULT 0,
+            locked BOOLEAN DEFAULT FALSE,
+            environment VARCHAR(50) DEFAULT 'main',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+        """,
+        add_column('decorative_objects', 'environment', "VARCHAR(50) DEFAULT 'main'"),
+    ]),
+    ('002_restaurant_layouts', 'Layouts guardados del restaurante', [
+        """
+        CREATE TABLE IF NOT EXISTS restaurant_layouts (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            description TEXT,
+            layout_data JSON,
+            is_active BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    ('003_app_users', 'Usuarios de la aplicación con usuarios por defecto', [
+        """
+        CREATE TABLE IF NOT EXISTS app_users (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            username VARCHAR(100) UNIQUE NOT NULL,
+            email VARCHAR(255) UNIQUE NOT NULL,
+            password VARCHAR(255) NOT NULL,
+            full_name VARCHAR(255) NOT NULL,
+            company_id INT NOT NULL DEFAULT 1,
+            role_id INT NOT NULL DEFAULT 1,
+            is_active TINYINT(1) DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        INSERT IGNORE INTO app_users (username, email, password, full_name, company_id, role_id)
+        VALUES
+        ('admin', 'admin@gastro.com', 'admin123', 'Administrador', 1, 1),
+        ('chef1', 'chef@gastro.com', 'chef123', 'Chef Principal', 1, 2),
+        ('mozo1', 'mozo1@gastro.com', 'mozo123', 'Mozo 1', 1, 3)
+        """,
+    ]),
+    ('004_areas', 'Áreas del salón con áreas por defecto', [
+        """
+        CREATE TABLE IF NOT EXISTS areas (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            description TEXT,
+            capacity INT NOT NULL DEFAULT 0,
+            outdoor TINYINT(1) DEFAULT 0,
+            color VARCHAR(7) DEFAULT '#3B82F6',
+            company_id INT NOT NULL DEFAULT 1,
+            is_active TINYINT(1) DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+        """,
+        # areas no tiene índice único: el INSERT IGNORE anterior duplicaba las
+        # áreas por defecto en cada GET /api/areas
+        seed_if_empty('areas', """
+            INSERT INTO areas (name, description, capacity, outdoor, color, company_id)
+            VALUES
+            ('Salón Principal', 'Área principal del restaurante', 50, 0, '#3B82F6', 1),
+            ('Terraza', 'Área exterior con vista', 24, 1, '#10B981', 1),
+            ('Salón VIP', 'Área exclusiva', 12, 0, '#8B5CF6', 1)
+        """),
+    ]),
+    ('005_tables', 'Mesas con posición en el plano', [
+        """
+        CREATE TABLE IF NOT EXISTS tables (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            number INT NOT NULL UNIQUE,
+            capacity INT NOT NULL DEFAULT 4,
+            location VARCHAR(50),
+            status VARCHAR(20) DEFAULT 'available',
+            x INT DEFAULT 0,
+            y INT DEFAULT 0,
+            width INT DEFAULT 100,
+            height INT DEFAULT 100,
+            rotation INT DEFAULT 0,
+            shape VARCHAR(20) DEFAULT 'square',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    ('006_addresses', 'Direcciones de clientes (1 cliente -> N direcciones)', [
+        """
+        CREATE TABLE IF NOT EXISTS addresses (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            customer_id INT NOT NULL,
+            address_type ENUM('home', 'work', 'other') DEFAULT 'home',
+            street_address VARCHAR(255) NOT NULL,
+            city VARCHAR(100) NOT NULL,
+            state_province VARCHAR(100),
+            postal_code VARCHAR(20),
+            country VARCHAR(100) DEFAULT 'Argentina',
+            latitude DECIMAL(10, 8),
+            longitude DECIMAL(11, 8),
+            is_default BOOLEAN DEFAULT FALSE,
+            delivery_instructions TEXT,
+            formatted_address TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+
+            FOREIGN KEY (customer_id) REFERENCES customers(id) ON DELETE CASCADE,
+            INDEX idx_customer_id (customer_id),
+            INDEX idx_address_type (address_type),
+            INDEX idx_is_default (is_default)
+        )
+        """,
+    ]),
+    ('007_orders_payment_status', 'Estado de pago en órdenes', [
+        add_column('orders', 'payment_status',
+                   "ENUM('pending', 'paid', 'partial', 'refunded', 'cancelled') DEFAULT 'pending' AFTER status"),
+    ]),
+    ('008_mercadopago_webhook_inbox', 'Bandeja de webhooks de MercadoPago', [
+        INBOX_TABLE_DDL,
+    ]),
+    ('009_product_image_variants', 'Variantes de imágenes de productos', [
+        VARIANTS_TABLE_DDL,
+    ]),
+    ('010_product_ingredient_costs', 'Costo de ingredientes guardado por producto', [
+        add_column('product_ingredients', 'cost_contribution', "DECIMAL(10,2) DEFAULT 0.00"),
+        add_column('product_ingredients', 'is_active', "BOOLEAN DEFAULT TRUE"),
+        add_column('products', 'total_ingredient_cost', "DECIMAL(12,2) NOT NULL DEFAULT 0.00"),
+        add_column('products', 'ingredient_count', "INT NOT NULL DEFAULT 0"),
+        add_column('products', 'ingredient_cost_updated_at', "TIMESTAMP NULL"),
+        add_index('products', 'idx_products_ingredient_cost', 'total_ingredient_cost'),
+        backfill_product_costs,
+    ]),
+    ('011_floor_layout_versions', 'Versión optimista en mesas y objetos del plano', [
+        add_column('tables', 'version', "INT NOT NULL DEFAULT 0"),
+        add_column('decorative_objects', 'version', "INT NOT NULL DEFAULT 0"),
+    ]),
+]
+
+
+# ============================================================
+# EJECUCIÓN
+# ============================================================
+
+class SchemaBootstrap:
+    """
+    Aplica las migraciones pendientes del registro y deja un reporte de tiempos.
+
+    Args:
+        get_connection: callable que devuelve una conexión MySQL
+        migrations: lista de (versión, descripción, pasos); cada paso es un
+                    string SQL o un callable(cursor)
+    """
+
+    def __init__(self, get_connection, migrations=None):
+        self.get_connection = get_connection
+        self.migrations = migrations if migrations is not None else MIGRATIONS
+        self.last_report = None
+
+        versions = [version for version, _, _ in self.migrations]
+        if len(versions) != len(set(versions)):
+            raise ValueError("Versiones de migración duplicadas en el registro")
+
+    def applied_versions(self, cursor):
+        cursor.execute("SELECT version FROM schema_migrations")
+        return {row[0] for row in cursor.fetchall()}
+
+    def _apply(self, cursor, steps):
+        for step in steps:
+            if callable(step):
+                step(cursor)
+            else:
+                cursor.execute(step)
+                if cursor.with_rows:
+                    cursor.fetchall()
+
+    def run(self):
+        """Aplicar lo pendiente. Devuelve el reporte (también en last_report)"""
+        start = time.perf_counter()
+        report = {'applied': [], 'skipped': [], 'failed': [], 'total_ms': 0.0}
+
+        connection = self.get_connection()
+        cursor = connection.cursor()
+        locked = False
+        try:
+            cursor.execute("SELECT GET_LOCK(%s, %s)", (LOCK_NAME, LOCK_TIMEOUT))
+            locked = cursor.fetchone()[0] == 1
+            if not locked:
+                raise RuntimeError(f"No se pudo tomar el lock {LOCK_NAME} en {LOCK_TIMEOUT}s")
+
+            cursor.execute(MIGRATIONS_TABLE_DDL)
+            applied = self.applied_versions(cursor)
+
+            for version, description, steps in self.migrations:
+                if version in applied:
+                    report['skipped'].append(version)
+                    continue
+                step_start = time.perf_counter()
+                try:
+                    self._apply(cursor, steps)
+                    elapsed_ms = (time.perf_counter() - step_start) * 1000
+                    cursor.execute(
+                        "INSERT INTO schema_migrations (version, description, duration_ms) VALUES (%s, %s, %s)",
+                        (version, description, int(elapsed_ms))
+                    )
+                    connection.commit()
+                    report['applied'].append((version, elapsed_ms))
+                except Exception as e:
+                    connection.rollback()
+                    report['failed'].append((version, str(e)))
+                    logger.error(f"[SCHEMA] Migración {version} falló: {e}")
+        finally:
+            if locked:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+                cursor.fetchall()
+            cursor.close()
+            connection.close()
+
+        report['total_ms'] = (time.perf_counter() - start) * 1000
+        self.last_report = report
+        return report
+
+    def status(self):
+        """Lista de (versión, descripción, aplicada_en) para todo el registro"""
+        connection = self.get_connection()
+        cursor = connection.cursor()
+        try:
+            cursor.execute(MIGRATIONS_TABLE_DDL)
+            cursor.execute("SELECT version, applied_at FROM schema_migrations")
+            applied = dict(cursor.fetchall())
+        finally:
+            cursor.close()
+            connection.close()
+        return [(version, description, applied.get(version)) for version, description, _ in self.migrations]
+
+
+def print_report(report):
+    """Reporte de arranque en el formato de los prints del servidor"""
+    for version, elapsed_ms in report['applied']:
+        print(f"   ✅ {version} ({elapsed_ms:.0f}ms)")
+    for version, error in report['failed']:
+        print(f"   ❌ {version}: {error}")
+    print(f"🗄️ Esquema: {len(report['applied'])} migraciones aplicadas, "
+          f"{len(report['skipped'])} ya estaban, {len(report['failed'])} con error "
+          f"en {report['total_ms']:.0f}ms")
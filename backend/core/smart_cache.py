@@ -3,11 +3,19 @@ Sistema de Cache Inteligente con Invalidación Automática
 """
 import time
 import json
+import heapq
 import hashlib
-from typing import Any, Optional, Dict, List, Callable
+import os
+import sys
+import threading
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Optional, Dict, List, Callable, Set
 from datetime import datetime
 from enum import Enum
 
+from core.metrics import registry, smart_cache_collector
+
 class CacheStrategy(Enum):
     """Estrategias de invalidación de cache"""
     TIME_BASED = "time"          # Se invalida por tiempo (TTL)
@@ -15,18 +23,86 @@ class CacheStrategy(Enum):
     HYBRID = "hybrid"             # Combina tiempo + eventos
     MANUAL = "manual"             # Solo invalidación manual
 
+# Separador de segmentos de las claves: "products:cat:5:page:2"
+KEY_SEPARATOR = ':'
+
+
+def make_key(*parts) -> str:
+    """Construir una clave estructurada por segmentos (indexable por prefijo)"""
+    return KEY_SEPARATOR.join(str(part) for part in parts)
+
+
+def _normalize_for_hash(value):
+    """Convertir argumentos a una forma JSON estable (sets ordenados, objetos por tipo+id)"""
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_normalize_for_hash(v) for v in value]
+    if isinstance(value, dict):
+        return {str(k): _normalize_for_hash(v) for k, v in value.items()}
+    if isinstance(value, (set, frozenset)):
+        return sorted((_normalize_for_hash(v) for v in value), key=repr)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    # Objetos arbitrarios: su repr suele incluir la dirección de memoria, no sirve
+    return f"{type(value).__qualname__}#{getattr(value, 'id', id(value))}"
+
+
+def stable_hash(args: tuple, kwargs: dict) -> str:
+    """Hash estable de los argumentos (independiente del orden de kwargs y de sets)"""
+    payload = json.dumps(
+        [_normalize_for_hash(args), _normalize_for_hash(kwargs)],
+        sort_keys=True, separators=(',', ':'), default=str
+    )
+    return hashlib.blake2b(payload.encode(), digest_size=12).hexdigest()
+
+
+def _estimate_size(data: Any) -> int:
+    """Tamaño aproximado en bytes de un valor cacheado"""
+    try:
+        return len(json.dumps(data, default=str, separators=(',', ':')))
+    except (TypeError, ValueError):
+        return sys.getsizeof(data)
+
+
+class _CacheEntry:
+    __slots__ = ('data', 'expires_at', 'ttl', 'type', 'depends_on', 'size')
+
+    def __init__(self, data, expires_at, ttl, cache_type, depends_on, size):
+        self.data = data
+        self.expires_at = expires_at
+        self.ttl = ttl
+        self.type = cache_type
+        self.depends_on = depends_on
+        self.size = size
+
+
 class SmartCache:
     """
     Cache inteligente con múltiples estrategias de invalidación
+    
+    Toda la contabilidad es indexada para que ninguna operación recorra el
+    cache completo:
+    - tabla -> claves y clave -> tablas (la entrada guarda sus tablas)
+    - prefijo de segmentos -> claves ("products", "products:cat", "products:cat:5")
+    - heap de vencimientos que recorre un barrido en segundo plano
+    - LRU con límite de entradas y de bytes
     """
     
-    def __init__(self):
-        self.cache = {}
-        self.dependencies = {}  # Qué keys dependen de qué tablas
+    def __init__(self, max_entries: int = None, max_bytes: int = None,
+                 sweep_interval: float = None):
+        self.cache: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self.max_entries = max_entries or int(os.getenv('SMART_CACHE_MAX_ENTRIES', 50000))
+        self.max_bytes = max_bytes or int(float(os.getenv('SMART_CACHE_MAX_MB', 64)) * 1024 * 1024)
+        self.sweep_interval = sweep_interval or float(os.getenv('SMART_CACHE_SWEEP_INTERVAL', 30))
+        self.total_bytes = 0
+        self.lock = threading.RLock()
         self.stats = {
             'hits': 0,
             'misses': 0,
-            'invalidations': 0
+            'invalidations': 0,
+            'evictions': 0,
+            'expirations': 0
         }
         
         # Configuración de TTL por tipo de dato
@@ -40,125 +116,250 @@ class SmartCache:
         }
         
         # Registro de dependencias tabla -> cache_keys
-        self.table_dependencies = {
+        self.table_dependencies: Dict[str, Set[str]] = {
             'products': set(),
             'categories': set(),
             'subcategories': set(),
             'orders': set(),
             'tables': set(),
         }
+        # Índice de prefijos por segmento -> cache_keys
+        self.prefix_index: Dict[str, Set[str]] = {}
+        # Vencimientos (expires_at, key); las entradas viejas se descartan al salir
+        self.expiry_heap = []
+        
+        self._sweeper = None
+        self._stop_event = threading.Event()
     
     def get(self, key: str) -> Optional[Any]:
         """Obtener valor del cache"""
-        if key in self.cache:
-            entry = self.cache[key]
-            
-            # Verificar si expiró por tiempo
-            if time.time() - entry['timestamp'] < entry['ttl']:
-                self.stats['hits'] += 1
-                return entry['data']
-            else:
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry is not None:
+                # Verificar si expiró por tiempo
+                if time.time() < entry.expires_at:
+                    self.cache.move_to_end(key)
+                    self.stats['hits'] += 1
+                    return entry.data
                 # Expiró, eliminar
-                del self.cache[key]
-                self._remove_dependencies(key)
-        
-        self.stats['misses'] += 1
-        return None
+                self._remove(key)
+                self.stats['expirations'] += 1
+            
+            self.stats['misses'] += 1
+            return None
     
     def set(self, key: str, data: Any, cache_type: str = 'default', 
-            depends_on: List[str] = None):
+            depends_on: List[str] = None, ttl: int = None):
         """
         Guardar en cache con dependencias
         
         Args:
-            key: Clave del cache
+            key: Clave del cache (segmentada con ':' para poder invalidar por prefijo)
             data: Datos a cachear
             cache_type: Tipo para determinar TTL
             depends_on: Lista de tablas de las que depende este cache
+            ttl: TTL explícito (por defecto el del tipo)
         """
-        ttl = self.ttl_config.get(cache_type, 60)
+        ttl = ttl or self.ttl_config.get(cache_type, 60)
+        size = _estimate_size(data) + len(key)
+        expires_at = time.time() + ttl
+        depends_on = tuple(depends_on or ())
         
-        self.cache[key] = {
-            'data': data,
-            'timestamp': time.time(),
-            'ttl': ttl,
-            'type': cache_type,
-            'depends_on': depends_on or []
-        }
-        
-        # Registrar dependencias
-        if depends_on:
+        with self.lock:
+            if key in self.cache:
+                self._remove(key)
+            
+            self.cache[key] = _CacheEntry(data, expires_at, ttl, cache_type, depends_on, size)
+            self.total_bytes += size
+            heapq.heappush(self.expiry_heap, (expires_at, key))
+            
+            # Registrar dependencias
             for table in depends_on:
-                if table in self.table_dependencies:
-                    self.table_dependencies[table].add(key)
+                self.table_dependencies.setdefault(table, set()).add(key)
+            for prefix in self._prefixes(key):
+                self.prefix_index.setdefault(prefix, set()).add(key)
+            
+            self._evict_if_needed()
+            if len(self.expiry_heap) > 2 * len(self.cache) + 1024:
+                self._compact_heap()
+    
+    def delete(self, key: str) -> bool:
+        """Eliminar una clave puntual"""
+        with self.lock:
+            if key not in self.cache:
+                return False
+            self._remove(key)
+            self.stats['invalidations'] += 1
+            return True
     
     def invalidate_table(self, table_name: str):
         """
         Invalidar todo el cache relacionado con una tabla
         Esto se llama cuando hay INSERT, UPDATE o DELETE en esa tabla
         """
-        if table_name in self.table_dependencies:
-            keys_to_invalidate = list(self.table_dependencies[table_name])
-            
+        with self.lock:
+            keys_to_invalidate = list(self.table_dependencies.get(table_name, ()))
             for key in keys_to_invalidate:
-                if key in self.cache:
-                    del self.cache[key]
-                    self.stats['invalidations'] += 1
-            
-            # Limpiar las dependencias
-            self.table_dependencies[table_name].clear()
-            
+                self._remove(key)
+            self.stats['invalidations'] += len(keys_to_invalidate)
+        
+        if keys_to_invalidate:
             print(f"🗑️ Invalidado cache de {len(keys_to_invalidate)} items por cambio en tabla '{table_name}'")
+        return len(keys_to_invalidate)
     
     def invalidate_pattern(self, pattern: str):
-        """Invalidar por patrón (ej: 'products_*')"""
-        keys_to_delete = [k for k in self.cache.keys() if pattern in k]
+        """
+        Invalidar por prefijo de segmentos (ej: 'products:cat:5' o 'products:cat:5:*')
         
-        for key in keys_to_delete:
-            del self.cache[key]
-            self._remove_dependencies(key)
-            self.stats['invalidations'] += 1
+        Usa el índice de prefijos: el costo es proporcional a las claves
+        afectadas, no al tamaño del cache.
+        """
+        prefix = pattern.rstrip('*').rstrip(KEY_SEPARATOR)
+        with self.lock:
+            keys_to_delete = list(self.prefix_index.get(prefix, ()))
+            for key in keys_to_delete:
+                self._remove(key)
+            self.stats['invalidations'] += len(keys_to_delete)
         
         return len(keys_to_delete)
     
-    def _remove_dependencies(self, key: str):
-        """Remover key de todas las dependencias"""
-        for table_keys in self.table_dependencies.values():
-            table_keys.discard(key)
+    def clear(self):
+        """Vaciar el cache completo"""
+        with self.lock:
+            self.cache.clear()
+            self.prefix_index.clear()
+            self.expiry_heap = []
+            self.total_bytes = 0
+            for keys in self.table_dependencies.values():
+                keys.clear()
+    
+    @staticmethod
+    def _prefixes(key: str):
+        """Prefijos por segmento de una clave, incluida la clave completa"""
+        parts = key.split(KEY_SEPARATOR)
+        return [KEY_SEPARATOR.join(parts[:i]) for i in range(1, len(parts) + 1)]
+    
+    def _remove(self, key: str):
+        """Eliminar una entrada y sus índices (O(tablas + segmentos) de esa clave)"""
+        entry = self.cache.pop(key, None)
+        if entry is None:
+            return
+        self.total_bytes -= entry.size
+        self._remove_dependencies(key, entry)
+        for prefix in self._prefixes(key):
+            keys = self.prefix_index.get(prefix)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.prefix_index[prefix]
+    
+    def _remove_dependencies(self, key: str, entry: _CacheEntry):
+        """Remover key solo de las tablas de las que dependía"""
+        for table in entry.depends_on:
+            table_keys = self.table_dependencies.get(table)
+            if table_keys is not None:
+                table_keys.discard(key)
+    
+    def _evict_if_needed(self):
+        """Desalojar por LRU hasta respetar los límites de entradas y bytes"""
+        while self.cache and (len(self.cache) > self.max_entries or self.total_bytes > self.max_bytes):
+            key = next(iter(self.cache))
+            self._remove(key)
+            self.stats['evictions'] += 1
+    
+    def _compact_heap(self):
+        self.expiry_heap = [(entry.expires_at, key) for key, entry in self.cache.items()]
+        heapq.heapify(self.expiry_heap)
+    
+    def sweep(self, max_items: int = 10000) -> int:
+        """Eliminar entradas vencidas (recorre solo las vencidas gracias al heap)"""
+        removed = 0
+        now = time.time()
+        with self.lock:
+            heap = self.expiry_heap
+            while heap and heap[0][0] <= now and removed < max_items:
+                expires_at, key = heapq.heappop(heap)
+                entry = self.cache.get(key)
+                # La clave pudo re-escribirse con otro vencimiento
+                if entry is not None and entry.expires_at == expires_at:
+                    self._remove(key)
+                    removed += 1
+            self.stats['expirations'] += removed
+        return removed
+    
+    def start_sweeper(self):
+        """Iniciar el barrido periódico de vencidos en segundo plano"""
+        if self._sweeper and self._sweeper.is_alive():
+            return
+        self._stop_event.clear()
+        
+        def loop():
+            while not self._stop_event.wait(self.sweep_interval):
+                try:
+                    self.sweep()
+                except Exception as e:
+                    print(f"⚠️ Error en barrido de cache: {e}")
+        
+        self._sweeper = threading.Thread(target=loop, name='smart-cache-sweeper', daemon=True)
+        self._sweeper.start()
+    
+    def stop_sweeper(self):
+        self._stop_event.set()
     
     def get_stats(self) -> Dict:
         """Obtener estadísticas del cache"""
-        total_requests = self.stats['hits'] + self.stats['misses']
-        hit_rate = (self.stats['hits'] / total_requests * 100) if total_requests > 0 else 0
-        
-        return {
-            'total_items': len(self.cache),
-            'hits': self.stats['hits'],
-            'misses': self.stats['misses'],
-            'hit_rate': f"{hit_rate:.1f}%",
-            'invalidations': self.stats['invalidations'],
-            'memory_items': len(self.cache)
-        }
+        with self.lock:
+            total_requests = self.stats['hits'] + self.stats['misses']
+            hit_rate = (self.stats['hits'] / total_requests * 100) if total_requests > 0 else 0
+            
+            return {
+                'total_items': len(self.cache),
+                'hits': self.stats['hits'],
+                'misses': self.stats['misses'],
+                'hit_rate': f"{hit_rate:.1f}%",
+                'invalidations': self.stats['invalidations'],
+                'evictions': self.stats['evictions'],
+                'expirations': self.stats['expirations'],
+                'memory_items': len(self.cache),
+                'memory_bytes': self.total_bytes,
+                'max_bytes': self.max_bytes
+            }
 
 # ============================================================
 # DECORADORES PARA CACHE AUTOMÁTICO
 # ============================================================
 
 cache_instance = SmartCache()
+cache_instance.start_sweeper()
+registry.register_collector(smart_cache_collector(cache_instance))
 
-def cached(cache_type: str = 'default', depends_on: List[str] = None):
+def cached(cache_type: str = 'default', depends_on: List[str] = None,
+           key: Callable[..., str] = None, method: bool = False):
     """
     Decorador para cachear resultados de funciones automáticamente
     
     Uso:
-    @cached(cache_type='products', depends_on=['products', 'categories'])
-    def get_products_by_category(category_id):
+    @cached(cache_type='products', depends_on=['products', 'categories'],
+            key=lambda self, category_id: make_key('products', 'cat', category_id))
+    def get_products_by_category(self, category_id):
         return db.query("SELECT * FROM products WHERE category_id = ?", category_id)
+    
+    Sin `key`, la clave es "<módulo.función>:<hash estable de los argumentos>".
+    Con method=True (métodos de instancia o classmethods) se ignora el primer
+    argumento (`self`/`cls`) para que todas las instancias compartan entradas;
+    funciones sueltas y staticmethods usan todos sus argumentos.
     """
     def decorator(func: Callable):
+        namespace = f"{func.__module__}.{func.__qualname__}"
+        
+        @wraps(func)
         def wrapper(*args, **kwargs):
-            # Generar key única basada en función y argumentos
-            cache_key = f"{func.__name__}_{str(args)}_{str(kwargs)}"
+            # Generar key estable basada en función y argumentos
+            if key is not None:
+                cache_key = key(*args, **kwargs)
+            else:
+                hashed_args = args[1:] if method and args else args
+                cache_key = make_key(namespace, stable_hash(hashed_args, kwargs))
             
             # Intentar obtener del cache
             cached_result = cache_instance.get(cache_key)
@@ -194,7 +395,7 @@ class CacheInvalidator:
         # Lógica específica por tabla
         if table == 'products':
             # También invalidar categorías si cambia el conteo
-            cache_instance.invalidate_pattern('categories_with_count')
+            cache_instance.invalidate_pattern('categories:with_count')
         
         elif table == 'orders':
             # Invalidar productos hot (más vendidos)
@@ -209,8 +410,9 @@ class CacheInvalidator:
         # Invalidación más específica
         if table == 'products':
             # Solo invalidar el producto específico y su categoría
-            cache_instance.invalidate_pattern(f'product_{record_id}')
-            cache_instance.invalidate_pattern(f'products_category_{changes.get("category_id")}')
+            cache_instance.invalidate_pattern(make_key('product', record_id))
+            if changes.get('category_id') is not None:
+                cache_instance.invalidate_pattern(make_key('products', 'cat', changes['category_id']))
     
     @staticmethod
     def on_delete(table: str, record_id: Any):
@@ -218,7 +420,7 @@ class CacheInvalidator:
         cache_instance.invalidate_table(table)
         
         # Limpiar referencias específicas
-        cache_instance.invalidate_pattern(f'{table}_{record_id}')
+        cache_instance.invalidate_pattern(make_key(table, record_id))
 
 # ============================================================
 # EJEMPLO DE USO EN ENDPOINTS
@@ -234,7 +436,8 @@ class ProductService:
         self.cache = cache_instance
         self.invalidator = CacheInvalidator()
     
-    @cached(cache_type='products', depends_on=['products', 'categories'])
+    @cached(cache_type='products', depends_on=['products', 'categories'],
+            key=lambda self, category_id: make_key('products', 'cat', category_id))
     def get_products_by_category(self, category_id: int):
         """
         Obtener productos por categoría (con cache automático)
@@ -304,7 +507,7 @@ class ProductService:
         """
         Productos más vendidos (cache agresivo de 1 minuto)
         """
-        cache_key = 'hot_products_top10'
+        cache_key = make_key('hot_products', 'top10')
         
         # Intentar cache primero
         cached = self.cache.get(cache_key)
@@ -0,0 +1,356 @@
+"""
+Bandeja de entrada durable para webhooks de MercadoPago
+
+El handler HTTP solo persiste el evento crudo y responde 200 de inmediato.
+Un pool de workers en segundo plano consulta el estado del pago y aplica
+los cambios de payment_status en las órdenes por lotes, con reintentos y
+backoff exponencial. Los eventos se deduplican por payment id.
+"""
+import json
+import logging
+import random
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+INBOX_TABLE_DDL = """
+CREATE TABLE IF NOT EXISTS mercadopago_webhook_inbox (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    payment_id VARCHAR(64) NOT NULL,
+    topic VARCHAR(50) NOT NULL,
+    payload TEXT,
+    status ENUM('pending', 'processing', 'done', 'failed') DEFAULT 'pending',
+    deliveries INT DEFAULT 1,
+    attempts INT DEFAULT 0,
+    next_attempt_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    claimed_by VARCHAR(64) NULL,
+    claimed_at TIMESTAMP NULL,
+    mp_status VARCHAR(30) NULL,
+    order_id INT NULL,
+    last_error TEXT,
+    received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    processed_at TIMESTAMP NULL,
+    UNIQUE KEY uk_inbox_payment (payment_id),
+    INDEX idx_inbox_pending (status, next_attempt_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+# Estados de MercadoPago que ya no cambian: una re-entrega no se reprocesa.
+# 'approved' no es final: después puede llegar un refunded o charged_back.
+FINAL_MP_STATUSES = ('cancelled', 'refunded', 'charged_back')
+
+# Estado de MercadoPago -> orders.payment_status
+ORDER_PAYMENT_STATUS = {
+    'approved': 'paid',
+    'refunded': 'refunded',
+    'charged_back': 'refunded',
+    'cancelled': 'cancelled',
+}
+
+
+def extract_payment_id(data: Dict, query: Optional[Dict] = None) -> Optional[str]:
+    """
+    Obtener el payment id de una notificación. MercadoPago envía tanto el
+    formato webhook (JSON con type/data.id) como el IPN (?topic=payment&id=).
+    """
+    query = query or {}
+    topic = data.get('type') or data.get('topic') or _first(query.get('type')) or _first(query.get('topic'))
+    if topic != 'payment':
+        return None
+
+    payment_id = (data.get('data') or {}).get('id') or data.get('id')
+    payment_id = payment_id or _first(query.get('data.id')) or _first(query.get('id'))
+    return str(payment_id) if payment_id else None
+
+
+def _first(value):
+    if isinstance(value, list):
+        return value[0] if value else None
+    return value
+
+
+class WebhookInbox:
+    """
+    Inbox persistida en MySQL:
+    - enqueue(): INSERT deduplicado por payment_id (solo la escritura, sin HTTP)
+    - workers: reclaman lotes, consultan MercadoPago en paralelo y actualizan
+      orders en una sola transacción por lote
+    - reintentos con backoff exponencial + jitter hasta max_attempts
+    """
+
+    def __init__(self, get_connection: Callable, fetch_payment: Callable,
+                 workers: int = 4, batch_size: int = 20, poll_interval: float = 2.0,
+                 max_attempts: int = 8, base_backoff: float = 5.0, max_backoff: float = 900.0,
+                 claim_timeout: int = 300):
+        self.get_connection = get_connection
+        self.fetch_payment = fetch_payment
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.claim_timeout = claim_timeout
+
+        self._wakeup = threading.Event()
+        self._stop_event = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._fetch_executor: Optional[ThreadPoolExecutor] = None
+        self._metrics_lock = threading.Lock()
+        self.metrics = {
+            'received': 0,
+            'duplicates': 0,
+            'processed': 0,
+            'orders_updated': 0,
+            'retries': 0,
+            'failed': 0,
+            'batches': 0,
+        }
+
+    # ============================================
+    # ESCRITURA (camino del request HTTP)
+    # ============================================
+
+    def ensure_table(self):
+        connection = self.get_connection()
+        cursor = connection.cursor()
+        try:
+            cursor.execute(INBOX_TABLE_DDL)
+            connection.commit()
+        finally:
+            cursor.close()
+            connection.close()
+
+    def enqueue(self, payment_id: str, topic: str, payload: Dict) -> bool:
+        """
+        Persistir el evento. Devuelve False si era un duplicado de un pago
+        que ya está en estado final. Lanza excepción si no se pudo guardar
+        (el handler debe responder != 200 para que MercadoPago reintente).
+        """
+        connection = self.get_connection()
+        cursor = connection.cursor()
+        try:
+            # Una re-entrega reabre el evento solo si el pago no está en estado final.
+            # Si está en proceso solo sube deliveries: el worker lo vuelve a pending al terminar
+            final_statuses = ", ".join(f"'{s}'" for s in FINAL_MP_STATUSES)
+            cursor.execute(f"""
+                INSERT INTO mercadopago_webhook_inbox (payment_id, topic, payload)
+                VALUES (%s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    deliveries = deliveries + 1,
+                    payload = VALUES(payload),
+                    attempts = IF(status = 'failed', 0, attempts),
+                    next_attempt_at = IF(status IN ('done', 'failed')
+                                         AND COALESCE(mp_status, '') NOT IN ({final_statuses}),
+                                         CURRENT_TIMESTAMP, next_attempt_at),
+                    status = IF(status IN ('done', 'failed')
+                                AND COALESCE(mp_status, '') NOT IN ({final_statuses}),
+                                'pending', status)
+            """, (payment_id, topic, json.dumps(payload, default=str)))
+            connection.commit()
+            # rowcount: 1 = insertado, 2 = actualizado (re-entrega)
+            is_new = cursor.rowcount == 1
+        finally:
+            cursor.close()
+            connection.close()
+
+        with self._metrics_lock:
+            self.metrics['received'] += 1
+            if not is_new:
+                self.metrics['duplicates'] += 1
+
+        self._wakeup.set()
+        return is_new
+
+    # ============================================
+    # WORKERS
+    # ============================================
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop_event.clear()
+        self._fetch_executor = ThreadPoolExecutor(max_workers=self.workers * 2,
+                                                  thread_name_prefix='mp-fetch')
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, name=f'mp-inbox-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"[WEBHOOK_INBOX] {self.workers} workers iniciados")
+
+    def stop(self, timeout: float = 5.0):
+        self._stop_event.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        if self._fetch_executor:
+            self._fetch_executor.shutdown(wait=False)
+
+    def _worker_loop(self):
+        worker_id = f"{threading.current_thread().name}-{uuid.uuid4().hex[:8]}"
+        while not self._stop_event.is_set():
+            try:
+                processed = self.process_batch(worker_id)
+            except Exception as e:
+                logger.error(f"[WEBHOOK_INBOX] Error en worker {worker_id}: {e}")
+                processed = 0
+
+            # Lote lleno: seguir sin esperar; si no, dormir hasta el próximo evento
+            if processed < self.batch_size:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def _claim(self, worker_id: str) -> List[Dict]:
+        """Reclamar un lote de eventos pendientes (o abandonados por un worker caído)"""
+        connection = self.get_connection()
+        cursor = connection.cursor(dictionary=True)
+        try:
+            cursor.execute("""
+                UPDATE mercadopago_webhook_inbox
+                SET status = 'processing', claimed_by = %s, claimed_at = NOW()
+                WHERE (status = 'pending' AND next_attempt_at <= NOW())
+                   OR (status = 'processing' AND claimed_at < NOW() - INTERVAL %s SECOND)
+                ORDER BY id
+                LIMIT %s
+            """, (worker_id, self.claim_timeout, self.batch_size))
+            connection.commit()
+            if cursor.rowcount == 0:
+                return []
+
+            cursor.execute("""
+                SELECT id, payment_id, attempts, deliveries
+                FROM mercadopago_webhook_inbox
+                WHERE claimed_by = %s AND status = 'processing'
+            """, (worker_id,))
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+            connection.close()
+
+    def _fetch(self, event: Dict):
+        try:
+            return event, self.fetch_payment(event['payment_id']), None
+        except Exception as e:
+            return event, None, str(e)
+
+    def process_batch(self, worker_id: str) -> int:
+        events = self._claim(worker_id)
+        if not events:
+            return 0
+
+        # Consultas HTTP a MercadoPago en paralelo (fuera de cualquier conexión a la BD)
+        results = list(self._fetch_executor.map(self._fetch, events)) if self._fetch_executor \
+            else [self._fetch(event) for event in events]
+
+        succeeded = []
+        failed = []
+        for event, payment, error in results:
+            if payment and payment.get('status'):
+                succeeded.append((event, payment))
+            else:
+                failed.append((event, error or 'Sin respuesta de MercadoPago'))
+
+        if succeeded:
+            self._apply(succeeded)
+        for event, error in failed:
+            self._schedule_retry(event, error)
+
+        with self._metrics_lock:
+            self.metrics['batches'] += 1
+            self.metrics['processed'] += len(succeeded)
+
+        logger.info(f"[WEBHOOK_INBOX] Lote procesado: {len(succeeded)} ok, {len(failed)} con error")
+        return len(events)
+
+    def _apply(self, succeeded):
+        """Actualizar orders y marcar los eventos como procesados en una transacción"""
+        updates_by_status: Dict[str, List[int]] = {}
+        inbox_rows = []
+        for event, payment in succeeded:
+            mp_status = payment.get('status')
+            order_id = payment.get('external_reference')
+            try:
+                order_id = int(order_id) if order_id else None
+            except (TypeError, ValueError):
+                order_id = None
+
+            order_status = ORDER_PAYMENT_STATUS.get(mp_status)
+            if order_id and order_status:
+                updates_by_status.setdefault(order_status, []).append(order_id)
+            inbox_rows.append((event['deliveries'], event['deliveries'], mp_status, order_id, event['id']))
+
+        connection = self.get_connection()
+        cursor = connection.cursor()
+        try:
+            connection.start_transaction()
+            orders_updated = 0
+            for order_status, order_ids in updates_by_status.items():
+                placeholders = ", ".join(["%s"] * len(order_ids))
+                cursor.execute(f"""
+                    UPDATE orders
+                    SET payment_status = %s, payment_method = 'mercadopago', updated_at = NOW()
+                    WHERE id IN ({placeholders})
+                """, [order_status] + order_ids)
+                orders_updated += cursor.rowcount
+
+            # Si llegó una re-entrega mientras se procesaba (deliveries subió desde el claim)
+            # el pago pudo cambiar después de nuestra consulta: vuelve a pending para otra vuelta
+            cursor.executemany("""
+                UPDATE mercadopago_webhook_inbox
+                SET status = IF(deliveries > %s, 'pending', 'done'),
+                    next_attempt_at = IF(deliveries > %s, NOW(), next_attempt_at),
+                    mp_status = %s, order_id = %s,
+                    processed_at = NOW(), claimed_by = NULL, last_error = NULL
+                WHERE id = %s
+            """, inbox_rows)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            cursor.close()
+            connection.close()
+
+        with self._metrics_lock:
+            self.metrics['orders_updated'] += orders_updated
+
+    def _schedule_retry(self, event: Dict, error: str):
+        attempts = event['attempts'] + 1
+        if attempts >= self.max_attempts:
+            status, delay = 'failed', 0
+        else:
+            status = 'pending'
+            delay = min(self.base_backoff * (2 ** (attempts - 1)), self.max_backoff)
+            delay += random.uniform(0, delay * 0.2)
+
+        connection = self.get_connection()
+        cursor = connection.cursor()
+        try:
+            cursor.execute("""
+                UPDATE mercadopago_webhook_inbox
+                SET status = %s, attempts = %s, last_error = %s, claimed_by = NULL,
+                    next_attempt_at = NOW() + INTERVAL %s SECOND
+                WHERE id = %s
+            """, (status, attempts, error[:1000], int(delay), event['id']))
+            connection.commit()
+        finally:
+            cursor.close()
+            connection.close()
+
+        with self._metrics_lock:
+            if status == 'failed':
+                self.metrics['failed'] += 1
+                logger.error(f"[WEBHOOK_INBOX] Pago {event['payment_id']} descartado tras {attempts} intentos: {error}")
+            else:
+                self.metrics['retries'] += 1
+                logger.warning(f"[WEBHOOK_INBOX] Pago {event['payment_id']} reintento {attempts} en {int(delay)}s: {error}")
+
+    def get_stats(self) -> Dict:
+        with self._metrics_lock:
+            stats = dict(self.metrics)
+        stats['workers_alive'] = sum(1 for t in self._threads if t.is_alive())
+        return stats
@@ -2,9 +2,10 @@
 Main FastAPI application for Restaurant Management System.
 """
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
+import time
 import structlog
 
 from core.config import settings
@@ -12,6 +13,12 @@ from core.database import init_db
 from core.websocket import manager
 from core.security import decode_token
 from core.cache import init_redis
+from core.deadlines import begin_request, end_request, DeadlineExceeded
+from core.metrics import (
+    registry as metrics_registry, HTTP_REQUESTS, HTTP_LATENCY, CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    route_label, query_budget_collector
+)
+from core import request_timing
 
 # Import routers
 from api.auth import router as auth_router
@@ -75,11 +82,22 @@ async def lifespan(app: FastAPI):
     logger.info("Shutting down Restaurant Management System")
 
 
+class TimedJSONResponse(JSONResponse):
+    """JSONResponse that reports its serialization time in the request's Server-Timing header"""
+
+    def render(self, content) -> bytes:
+        started = time.perf_counter()
+        body = super().render(content)
+        request_timing.record_serialization(time.perf_counter() - started)
+        return body
+
+
 # Create FastAPI application
 app = FastAPI(
     title=settings.APP_NAME,
     version=settings.VERSION,
     lifespan=lifespan,
+    default_response_class=TimedJSONResponse,
     docs_url="/api/docs" if settings.DEBUG else None,
     redoc_url="/api/redoc" if settings.DEBUG else None,
 )
@@ -93,6 +111,67 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+# Request deadlines (see core/deadlines.py)
+@app.middleware("http")
+async def request_deadline(request: Request, call_next):
+    """
+    Per-route time budget. DB statements run with the remaining time as their
+    execution limit, so a slow query fails with 504 instead of holding a pooled connection.
+    """
+    deadline = begin_request(request.method, request.url.path)
+    try:
+        return await call_next(request)
+    except DeadlineExceeded:
+        return JSONResponse(status_code=504, content={"detail": "Request deadline exceeded"})
+    except Exception:
+        if deadline.timed_out:
+            logger.warning("Request deadline exceeded", route=deadline.route, budget=deadline.budget)
+            return JSONResponse(status_code=504, content={"detail": "Request deadline exceeded"})
+        raise
+    finally:
+        end_request(deadline)
+
+
+# Request metrics (see core/metrics.py) and per-request timing breakdown (see core/request_timing.py)
+@app.middleware("http")
+async def request_metrics(request: Request, call_next):
+    """
+    Per-route request count and latency, labelled by the matched route template.
+    Query count, DB/LLM/serialization time go out as a Server-Timing header and
+    one structured access log line per request.
+    """
+    started = time.perf_counter()
+    timing = request_timing.begin(request.method, request.url.path)
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["Server-Timing"] = timing.server_timing()
+        return response
+    except request_timing.QueryBudgetExceeded as e:
+        # Strict mode (QUERY_BUDGET_STRICT=1): an N+1 fails the request instead of going unnoticed
+        logger.error("Query budget exceeded", error=str(e))
+        return JSONResponse(status_code=500, content={"detail": f"Query budget exceeded: {e}"},
+                            headers={"Server-Timing": timing.server_timing()})
+    finally:
+        route = request.scope.get("route")
+        label = getattr(route, "path", None) or route_label(request.url.path)
+        HTTP_REQUESTS.labels(request.method, label, status).inc()
+        HTTP_LATENCY.labels(request.method, label).observe(time.perf_counter() - started)
+        logger.info("access", **request_timing.end(timing, status, method=request.method, path=request.url.path))
+
+
+def _websocket_metrics():
+    """Open WebSocket connections per role, read at scrape time"""
+    return [("gastro_websocket_connections", "gauge", "Open WebSocket connections by role",
+             [({"role": role}, count) for role, count in manager.get_connection_count().items()])]
+
+
+metrics_registry.register_collector(_websocket_metrics)
+metrics_registry.register_collector(query_budget_collector(request_timing.budget_stats))
+
+
 # Include API routers
 app.include_router(auth_router, prefix="/api/v1/auth", tags=["auth"])
 # Use optimized products router with lazy loading and caching
@@ -134,6 +213,13 @@ async def health_check():
     }
 
 
+# Prometheus scrape endpoint
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Metrics in Prometheus text exposition format"""
+    return Response(content=metrics_registry.render(), media_type=METRICS_CONTENT_TYPE)
+
+
 # WebSocket endpoint for real-time updates
 @app.websocket("/ws/{role}")
 async def websocket_endpoint(websocket: WebSocket, role: str, token: str):
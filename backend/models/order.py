@@ -37,6 +37,7 @@ class Order(Base, TimestampMixin):
     __table_args__ = (
         Index('idx_orders_table_status', 'table_number', 'status'),
         Index('idx_orders_status_created', 'status', 'created_at'),
+        Index('idx_orders_created', 'created_at'),
         Index('idx_orders_waiter_date', 'waiter_id', 'created_at'),
         Index('idx_orders_daily_reports', 'ordered_at'),
         mysql_table_args
@@ -43,6 +43,7 @@ class Product(Base, TimestampMixin):
     __table_args__ = (
         Index('idx_products_name', 'name'),
         Index('idx_products_category_available', 'category_id', 'is_available'),
+        Index('idx_products_category_available_name', 'category_id', 'is_available', 'name'),
         Index('idx_products_featured', 'is_featured'),
         Index('idx_products_price_range', 'base_price'),
         mysql_table_args
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Benchmark del snapshot del catálogo (core/catalog.py)
+
+Compara, sobre un menú sintético, las búsquedas que hacía el chat recorriendo
+restaurant_data['products'] en cada mensaje contra los índices del snapshot:
+producto por id, producto mencionado en el mensaje, productos de una categoría
+y armado de la lista de categorías + muestras para el prompt.
+
+Uso:
+    python scripts/benchmark_catalog.py [productos]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.catalog import CatalogSnapshot
+
+REPEAT = 2000
+CATEGORIES = ['Entradas', 'Pastas', 'Pizzas', 'Carnes', 'Pescados', 'Ensaladas', 'Postres',
+              'Bebidas', 'Vinos', 'Cervezas', 'Cafetería', 'Sandwiches']
+WORDS = ['Milanesa', 'Napolitana', 'Ravioles', 'Sorrentinos', 'Fugazzeta', 'Provoleta', 'Bife',
+         'Chorizo', 'Flan', 'Tiramisú', 'Malbec', 'Lomo', 'Ñoquis', 'Suprema', 'Trucha', 'Merluza']
+
+
+def build_rows(count):
+    rng = random.Random(7)
+    rows = []
+    for i in range(1, count + 1):
+        rows.append({
+            'id': i,
+            'name': f"{rng.choice(WORDS)} {rng.choice(WORDS)} {i}",
+            'description': 'Plato de la casa',
+            'price': rng.randint(1000, 20000),
+            'category_id': i % len(CATEGORIES),
+            'category_name': CATEGORIES[i % len(CATEGORIES)],
+            'image_url': None,
+        })
+    rows.sort(key=lambda r: (r['category_name'], r['name']))
+    return rows
+
+
+def legacy_find(products_data, message):
+    message_lower = message.lower()
+    best_product, max_matches = None, 0
+    for product in products_data:
+        name = product['name'].lower()
+        if name in message_lower or message_lower in name:
+            return product
+        matches = sum(1 for word in name.split() if word in message_lower.split())
+        if matches > max_matches:
+            max_matches, best_product = matches, product
+    return best_product
+
+
+def legacy_samples(products_data):
+    categories = list(set([p['category_name'] for p in products_data if p['category_name']]))
+    samples = {}
+    for product in products_data:
+        cat = product['category_name']
+        samples.setdefault(cat, [])
+        if len(samples[cat]) < 3:
+            samples[cat].append(product)
+    return categories, samples
+
+
+def timed_us(fn, *args):
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        result = fn(*args)
+    return (time.perf_counter() - start) / REPEAT * 1e6, result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    rows = build_rows(count)
+
+    start = time.perf_counter()
+    catalog = CatalogSnapshot(rows)
+    build_ms = (time.perf_counter() - start) * 1000
+    print(f"📦 {count} productos, {len(catalog.category_names)} categorías - snapshot en {build_ms:.1f}ms")
+
+    target = rows[len(rows) // 2]
+    message = f"qué tiene la {target['name'].lower()}?"
+
+    cases = [
+        ('producto por id',
+         lambda: next((p for p in rows if str(p['id']) == str(target['id'])), None),
+         lambda: catalog.get(str(target['id']))),
+        ('producto en el mensaje',
+         lambda: legacy_find(rows, message),
+         lambda: catalog.find_in_message(message)[0]),
+        ('productos de una categoría',
+         lambda: [p for p in rows if p['category_name'].lower() == 'pastas'],
+         lambda: catalog.in_category('pastas')),
+        ('categorías + muestras prompt',
+         lambda: legacy_samples(rows),
+         lambda: (catalog.categories_text, catalog.samples_text)),
+    ]
+
+    print(f"\n{'operación':<30}{'lista µs':>12}{'snapshot µs':>14}")
+    for name, legacy, indexed in cases:
+        legacy_us, legacy_result = timed_us(legacy)
+        indexed_us, indexed_result = timed_us(indexed)
+        print(f"{name:<30}{legacy_us:>12.2f}{indexed_us:>14.3f}")
+
+    found, _ = catalog.find_in_message(message)
+    assert found.id == target['id'] == legacy_find(rows, message)['id']
+    assert len(catalog.in_category('PASTAS')) == len([p for p in rows if p['category_name'] == 'Pastas'])
+    print("\n✅ Mismos resultados que el recorrido lineal")
+
+
+if __name__ == "__main__":
+    main()
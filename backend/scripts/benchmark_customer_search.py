@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Benchmark del índice de búsqueda de clientes (core/customer_search.py)
+
+Genera clientes sintéticos (por defecto 100.000), construye el índice y
+mide p50/p95/p99 para búsquedas por prefijo, substring, teléfono y con
+errores de tipeo. Como referencia mide el equivalente a LIKE '%q%'
+(recorrido lineal) sobre los mismos datos.
+
+Uso:
+    python scripts/benchmark_customer_search.py [cantidad_clientes] [consultas_por_tipo]
+"""
+import os
+import random
+import sys
+import time
+import resource
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.customer_search import CustomerSearchIndex, normalize_text
+
+FIRST_NAMES = [
+    'Juan', 'María', 'José', 'Lucía', 'Martín', 'Sofía', 'Diego', 'Valentina', 'Pablo', 'Camila',
+    'Federico', 'Agustina', 'Nicolás', 'Florencia', 'Matías', 'Julieta', 'Tomás', 'Milagros',
+    'Santiago', 'Rocío', 'Facundo', 'Carolina', 'Gonzalo', 'Micaela', 'Lautaro', 'Paula',
+    'Ezequiel', 'Antonella', 'Joaquín', 'Brenda', 'Ramiro', 'Daniela', 'Hernán', 'Natalia',
+]
+LAST_NAMES = [
+    'González', 'Rodríguez', 'Gómez', 'Fernández', 'López', 'Díaz', 'Martínez', 'Pérez',
+    'García', 'Sánchez', 'Romero', 'Sosa', 'Álvarez', 'Torres', 'Ruiz', 'Ramírez', 'Flores',
+    'Benítez', 'Acosta', 'Medina', 'Herrera', 'Suárez', 'Aguirre', 'Giménez', 'Gutiérrez',
+    'Pereyra', 'Rojas', 'Molina', 'Castro', 'Ortiz', 'Silva', 'Núñez', 'Luna', 'Juárez',
+    'Cabrera', 'Ríos', 'Morales', 'Godoy', 'Moreno', 'Ferreyra', 'Domínguez', 'Carrizo',
+    'Peralta', 'Castillo', 'Ledesma', 'Quiroga', 'Vega', 'Vera', 'Muñoz', 'Ojeda', 'Ponce',
+    'Villalba', 'Cardozo', 'Navarro', 'Coronel', 'Vázquez', 'Ramos', 'Vargas', 'Cáceres',
+    'Arias', 'Figueroa', 'Córdoba', 'Correa', 'Maldonado', 'Paz', 'Rivero', 'Miranda',
+    'Mansilla', 'Farías', 'Roldán', 'Méndez', 'Guzmán', 'Agüero', 'Hernández', 'Lucero',
+]
+DOMAINS = ['gmail.com', 'hotmail.com', 'yahoo.com.ar', 'outlook.com', 'fibertel.com.ar']
+
+
+def generate_customers(count, seed=42):
+    rng = random.Random(seed)
+    customers = []
+    for customer_id in range(1, count + 1):
+        first = rng.choice(FIRST_NAMES)
+        last = rng.choice(LAST_NAMES)
+        if rng.random() < 0.3:
+            # Apellido compuesto
+            last = f"{last} {rng.choice(LAST_NAMES)}"
+        email_user = normalize_text(f"{first}.{last}{rng.randint(1, 9999)}").replace(' ', '')
+        customers.append({
+            'id': customer_id,
+            'first_name': first,
+            'last_name': last,
+            'email': f"{email_user}@{rng.choice(DOMAINS)}",
+            'phone': f"+54 11 {rng.randint(4000, 6999)}-{rng.randint(1000, 9999)}",
+            'company_id': 1,
+            'is_active': 1 if rng.random() > 0.05 else 0,
+        })
+    return customers
+
+
+def typo(word, rng):
+    """Cambiar una letra para simular un error de tipeo"""
+    if len(word) < 4:
+        return word
+    pos = rng.randint(1, len(word) - 2)
+    return word[:pos] + rng.choice('aeiourstln') + word[pos + 1:]
+
+
+def build_queries(customers, per_type, seed=7):
+    rng = random.Random(seed)
+    sample = rng.sample(customers, per_type)
+    return {
+        'prefijo': [c['first_name'][:rng.randint(2, 4)] for c in sample],
+        'nombre_completo': [f"{c['first_name']} {c['last_name'][:3]}" for c in sample],
+        'substring': [normalize_text(c['last_name'])[1:5] for c in sample],
+        'telefono': [c['phone'][-rng.randint(4, 8):].replace('-', '') for c in sample],
+        'email': [c['email'][:rng.randint(5, 10)] for c in sample],
+        'fuzzy': [typo(normalize_text(c['last_name']), rng) for c in sample],
+    }
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def linear_like(customers_normalized, query):
+    """Equivalente a LIKE '%q%' sobre nombre, email y teléfono"""
+    q = normalize_text(query)
+    return [c for c in customers_normalized if q in c[1] or q in c[2] or q in c[3]][:10]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    per_type = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+
+    print(f"👥 Generando {count} clientes sintéticos...")
+    customers = generate_customers(count)
+
+    index = CustomerSearchIndex()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    index.build(customers)
+    build_seconds = time.perf_counter() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    stats = index.get_stats()
+    print(f"✅ Índice construido en {build_seconds:.2f}s "
+          f"({stats['trigrams']} trigramas, {stats['postings']} postings, "
+          f"+{(rss_after - rss_before) / 1024:.0f}MB RSS)")
+
+    queries = build_queries(customers, per_type)
+    print(f"\n{'tipo':<16}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'sin resultado':>15}")
+    all_latencies = []
+    for kind, kind_queries in queries.items():
+        latencies = []
+        empty = 0
+        for q in kind_queries:
+            t0 = time.perf_counter()
+            result = index.search(q, limit=10)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            if not result:
+                empty += 1
+        all_latencies.extend(latencies)
+        print(f"{kind:<16}{percentile(latencies, 0.5):>10.3f}{percentile(latencies, 0.95):>10.3f}"
+              f"{percentile(latencies, 0.99):>10.3f}{empty:>15}")
+    print(f"{'TOTAL':<16}{percentile(all_latencies, 0.5):>10.3f}{percentile(all_latencies, 0.95):>10.3f}"
+          f"{percentile(all_latencies, 0.99):>10.3f}")
+
+    # Actualizaciones incrementales (create_customer / update_customer)
+    rng = random.Random(3)
+    t0 = time.perf_counter()
+    updates = 2000
+    for i in range(updates):
+        customer = dict(rng.choice(customers))
+        customer['last_name'] = rng.choice(LAST_NAMES)
+        index.upsert(customer)
+    upsert_ms = (time.perf_counter() - t0) * 1000 / updates
+    print(f"\n✏️  upsert promedio: {upsert_ms:.3f}ms ({index.get_stats()['compactions']} compactaciones)")
+
+    # Referencia: recorrido lineal equivalente al LIKE actual
+    normalized = [(c['id'], normalize_text(f"{c['first_name']} {c['last_name']}"),
+                   normalize_text(c['email']), c['phone']) for c in customers]
+    linear = []
+    for q in queries['substring'][:50]:
+        t0 = time.perf_counter()
+        linear_like(normalized, q)
+        linear.append((time.perf_counter() - t0) * 1000)
+    print(f"🐢 LIKE '%q%' lineal (referencia, en memoria): p99 {percentile(linear, 0.99):.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
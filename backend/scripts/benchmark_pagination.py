@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Benchmark de paginación: OFFSET vs keyset (cursor)
+
+Crea tablas temporales con la misma forma e índices que products/orders,
+las llena con datos sintéticos y mide la página 1 y la página 50 (y una
+página profunda del historial de órdenes) con las dos estrategias. Las
+consultas keyset son las mismas que generan core/pagination.py y los
+endpoints de api/products_optimized.py, api/products.py y api/orders.py.
+
+Uso:
+    # Contra MySQL (usa MYSQL_CONFIG de complete_server, tablas bench_* temporales)
+    python scripts/benchmark_pagination.py mysql [productos] [ordenes]
+
+    # Local sin servidor (SQLite en memoria)
+    python scripts/benchmark_pagination.py sqlite [productos] [ordenes]
+"""
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PRODUCTS_PAGE = 20
+ORDERS_PAGE = 50
+REPEAT = 20
+
+
+def connect(engine):
+    if engine == 'sqlite':
+        return sqlite3.connect(':memory:'), '?'
+    import mysql.connector
+    from complete_server import MYSQL_CONFIG
+    return mysql.connector.connect(**MYSQL_CONFIG, ssl_disabled=False), '%s'
+
+
+def setup(conn, ph, products, orders, engine):
+    cursor = conn.cursor()
+    cursor.execute("DROP TABLE IF EXISTS bench_products")
+    cursor.execute("DROP TABLE IF EXISTS bench_orders")
+    auto = "INTEGER PRIMARY KEY" if engine == 'sqlite' else "INT PRIMARY KEY"
+    cursor.execute(f"""
+        CREATE TABLE bench_products (
+            id {auto}, category_id INT NOT NULL, is_available INT NOT NULL,
+            name VARCHAR(200) NOT NULL, description TEXT, base_price DECIMAL(10,2)
+        )
+    """)
+    cursor.execute(f"""
+        CREATE TABLE bench_orders (
+            id {auto}, status VARCHAR(20) NOT NULL, table_number INT NOT NULL,
+            created_at DATETIME NOT NULL, total DECIMAL(10,2)
+        )
+    """)
+    cursor.execute("CREATE INDEX idx_bench_products_cat_avail_name ON bench_products (category_id, is_available, name)")
+    cursor.execute("CREATE INDEX idx_bench_orders_created ON bench_orders (created_at)")
+
+    rng = random.Random(42)
+    words = ['Milanesa', 'Pizza', 'Empanada', 'Ravioles', 'Ensalada', 'Lomo', 'Flan', 'Tarta',
+             'Sorrentinos', 'Provoleta', 'Bife', 'Ñoquis', 'Suprema', 'Choripán', 'Locro']
+    rows = [(i, 1 if i <= products else rng.randint(2, 30), 1,
+             f"{rng.choice(words)} {rng.choice(words)} {i}", 'Descripción ' * 10, rng.randint(1000, 20000))
+            for i in range(1, products * 3 + 1)]
+    cursor.executemany(f"INSERT INTO bench_products VALUES ({ph}, {ph}, {ph}, {ph}, {ph}, {ph})", rows)
+
+    start = datetime(2024, 1, 1)
+    batch = []
+    for i in range(1, orders + 1):
+        created = start + timedelta(seconds=i * 90 + rng.randint(0, 60))
+        batch.append((i, rng.choice(['pending', 'delivered', 'paid']), rng.randint(1, 40),
+                      created.strftime('%Y-%m-%d %H:%M:%S'), rng.randint(1000, 50000)))
+        if len(batch) == 5000:
+            cursor.executemany(f"INSERT INTO bench_orders VALUES ({ph}, {ph}, {ph}, {ph}, {ph})", batch)
+            batch = []
+    if batch:
+        cursor.executemany(f"INSERT INTO bench_orders VALUES ({ph}, {ph}, {ph}, {ph}, {ph})", batch)
+    conn.commit()
+    cursor.close()
+
+
+def timed(conn, sql, params):
+    cursor = conn.cursor()
+    best = None
+    rows = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    cursor.close()
+    return best, rows
+
+
+def product_pages(conn, ph, page):
+    base = ("SELECT id, name, base_price FROM bench_products "
+            f"WHERE category_id = {ph} AND is_available = 1 ")
+    offset_ms, offset_rows = timed(
+        conn, base + f"ORDER BY name, id LIMIT {PRODUCTS_PAGE + 1} OFFSET {(page - 1) * PRODUCTS_PAGE}", (1,))
+
+    # Caminar los cursores hasta la página pedida (lo que hace el cliente)
+    last = None
+    for _ in range(page - 1):
+        if last is None:
+            sql, params = base + f"ORDER BY name, id LIMIT {PRODUCTS_PAGE + 1}", (1,)
+        else:
+            sql = base + f"AND name >= {ph} AND (name > {ph} OR (name = {ph} AND id > {ph})) ORDER BY name, id LIMIT {PRODUCTS_PAGE + 1}"
+            params = (1, last[1], last[1], last[1], last[0])
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        last = cursor.fetchall()[PRODUCTS_PAGE - 1]
+        cursor.close()
+
+    if last is None:
+        keyset_ms, keyset_rows = timed(conn, base + f"ORDER BY name, id LIMIT {PRODUCTS_PAGE + 1}", (1,))
+    else:
+        keyset_ms, keyset_rows = timed(
+            conn,
+            base + f"AND name >= {ph} AND (name > {ph} OR (name = {ph} AND id > {ph})) ORDER BY name, id LIMIT {PRODUCTS_PAGE + 1}",
+            (1, last[1], last[1], last[1], last[0]))
+    assert [r[0] for r in offset_rows] == [r[0] for r in keyset_rows]
+    return offset_ms, keyset_ms
+
+
+def order_pages(conn, ph, page):
+    base = "SELECT id, status, created_at, total FROM bench_orders "
+    order = f"ORDER BY created_at DESC, id DESC LIMIT {ORDERS_PAGE + 1}"
+    offset_ms, offset_rows = timed(conn, base + order + f" OFFSET {(page - 1) * ORDERS_PAGE}", ())
+
+    if page == 1:
+        keyset_ms, keyset_rows = timed(conn, base + order, ())
+    else:
+        # El cursor es (created_at, id) de la última fila de la página anterior
+        cursor = conn.cursor()
+        cursor.execute(base + order.replace(f"LIMIT {ORDERS_PAGE + 1}", f"LIMIT 1 OFFSET {(page - 1) * ORDERS_PAGE - 1}"))
+        prev = cursor.fetchall()[0]
+        cursor.close()
+        keyset_ms, keyset_rows = timed(
+            conn, base + f"WHERE created_at <= {ph} AND (created_at < {ph} OR (created_at = {ph} AND id < {ph})) " + order,
+            (prev[2], prev[2], prev[2], prev[0]))
+    assert [r[0] for r in offset_rows] == [r[0] for r in keyset_rows]
+    return offset_ms, keyset_ms
+
+
+def main():
+    engine = sys.argv[1] if len(sys.argv) > 1 else 'sqlite'
+    products = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    orders = int(sys.argv[3]) if len(sys.argv) > 3 else 200000
+
+    conn, ph = connect(engine)
+    print(f"🧪 Motor {engine}: {products} productos en la categoría, {orders} órdenes")
+    setup(conn, ph, products, orders, engine)
+
+    try:
+        print(f"\n{'listado':<28}{'OFFSET ms':>12}{'keyset ms':>12}")
+        for page in (1, 50):
+            offset_ms, keyset_ms = product_pages(conn, ph, page)
+            print(f"{f'productos página {page}':<28}{offset_ms:>12.3f}{keyset_ms:>12.3f}")
+        deepest = max(2, orders // ORDERS_PAGE - 1)
+        for page in (1, 50, deepest):
+            offset_ms, keyset_ms = order_pages(conn, ph, page)
+            print(f"{f'órdenes página {page}':<28}{offset_ms:>12.3f}{keyset_ms:>12.3f}")
+    finally:
+        cursor = conn.cursor()
+        cursor.execute("DROP TABLE IF EXISTS bench_products")
+        cursor.execute("DROP TABLE IF EXISTS bench_orders")
+        conn.commit()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Benchmark de SmartCache (core/smart_cache.py)
+
+Llena el cache con 1k..100k entradas repartidas en categorías y mide que
+las operaciones de invalidación y vencimiento no crezcan con el tamaño del
+cache: invalidar una categoría por prefijo, invalidar una tabla chica,
+vencer una clave suelta y barrer vencidos. Como referencia mide el recorrido
+por substring que hacía la versión anterior de invalidate_pattern.
+
+Uso:
+    python scripts/benchmark_smart_cache.py [tamaños separados por coma]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.smart_cache import SmartCache, make_key, stable_hash
+
+CATEGORIES = 100
+PAGES_PER_QUERY = 10
+HOT_CATEGORY_KEYS = 100
+
+
+def fill(cache, size):
+    """size entradas: productos por categoría/página y algunas mesas"""
+    row = [{'id': i, 'name': f'Producto {i}', 'price': 1500.0} for i in range(5)]
+    for i in range(size):
+        category = i % CATEGORIES
+        if i % 1000 == 0:
+            # Pocas claves dependientes de 'tables': invalidarlas debe costar poco
+            cache.set(make_key('tables', 'layout', i), row, 'tables', depends_on=['tables'])
+            continue
+        key = make_key('products', 'cat', category, 'q', i // (CATEGORIES * PAGES_PER_QUERY), 'page', i)
+        cache.set(key, row, 'products', depends_on=['products', 'categories'], ttl=600)
+    # Categoría de tamaño fijo: lo que se invalida es igual en todos los tamaños
+    for page in range(HOT_CATEGORY_KEYS):
+        cache.set(make_key('products', 'cat', 'hot', 'page', page), row, 'products',
+                  depends_on=['products', 'categories'], ttl=600)
+
+
+def timed_ms(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return (time.perf_counter() - start) * 1000, result
+
+
+def legacy_substring_scan(cache, pattern):
+    """Recorrido de la implementación anterior (referencia)"""
+    return [k for k in list(cache.cache.keys()) if pattern in k]
+
+
+def main():
+    sizes = [int(s) for s in sys.argv[1].split(',')] if len(sys.argv) > 1 else [1000, 10000, 50000, 100000]
+
+    print(f"{'entradas':>10}{'cat ms':>10}{'borradas':>10}{'tabla ms':>10}{'vence ms':>10}"
+          f"{'barrido ms':>12}{'MB':>8}{'substring ms':>14}")
+    for size in sizes:
+        cache = SmartCache(max_entries=size * 2, max_bytes=1024 ** 3, sweep_interval=3600)
+        fill(cache, size)
+
+        # Invalidar una categoría de HOT_CATEGORY_KEYS claves
+        per_cat_ms, deleted = timed_ms(cache.invalidate_pattern, make_key('products', 'cat', 'hot'))
+        # Invalidar la tabla chica
+        table_ms, _ = timed_ms(cache.invalidate_table, 'tables')
+
+        # Vencimiento de una clave leída (antes recorría todas las tablas)
+        key = make_key('products', 'cat', 8, 'expiring')
+        cache.set(key, [1], 'products', depends_on=['products', 'categories'], ttl=0.001)
+        time.sleep(0.002)
+        expire_ms, _ = timed_ms(cache.get, key)
+
+        # Barrido: 100 claves vencidas entre todas las demás
+        for i in range(100):
+            k = make_key('products', 'cat', 9, 'sweep', i)
+            cache.set(k, [1], 'products', depends_on=['products'], ttl=0.001)
+        time.sleep(0.002)
+        sweep_ms, swept = timed_ms(cache.sweep)
+        assert swept == 100, swept
+
+        legacy_ms, _ = timed_ms(legacy_substring_scan, cache, 'products:cat:10:')
+        mb = cache.get_stats()['memory_bytes'] / 1024 / 1024
+
+        print(f"{size:>10}{per_cat_ms:>10.3f}{deleted:>10}{table_ms:>10.3f}{expire_ms:>10.4f}"
+              f"{sweep_ms:>12.3f}{mb:>8.1f}{legacy_ms:>14.2f}")
+
+    # Límite de memoria: LRU por bytes
+    cache = SmartCache(max_entries=10 ** 6, max_bytes=2 * 1024 * 1024, sweep_interval=3600)
+    fill(cache, 50000)
+    stats = cache.get_stats()
+    print(f"\n📦 Límite 2MB: {stats['total_items']} entradas, {stats['memory_bytes'] / 1024:.0f}KB, "
+          f"{stats['evictions']} desalojos LRU")
+
+    # Hash estable: mismo resultado con kwargs en otro orden y sets
+    assert stable_hash((1, {3, 1, 2}), {'a': 1, 'b': 2}) == stable_hash((1, {2, 3, 1}), {'b': 2, 'a': 1})
+    print("✅ Hash de argumentos estable")
+
+
+if __name__ == "__main__":
+    main()
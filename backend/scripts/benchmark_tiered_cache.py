@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la caché de dos niveles (core/cache.py TieredCache)
+
+Usa el Redis falso en memoria (scripts/fake_redis.py) con latencia simulada
+y una "consulta MySQL" lenta para medir:
+  - cuántas veces se recalcula una clave cuando vence con N requests concurrentes
+  - latencia p50/p99 servida desde L1, L2 y en miss
+  - que se sirva el valor viejo cuando la base o Redis fallan
+  - hit ratio por prefijo
+
+Uso:
+    python scripts/benchmark_tiered_cache.py [requests_concurrentes] [latencia_db_ms]
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.cache import TieredCache
+from fake_redis import FakeAsyncRedis
+
+
+class SlowFakeRedis(FakeAsyncRedis):
+    """Redis falso con latencia de red y modo caído"""
+
+    def __init__(self, latency):
+        super().__init__()
+        self.latency = latency
+        self.down = False
+
+    async def get(self, key):
+        await asyncio.sleep(self.latency)
+        if self.down:
+            raise ConnectionError("Redis no disponible")
+        return await super().get(key)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+async def timed(coro):
+    start = time.perf_counter()
+    await coro
+    return (time.perf_counter() - start) * 1000
+
+
+async def main_async(concurrency, db_latency):
+    client = SlowFakeRedis(latency=0.001)
+    tc = TieredCache(l1_ttl=0.5, stale_ttl=60, redis_timeout=0.05, stale_grace=0.05)
+    state = {'queries': 0, 'fail': False}
+
+    async def load_menu():
+        state['queries'] += 1
+        await asyncio.sleep(db_latency)
+        if state['fail']:
+            raise RuntimeError("MySQL timeout")
+        return {'products': list(range(50)), 'version': state['queries']}
+
+    def get(key='products:cat:1:skip:0', ttl=2):
+        return tc.get_or_compute(key, load_menu, ttl, tags=['products', 'category:1'],
+                                 prefix='products:cat', client=client)
+
+    # 1. Estampida en frío: todas las requests llegan con la clave vacía
+    latencies = await asyncio.gather(*[timed(get()) for _ in range(concurrency)])
+    print(f"🧊 Miss en frío con {concurrency} requests: {state['queries']} consulta(s) a la base, "
+          f"p99 {percentile(latencies, 0.99):.1f}ms")
+    assert state['queries'] == 1
+
+    # 2. Hits en L1 y en L2
+    l1 = [await timed(get()) for _ in range(500)]
+    tc.clear()
+    l2 = [await timed(get()) for _ in range(1)]
+    print(f"⚡ L1 p50 {percentile(l1, 0.5) * 1000:.1f}µs  |  L2 {l2[0]:.2f}ms")
+
+    # 3. La clave vence con la base lenta: se sirve el valor viejo y se recalcula una vez
+    await asyncio.sleep(2.1)
+    tc.clear()
+    before = state['queries']
+    latencies = await asyncio.gather(*[timed(get()) for _ in range(concurrency)])
+    await asyncio.sleep(db_latency + 0.05)
+    print(f"⏳ Vencida con {concurrency} requests: {state['queries'] - before} recálculo(s), "
+          f"p99 {percentile(latencies, 0.99):.1f}ms (servido stale mientras recalcula)")
+    assert state['queries'] - before == 1
+
+    # 4. La base falla: se sigue sirviendo el último valor
+    await asyncio.sleep(2.1)
+    tc.clear()
+    state['fail'] = True
+    value = await get()
+    await asyncio.sleep(db_latency + 0.05)
+    state['fail'] = False
+    print(f"🛟 MySQL caído: servido valor versión {value['version']} (stale)")
+
+    # 5. Redis caído: L1 stale cubre las lecturas sin tocar la base
+    await get()
+    await asyncio.sleep(db_latency + 0.6)
+    client.down = True
+    before = state['queries']
+    value = await get()
+    client.down = False
+    print(f"🛟 Redis caído: servido desde L1 stale sin consultar la base "
+          f"({state['queries'] - before} consultas)")
+    assert state['queries'] == before
+
+    # 6. XFetch: con tráfico continuo la clave se refresca antes de vencer
+    tc_x = TieredCache(l1_ttl=0.05, stale_ttl=60, redis_timeout=0.05, beta=4.0)
+    xclient = SlowFakeRedis(latency=0.001)
+    calls = {'n': 0}
+
+    async def load_slow():
+        calls['n'] += 1
+        await asyncio.sleep(0.2)
+        return calls['n']
+
+    misses = 0
+    deadline = time.monotonic() + 3
+    await tc_x.get_or_compute('menu:digest', load_slow, 1, client=xclient)
+    while time.monotonic() < deadline:
+        latency = await timed(tc_x.get_or_compute('menu:digest', load_slow, 1, client=xclient))
+        if latency > 100:
+            misses += 1
+        await asyncio.sleep(0.01)
+    stats = tc_x.get_stats()['prefixes']['menu']
+    print(f"🔮 XFetch: {stats['early_refreshes']} refrescos anticipados, "
+          f"{misses} requests bloqueadas esperando a la base en 3s")
+
+    print("\n📊 Hit ratio por prefijo:")
+    for prefix, counters in tc.get_stats()['prefixes'].items():
+        print(f"   {prefix}: {counters}")
+
+
+def main():
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    db_latency = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.3
+    asyncio.run(main_async(concurrency, db_latency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Recalcular el modelo de maridajes (canasta de compras) desde order_items
+
+Uso:
+    python scripts/build_pairing_model.py [dias_de_historial] [producto_id]
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from complete_server import init_pool, execute_mysql_query
+from core.pairing_engine import pairing_engine, DEFAULT_MODEL_PATH
+
+
+def main():
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 365
+    sample_product = int(sys.argv[2]) if len(sys.argv) > 2 else None
+
+    print("🔄 Inicializando pool de conexiones...")
+    if not init_pool():
+        print("❌ No se pudo conectar a la base de datos")
+        sys.exit(1)
+
+    print(f"🧺 Calculando co-ocurrencias de los últimos {days} días...")
+    stats = pairing_engine.build_from_db(execute_mysql_query, days=days)
+    pairing_engine.save(DEFAULT_MODEL_PATH)
+
+    print(f"✅ Modelo listo ({stats['backend']}) en {stats['build_seconds']}s")
+    print(f"   Pedidos: {stats['orders']}")
+    print(f"   Productos: {stats['products']}")
+    print(f"   Pares: {stats['pairs']}")
+    print(f"   Archivo: {DEFAULT_MODEL_PATH}")
+
+    if sample_product is not None:
+        print(f"\n📊 Vecinos del producto {sample_product}:")
+        for n in pairing_engine.neighbours(sample_product):
+            print(f"  - {n['product_id']}: lift={n['lift']} confidence={n['confidence']} "
+                  f"support={n['support']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Servidor falso de Gemini para pruebas de carga sin cuota ni costo
+
+Implementa POST /v1beta/models/{modelo}:generateContent (el endpoint REST
+que usa google.generativeai con transport='rest') y responde según el tipo
+de prompt que arma complete_server:
+  - intención del chat (JSON con intent_type / response_text)
+  - maridajes (JSON con pairings tomados de la lista "ID|Nombre|...")
+  - sugerencia de ingredientes (JSON con suggestions)
+  - cualquier otro: texto libre
+
+La latencia sigue una distribución log-normal alrededor de FAKE_GEMINI_LATENCY
+para parecerse a la del modelo real. GET /stats devuelve las llamadas recibidas.
+
+Uso:
+    # Terminal 1: API falsa (latencia mediana 0.8s, 2% de errores 503)
+    FAKE_GEMINI_LATENCY=0.8 FAKE_GEMINI_ERROR_RATE=0.02 python scripts/fake_gemini_server.py 9200
+
+    # Terminal 2: servidor apuntando a la API falsa
+    GEMINI_API_KEY=fake GEMINI_API_ENDPOINT=http://localhost:9200 python complete_server.py
+"""
+import http.server
+import json
+import math
+import os
+import random
+import re
+import socketserver
+import sys
+import threading
+import time
+
+# Latencia mediana (segundos), dispersión log-normal y tasa de errores 503 simuladas
+LATENCY = float(os.environ.get('FAKE_GEMINI_LATENCY', 0.8))
+LATENCY_SIGMA = float(os.environ.get('FAKE_GEMINI_LATENCY_SIGMA', 0.35))
+ERROR_RATE = float(os.environ.get('FAKE_GEMINI_ERROR_RATE', 0.0))
+
+INTENTS = [
+    ('product_recommendations', 'Te muestro algunas opciones que te van a encantar:'),
+    ('general_inquiry', 'Tenemos opciones para todos los gustos, ¿buscás algo en particular?'),
+    ('greeting', '¡Hola! ¿Qué tenés ganas de comer hoy?'),
+    ('casual_conversation', '¡De nada! Cualquier cosa me avisás.'),
+]
+INTENT_WEIGHTS = [0.55, 0.25, 0.12, 0.08]
+
+PAIRING_TYPES = ['appetizer', 'side', 'wine', 'beverage', 'cocktail']
+
+rng = random.Random(int(os.environ.get('FAKE_GEMINI_SEED', 7)))
+rng_lock = threading.Lock()
+stats = {'requests': 0, 'errors': 0, 'by_kind': {}}
+stats_lock = threading.Lock()
+
+
+def prompt_text(body):
+    """Juntar system_instruction + contents en un solo texto"""
+    parts = []
+    for block in [body.get('systemInstruction') or body.get('system_instruction') or {}] + body.get('contents', []):
+        for part in block.get('parts', []):
+            parts.append(part.get('text', ''))
+    return '\n'.join(parts)
+
+
+def fake_answer(text):
+    """(tipo, texto de respuesta) según lo que pide el prompt"""
+    with rng_lock:
+        if '"intent_type"' in text:
+            intent, response_text = rng.choices(INTENTS, INTENT_WEIGHTS)[0]
+            return 'intent', json.dumps({
+                'intent_type': intent, 'target_product_id': None,
+                'response_text': response_text, 'confidence': str(rng.randint(70, 98)),
+            }, ensure_ascii=False)
+
+        if 'ID|Nombre' in text:
+            ids = re.findall(r'^(\d+)\|', text, re.MULTILINE)
+            chosen = rng.sample(ids, min(8, len(ids)))
+            return 'pairings', json.dumps({'pairings': [
+                {'product_id': int(product_id), 'reason': 'Combina muy bien', 'type': rng.choice(PAIRING_TYPES)}
+                for product_id in chosen
+            ]}, ensure_ascii=False)
+
+        if '"suggestions"' in text:
+            return 'ingredients', json.dumps({'suggestions': [
+                {'name': name, 'category': 'general', 'quantity': str(rng.randint(10, 300)),
+                 'unit': 'g', 'optional': False, 'reason': 'Base de la receta'}
+                for name in rng.sample(['Tomate', 'Cebolla', 'Ajo', 'Queso', 'Harina', 'Aceite de oliva', 'Albahaca'], 4)
+            ]}, ensure_ascii=False)
+
+        return 'text', rng.choice([
+            'OK',
+            'Te recomiendo probar nuestras especialidades de la casa.',
+            'Es una excelente elección, combina muy bien con un vino tinto.',
+        ])
+
+
+def sample_latency():
+    with rng_lock:
+        return LATENCY * math.exp(rng.gauss(0, LATENCY_SIGMA)) if LATENCY > 0 else 0
+
+
+class FakeGeminiHandler(http.server.BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        if ':generateContent' not in self.path:
+            self._send(404, {'error': {'code': 404, 'message': 'not found', 'status': 'NOT_FOUND'}})
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except json.JSONDecodeError:
+            self._send(400, {'error': {'code': 400, 'message': 'invalid JSON', 'status': 'INVALID_ARGUMENT'}})
+            return
+
+        text = prompt_text(body)
+        kind, answer = fake_answer(text)
+        time.sleep(sample_latency())
+
+        with rng_lock:
+            failed = rng.random() < ERROR_RATE
+        with stats_lock:
+            stats['requests'] += 1
+            stats['by_kind'][kind] = stats['by_kind'].get(kind, 0) + 1
+            if failed:
+                stats['errors'] += 1
+        if failed:
+            self._send(503, {'error': {'code': 503, 'message': 'The model is overloaded', 'status': 'UNAVAILABLE'}})
+            return
+
+        prompt_tokens = len(text) // 4
+        self._send(200, {
+            'candidates': [{
+                'content': {'parts': [{'text': answer}], 'role': 'model'},
+                'finishReason': 'STOP',
+                'index': 0,
+            }],
+            'usageMetadata': {
+                'promptTokenCount': prompt_tokens,
+                'candidatesTokenCount': len(answer) // 4,
+                'totalTokenCount': prompt_tokens + len(answer) // 4,
+            },
+        })
+
+    def do_GET(self):
+        if self.path == '/stats':
+            with stats_lock:
+                self._send(200, json.loads(json.dumps(stats)))
+        else:
+            self._send(404, {'error': {'code': 404, 'message': 'not found', 'status': 'NOT_FOUND'}})
+
+    def _send(self, status, payload):
+        data = json.dumps(payload, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadedServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 9200
+    server = ThreadedServer(('0.0.0.0', port), FakeGeminiHandler)
+    print(f"🤖 Gemini falso en http://localhost:{port} (latencia ~{LATENCY}s, errores {ERROR_RATE:.0%})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n👋 Detenido. Llamadas: {stats['requests']} ({stats['errors']} errores) {stats['by_kind']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Servidor falso de MercadoPago para probar la bandeja de webhooks en local
+
+Expone GET /v1/payments/{id} (lo que consulta fetch_payment) y puede
+disparar webhooks contra el servidor del restaurante, con re-entregas
+duplicadas, latencia y errores simulados.
+
+Uso:
+    # Terminal 1: API falsa
+    FAKE_MP_LATENCY=0.3 FAKE_MP_ERROR_RATE=0.2 python scripts/fake_mercadopago_server.py 9100
+
+    # Terminal 2: servidor apuntando a la API falsa
+    MP_API_BASE_URL=http://localhost:9100 python complete_server.py
+
+    # Terminal 3: enviar webhooks para las órdenes 1..50 (3 entregas por pago)
+    python scripts/fake_mercadopago_server.py 9100 send http://localhost:9002 1 50 3
+"""
+import http.server
+import json
+import os
+import random
+import socketserver
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+# Latencia (segundos) y tasa de errores 500 simuladas
+LATENCY = float(os.environ.get('FAKE_MP_LATENCY', 0.1))
+ERROR_RATE = float(os.environ.get('FAKE_MP_ERROR_RATE', 0.0))
+
+# Los payment ids del fake se derivan de la orden: 9000000 + order_id
+PAYMENT_ID_OFFSET = 9000000
+
+payments = {}
+payments_lock = threading.Lock()
+stats = {'requests': 0, 'errors': 0}
+
+
+def make_payment(order_id, status='approved'):
+    payment_id = PAYMENT_ID_OFFSET + int(order_id)
+    return {
+        'id': payment_id,
+        'status': status,
+        'status_detail': 'accredited' if status == 'approved' else status,
+        'external_reference': str(order_id),
+        'transaction_amount': 1.0,
+        'payment_method_id': 'account_money',
+        'payer': {'email': 'test_user@testuser.com'},
+    }
+
+
+class FakeMercadoPagoHandler(http.server.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        stats['requests'] += 1
+        if not self.path.startswith('/v1/payments/'):
+            self._send(404, {'message': 'not_found'})
+            return
+
+        time.sleep(LATENCY)
+        if random.random() < ERROR_RATE:
+            stats['errors'] += 1
+            self._send(500, {'message': 'internal_error'})
+            return
+
+        payment_id = self.path.rsplit('/', 1)[-1]
+        with payments_lock:
+            payment = payments.get(payment_id)
+        if payment is None and payment_id.isdigit() and int(payment_id) > PAYMENT_ID_OFFSET:
+            # Pago desconocido: se asume aprobado para la orden derivada del id
+            payment = make_payment(int(payment_id) - PAYMENT_ID_OFFSET)
+        if payment is None:
+            self._send(404, {'message': 'Payment not found'})
+            return
+        self._send(200, payment)
+
+    def do_POST(self):
+        # Registrar un pago: {"order_id": 12, "status": "approved"}
+        content_length = int(self.headers.get('Content-Length', 0))
+        data = json.loads(self.rfile.read(content_length) or b'{}')
+        payment = make_payment(data['order_id'], data.get('status', 'approved'))
+        with payments_lock:
+            payments[str(payment['id'])] = payment
+        self._send(201, payment)
+
+    def _send(self, code, body):
+        payload = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadedServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def send_webhooks(target, first_order, last_order, deliveries):
+    """Disparar webhooks (con duplicados) y medir el tiempo de respuesta del ack"""
+    url = f"{target.rstrip('/')}/api/webhooks/mercadopago"
+    latencies = []
+    codes = {}
+
+    events = []
+    for order_id in range(first_order, last_order + 1):
+        events.extend([PAYMENT_ID_OFFSET + order_id] * deliveries)
+    random.shuffle(events)
+
+    for payment_id in events:
+        body = json.dumps({'type': 'payment', 'action': 'payment.updated',
+                           'data': {'id': str(payment_id)}}).encode()
+        request = urllib.request.Request(url, data=body, method='POST',
+                                         headers={'Content-Type': 'application/json'})
+        start = time.time()
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:
+                code = response.status
+        except urllib.error.HTTPError as e:
+            code = e.code
+        except Exception:
+            code = 'error'
+        latencies.append((time.time() - start) * 1000)
+        codes[code] = codes.get(code, 0) + 1
+
+    latencies.sort()
+    print(f"📨 {len(events)} webhooks enviados a {url}")
+    print(f"   Códigos: {codes}")
+    print(f"   Ack p50: {latencies[len(latencies) // 2]:.1f}ms  "
+          f"p99: {latencies[int(len(latencies) * 0.99) - 1]:.1f}ms")
+
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 9100
+
+    if len(sys.argv) > 2 and sys.argv[2] == 'send':
+        target = sys.argv[3] if len(sys.argv) > 3 else 'http://localhost:9002'
+        first_order = int(sys.argv[4]) if len(sys.argv) > 4 else 1
+        last_order = int(sys.argv[5]) if len(sys.argv) > 5 else 20
+        deliveries = int(sys.argv[6]) if len(sys.argv) > 6 else 2
+        send_webhooks(target, first_order, last_order, deliveries)
+        return
+
+    print(f"💳 MercadoPago falso en http://localhost:{port} "
+          f"(latencia {LATENCY}s, errores {ERROR_RATE:.0%})")
+    with ThreadedServer(("0.0.0.0", port), FakeMercadoPagoHandler) as httpd:
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            print(f"\n👋 Detenido. Requests: {stats['requests']}, errores simulados: {stats['errors']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Redis falso en memoria (API de redis.asyncio) para probar la caché sin servidor
+
+Implementa el subconjunto de comandos que usan core/cache.py y
+api/products_optimized.py: strings con TTL, sets, RENAME, SCAN/SSCAN,
+UNLINK y pipelines. Cuenta cuántas claves toca cada comando para poder
+comparar el costo de invalidar por tags contra KEYS/SCAN del keyspace.
+
+Uso:
+    # Verificar la invalidación por tags y medirla contra KEYS
+    python scripts/fake_redis.py [entradas_por_categoria] [categorias]
+"""
+import asyncio
+import fnmatch
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeResponseError(Exception):
+    """Equivalente a redis.exceptions.ResponseError"""
+
+
+class FakeAsyncRedis:
+    """Cliente falso compatible con redis.asyncio.Redis (decode_responses=True)"""
+
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        # Claves examinadas por comando, para medir el costo de invalidar
+        self.touched = 0
+        self.commands = 0
+
+    # ---- helpers internos ----
+
+    def _alive(self, key):
+        deadline = self.expires.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+    def _remove(self, key):
+        self.expires.pop(key, None)
+        return self.data.pop(key, None) is not None
+
+    # ---- strings ----
+
+    async def get(self, key):
+        self.commands += 1
+        self.touched += 1
+        if not self._alive(key):
+            return None
+        value = self.data[key]
+        if isinstance(value, set):
+            raise FakeResponseError("WRONGTYPE")
+        return value
+
+    async def set(self, key, value, ex=None, nx=False):
+        self.commands += 1
+        self.touched += 1
+        if nx and self._alive(key):
+            return None
+        self.data[key] = str(value)
+        self.expires.pop(key, None)
+        if ex:
+            self.expires[key] = time.monotonic() + ex
+        return True
+
+    async def setex(self, key, ttl, value):
+        return await self.set(key, value, ex=ttl)
+
+    async def incr(self, key):
+        self.commands += 1
+        self.touched += 1
+        value = int(self.data.get(key, 0)) + 1 if self._alive(key) else 1
+        self.data[key] = str(value)
+        return value
+
+    # ---- claves ----
+
+    async def delete(self, *keys):
+        self.commands += 1
+        self.touched += len(keys)
+        return sum(1 for key in keys if self._alive(key) and self._remove(key))
+
+    async def unlink(self, *keys):
+        return await self.delete(*keys)
+
+    async def exists(self, *keys):
+        self.commands += 1
+        return sum(1 for key in keys if self._alive(key))
+
+    async def expire(self, key, ttl):
+        self.commands += 1
+        self.touched += 1
+        if not self._alive(key):
+            return False
+        self.expires[key] = time.monotonic() + ttl
+        return True
+
+    async def ttl(self, key):
+        self.commands += 1
+        if not self._alive(key):
+            return -2
+        deadline = self.expires.get(key)
+        return -1 if deadline is None else max(0, int(deadline - time.monotonic()))
+
+    async def rename(self, src, dst):
+        self.commands += 1
+        self.touched += 1
+        if not self._alive(src):
+            raise FakeResponseError("ERR no such key")
+        self.data[dst] = self.data.pop(src)
+        if src in self.expires:
+            self.expires[dst] = self.expires.pop(src)
+        else:
+            self.expires.pop(dst, None)
+        return True
+
+    async def keys(self, pattern="*"):
+        self.commands += 1
+        self.touched += len(self.data)
+        return [key for key in list(self.data) if fnmatch.fnmatchcase(key, pattern) and self._alive(key)]
+
+    async def scan_iter(self, match="*", count=None):
+        self.commands += 1
+        for key in list(self.data):
+            self.touched += 1
+            if fnmatch.fnmatchcase(key, match) and self._alive(key):
+                yield key
+
+    # ---- sets ----
+
+    async def sadd(self, key, *members):
+        self.commands += 1
+        self.touched += 1
+        current = self.data.get(key) if self._alive(key) else None
+        if current is None:
+            current = self.data[key] = set()
+        before = len(current)
+        current.update(members)
+        return len(current) - before
+
+    async def srem(self, key, *members):
+        self.commands += 1
+        if not self._alive(key):
+            return 0
+        current = self.data[key]
+        before = len(current)
+        current.difference_update(members)
+        if not current:
+            self._remove(key)
+        return before - len(current)
+
+    async def smembers(self, key):
+        self.commands += 1
+        if not self._alive(key):
+            return set()
+        self.touched += len(self.data[key])
+        return set(self.data[key])
+
+    async def sscan(self, key, cursor=0, match=None, count=10):
+        self.commands += 1
+        if not self._alive(key):
+            return 0, []
+        members = sorted(self.data[key])
+        batch = members[cursor:cursor + count]
+        self.touched += len(batch)
+        next_cursor = cursor + count if cursor + count < len(members) else 0
+        return next_cursor, batch
+
+    # ---- conexión ----
+
+    async def ping(self):
+        return True
+
+    async def close(self):
+        pass
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    """Pipeline que encola comandos y los ejecuta en execute()"""
+
+    def __init__(self, client):
+        self.client = client
+        self.queued = []
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+
+        def queue(*args, **kwargs):
+            self.queued.append((method, args, kwargs))
+            return self
+        return queue
+
+    async def execute(self):
+        results = []
+        for method, args, kwargs in self.queued:
+            results.append(await method(*args, **kwargs))
+        self.queued = []
+        return results
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.queued = []
+
+
+async def check_tag_invalidation(per_category, categories):
+    from core.cache import set_with_tags, invalidate_tags, tag_key
+
+    client = FakeAsyncRedis()
+    for category_id in range(1, categories + 1):
+        for page in range(per_category):
+            key = f"products:cat:{category_id}:skip:{page * 50}:limit:50:variants:False"
+            await set_with_tags(client, key, '{"products": []}', 60,
+                                ["products", f"category:{category_id}"])
+    await set_with_tags(client, "categories:counts:True", "[]", 300, ["categories"])
+    total_keys = len(client.data)
+    print(f"🗄️  {total_keys} claves en el Redis falso ({categories} categorías x {per_category} páginas)")
+
+    # Invalidar una sola categoría por tag
+    client.touched = 0
+    start = time.perf_counter()
+    deleted = await invalidate_tags(client, "category:1")
+    elapsed = (time.perf_counter() - start) * 1000
+    assert deleted == per_category, deleted
+    assert not any(k.startswith("products:cat:1:") for k in client.data)
+    assert any(k.startswith("products:cat:2:") for k in client.data)
+    assert "categories:counts:True" in client.data
+    print(f"🏷️  Tag category:1 -> {deleted} claves borradas, {client.touched} claves tocadas, {elapsed:.2f}ms")
+
+    # Mismo trabajo con KEYS (comportamiento anterior)
+    client.touched = 0
+    start = time.perf_counter()
+    keys = await client.keys("products:cat:2:*")
+    await client.delete(*keys)
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"🐢 KEYS products:cat:2:* -> {len(keys)} claves borradas, {client.touched} claves tocadas, {elapsed:.2f}ms")
+
+    # Invalidar un tag vacío o inexistente no falla
+    assert await invalidate_tags(client, "category:999") == 0
+
+    # Borrar todo el catálogo
+    deleted = await invalidate_tags(client, "products", "categories")
+    leftover = [k for k in client.data if not k.startswith("tag:category:")]
+    assert not leftover, leftover[:5]
+    assert tag_key("products") not in client.data
+    print(f"🧹 Tags products+categories -> {deleted} claves borradas")
+    print("✅ Invalidación por tags verificada")
+
+
+def main():
+    per_category = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    categories = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    asyncio.run(check_tag_invalidation(per_category, categories))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Generar variantes WebP/JPEG (thumb/card/detail) de las fotos de productos
+
+Modos:
+    # Probar el pipeline con un archivo local (sin base de datos): escribe en
+    # static/products/variants/ y muestra tamaños y tiempos
+    python scripts/generate_image_variants.py archivo foto.jpg
+
+    # Backfill: descargar la image_url de cada producto y generar sus variantes
+    # (usa IMAGE_STORAGE_TYPE=s3|local como complete_server)
+    python scripts/generate_image_variants.py backfill [limite] [workers]
+"""
+import os
+import sys
+import time
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.image_pipeline import (
+    ImagePipeline, LocalImageStorage, render_variants, slugify, source_hash, PIL_AVAILABLE
+)
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PRODUCTS_IMG_DIR = os.path.join(BACKEND_DIR, 'static', 'products')
+
+
+def process_file(path):
+    with open(path, 'rb') as f:
+        image_bytes = f.read()
+
+    pipeline = ImagePipeline(LocalImageStorage(PRODUCTS_IMG_DIR, '/static/products'))
+    start = time.perf_counter()
+    manifest = pipeline.process_sync(os.path.splitext(os.path.basename(path))[0], image_bytes)
+    elapsed = (time.perf_counter() - start) * 1000
+
+    print(f"🖼️ {path}: {len(image_bytes) / 1024:.0f}KB original, {elapsed:.0f}ms")
+    for name, variant in manifest['variants'].items():
+        print(f"   {name:<7} {variant['width']:>5}x{variant['height']:<5} "
+              f"webp {variant['webp_bytes'] / 1024:>6.1f}KB  jpeg {variant['jpeg_bytes'] / 1024:>6.1f}KB  {variant['webp']}")
+    print(f"   srcset webp: {manifest['srcset']['webp']}")
+
+
+def download(url, timeout=15):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return response.read()
+
+
+def backfill(limit, workers):
+    from complete_server import init_pool, execute_mysql_query, image_pipeline, image_variant_store
+
+    if not init_pool():
+        print("❌ No se pudo conectar a la base de datos")
+        return
+    image_variant_store.ensure_table()
+    image_variant_store.load()
+
+    products = execute_mysql_query(
+        "SELECT id, name, image_url FROM products WHERE image_url IS NOT NULL AND image_url != '' "
+        "ORDER BY id LIMIT %s", (limit,)
+    ) or []
+    print(f"📦 {len(products)} productos con imagen, {workers} procesos")
+
+    pending = {}
+    skipped = failed = done = 0
+    start = time.time()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for product in products:
+            try:
+                image_bytes = download(product['image_url'])
+            except Exception as e:
+                print(f"   ⚠️ {product['id']} {product['name']}: no se pudo descargar ({e})")
+                failed += 1
+                continue
+            digest = source_hash(image_bytes)
+            current = image_variant_store.get(product['id'])
+            if current and current.get('hash') == digest:
+                skipped += 1
+                continue
+            pending[pool.submit(render_variants, image_bytes)] = (product, digest)
+
+        for future in as_completed(pending):
+            product, digest = pending[future]
+            try:
+                manifest = image_pipeline.store_variants(slugify(product['name']), digest, future.result())
+                image_variant_store.save(product['id'], manifest, image_url=manifest['full'])
+                done += 1
+            except Exception as e:
+                print(f"   ❌ {product['id']} {product['name']}: {e}")
+                failed += 1
+
+    print(f"✅ {done} generados, {skipped} sin cambios, {failed} con error en {time.time() - start:.1f}s")
+
+
+def main():
+    if not PIL_AVAILABLE:
+        print("❌ Pillow no está instalado: pip install Pillow")
+        sys.exit(1)
+
+    mode = sys.argv[1] if len(sys.argv) > 1 else 'backfill'
+    if mode == 'archivo':
+        process_file(sys.argv[2])
+    else:
+        limit = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+        workers = int(sys.argv[3]) if len(sys.argv) > 3 else os.cpu_count() or 2
+        backfill(limit, workers)
+
+
+if __name__ == "__main__":
+    main()
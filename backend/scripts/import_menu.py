@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Importar un menú completo desde CSV / JSON / NDJSON
+
+Usa core/menu_import.py: lectura en streaming por lotes, una sola precarga de
+categorías/subcategorías/productos y un INSERT ... ON DUPLICATE KEY UPDATE
+multi-fila por lote. Los productos se identifican por categoría + nombre:
+los existentes se actualizan y los nuevos se crean.
+
+Uso:
+    python scripts/import_menu.py menu.csv
+    python scripts/import_menu.py menu.json --lote 1000
+    python scripts/import_menu.py menu.ndjson --dry-run
+    python scripts/import_menu.py menu.csv --sin-actualizar   # solo agrega nuevos
+
+Formato CSV (separador , ; o tab):
+    nombre,precio,categoria,subcategoria,descripcion,imagen,disponible
+    Milanesa Napolitana,8500,Carnes,Milanesas,Con jamón y queso,,1
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.menu_import import MenuImporter, MenuImportError, DEFAULT_BATCH_SIZE
+
+
+def print_progress(stats):
+    print(f"   📦 lote {stats['batches']}: {stats['read']} leídos, {stats['inserted']} nuevos, "
+          f"{stats['updated']} actualizados, {stats['invalid']} inválidos "
+          f"- {stats['rows_per_sec']:.0f} registros/s")
+
+
+def main():
+    args = sys.argv[1:]
+    if not args or args[0].startswith('--'):
+        print(__doc__)
+        sys.exit(1)
+
+    path = args[0]
+    batch_size = DEFAULT_BATCH_SIZE
+    dry_run = '--dry-run' in args
+    update_existing = '--sin-actualizar' not in args
+    if '--lote' in args:
+        batch_size = int(args[args.index('--lote') + 1])
+
+    import mysql.connector
+    from complete_server import MYSQL_CONFIG
+
+    importer = MenuImporter(
+        get_connection=lambda: mysql.connector.connect(**MYSQL_CONFIG),
+        batch_size=batch_size,
+        dry_run=dry_run,
+        update_existing=update_existing,
+        progress=print_progress,
+    )
+
+    print(f"🚀 Importando {path} (lotes de {batch_size}{', DRY-RUN sin escribir' if dry_run else ''})")
+    try:
+        stats = importer.import_file(path)
+    except MenuImportError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+    print(f"\n✅ {stats['read']} registros en {stats['elapsed']:.2f}s ({stats['rows_per_sec']:.0f}/s)")
+    print(f"   • Productos nuevos: {stats['inserted']}")
+    print(f"   • Productos actualizados: {stats['updated']}")
+    if not update_existing:
+        print(f"   • Existentes sin tocar: {stats['unchanged']}")
+    print(f"   • Categorías creadas: {stats['categories_created']}")
+    print(f"   • Subcategorías creadas: {stats['subcategories_created']}")
+    print(f"   • Consultas a la base: {stats['queries']} en {stats['batches']} lotes")
+    if importer.errors:
+        print(f"\n⚠️ {len(importer.errors)} registros inválidos:")
+        for number, error in importer.errors[:20]:
+            print(f"   línea {number}: {error}")
+        if len(importer.errors) > 20:
+            print(f"   ... y {len(importer.errors) - 20} más")
+    if dry_run:
+        print("\nℹ️ Dry-run: no se escribió nada en la base de datos")
+
+
+if __name__ == "__main__":
+    main()
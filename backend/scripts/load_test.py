@@ -0,0 +1,771 @@
+#!/usr/bin/env python3
+"""
+Prueba de carga sintética de complete_server
+
+Tres pasos, pensados para correr igual en cada commit y comparar resultados:
+
+  seed     Carga un dataset reproducible (semilla fija) en una base MySQL
+           LOCAL: categorías y productos a partir de las plantillas de
+           expand_products_1000, ingredientes y recetas, clientes, mesas,
+           historial de órdenes con items y la cola de cocina abierta.
+  run      Usuarios virtuales con la mezcla de tráfico del salón: tablets de
+           mozos, pantallas de cocina, chat del menú (con Gemini falso) y
+           dashboards. Mide p50/p95/p99, throughput y errores por ruta, y
+           las consultas a la base por request leyendo /metrics.
+  compare  Diferencia entre dos reportes JSON (p. ej. antes/después de un commit).
+
+Las consultas por ruta se miden con un perfilado secuencial antes de la carga
+(una llamada en frío y otra en caliente por ruta). Requiere WORKERS=1: con
+pre-fork cada worker tiene su propio /metrics y el reporte lo marca como no
+confiable.
+
+Durante la carga se lee además el header Server-Timing de cada respuesta
+(core/request_timing.py): consultas por request (promedio y máximo por ruta)
+y requests que superaron el presupuesto de consultas de su ruta. Si alguno lo
+superó, `run` termina con código 2: en CI un N+1 nuevo rompe el build.
+
+Uso:
+    # 1. Base local con el esquema de gastro + dataset (small | medium | large)
+    MYSQL_HOST=127.0.0.1 MYSQL_PORT=3306 MYSQL_USER=root MYSQL_PASSWORD=root MYSQL_DATABASE=gastro_load \\
+        python scripts/load_test.py seed medium [semilla] [reset]
+
+    # 2. Gemini falso + servidor contra la misma base
+    python scripts/fake_gemini_server.py 9200
+    GEMINI_API_KEY=fake GEMINI_API_ENDPOINT=http://localhost:9200 MYSQL_HOST=127.0.0.1 ... python complete_server.py
+
+    # 3. 60 segundos con 40 usuarios virtuales (LOADTEST_THINK_SCALE=0 para máxima presión)
+    python scripts/load_test.py run http://localhost:9002 60 40 reports/load_$(git rev-parse --short HEAD).json
+
+    # 4. Comparar dos corridas
+    python scripts/load_test.py compare reports/load_abc123.json reports/load_def456.json
+"""
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlparse, urlencode
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SEED = 42
+BATCH = 2000
+REQUEST_TIMEOUT = 30
+# Variación porcentual de p95/throughput a partir de la cual compare marca la ruta
+REGRESSION_THRESHOLD = 0.10
+
+SCALES = {
+    'small': {'products': 300, 'customers': 500, 'tables': 30, 'orders': 5000, 'kitchen_orders': 40},
+    'medium': {'products': 1000, 'customers': 5000, 'tables': 60, 'orders': 50000, 'kitchen_orders': 120},
+    'large': {'products': 3000, 'customers': 50000, 'tables': 120, 'orders': 500000, 'kitchen_orders': 300},
+}
+
+# Solo se siembra en bases locales (los scripts viejos apuntan por defecto a la base de Aiven)
+LOCAL_HOSTS = ('localhost', '127.0.0.1', '::1', 'mysql', 'db')
+
+INGREDIENTS = [
+    ('Aceite de oliva', 0.02), ('Sal', 0.001), ('Pimienta negra', 0.03), ('Ajo', 0.01), ('Limón', 1.50),
+    ('Cebolla', 0.004), ('Zanahoria', 0.003), ('Apio', 0.005), ('Caldo de pollo', 0.02), ('Lechuga', 0.006),
+    ('Tomate', 0.005), ('Vinagre balsámico', 0.06), ('Pasta', 0.004), ('Parmesano', 0.03), ('Harina', 0.002),
+    ('Mozzarella', 0.015), ('Orégano', 0.05), ('Carne de res', 0.025), ('Romero', 0.14), ('Pollo', 0.012),
+    ('Tomillo', 0.16), ('Salmón', 0.028), ('Perejil', 0.02), ('Camarones', 0.032), ('Vino blanco', 0.05),
+    ('Azúcar', 0.0015), ('Huevo', 0.25), ('Manteca', 0.012), ('Chocolate', 0.012), ('Agua', 0.001),
+]
+
+STATIONS = ['grill', 'salads', 'desserts', 'drinks', 'fryer', 'general']
+FIRST_NAMES = ['Juan', 'María', 'Lucía', 'Martín', 'Sofía', 'Diego', 'Valentina', 'Lucas', 'Camila', 'Mateo']
+LAST_NAMES = ['González', 'Rodríguez', 'Fernández', 'López', 'Martínez', 'García', 'Pérez', 'Sánchez', 'Romero']
+# Horas de las órdenes del historial: picos de almuerzo y cena
+ORDER_HOURS = [11, 12, 12, 13, 13, 13, 14, 15, 19, 20, 20, 21, 21, 21, 22, 22, 23]
+
+
+# ============================================================
+# SEED
+# ============================================================
+
+def insert_batches(cursor, query, rows):
+    for start in range(0, len(rows), BATCH):
+        cursor.executemany(query, rows[start:start + BATCH])
+
+
+def next_id(cursor, table):
+    cursor.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {table}")
+    return cursor.fetchone()[0]
+
+
+def seed(scale_name, seed_value, reset):
+    import mysql.connector
+    from complete_server import MYSQL_CONFIG
+    from core.schema_bootstrap import SchemaBootstrap, print_report
+    from core.product_costs import recompute_all
+    from scripts.expand_products_1000 import PRODUCT_TEMPLATES
+
+    scale = SCALES[scale_name]
+    if MYSQL_CONFIG['host'] not in LOCAL_HOSTS and os.environ.get('LOADTEST_ALLOW_REMOTE') != '1':
+        print(f"❌ {MYSQL_CONFIG['host']} no es una base local. Configurar MYSQL_HOST "
+              f"(o LOADTEST_ALLOW_REMOTE=1 si realmente es una base descartable)")
+        sys.exit(1)
+
+    connect = lambda **extra: mysql.connector.connect(**MYSQL_CONFIG, connect_timeout=20, **extra)
+    print(f"🧱 Migraciones de esquema en {MYSQL_CONFIG['host']}/{MYSQL_CONFIG['database']}...")
+    print_report(SchemaBootstrap(get_connection=lambda: connect(autocommit=True)).run())
+
+    rng = random.Random(seed_value)
+    connection = connect()
+    cursor = connection.cursor()
+    start = time.perf_counter()
+    try:
+        if reset:
+            print("🧹 Vaciando tablas del dataset...")
+            cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+            for table in ('kitchen_queue_items', 'order_items', 'orders', 'product_ingredients',
+                          'products', 'ingredients', 'customers', 'tables'):
+                cursor.execute(f"DELETE FROM {table}")
+            cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+            connection.commit()
+
+        # Categorías de las plantillas
+        cursor.execute("SELECT id, name FROM categories")
+        categories = {name: category_id for category_id, name in cursor.fetchall()}
+        for name in PRODUCT_TEMPLATES:
+            if name not in categories:
+                cursor.execute("INSERT INTO categories (name, is_active) VALUES (%s, 1)", (name,))
+                categories[name] = cursor.lastrowid
+
+        # Productos: se recorren las plantillas y las vueltas siguientes llevan sufijo
+        templates = [(category, item) for category, items in PRODUCT_TEMPLATES.items() for item in items]
+        product_id = next_id(cursor, 'products')
+        products = []
+        for i in range(scale['products']):
+            category, (name, description, price) = templates[i % len(templates)]
+            round_number = i // len(templates)
+            products.append((
+                product_id + i,
+                name if round_number == 0 else f"{name} ({round_number + 1})",
+                round(price * rng.uniform(0.85, 1.25), 2),
+                description,
+                categories[category],
+            ))
+        insert_batches(cursor, """
+            INSERT INTO products (id, name, price, description, category_id, available)
+            VALUES (%s, %s, %s, %s, %s, 1)
+        """, products)
+        print(f"🍽️ {len(products)} productos")
+
+        # Ingredientes y recetas (3-8 por producto)
+        ingredient_ids = []
+        for name, cost in INGREDIENTS:
+            cursor.execute("SELECT id FROM ingredients WHERE name = %s", (name,))
+            row = cursor.fetchone()
+            if row:
+                ingredient_ids.append(row[0])
+            else:
+                cursor.execute("INSERT INTO ingredients (name, cost_per_unit) VALUES (%s, %s)", (name, cost))
+                ingredient_ids.append(cursor.lastrowid)
+        recipes = [
+            (product[0], ingredient_id, rng.randint(10, 400))
+            for product in products
+            for ingredient_id in rng.sample(ingredient_ids, rng.randint(3, 8))
+        ]
+        insert_batches(cursor, """
+            INSERT IGNORE INTO product_ingredients (product_id, ingredient_id, quantity)
+            VALUES (%s, %s, %s)
+        """, recipes)
+        recompute_all(cursor, [product[0] for product in products])
+        print(f"🧂 {len(recipes)} relaciones producto-ingrediente")
+
+        # Clientes
+        customer_id = next_id(cursor, 'customers')
+        customers = [
+            (customer_id + i, rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES),
+             f"11{rng.randint(40000000, 69999999)}", f"cliente{customer_id + i}@loadtest.local",
+             str(20000000 + customer_id + i))
+            for i in range(scale['customers'])
+        ]
+        insert_batches(cursor, """
+            INSERT INTO customers (id, first_name, last_name, phone, email, dni, created_at)
+            VALUES (%s, %s, %s, %s, %s, %s, NOW())
+        """, customers)
+        print(f"👥 {len(customers)} clientes")
+
+        # Mesas en grilla
+        tables = [
+            (number, rng.choice([2, 4, 4, 6, 8]), 'Salón', 'available',
+             100 + (number - 1) % 10 * 110, 100 + (number - 1) // 10 * 110, 80, 80, 0,
+             rng.choice(['square', 'round']))
+            for number in range(1, scale['tables'] + 1)
+        ]
+        insert_batches(cursor, """
+            INSERT IGNORE INTO tables (number, capacity, location, status, x, y, width, height, rotation, shape)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """, tables)
+        print(f"🪑 {len(tables)} mesas")
+
+        # Historial de órdenes de los últimos 90 días (ids explícitos para poder armar los items)
+        order_id = next_id(cursor, 'orders')
+        item_id = first_item_id = next_id(cursor, 'order_items')
+        now = datetime.now().replace(microsecond=0)
+        open_from = scale['orders'] - scale['kitchen_orders']
+        orders, items, kitchen = [], [], []
+        for i in range(scale['orders']):
+            current_id = order_id + i
+            is_open = i >= open_from
+            if is_open:
+                created = now - timedelta(minutes=rng.randint(1, 45))
+                status = rng.choice(['pending', 'preparing'])
+            else:
+                created = (now - timedelta(days=rng.randint(1, 90))).replace(
+                    hour=rng.choice(ORDER_HOURS), minute=rng.randint(0, 59), second=rng.randint(0, 59))
+                status = rng.choice(['delivered'] * 8 + ['cancelled'])
+            table_number = rng.randint(1, scale['tables'])
+            subtotal = 0
+            for _ in range(rng.randint(1, 5)):
+                product = rng.choice(products)
+                quantity = rng.randint(1, 3)
+                subtotal += product[2] * quantity
+                items.append((item_id, current_id, product[0], quantity, product[2], ''))
+                if is_open:
+                    kitchen.append((current_id, item_id, product[1], quantity, rng.choice(STATIONS),
+                                    rng.choice(['new', 'new', 'viewed', 'preparing']), table_number, 'Mozo', created))
+                item_id += 1
+            subtotal = round(subtotal, 2)
+            tax = round(subtotal * 0.21, 2)
+            orders.append((current_id, table_number, rng.choice(customers)[0] if rng.random() < 0.3 else None,
+                           status, 'pending' if is_open else 'paid', subtotal, tax, round(subtotal + tax, 2), created))
+
+            if len(items) >= BATCH * 5:
+                flush_orders(cursor, orders, items)
+                orders, items = [], []
+                connection.commit()
+                print(f"   🧾 {i + 1}/{scale['orders']} órdenes...")
+        flush_orders(cursor, orders, items)
+        insert_batches(cursor, """
+            INSERT INTO kitchen_queue_items (
+                order_id, order_item_id, product_name, quantity, station, status,
+                table_number, waiter_name, created_at
+            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """, kitchen)
+        connection.commit()
+        print(f"🧾 {scale['orders']} órdenes, {item_id - first_item_id} items, "
+              f"{len(kitchen)} items en cocina")
+        print(f"✅ Dataset '{scale_name}' (semilla {seed_value}) cargado en {time.perf_counter() - start:.1f}s")
+    except Exception as e:
+        connection.rollback()
+        print(f"💥 Error sembrando la base: {e}")
+        sys.exit(1)
+    finally:
+        cursor.close()
+        connection.close()
+
+
+def flush_orders(cursor, orders, items):
+    insert_batches(cursor, """
+        INSERT INTO orders (id, table_number, customer_id, waiter_id, status, payment_status,
+                            subtotal, tax, total, created_at)
+        VALUES (%s, %s, %s, 1, %s, %s, %s, %s, %s, %s)
+    """, orders)
+    insert_batches(cursor, """
+        INSERT INTO order_items (id, order_id, product_id, quantity, price, notes)
+        VALUES (%s, %s, %s, %s, %s, %s)
+    """, items)
+
+
+# ============================================================
+# CLIENTE Y REGISTRO DE LATENCIAS
+# ============================================================
+
+class Client:
+    """HTTP mínimo sobre http.client (el servidor cierra la conexión en cada request)"""
+
+    def __init__(self, base_url):
+        parsed = urlparse(base_url)
+        self.host = parsed.hostname
+        self.port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+        self.connection_class = http.client.HTTPSConnection if parsed.scheme == 'https' else http.client.HTTPConnection
+
+    def request(self, method, path, body=None, headers=None):
+        connection = self.connection_class(self.host, self.port, timeout=REQUEST_TIMEOUT)
+        headers = dict(headers or {})
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+        start = time.perf_counter()
+        try:
+            connection.request(method, path, body=payload, headers=headers)
+            response = connection.getresponse()
+            data = response.read()
+            return response.status, data, dict(response.getheaders()), time.perf_counter() - start
+        finally:
+            connection.close()
+
+    def get_json(self, path):
+        status, data, _, _ = self.request('GET', path)
+        return json.loads(data) if status == 200 else None
+
+
+def parse_server_timing(header):
+    """'db;dur=3.1;desc="2 queries", app;dur=9' -> {'db': {'dur': 3.1, 'desc': '2 queries'}, 'app': {'dur': 9.0}}"""
+    metrics = {}
+    for entry in (header or '').split(','):
+        name, *params = [part.strip() for part in entry.split(';')]
+        if not name:
+            continue
+        values = {}
+        for param in params:
+            key, _, value = param.partition('=')
+            value = value.strip('"')
+            values[key] = float(value) if key == 'dur' else value
+        metrics[name] = values
+    return metrics
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}
+
+    def record(self, route, elapsed, status, server_timing=None):
+        timing = parse_server_timing(server_timing) if server_timing else {}
+        queries = timing.get('db', {}).get('desc', '').split(' ')[0]
+        with self.lock:
+            entry = self.routes.setdefault(route, {'latencies': [], 'status': {}, 'errors': 0,
+                                                   'queries': [], 'over_budget': 0})
+            entry['latencies'].append(elapsed)
+            entry['status'][str(status)] = entry['status'].get(str(status), 0) + 1
+            if status == 'exception' or (isinstance(status, int) and status >= 500):
+                entry['errors'] += 1
+            if queries.isdigit():
+                entry['queries'].append(int(queries))
+            if 'budget' in timing:
+                entry['over_budget'] += 1
+
+
+def percentile(sorted_values, fraction):
+    """Percentil por rango más cercano"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, duration):
+    values = sorted(latencies)
+    to_ms = lambda value: round(value * 1000, 2) if value is not None else None
+    return {
+        'requests': len(values),
+        'throughput_rps': round(len(values) / duration, 2) if duration else None,
+        'mean_ms': to_ms(sum(values) / len(values)) if values else None,
+        'p50_ms': to_ms(percentile(values, 0.50)),
+        'p95_ms': to_ms(percentile(values, 0.95)),
+        'p99_ms': to_ms(percentile(values, 0.99)),
+        'max_ms': to_ms(values[-1]) if values else None,
+    }
+
+
+# ============================================================
+# /metrics: consultas a la base y llamadas al LLM
+# ============================================================
+
+def scrape(client):
+    """Totales de consultas, errores de consultas y llamadas al LLM + pid del worker que respondió"""
+    status, data, _, _ = client.request('GET', '/metrics')
+    if status != 200:
+        return None
+    totals = {'db_queries': 0.0, 'db_query_errors': 0.0, 'llm_calls': 0.0, 'worker': None}
+    for line in data.decode().splitlines():
+        if line.startswith('#') or ' ' not in line:
+            continue
+        sample, value = line.rsplit(' ', 1)
+        name = sample.split('{', 1)[0]
+        if name == 'gastro_db_query_duration_seconds_count':
+            totals['db_queries'] += float(value)
+        elif name == 'gastro_db_query_errors_total':
+            totals['db_query_errors'] += float(value)
+        elif name == 'gastro_llm_calls_total':
+            totals['llm_calls'] += float(value)
+        elif name == 'gastro_worker_info':
+            totals['worker'] = sample.split('worker="', 1)[1].split('"', 1)[0]
+    return totals
+
+
+def metrics_delta(before, after):
+    if not before or not after:
+        return None
+    return {key: int(after[key] - before[key]) for key in ('db_queries', 'db_query_errors', 'llm_calls')}
+
+
+# ============================================================
+# MEZCLA DE TRÁFICO
+# ============================================================
+
+CHAT_MESSAGES = [
+    'hola', '¿qué me recomendás para cenar?', 'quiero algo liviano', '¿tienen opciones vegetarianas?',
+    '¿qué postres hay?', 'algo para compartir', '¿qué vino va con una carne?', 'gracias',
+]
+
+
+class Dataset:
+    """Ids reales que usan los usuarios virtuales (se leen de la API al arrancar)"""
+
+    def __init__(self, client):
+        categories = client.get_json('/api/categories') or []
+        products = client.get_json('/api/products') or []
+        tables = client.get_json('/api/tables') or []
+        categories = categories.get('categories', categories) if isinstance(categories, dict) else categories
+        products = products.get('products', products) if isinstance(products, dict) else products
+        self.category_ids = [category['id'] for category in categories if isinstance(category, dict)]
+        self.products = [product for product in products if isinstance(product, dict) and product.get('id')]
+        self.table_numbers = [table['number'] for table in tables if isinstance(table, dict) and table.get('number')]
+        if not self.products:
+            raise RuntimeError("La API no devolvió productos: ¿se corrió 'seed' contra la base del servidor?")
+
+
+class VirtualUser:
+    """Un dispositivo del salón: cada paso es una acción de su persona y después espera"""
+
+    def __init__(self, index, persona, client, dataset, recorder, seed_value):
+        self.index = index
+        self.persona = persona
+        self.client = client
+        self.dataset = dataset
+        self.recorder = recorder
+        self.rng = random.Random(seed_value * 1000 + index)
+        self.etags = {}
+        self.kitchen_items = []
+        self.thread_id = f"loadtest_{seed_value}_{index}"
+
+    def call(self, route, method, path, body=None, conditional=False):
+        headers = {}
+        if conditional and route in self.etags:
+            headers['If-None-Match'] = self.etags[route]
+        start = time.perf_counter()
+        try:
+            status, data, response_headers, elapsed = self.client.request(method, path, body, headers)
+        except Exception:
+            self.recorder.record(route, time.perf_counter() - start, 'exception')
+            return None
+        self.recorder.record(route, elapsed, status, response_headers.get('Server-Timing'))
+        if response_headers.get('ETag'):
+            self.etags[route] = response_headers['ETag']
+        if status == 200 and data:
+            try:
+                return json.loads(data)
+            except ValueError:
+                return None
+        return None
+
+    # ---------- tablet del mozo ----------
+
+    def waiter_categories(self):
+        self.call('GET /api/categories', 'GET', '/api/categories', conditional=True)
+
+    def waiter_products(self):
+        category_id = self.rng.choice(self.dataset.category_ids) if self.dataset.category_ids else None
+        path = '/api/products' + (f"?{urlencode({'category_id': category_id})}" if category_id else '')
+        self.call('GET /api/products?category_id', 'GET', path)
+
+    def waiter_tables(self):
+        self.call('GET /api/tables', 'GET', '/api/tables', conditional=True)
+
+    def waiter_active_orders(self):
+        self.call('GET /api/orders/active', 'GET', '/api/orders/active')
+
+    def waiter_create_order(self):
+        items = []
+        subtotal = 0
+        for product in self.rng.sample(self.dataset.products, min(len(self.dataset.products), self.rng.randint(1, 4))):
+            quantity = self.rng.randint(1, 3)
+            price = float(product.get('price') or 0)
+            subtotal += price * quantity
+            items.append({'product': {'id': product['id'], 'price': price}, 'quantity': quantity})
+        tax = round(subtotal * 0.21, 2)
+        self.call('POST /api/orders', 'POST', '/api/orders', {
+            'table_number': self.rng.choice(self.dataset.table_numbers) if self.dataset.table_numbers else 1,
+            'items': items, 'subtotal': round(subtotal, 2), 'tax': tax, 'total': round(subtotal + tax, 2),
+            'status': 'pending', 'notes': 'loadtest',
+        })
+
+    # ---------- pantalla de cocina ----------
+
+    def kitchen_queue(self):
+        queue = self.call('GET /api/kitchen/queue', 'GET', '/api/kitchen/queue')
+        rows = queue.get('items', queue.get('queue', [])) if isinstance(queue, dict) else (queue or [])
+        self.kitchen_items = [row for row in rows if isinstance(row, dict) and row.get('status') in ('new', 'viewed', 'preparing')]
+
+    def kitchen_orders(self):
+        self.call('GET /api/orders/kitchen', 'GET', '/api/orders/kitchen')
+
+    def kitchen_update(self):
+        if not self.kitchen_items:
+            self.kitchen_queue()
+            return
+        item = self.kitchen_items.pop(self.rng.randrange(len(self.kitchen_items)))
+        new_status = 'ready' if item.get('status') == 'preparing' else 'preparing'
+        self.call('PUT /api/kitchen/queue/{id}', 'PUT', f"/api/kitchen/queue/{item['id']}", {'status': new_status})
+
+    # ---------- chat del menú ----------
+
+    def chat_message(self):
+        self.call('POST /api/chat/menu-ai', 'POST', '/api/chat/menu-ai', {
+            'message': self.rng.choice(CHAT_MESSAGES), 'threadId': self.thread_id, 'context': {},
+        })
+
+    def chat_pairings(self):
+        product = self.rng.choice(self.dataset.products)
+        self.call('POST /api/chat/pairings', 'POST', '/api/chat/pairings', {
+            'product_id': product['id'], 'product': product.get('name', ''), 'category': product.get('category_name', ''),
+        })
+
+    # ---------- dashboards ----------
+
+    def dashboard_sales(self):
+        end = datetime.now().date()
+        start = end - timedelta(days=self.rng.choice([1, 7, 30]))
+        self.call('GET /api/reports/sales', 'GET', f"/api/reports/sales?{urlencode({'start_date': start, 'end_date': end})}")
+
+    def dashboard_performance(self):
+        self.call('GET /api/reports/performance', 'GET', '/api/reports/performance')
+
+    def dashboard_tables(self):
+        self.call('GET /api/reports/tables', 'GET', '/api/reports/tables')
+
+    def dashboard_orders(self):
+        self.call('GET /api/orders', 'GET', '/api/orders')
+
+    def dashboard_costs(self):
+        self.call('GET /api/ingredients/product-costs', 'GET', '/api/ingredients/product-costs')
+
+
+# persona -> (peso en la población, segundos de espera medios entre acciones, [(acción, peso)])
+PERSONAS = {
+    'waiter': (0.45, 2.0, [
+        ('waiter_categories', 0.15), ('waiter_products', 0.35), ('waiter_tables', 0.20),
+        ('waiter_active_orders', 0.15), ('waiter_create_order', 0.15),
+    ]),
+    'kitchen': (0.20, 3.0, [('kitchen_queue', 0.60), ('kitchen_orders', 0.15), ('kitchen_update', 0.25)]),
+    'chat': (0.20, 6.0, [('chat_message', 0.75), ('chat_pairings', 0.25)]),
+    'dashboard': (0.15, 10.0, [
+        ('dashboard_sales', 0.30), ('dashboard_performance', 0.20), ('dashboard_tables', 0.10),
+        ('dashboard_orders', 0.25), ('dashboard_costs', 0.15),
+    ]),
+}
+
+
+def assign_personas(count):
+    """Reparto proporcional y determinista de personas entre los usuarios virtuales"""
+    personas = []
+    for name, (weight, _, _) in PERSONAS.items():
+        personas += [name] * max(1, round(weight * count))
+    while len(personas) < count:
+        personas.append('waiter')
+    return personas[:count]
+
+
+def vu_loop(user, deadline, think_scale):
+    _, think_time, actions = PERSONAS[user.persona]
+    names = [name for name, _ in actions]
+    weights = [weight for _, weight in actions]
+    while time.time() < deadline:
+        getattr(user, user.rng.choices(names, weights)[0])()
+        if think_scale > 0:
+            time.sleep(min(user.rng.expovariate(1 / (think_time * think_scale)), max(0, deadline - time.time())))
+
+
+def profile_routes(client, dataset, seed_value):
+    """Consultas a la base por ruta: una llamada en frío y otra en caliente, de a una"""
+    user = VirtualUser(-1, 'profile', client, dataset, Recorder(), seed_value)
+    profile = {}
+    workers = set()
+    for persona, (_, _, actions) in PERSONAS.items():
+        for action, _ in actions:
+            runs = []
+            for _ in range(2):
+                if action == 'kitchen_update':
+                    # Necesita items de la cola, leídos fuera de la ventana medida
+                    user.kitchen_queue()
+                before = scrape(client)
+                user.recorder.routes.clear()
+                getattr(user, action)()
+                after = scrape(client)
+                workers.update(sample['worker'] for sample in (before, after) if sample)
+                runs.append(metrics_delta(before, after))
+            route = next(iter(user.recorder.routes), action)
+            if runs[0] and runs[1]:
+                profile[route] = {
+                    'db_queries_cold': runs[0]['db_queries'],
+                    'db_queries_warm': runs[1]['db_queries'],
+                    'llm_calls_warm': runs[1]['llm_calls'],
+                }
+    return profile, len(workers)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except Exception:
+        return None
+
+
+def run(base_url, duration, users, output, seed_value):
+    client = Client(base_url)
+    think_scale = float(os.environ.get('LOADTEST_THINK_SCALE', 1.0))
+    print(f"🎯 {base_url}: {users} usuarios virtuales durante {duration}s (espera x{think_scale})")
+
+    dataset = Dataset(client)
+    print(f"📦 Dataset: {len(dataset.products)} productos, {len(dataset.category_ids)} categorías, "
+          f"{len(dataset.table_numbers)} mesas")
+
+    print("🔬 Perfilando consultas por ruta...")
+    profile, profiled_workers = profile_routes(client, dataset, seed_value)
+    if profiled_workers > 1:
+        print("⚠️ /metrics respondido por varios workers: las consultas por ruta no son confiables (usar WORKERS=1)")
+
+    recorder = Recorder()
+    personas = assign_personas(users)
+    vus = [VirtualUser(index, persona, client, dataset, recorder, seed_value) for index, persona in enumerate(personas)]
+
+    before = scrape(client)
+    started = time.time()
+    deadline = started + duration
+    ramp = min(5.0, duration / 10)
+    threads = []
+    for index, user in enumerate(vus):
+        thread = threading.Thread(target=vu_loop, args=(user, deadline, think_scale), daemon=True)
+        thread.start()
+        threads.append(thread)
+        time.sleep(ramp / len(vus))
+    for thread in threads:
+        thread.join(timeout=max(0, deadline - time.time()) + REQUEST_TIMEOUT)
+    elapsed = time.time() - started
+    after = scrape(client)
+    delta = metrics_delta(before, after)
+
+    all_latencies = [value for entry in recorder.routes.values() for value in entry['latencies']]
+    totals = summarize(all_latencies, elapsed)
+    totals['errors'] = sum(entry['errors'] for entry in recorder.routes.values())
+    totals['over_query_budget'] = sum(entry['over_budget'] for entry in recorder.routes.values())
+    if delta:
+        totals.update(delta)
+        totals['db_queries_per_request'] = round(delta['db_queries'] / totals['requests'], 2) if totals['requests'] else None
+
+    routes = {}
+    for route, entry in sorted(recorder.routes.items()):
+        routes[route] = {**summarize(entry['latencies'], elapsed), 'errors': entry['errors'],
+                         'status': entry['status'], **profile.get(route, {})}
+        if entry['queries']:
+            routes[route].update(queries_mean=round(sum(entry['queries']) / len(entry['queries']), 2),
+                                 queries_max=max(entry['queries']), over_query_budget=entry['over_budget'])
+
+    report = {
+        'meta': {
+            'started_at': datetime.fromtimestamp(started).isoformat(timespec='seconds'),
+            'git_commit': git_commit(),
+            'base_url': base_url,
+            'duration_s': round(elapsed, 1),
+            'virtual_users': users,
+            'personas': {name: personas.count(name) for name in PERSONAS},
+            'seed': seed_value,
+            'think_scale': think_scale,
+            'metrics_workers': profiled_workers,
+        },
+        'totals': totals,
+        'routes': routes,
+    }
+
+    print(f"\n📊 {totals['requests']} requests en {elapsed:.1f}s ({totals['throughput_rps']} req/s), "
+          f"{totals['errors']} errores")
+    print(f"   p50 {totals['p50_ms']}ms · p95 {totals['p95_ms']}ms · p99 {totals['p99_ms']}ms")
+    if delta:
+        print(f"   🗄️ {delta['db_queries']} consultas ({totals['db_queries_per_request']}/request), "
+              f"🤖 {delta['llm_calls']} llamadas al LLM")
+    print(f"\n{'Ruta':<38} {'req':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'err':>5} {'db':>4} {'dbmax':>5}")
+    for route, stats in routes.items():
+        flag = ' ⚠️ presupuesto' if stats.get('over_query_budget') else ''
+        print(f"{route:<38} {stats['requests']:>6} {stats['p50_ms']:>8} {stats['p95_ms']:>8} "
+              f"{stats['p99_ms']:>8} {stats['errors']:>5} {stats.get('db_queries_warm', '-'):>4} "
+              f"{stats.get('queries_max', '-'):>5}{flag}")
+    if totals['over_query_budget']:
+        print(f"\n❌ {totals['over_query_budget']} requests superaron el presupuesto de consultas de su ruta (posible N+1)")
+
+    if output:
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\n💾 Reporte guardado en {output}")
+    return report
+
+
+# ============================================================
+# COMPARE
+# ============================================================
+
+def change(before, after):
+    if not before or after is None:
+        return None
+    return (after - before) / before
+
+
+def compare(path_a, path_b):
+    with open(path_a, encoding='utf-8') as f:
+        a = json.load(f)
+    with open(path_b, encoding='utf-8') as f:
+        b = json.load(f)
+
+    print(f"🔀 {a['meta'].get('git_commit')} → {b['meta'].get('git_commit')}")
+    print(f"{'Ruta':<38} {'p95 A':>9} {'p95 B':>9} {'Δp95':>7} {'rps A':>7} {'rps B':>7} {'db A':>5} {'db B':>5}")
+    regressions = 0
+    for route in sorted(set(a['routes']) | set(b['routes'])):
+        ra, rb = a['routes'].get(route, {}), b['routes'].get(route, {})
+        delta = change(ra.get('p95_ms'), rb.get('p95_ms'))
+        more_queries = (rb.get('db_queries_warm') or 0) > (ra.get('db_queries_warm') or 0)
+        flag = '⚠️' if (delta is not None and delta > REGRESSION_THRESHOLD) or more_queries else '  '
+        regressions += flag != '  '
+        print(f"{flag}{route:<36} {ra.get('p95_ms', '-'):>9} {rb.get('p95_ms', '-'):>9} "
+              f"{f'{delta:+.0%}' if delta is not None else '-':>7} {ra.get('throughput_rps', '-'):>7} "
+              f"{rb.get('throughput_rps', '-'):>7} {ra.get('db_queries_warm', '-'):>5} {rb.get('db_queries_warm', '-'):>5}")
+
+    ta, tb = a['totals'], b['totals']
+    print(f"\nTotal: p95 {ta.get('p95_ms')} → {tb.get('p95_ms')}ms, "
+          f"{ta.get('throughput_rps')} → {tb.get('throughput_rps')} req/s, "
+          f"consultas/request {ta.get('db_queries_per_request')} → {tb.get('db_queries_per_request')}")
+    print(f"{'⚠️' if regressions else '✅'} {regressions} rutas con p95 +{REGRESSION_THRESHOLD:.0%} o más consultas")
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ('seed', 'run', 'compare'):
+        print(__doc__)
+        sys.exit(1)
+    command, args = sys.argv[1], sys.argv[2:]
+    seed_value = int(os.environ.get('LOADTEST_SEED', SEED))
+
+    if command == 'seed':
+        scale = args[0] if args else 'small'
+        if scale not in SCALES:
+            print(f"❌ Escala desconocida: {scale} (usar {', '.join(SCALES)})")
+            sys.exit(1)
+        numbers = [arg for arg in args[1:] if arg.isdigit()]
+        seed(scale, int(numbers[0]) if numbers else seed_value, 'reset' in args[1:])
+    elif command == 'run':
+        if not args:
+            print("❌ Falta la URL del servidor")
+            sys.exit(1)
+        duration = int(args[1]) if len(args) > 1 else 60
+        users = int(args[2]) if len(args) > 2 else 20
+        report = run(args[0], duration, users, args[3] if len(args) > 3 else None, seed_value)
+        if report['totals']['over_query_budget']:
+            sys.exit(2)
+    else:
+        if len(args) != 2:
+            print("❌ compare necesita dos reportes JSON")
+            sys.exit(1)
+        compare(args[0], args[1])
+
+
+if __name__ == "__main__":
+    main()
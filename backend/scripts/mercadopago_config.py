@@ -2,6 +2,7 @@ import mercadopago
 import os
 from datetime import datetime, timedelta
 import json
+import urllib.request
 
 # URLs base - Configurables por ambiente
 # Para desarrollo local con ngrok o túnel:
@@ -18,6 +19,9 @@ BACKEND_URL = os.getenv('BACKEND_URL', 'http://172.29.228.80:9002')
 MP_ACCESS_TOKEN = os.getenv('MP_ACCESS_TOKEN', 'TEST-YOUR-ACCESS-TOKEN-HERE')
 MP_PUBLIC_KEY = os.getenv('MP_PUBLIC_KEY', 'TEST-YOUR-PUBLIC-KEY-HERE')
 
+# API alternativa (ej: scripts/fake_mercadopago_server.py para pruebas locales)
+MP_API_BASE_URL = os.getenv('MP_API_BASE_URL')
+
 # Inicializar SDK
 sdk = mercadopago.SDK(MP_ACCESS_TOKEN)
 
@@ -136,6 +140,24 @@ def get_payment_status(payment_id):
         print(f"Error obteniendo estado del pago: {str(e)}")
         return None
 
+def fetch_payment(payment_id, timeout=10):
+    """
+    Obtiene un pago para la bandeja de webhooks. A diferencia de
+    get_payment_status, lanza excepción ante errores para poder reintentar.
+    """
+    if MP_API_BASE_URL:
+        request = urllib.request.Request(
+            f"{MP_API_BASE_URL.rstrip('/')}/v1/payments/{payment_id}",
+            headers={'Authorization': f'Bearer {MP_ACCESS_TOKEN}'}
+        )
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read().decode('utf-8'))
+
+    payment = sdk.payment().get(payment_id)
+    if payment.get("status") != 200:
+        raise Exception(f"MercadoPago respondió {payment.get('status')} para el pago {payment_id}")
+    return payment["response"]
+
 def process_webhook(data):
     """
     Procesa los webhooks de MercadoPago
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Consultas más pesadas e índices sugeridos (core/query_analytics.py)
+
+  top      Consultas con más tiempo acumulado en un servidor corriendo, con
+           los problemas del último EXPLAIN y los índices sugeridos.
+  analyze  Pedirle al servidor que corra ya el EXPLAIN de las más pesadas.
+  explain  Analizar una consulta suelta contra la base configurada
+           (MYSQL_HOST, MYSQL_USER, ...), sin pasar por el servidor.
+
+Con WORKERS > 1 cada worker tiene sus estadísticas: top/analyze ven las del
+worker que atiende el request.
+
+Uso:
+    python scripts/query_advisor.py top http://localhost:9002 [limite] [total|mean|p95|max|count]
+    python scripts/query_advisor.py analyze http://localhost:9002
+    python scripts/query_advisor.py explain "SELECT ... WHERE DATE(o.created_at) BETWEEN %s AND %s" 2026-01-01 2026-01-31
+"""
+import json
+import os
+import sys
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ISSUE_LABELS = {
+    'full_scan': '🐢 full scan',
+    'filesort': '🔃 filesort',
+    'temporary_table': '🧮 tabla temporal',
+    'function_wrapped_column': '🧩 columna dentro de función',
+    'explain_failed': '❓ EXPLAIN falló',
+}
+
+
+def fetch(base_url, path, method='GET'):
+    request = urllib.request.Request(base_url.rstrip('/') + path, method=method, data=b'{}' if method == 'POST' else None,
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=120) as response:
+        return json.loads(response.read())
+
+
+def describe_issue(issue):
+    label = ISSUE_LABELS.get(issue['type'], issue['type'])
+    if issue['type'] == 'function_wrapped_column':
+        detail = f"{issue['function']}({issue['column']})" + (' (columna indexada)' if issue.get('indexed') else '')
+        if issue.get('rewrite'):
+            detail += f" → usar {issue['rewrite']}"
+        return f"{label}: {detail}"
+    if issue['type'] == 'explain_failed':
+        return f"{label}: {issue['detail']}"
+    return f"{label}: {issue.get('table')} (~{issue.get('rows')} filas)"
+
+
+def print_report(report):
+    print(f"📊 {report['fingerprints']} fingerprints ({report['queries']} consultas, {report['total_ms']}ms), "
+          f"{report['evicted']} descartados")
+    if report.get('last_analysis') is None:
+        print("   (todavía sin EXPLAIN: correr `analyze`)")
+    for entry in report['top']:
+        print(f"\n#{entry['fingerprint']}  x{entry['count']}  total {entry['total_ms']}ms  "
+              f"media {entry['mean_ms']}ms  p95 {entry['p95_ms']}ms  filas ~{entry['rows_mean']}")
+        print(f"   {entry['query'][:160]}")
+        for issue in entry.get('issues') or []:
+            print(f"   {describe_issue(issue)}")
+        for index in entry.get('suggested_indexes') or []:
+            print(f"   💡 {index}")
+    if report.get('suggested_indexes'):
+        print("\n💡 Índices sugeridos (revisar antes de aplicar):")
+        for index in report['suggested_indexes']:
+            print(f"   {index};")
+
+
+def explain_local(sql, params):
+    import mysql.connector
+    from complete_server import MYSQL_CONFIG
+    from core.metrics import normalize_query
+    from core.query_analytics import index_advisor
+
+    connection = mysql.connector.connect(**MYSQL_CONFIG, connect_timeout=20)
+
+    def execute_query(query, query_params=None):
+        cursor = connection.cursor(dictionary=True)
+        try:
+            cursor.execute(query, query_params)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    try:
+        report = index_advisor.explain(execute_query, sql, tuple(params), normalize_query(sql))
+    finally:
+        connection.close()
+
+    print(f"🔍 {report['query']}")
+    for row in report['plan']:
+        print(f"   {row['table']:<20} type={row['type']:<8} key={row['key']} rows={row['rows']} {row['Extra'] or ''}")
+    for issue in report['issues']:
+        print(f"   {describe_issue(issue)}")
+    for index in report['suggested_indexes']:
+        print(f"   💡 {index};")
+    if not report['issues']:
+        print("   ✅ Sin problemas detectados")
+
+
+def main():
+    if len(sys.argv) < 3 or sys.argv[1] not in ('top', 'analyze', 'explain'):
+        print(__doc__)
+        sys.exit(1)
+    command, args = sys.argv[1], sys.argv[2:]
+
+    if command == 'top':
+        limit = int(args[1]) if len(args) > 1 else 20
+        order = args[2] if len(args) > 2 else 'total'
+        print_report(fetch(args[0], f"/api/db/slow-queries?limit={limit}&order={order}"))
+    elif command == 'analyze':
+        report = fetch(args[0], '/api/db/slow-queries/analyze', method='POST')
+        print(f"🔬 {report['analyzed']} consultas analizadas\n")
+        print_report(report)
+    else:
+        explain_local(args[0], args[1:])
+
+
+if __name__ == "__main__":
+    main()
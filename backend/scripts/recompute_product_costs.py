@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Recalcular el costo de ingredientes guardado en products
+
+Vuelve a calcular product_ingredients.cost_contribution (cantidad x precio del
+ingrediente) y products.total_ingredient_cost / ingredient_count por lotes
+(core/product_costs.py). Útil después de cargas masivas de precios o recetas
+hechas por fuera de la API.
+
+Uso:
+    python scripts/recompute_product_costs.py            # todos los productos
+    python scripts/recompute_product_costs.py 12 15 40   # solo esos productos
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mysql.connector
+
+from complete_server import MYSQL_CONFIG
+from core.product_costs import recompute_all, PRODUCT_COSTS_QUERY
+
+
+def main():
+    try:
+        product_ids = [int(arg) for arg in sys.argv[1:]] or None
+    except ValueError:
+        print("❌ Los ids de producto deben ser numéricos")
+        sys.exit(1)
+
+    connection = mysql.connector.connect(**MYSQL_CONFIG, ssl_disabled=False, connect_timeout=20)
+    cursor = connection.cursor(dictionary=True)
+    try:
+        print("🔄 Recalculando costos de ingredientes...")
+        start = time.perf_counter()
+        count = recompute_all(cursor, product_ids)
+        connection.commit()
+        print(f"✅ {count} productos recalculados en {time.perf_counter() - start:.2f}s")
+
+        cursor.execute(PRODUCT_COSTS_QUERY + " LIMIT 5")
+        rows = cursor.fetchall()
+        if rows:
+            print("\n📊 Productos con mayor costo de ingredientes:")
+            for row in rows:
+                print(f"   {row['product_name']}: ${row['total_ingredient_cost']} ({row['total_ingredients']} ingredientes)")
+    except Exception as e:
+        connection.rollback()
+        print(f"💥 Error recalculando costos: {e}")
+        sys.exit(1)
+    finally:
+        cursor.close()
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
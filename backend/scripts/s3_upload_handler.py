@@ -101,9 +101,30 @@ class S3ImageHandler:
                 'error': str(e)
             }
     
+    def upload_product_image_variants(self, image_data, product_name):
+        """
+        Subir la imagen como juego de variantes WebP/JPEG (thumb/card/detail)
+        con nombres por hash de contenido y caché inmutable.
+        
+        Returns:
+            dict con el mapa de variantes y los srcset (ver core/image_pipeline.py)
+        """
+        from core.image_pipeline import ImagePipeline, S3ImageStorage
+        
+        if isinstance(image_data, str):
+            if 'base64,' in image_data:
+                image_data = image_data.split('base64,')[1]
+            image_data = base64.b64decode(image_data)
+        
+        storage = S3ImageStorage(self.s3_client, S3_BUCKET_NAME, S3_BASE_URL, prefix='gastro/products/')
+        return ImagePipeline(storage).process_sync(product_name, image_data)
+    
     def optimize_image(self, image_bytes, content_type, max_width=1200, quality=85):
         """
         Optimizar imagen para web (redimensionar y comprimir)
+        
+        Genera una sola imagen; para la grilla del menú usar
+        upload_product_image_variants (varios anchos + WebP).
         """
         try:
             # Abrir imagen con PIL
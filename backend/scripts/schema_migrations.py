@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Estado y aplicación manual del bootstrap de esquema (core/schema_bootstrap.py)
+
+complete_server aplica las migraciones pendientes al arrancar; este script
+sirve para verlas o aplicarlas sin levantar el servidor (por ejemplo con
+SCHEMA_BOOTSTRAP=0 en producción y un paso de release).
+
+Uso:
+    python scripts/schema_migrations.py            # estado
+    python scripts/schema_migrations.py aplicar
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mysql.connector
+
+from complete_server import MYSQL_CONFIG
+from core.schema_bootstrap import SchemaBootstrap, print_report
+
+
+def main():
+    mode = sys.argv[1] if len(sys.argv) > 1 else 'estado'
+    bootstrap = SchemaBootstrap(
+        get_connection=lambda: mysql.connector.connect(**MYSQL_CONFIG, ssl_disabled=False, autocommit=True)
+    )
+
+    if mode == 'aplicar':
+        print_report(bootstrap.run())
+        return
+
+    pending = 0
+    for version, description, applied_at in bootstrap.status():
+        if applied_at:
+            print(f"   ✅ {version:<32} {applied_at}  {description}")
+        else:
+            pending += 1
+            print(f"   ⏳ {version:<32} {'pendiente':<19}  {description}")
+    print(f"\n📋 {pending} migraciones pendientes")
+
+
+if __name__ == "__main__":
+    main()
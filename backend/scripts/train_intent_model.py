@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Entrenar el clasificador local de intención con el log de decisiones de la IA
+
+Entrena el modelo TF-IDF + softmax (core/intent_classifier.py) con
+data/intent_log.jsonl, lo guarda y vuelve a pasar los mensajes del log por
+el clasificador completo (reglas + modelo) contra el catálogo real: muestra
+qué fracción se habría resuelto sin IA, cuántas coinciden con la decisión
+de la IA y la latencia local.
+
+Uso:
+    python scripts/train_intent_model.py [ruta_del_log]
+"""
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from complete_server import init_pool, get_restaurant_data
+from core.intent_classifier import IntentClassifier, DEFAULT_LOG_PATH, DEFAULT_MODEL_PATH, NUMPY_AVAILABLE
+
+
+def main():
+    log_path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_LOG_PATH
+    if not os.path.exists(log_path):
+        print(f"❌ No existe el log de decisiones: {log_path}")
+        sys.exit(1)
+
+    classifier = IntentClassifier(log_path=log_path)
+    if not NUMPY_AVAILABLE:
+        print("⚠️ NumPy no está instalado: se evalúan solo las reglas")
+
+    stats = classifier.train()
+    model = stats['model']
+    if model['trained_at']:
+        classifier.save(DEFAULT_MODEL_PATH)
+        print(f"✅ Modelo entrenado con {model['samples']} decisiones en {model.get('train_seconds', 0)}s")
+        print(f"   Intenciones: {', '.join(model['labels'])}")
+        print(f"   Precisión en validación: {model['holdout_accuracy']} "
+              f"({'habilitado' if model['enabled'] else 'NO habilitado'})")
+        print(f"   Archivo: {DEFAULT_MODEL_PATH}")
+
+    print("\n🔄 Cargando catálogo...")
+    if not init_pool():
+        print("❌ No se pudo conectar a la base de datos")
+        sys.exit(1)
+    catalog = get_restaurant_data()['catalog']
+
+    with open(log_path, 'r', encoding='utf-8') as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+
+    served = Counter()
+    agree = 0
+    elapsed = 0.0
+    for entry in entries:
+        context = {'selectedFood': 'contexto'} if entry.get('context') else None
+        start = time.perf_counter()
+        result = classifier.classify(entry['message'], catalog, context)
+        elapsed += time.perf_counter() - start
+        if result:
+            served[result['source']] += 1
+            agree += result['intent_type'] == entry['intent']
+
+    local = sum(served.values())
+    total = len(entries) or 1
+    print(f"\n📊 Replay de {len(entries)} turnos resueltos por la IA:")
+    print(f"   Resueltos localmente: {local} ({local / total:.1%}) - reglas {served['rules']}, modelo {served['model']}")
+    print(f"   Coinciden con la IA: {agree}/{local}" + (f" ({agree / local:.1%})" if local else ""))
+    print(f"   Latencia local promedio: {elapsed / total * 1000:.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+"""Búsqueda de productos mencionados en mensajes del chat"""
+from core.catalog import CatalogSnapshot
+
+ROWS = [
+    {'id': 1, 'name': 'Milanesa Napolitana', 'category_name': 'Platos'},
+    {'id': 2, 'name': 'Coca-Cola', 'category_name': 'Bebidas'},
+    {'id': 3, 'name': 'Flan casero', 'category_name': 'Postres'},
+]
+
+
+def find(message):
+    product, _ = CatalogSnapshot(ROWS).find_in_message(message)
+    return product.id if product else None
+
+
+def test_punctuation_around_words_still_matches():
+    assert find('qué tiene la milanesa?') == 1
+    assert find('¿Milanesa?') == 1
+    assert find('¡Un flan, por favor!') == 3
+
+
+def test_hyphenated_names_match_with_or_without_hyphen():
+    assert find('precio de la coca-cola') == 2
+    assert find('precio de la coca cola') == 2
+
+
+def test_partial_name_falls_back_to_substring_scan():
+    assert find('napo') == 1
+
+
+def test_unrelated_message_finds_nothing():
+    assert find('hola, buenas noches') is None
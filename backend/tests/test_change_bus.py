@@ -0,0 +1,31 @@
+"""ETag de respuestas cacheadas: versiones de tablas + hash del contenido"""
+from core.change_bus import ChangeBus
+
+
+class LocalChannel:
+    def subscribe(self, callback):
+        pass
+
+    def publish(self, event, include_self=True):
+        pass
+
+
+def test_etag_changes_with_content_written_outside_the_server():
+    bus = ChangeBus(LocalChannel())
+    before = bus.etag(('products',), 'products_None_None', content='3f1a')
+    assert before == bus.etag(('products',), 'products_None_None', content='3f1a')
+    # Sin emit(): solo cambió lo que devolvió la base al rearmar el caché
+    assert before != bus.etag(('products',), 'products_None_None', content='9c0e')
+
+
+def test_etag_changes_after_local_write():
+    bus = ChangeBus(LocalChannel())
+    before = bus.etag(('products',), content='3f1a')
+    bus.emit('products', 7)
+    assert before != bus.etag(('products',), content='3f1a')
+
+
+def test_etag_is_the_same_in_every_worker_until_a_change():
+    first, recycled = ChangeBus(LocalChannel()), ChangeBus(LocalChannel())
+    assert first.etag(('tables', 'floor_layout'), content='3f1a') == \
+        recycled.etag(('tables', 'floor_layout'), content='3f1a')
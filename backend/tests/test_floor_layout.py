@@ -0,0 +1,173 @@
+"""Lote del plano: transacción explícita, versionado optimista y rollback"""
+import threading
+
+import pytest
+
+from core.floor_layout import apply_layout_batch, check_batch_settings, LayoutConflict, LayoutError, MAX_BATCH_AREAS
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self._rows = []
+
+    def execute(self, query, params=None):
+        connection = self.connection
+        connection.log.append(query.split()[0])
+        if query.startswith('SELECT'):
+            # FOR UPDATE: el bloqueo dura hasta el commit solo dentro de una transacción;
+            # en autocommit se suelta apenas termina la sentencia
+            if not connection.holds_lock:
+                connection.db.row_lock.acquire()
+            if connection.in_transaction:
+                connection.holds_lock = True
+            self._rows = [dict(connection.db.rows[table][str(item_id)])
+                          for table in connection.db.rows if f"FROM {table} " in query
+                          for item_id in params if str(item_id) in connection.db.rows[table]]
+            if not connection.in_transaction:
+                connection.db.row_lock.release()
+            if connection.db.interleave:
+                # Dar lugar a que el otro editor lea antes de escribir (si el bloqueo no lo impide)
+                try:
+                    connection.db.interleave.wait()
+                except threading.BrokenBarrierError:
+                    pass
+        elif query.startswith('INSERT'):
+            table = query.split()[2]
+            if table in connection.fail_on:
+                raise RuntimeError(f"fallo escribiendo {table}")
+            columns = query[query.index('(') + 1:query.index(')')].split(', ')
+            rows = [dict(zip(columns, params[i:i + len(columns)])) for i in range(0, len(params), len(columns))]
+            connection.pending.append((table, rows))
+            if not connection.in_transaction:
+                connection.apply_pending()
+
+    def fetchall(self):
+        return self._rows
+
+    def close(self):
+        pass
+
+
+class FakeDatabase:
+    """Filas compartidas entre conexiones con un bloqueo de filas al estilo InnoDB (uno para todo)"""
+
+    def __init__(self, interleave=None):
+        self.row_lock = threading.Lock()
+        self.interleave = interleave
+        self.rows = {
+            'tables': {'1': {'id': 1, 'version': 3, 'number': 1, 'x': 0, 'y': 0, 'width': 80, 'height': 80,
+                             'rotation': 0, 'shape': 'square', 'capacity': 4}},
+            'decorative_objects': {'7': {'id': 7, 'version': 0, 'type': 'plant', 'x': 0, 'y': 0, 'width': 10,
+                                         'height': 10, 'rotation': 0, 'locked': 0, 'environment': 'salon'}},
+        }
+
+
+class FakeConnection:
+    def __init__(self, db=None, fail_on=()):
+        self.db = db or FakeDatabase()
+        self.fail_on = fail_on
+        self.log = []
+        self.pending = []
+        self.in_transaction = False
+        self.holds_lock = False
+        self.committed = False
+        self.rolled_back = False
+
+    def cursor(self, dictionary=False):
+        return FakeCursor(self)
+
+    def start_transaction(self):
+        self.log.append('START')
+        self.in_transaction = True
+
+    def apply_pending(self):
+        for table, rows in self.pending:
+            for row in rows:
+                self.db.rows[table][str(row['id'])].update(row)
+        self.pending = []
+
+    def _release(self):
+        self.in_transaction = False
+        if self.holds_lock:
+            self.holds_lock = False
+            self.db.row_lock.release()
+
+    def commit(self):
+        self.log.append('COMMIT')
+        self.apply_pending()
+        self.committed = True
+        self._release()
+
+    def rollback(self):
+        self.log.append('ROLLBACK')
+        self.rolled_back = True
+        self.pending = []
+        self._release()
+
+
+def test_batch_runs_in_one_explicit_transaction():
+    connection = FakeConnection()
+    versions = apply_layout_batch(connection, {
+        'tables': [{'id': 1, 'x': 50, 'version': 3}],
+        'decorative_objects': [{'id': 7, 'rotation': 90, 'version': 0}],
+    })
+    assert versions == {'tables': {'1': 4}, 'decorative_objects': {'7': 1}}
+    assert connection.log == ['START', 'SELECT', 'SELECT', 'INSERT', 'INSERT', 'COMMIT']
+
+
+def test_stale_version_rejects_whole_batch():
+    connection = FakeConnection()
+    with pytest.raises(LayoutConflict) as error:
+        apply_layout_batch(connection, {
+            'tables': [{'id': 1, 'x': 50, 'version': 2}],
+            'decorative_objects': [{'id': 7, 'rotation': 90, 'version': 0}],
+        })
+    assert error.value.conflicts[0]['reason'] == 'stale'
+    assert 'INSERT' not in connection.log
+    assert connection.rolled_back and not connection.committed
+
+
+def test_failed_upsert_rolls_back_earlier_kinds():
+    connection = FakeConnection(fail_on=('decorative_objects',))
+    with pytest.raises(RuntimeError):
+        apply_layout_batch(connection, {
+            'tables': [{'id': 1, 'x': 50}],
+            'decorative_objects': [{'id': 7, 'rotation': 90}],
+        })
+    assert connection.rolled_back and not connection.committed
+    assert connection.db.rows['tables']['1']['x'] == 0
+
+
+def test_concurrent_batches_with_same_version_lose_no_edit():
+    # Dos editores mandan un cambio sobre la misma versión: uno se aplica y el otro recibe
+    # conflicto (antes los dos pasaban el chequeo y el primer cambio se perdía en silencio)
+    db = FakeDatabase(interleave=threading.Barrier(2, timeout=0.5))
+    results = {}
+    started = threading.Barrier(2)
+
+    def edit(x):
+        connection = FakeConnection(db)
+        started.wait()
+        try:
+            results[x] = apply_layout_batch(connection, {'tables': [{'id': 1, 'x': x, 'version': 3}]})
+        except LayoutConflict as e:
+            results[x] = e
+
+    threads = [threading.Thread(target=edit, args=(x,)) for x in (10, 20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    conflicts = [x for x, result in results.items() if isinstance(result, LayoutConflict)]
+    applied = [x for x, result in results.items() if not isinstance(result, LayoutConflict)]
+    assert len(conflicts) == 1 and len(applied) == 1
+    assert db.rows['tables']['1']['x'] == applied[0]
+    assert db.rows['tables']['1']['version'] == 4
+
+
+def test_too_many_areas_are_rejected_before_writing():
+    with pytest.raises(LayoutError):
+        check_batch_settings({'area_settings': [{'area_id': n} for n in range(MAX_BATCH_AREAS + 1)]})
+    check_batch_settings({'area_settings': [{'area_id': n} for n in range(MAX_BATCH_AREAS)]})
@@ -0,0 +1,33 @@
+"""Los trabajos terminados del pipeline de imágenes no se acumulan en memoria"""
+import time
+
+from core import image_pipeline
+from core.image_pipeline import ImagePipeline
+
+
+def test_finished_jobs_expire_after_ttl(monkeypatch):
+    monkeypatch.setattr(image_pipeline, 'JOB_TTL', 60)
+    pipeline = ImagePipeline(storage=None)
+    now = time.monotonic()
+    pipeline.jobs = {
+        1: {'status': 'done', 'finished_at': now - 120},
+        2: {'status': 'failed', 'finished_at': now - 10},
+        3: {'status': 'processing'},
+    }
+    assert pipeline.get_job(1) is None
+    assert pipeline.get_job(2)['status'] == 'failed'
+    assert sorted(pipeline.jobs) == [2, 3]
+
+
+def test_cap_drops_oldest_finished_jobs_first(monkeypatch):
+    monkeypatch.setattr(image_pipeline, 'MAX_JOBS', 2)
+    pipeline = ImagePipeline(storage=None)
+    now = time.monotonic()
+    pipeline.jobs = {
+        1: {'status': 'processing'},
+        2: {'status': 'done', 'finished_at': now - 5},
+        3: {'status': 'done', 'finished_at': now - 1},
+        4: {'status': 'processing'},
+    }
+    assert pipeline.get_stats()['tracked_jobs'] == 2
+    assert sorted(pipeline.jobs) == [1, 4]
@@ -0,0 +1,34 @@
+"""Reglas locales del clasificador de intención: solo con un producto claramente mencionado"""
+from core.catalog import CatalogSnapshot
+from core.intent_classifier import IntentClassifier
+
+
+def classify(message, rows, tmp_path):
+    classifier = IntentClassifier(log_path=str(tmp_path / 'intent_log.jsonl'))
+    return classifier.classify(message, CatalogSnapshot(rows))
+
+
+def test_hyphenated_product_is_matched_by_partial_or_full_name(tmp_path):
+    rows = [{'id': 1, 'name': 'Coca-Cola', 'price': 1500}, {'id': 2, 'name': 'Flan casero', 'price': 2000}]
+    for message in ('precio de la coca', '¿Cuánto sale la coca-cola?'):
+        result = classify(message, rows, tmp_path)
+        assert result['intent_type'] == 'specific_product_info'
+        assert result['target_product'].id == 1
+
+
+def test_ambiguous_mention_falls_through_to_gemini(tmp_path):
+    rows = [{'id': 1, 'name': 'Milanesa Napolitana'}, {'id': 2, 'name': 'Milanesa de Pollo'}]
+    assert classify('qué tiene la milanesa?', rows, tmp_path) is None
+
+
+def test_single_candidate_is_resolved_locally(tmp_path):
+    rows = [{'id': 1, 'name': 'Milanesa Napolitana'}, {'id': 2, 'name': 'Flan casero'}]
+    result = classify('qué tiene la milanesa?', rows, tmp_path)
+    assert result['intent_type'] == 'specific_product_ingredients'
+    assert result['target_product'].id == 1
+
+
+def test_full_name_wins_over_longer_names_sharing_words(tmp_path):
+    rows = [{'id': 1, 'name': 'Milanesa Napolitana'}, {'id': 2, 'name': 'Milanesa de Pollo'}]
+    result = classify('qué tiene la milanesa de pollo?', rows, tmp_path)
+    assert result['target_product'].id == 2
@@ -0,0 +1,25 @@
+"""Una línea NDJSON rota se reporta como registro inválido sin cortar el archivo"""
+import pytest
+
+from core.menu_import import MenuImporter, MenuImportError, iter_menu_records, parse_record
+
+
+def test_broken_ndjson_line_is_reported_as_invalid(tmp_path):
+    path = tmp_path / 'menu.ndjson'
+    path.write_text(
+        '{"name": "Flan", "category": "Postres", "price": "2000"}\n'
+        '{"name": "Milanesa", "category": \n'
+        '\n'
+        '{"name": "Coca-Cola", "category": "Bebidas", "price": 1500}\n',
+        encoding='utf-8'
+    )
+    records = list(iter_menu_records(str(path)))
+    assert [number for number, _ in records] == [1, 2, 4]
+    assert parse_record(records[2][1])['name'] == 'Coca-Cola'
+    with pytest.raises(MenuImportError, match='JSON inválido'):
+        parse_record(records[1][1])
+
+    importer = MenuImporter(get_connection=None)
+    importer._process_batch(None, None, [records[1]])
+    assert importer.stats['invalid'] == 1
+    assert importer.errors[0][0] == 2
@@ -0,0 +1,24 @@
+"""El backfill de la migración no pisa contribuciones cargadas a mano"""
+from core.product_costs import recompute_all
+
+
+class RecordingCursor:
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, query, params=None):
+        self.statements.append(' '.join(query.split()))
+
+
+def test_backfill_only_fills_missing_contributions():
+    cursor = RecordingCursor()
+    recompute_all(cursor, [3, 1], only_missing=True)
+    contribution_update = cursor.statements[0]
+    assert contribution_update.startswith('UPDATE product_ingredients pi')
+    assert contribution_update.endswith('AND (pi.cost_contribution IS NULL OR pi.cost_contribution = 0)')
+
+
+def test_full_recompute_rewrites_every_contribution():
+    cursor = RecordingCursor()
+    recompute_all(cursor, [3, 1])
+    assert 'cost_contribution IS NULL' not in cursor.statements[0]
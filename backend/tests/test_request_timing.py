@@ -0,0 +1,95 @@
+"""Presupuesto de consultas por ruta: rutas exactas antes que prefijos"""
+import pytest
+
+from core import request_timing
+
+
+@pytest.mark.parametrize('method, path, budget', [
+    ('GET', '/api/products', 3),
+    ('GET', '/api/products/12/ingredients', 3),
+    ('POST', '/api/products/12/ingredients', 4),
+    ('PUT', '/api/products/12/ingredients', 5),
+    ('GET', '/api/unknown', request_timing.DEFAULT_QUERY_BUDGET),
+])
+def test_budget_per_route(method, path, budget):
+    timing = request_timing.begin(method, path)
+    try:
+        assert timing.budget == budget
+    finally:
+        request_timing.end(timing)
+
+
+def test_env_override_for_exact_route(monkeypatch):
+    monkeypatch.setenv('QUERY_BUDGETS', 'PUT /api/products/{id}/ingredients=7,/api/products=2')
+    budgets = request_timing._load_budgets()
+    assert dict(budgets)['PUT /api/products/{id}/ingredients'] == 7
+    assert dict(budgets)['/api/products'] == 2
+    # Las rutas exactas se revisan antes que cualquier prefijo
+    assert [key.startswith('/') for key, _ in budgets] == sorted(key.startswith('/') for key, _ in budgets)
+
+
+class FakeCursor:
+    def __init__(self, executed):
+        self.executed = executed
+
+    def execute(self, query, params=None):
+        self.executed.append(query)
+
+    def fetchall(self):
+        return []
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, executed):
+        self.executed = executed
+
+    def cursor(self, dictionary=False):
+        return FakeCursor(self.executed)
+
+    def close(self):
+        pass
+
+
+class FakePool:
+    pool_name = 'fake'
+
+    def __init__(self):
+        self.executed = []
+
+    def get_connection(self):
+        return FakeConnection(self.executed)
+
+
+def test_strict_budget_stops_the_query_before_it_runs(monkeypatch):
+    complete_server = pytest.importorskip('complete_server')
+    from core.metrics import InstrumentedPool
+
+    pool = FakePool()
+    monkeypatch.setattr(complete_server, 'connection_pool', InstrumentedPool(pool))
+    monkeypatch.setattr(request_timing, 'STRICT', True)
+    timing = request_timing.begin('PUT', '/api/categories/3')
+    try:
+        assert timing.budget == 2
+        for number in (1, 2):
+            complete_server.execute_mysql_query(f"UPDATE categories SET sort_order = {number} WHERE id = 3")
+        with pytest.raises(request_timing.QueryBudgetExceeded):
+            complete_server.execute_mysql_query("UPDATE categories SET sort_order = 3 WHERE id = 3")
+        with pytest.raises(request_timing.QueryBudgetExceeded):
+            complete_server.execute_mysql_query_with_recovery("UPDATE categories SET sort_order = 4 WHERE id = 3")
+    finally:
+        request_timing.end(timing)
+    assert len(pool.executed) == 2
+    assert timing.db_queries == 2
+
+
+def test_floor_plan_batch_budget_covers_a_full_immediate_batch():
+    from core.floor_layout import LAYOUT_KINDS, MAX_BATCH_AREAS
+
+    timing = request_timing.begin('POST', '/api/floor-plan/batch')
+    try:
+        assert timing.budget == 2 * len(LAYOUT_KINDS) + MAX_BATCH_AREAS + 1
+    finally:
+        request_timing.end(timing)
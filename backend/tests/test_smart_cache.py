@@ -0,0 +1,30 @@
+"""Claves de @cached: el primer argumento solo se ignora en métodos declarados"""
+from core.smart_cache import cache_instance, cached
+
+
+class Menu:
+    calls = 0
+
+    @cached(method=True)
+    def price(self, product_id):
+        Menu.calls += 1
+        return product_id * 10
+
+    @staticmethod
+    @cached()
+    def tax(rate, amount):
+        Menu.calls += 1
+        return rate * amount
+
+
+def test_instances_share_method_entries():
+    cache_instance.clear()
+    Menu.calls = 0
+    assert Menu().price(3) == Menu().price(3) == 30
+    assert Menu.calls == 1
+
+
+def test_staticmethod_keys_use_every_argument():
+    cache_instance.clear()
+    assert Menu.tax(2, 5) == 10
+    assert Menu.tax(3, 5) == 15